@@ -1,5 +1,238 @@
+"""AI document analysis.
+
+Documents are analyzed by a model loaded lazily on first use and shared by
+every agent pointing at the same model path, so concurrent requests do not
+each pay for (or hold) their own copy.
+
+A model is a callable taking a list of text chunks and returning one
+JSON-serializable output per chunk. Documents longer than ``chunk_chars``
+are split into overlapping chunks at word boundaries; a document's
+``analysis`` is the list of its chunk outputs. Chunks of many documents are
+fed to the model together, at most ``batch_size`` per call.
+
+Results are cached in SQLite keyed by model and content hash (of the
+whitespace-normalized text, as in ``app.fingerprint``), so a page whose text
+did not change is never analyzed twice. Replacing the model file changes the
+key, so stale results are not reused.
+
+``process_documents`` analyzes a list in one go. ``submit`` and
+``process_document`` queue single documents on a micro-batcher that groups
+whatever arrives within ``batch_latency_ms`` (up to ``batch_size``
+documents) into one ``process_documents`` call; cache hits are answered
+without queueing.
+
+Usage::
+
+    from app.ai_doc_agent import process_document, process_documents
+    results = process_documents([page["content"] for page in pages])
+
+Settings (env): AI_MODEL_PATH, AI_BATCH_SIZE, AI_BATCH_LATENCY_MS,
+AI_CHUNK_CHARS, AI_CHUNK_OVERLAP, AI_CACHE_DB_PATH.
+"""
+import argparse
+import json
+import logging
 import os
-from typing import Any, Dict
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import OUTPUT_DIR
+from app.fingerprint import content_hash
+
+AI_MODEL_PATH = os.environ.get("AI_MODEL_PATH") or None
+BATCH_SIZE = int(os.environ.get("AI_BATCH_SIZE", 16))
+BATCH_LATENCY_MS = float(os.environ.get("AI_BATCH_LATENCY_MS", 10))
+CHUNK_CHARS = int(os.environ.get("AI_CHUNK_CHARS", 4000))
+CHUNK_OVERLAP = int(os.environ.get("AI_CHUNK_OVERLAP", 200))
+AI_CACHE_DB_PATH = os.environ.get("AI_CACHE_DB_PATH", os.path.join(os.path.dirname(OUTPUT_DIR), "ai_cache.sqlite3"))
+# Bound on the host parameters of one ``IN (...)`` query.
+_IN_BATCH = 500
+
+PLACEHOLDER_ANALYSIS = "This is a placeholder analysis."
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    model TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model, content_hash)
+) WITHOUT ROWID;
+"""
+
+
+def placeholder_model(chunks: List[str]) -> List[Any]:
+    # Placeholder for actual model inference
+    return [PLACEHOLDER_ANALYSIS for _ in chunks]
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Whitespace-normalized ``text`` in chunks of at most ``max_chars``.
+
+    Chunks end at a word boundary when there is one in their second half and
+    repeat the last ``overlap`` characters (rounded to a word) of the
+    previous chunk. Empty text has no chunks.
+    """
+    if max_chars <= 0 or not 0 <= overlap < max_chars:
+        raise ValueError("need max_chars > 0 and 0 <= overlap < max_chars")
+    text = " ".join((text or "").split())
+    chunks, start = [], 0
+    while start < len(text):
+        end = start + max_chars
+        if end >= len(text):
+            chunks.append(text[start:])
+            break
+        cut = text.rfind(" ", start + max_chars // 2, end + 1)
+        end = cut if cut > 0 else end
+        chunks.append(text[start:end])
+        nxt = text.find(" ", max(end - overlap, start + 1), end)
+        start = nxt + 1 if overlap and nxt >= 0 else end + (text[end:end + 1] == " ")
+    return chunks
+
+
+_models: Dict[str, Tuple[Any, threading.Lock]] = {}
+_models_lock = threading.Lock()
+
+
+def shared_model(key: str, loader: Callable[[], Any]) -> Tuple[Any, threading.Lock]:
+    """The process-wide model for ``key`` (loaded once) and the lock serializing its calls."""
+    entry = _models.get(key)
+    if entry is None:
+        with _models_lock:
+            entry = _models.get(key)
+            if entry is None:
+                start = time.monotonic()
+                entry = _models[key] = (loader(), threading.Lock())
+                logging.info(f"Loaded model {key or 'placeholder'} in {time.monotonic() - start:.2f}s")
+    return entry
+
+
+def unload_model(key: str):
+    """Drop the shared model for ``key``; the next use loads it again."""
+    with _models_lock:
+        _models.pop(key, None)
+
+
+class AnalysisCache:
+    """
+    Analysis Cache
+    Model outputs keyed by model and content hash, kept in SQLite.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Args:
+            db_path (Optional[str]): SQLite file holding the cache; in-memory
+                when omitted.
+        """
+        self.db_path = db_path or ":memory:"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.db_path != ":memory:" and os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            if self.db_path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, Dict]:
+        """Cached results of ``model`` for those of ``hashes`` it has seen."""
+        hashes, found = list(hashes), {}
+        with self._lock:
+            conn = self._open()
+            for i in range(0, len(hashes), _IN_BATCH):
+                batch = hashes[i:i + _IN_BATCH]
+                rows = conn.execute(
+                    f"SELECT content_hash, result FROM analyses WHERE model = ? "
+                    f"AND content_hash IN ({','.join('?' * len(batch))})", [model, *batch])
+                found.update((h, json.loads(result)) for h, result in rows)
+        return found
+
+    def put_many(self, model: str, results: Dict[str, Dict]):
+        now = time.time()
+        rows = [(model, h, json.dumps(result), now) for h, result in results.items()]
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _MicroBatcher:
+    """Runs queued documents through ``run`` in batches of up to ``max_size``,
+    waiting at most ``max_latency`` seconds for a batch to fill."""
+
+    def __init__(self, run: Callable[[List[str]], List[Dict]], max_size: int, max_latency: float):
+        self.run = run
+        self.max_size = max(1, max_size)
+        self.max_latency = max(0.0, max_latency)
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, document: str) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="ai-doc-batcher", daemon=True)
+                self._thread.start()
+            self._queue.put((document, future))
+        return future
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            batch = [(doc, f) for doc, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.run([doc for doc, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
 
 
 class AIDocAgent:
@@ -9,18 +242,125 @@ class AIDocAgent:
     using AI models.
     """
 
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: Optional[str] = None, loader: Optional[Callable[[], Any]] = None,
+                 cache: Optional[AnalysisCache] = None, batch_size: int = BATCH_SIZE,
+                 batch_latency_ms: float = BATCH_LATENCY_MS, chunk_chars: int = CHUNK_CHARS,
+                 chunk_overlap: int = CHUNK_OVERLAP):
+        """
+        Args:
+            model_path (Optional[str]): Model file; the placeholder model
+                when omitted. Nothing is loaded until a document needs it.
+            loader (Optional[Callable[[], Any]]): Builds the model instead of
+                ``load_model`` (e.g. a small CPU model or a stub in tests).
+            cache (Optional[AnalysisCache]): Result cache; in-memory when
+                omitted.
+            batch_size (int): Max chunks per model call and max documents
+                per micro-batch.
+            batch_latency_ms (float): How long a queued document waits for
+                others to share its batch.
+            chunk_chars (int): Max characters per chunk.
+            chunk_overlap (int): Characters repeated between chunks.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        chunk_text("", chunk_chars, chunk_overlap)
         self.model_path = model_path
-        self.model = self.load_model()
+        self._load = loader or self.load_model
+        self.cache = cache or AnalysisCache()
+        self.batch_size = batch_size
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        self.stats = {"documents": 0, "cache_hits": 0, "analyzed": 0, "chunks": 0, "model_calls": 0}
+        self._model_id: Optional[str] = None
+        self._batcher = _MicroBatcher(self.process_documents, batch_size, batch_latency_ms / 1000)
 
     def load_model(self) -> Any:
         """Load the AI model from the specified path."""
+        if self.model_path is None:
+            return placeholder_model
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(
                 f"Model file not found at {self.model_path}"
             )
         # Placeholder for actual model loading logic
-        return f"Loaded model from {self.model_path}"
+        return placeholder_model
+
+    @property
+    def model(self) -> Any:
+        return shared_model(self.model_path or "", self._load)[0]
+
+    @property
+    def model_id(self) -> str:
+        """Cache key of the model: its path and, for a file, its mtime and size."""
+        if self._model_id is None:
+            model_id = self.model_path or "placeholder"
+            if self.model_path and os.path.exists(self.model_path):
+                st = os.stat(self.model_path)
+                model_id = f"{model_id}@{st.st_mtime_ns}:{st.st_size}"
+            self._model_id = model_id
+        return self._model_id
+
+    def _infer(self, chunks: List[str]) -> List[Any]:
+        model, lock = shared_model(self.model_path or "", self._load)
+        outputs = []
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            with lock:
+                out = list(model(batch))
+            if len(out) != len(batch):
+                raise ValueError(f"model returned {len(out)} outputs for {len(batch)} chunks")
+            outputs.extend(out)
+            self.stats["model_calls"] += 1
+        return outputs
+
+    def process_documents(self, documents: List[str]) -> List[Dict[str, Any]]:
+        """
+        Analyze ``documents`` together, skipping those analyzed before.
+
+        Args:
+            documents (List[str]): Document contents (``None`` counts as empty).
+
+        Returns:
+            List[Dict[str, Any]]: One result per document, in order:
+            ``document_length``, ``content_hash``, ``chunks`` and
+            ``analysis`` (the model output of every chunk) plus ``cached``.
+        """
+        documents = [document or "" for document in documents]
+        hashes = [content_hash(document) for document in documents]
+        found = self.cache.get_many(self.model_id, set(hashes))
+        missing = {h: document for h, document in zip(hashes, documents) if h not in found}
+
+        chunks, owners = [], []
+        for h, document in missing.items():
+            parts = chunk_text(document, self.chunk_chars, self.chunk_overlap)
+            chunks.extend(parts)
+            owners.extend([h] * len(parts))
+        fresh = {h: {"chunks": 0, "analysis": []} for h in missing}
+        for h, output in zip(owners, self._infer(chunks) if chunks else []):
+            fresh[h]["chunks"] += 1
+            fresh[h]["analysis"].append(output)
+        if fresh:
+            self.cache.put_many(self.model_id, fresh)
+
+        self.stats["documents"] += len(documents)
+        self.stats["cache_hits"] += sum(h in found for h in hashes)
+        self.stats["analyzed"] += len(fresh)
+        self.stats["chunks"] += len(chunks)
+        return [{"document_length": len(document), "content_hash": h, **(found.get(h) or fresh[h]),
+                 "cached": h in found} for document, h in zip(documents, hashes)]
+
+    def submit(self, document: str) -> Future:
+        """Queue ``document`` on the micro-batcher; its result arrives on the future."""
+        h = content_hash(document or "")
+        cached = self.cache.get_many(self.model_id, [h])
+        if cached:
+            future: Future = Future()
+            self.stats["documents"] += 1
+            self.stats["cache_hits"] += 1
+            future.set_result({"document_length": len(document or ""), "content_hash": h, **cached[h],
+                               "cached": True})
+            return future
+        return self._batcher.submit(document)
 
     def process_document(self, document: str) -> Dict[str, Any]:
         """
@@ -32,17 +372,56 @@ class AIDocAgent:
         Returns:
             Dict[str, Any]: Analysis results.
         """
-        # Placeholder for actual document processing logic
-        return {
-            "document_length": len(document),
-            "analysis": "This is a placeholder analysis."
-        }
+        return self.submit(document).result()
+
+    def close(self):
+        """Stop the micro-batcher and close the cache; the shared model stays loaded."""
+        self._batcher.close()
+        self.cache.close()
+
+
+_default_agent = None
+_default_agent_lock = threading.Lock()
+
+
+def default_agent() -> AIDocAgent:
+    """The process-wide agent (``AI_MODEL_PATH``, cache at ``AI_CACHE_DB_PATH``)."""
+    global _default_agent
+    with _default_agent_lock:
+        if _default_agent is None:
+            _default_agent = AIDocAgent(AI_MODEL_PATH, cache=AnalysisCache(AI_CACHE_DB_PATH))
+        return _default_agent
+
+
+def process_document(document: str) -> Dict[str, Any]:
+    """Analyze a document with the process-wide agent."""
+    return default_agent().process_document(document)
+
+
+def process_documents(documents: List[str]) -> List[Dict[str, Any]]:
+    """Analyze documents together with the process-wide agent."""
+    return default_agent().process_documents(documents)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Analyze text files with the document agent.")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--model", default=AI_MODEL_PATH)
+    p.add_argument("--cache", default=AI_CACHE_DB_PATH, help="SQLite result cache")
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    documents = []
+    for path in args.files:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            documents.append(f.read())
+    agent = AIDocAgent(args.model, cache=AnalysisCache(args.cache), batch_size=args.batch_size)
+    try:
+        results = agent.process_documents(documents)
+    finally:
+        agent.close()
+    print(json.dumps({"results": dict(zip(args.files, results)), "stats": agent.stats}, indent=2))
 
 
 if __name__ == "__main__":
-    # This block is commented out as it requires a valid model path
-    # and logging setup
-    # agent = AIDocAgent(model_path="/path/to/model")
-    # result = agent.process_document("Sample document content.")
-    # print(f"Processing result: {result}")
-    pass
+    main()
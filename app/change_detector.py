@@ -1,26 +1,129 @@
 import logging
 
-from typing import List
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.config import OUTPUT_DIR
+from app.fingerprint import content_hash, hamming_distance, simhash
+from crawler.snapshot_store import url_key
+
+CHANGE_DB_PATH = os.environ.get("CHANGE_DB_PATH", os.path.join(os.path.dirname(OUTPUT_DIR), "changes.sqlite3"))
+# SimHash distance (bits) up to which a modified page counts as a
+# near-duplicate of its last real change. Off (-1) by default: a one-number
+# edit of a long page is often within 3 bits, so every edit is a change
+# unless this is opted into.
+SIMHASH_THRESHOLD = int(os.environ.get("CHANGE_SIMHASH_THRESHOLD", -1))
+
+NEW, CHANGED, NEAR_DUPLICATE, UNCHANGED, NOT_MODIFIED = "new", "changed", "near_duplicate", "unchanged", "not_modified"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    url_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    baseline_hash TEXT,
+    simhash TEXT,
+    content_length INTEGER NOT NULL DEFAULT 0,
+    links TEXT,
+    first_seen REAL NOT NULL,
+    checked_at REAL NOT NULL,
+    changed_at REAL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    not_modified INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS document_states (
+    document TEXT PRIMARY KEY,
+    state TEXT
+);
+"""
+
+
+@dataclass
+class DocumentState:
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    simhash: Optional[int] = None
+    content_length: int = 0
+    links: Optional[List[str]] = None
+    checked_at: Optional[float] = None
+    changed_at: Optional[float] = None
+    checks: int = 0
+    changes: int = 0
+    not_modified: int = 0
+
+
+@dataclass
+class ChangeResult:
+    url: str
+    status: str
+    distance: Optional[int] = None
+    fingerprint: Optional[int] = None
+    previous: Optional[DocumentState] = field(default=None, repr=False)
+
+    @property
+    def changed(self) -> bool:
+        """True when downstream processing should run for this fetch."""
+        return self.status in (NEW, CHANGED)
+
+    @property
+    def content_changed(self) -> bool:
+        """True when the text differs from the last fetch, near-duplicates included.
+
+        The stored content hash always moves to the new text, so callers
+        that keep snapshots must store one whenever this is true or the
+        edit is lost behind later 304 responses.
+        """
+        return self.status in (NEW, CHANGED, NEAR_DUPLICATE)
 
 
 class ChangeDetector:
     """
     Change Detector
-    This class detects changes in documents.
+    This class detects changes in documents and remembers, per URL, the HTTP
+    validators and content fingerprints of the last fetch.
     """
 
-    def __init__(self):
-        self.previous_states = {}
+    def __init__(self, db_path: Optional[str] = None, simhash_threshold: int = SIMHASH_THRESHOLD):
+        """
+        Args:
+            db_path (Optional[str]): SQLite file holding the state; in-memory
+                (lost on exit) when omitted.
+            simhash_threshold (int): Max SimHash distance treated as a
+                near-duplicate rather than a change; -1 (the default)
+                reports every edit as a change.
+        """
+        self.db_path = db_path or ":memory:"
+        self.simhash_threshold = simhash_threshold
+        if db_path and os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if db_path:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
 
     def detect_changes(self, documents: List[str]) -> List[str]:
         """
         Detect changes in the given documents.
 
         Args:
-            documents (List[str]): List of document paths to check for changes.
+            documents (List[str]): Document paths or crawled URLs to check.
 
         Returns:
-            List[str]: List of documents that have changed.
+            List[str]: Documents that changed since they were last checked.
         """
         changed_documents = []
         for doc in documents:
@@ -29,17 +132,166 @@ class ChangeDetector:
         return changed_documents
 
     def has_changed(self, document: str) -> bool:
-        """Check if a single document has changed."""
-        # Placeholder for actual change detection logic
+        """Check if a single document has changed since the previous call."""
         current_state = self.get_document_state(document)
-        previous_state = self.previous_states.get(document)
-        self.previous_states[document] = current_state
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM document_states WHERE document = ?", (document,)).fetchone()
+            self._conn.execute(
+                "INSERT INTO document_states (document, state) VALUES (?, ?) "
+                "ON CONFLICT(document) DO UPDATE SET state = excluded.state",
+                (document, current_state),
+            )
+        previous_state = row["state"] if row else None
         return current_state != previous_state
 
-    def get_document_state(self, document: str) -> str:
-        """Get the current state of a document."""
-        # Placeholder for actual state retrieval logic
-        return f"state_of_{document}"
+    def get_document_state(self, document: str) -> Optional[str]:
+        """Get the current state of a document.
+
+        Files are hashed; URLs use the fingerprint of their last real change
+        (near-duplicate edits keep the previous state). Unknown documents
+        have no state.
+        """
+        if os.path.isfile(document):
+            digest = hashlib.sha256()
+            with open(document, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            return digest.hexdigest()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT baseline_hash FROM documents WHERE url_key = ?", (url_key(document),)
+            ).fetchone()
+        return row["baseline_hash"] if row else None
+
+    def state(self, url: str) -> Optional[DocumentState]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE url_key = ?", (url_key(url),)).fetchone()
+        if row is None:
+            return None
+        return DocumentState(
+            url=row["url"],
+            etag=row["etag"],
+            last_modified=row["last_modified"],
+            content_hash=row["content_hash"],
+            simhash=int(row["simhash"], 16) if row["simhash"] else None,
+            content_length=row["content_length"],
+            links=json.loads(row["links"]) if row["links"] else None,
+            checked_at=row["checked_at"],
+            changed_at=row["changed_at"],
+            checks=row["checks"],
+            changes=row["changes"],
+            not_modified=row["not_modified"],
+        )
+
+    def validators(self, url: str, require_links: bool = False) -> Dict[str, str]:
+        """Conditional request headers for ``url`` (empty when never fetched).
+
+        With ``require_links`` nothing is returned unless the last fetch
+        stored its outlinks, since a 304 could not supply them otherwise.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, links FROM documents WHERE url_key = ?", (url_key(url),)
+            ).fetchone()
+        headers = {}
+        if row and require_links and row["links"] is None:
+            return headers
+        if row and row["etag"]:
+            headers["If-None-Match"] = row["etag"]
+        if row and row["last_modified"]:
+            headers["If-Modified-Since"] = row["last_modified"]
+        return headers
+
+    def not_modified(self, url: str) -> Optional[DocumentState]:
+        """Record a 304 for ``url`` and return its stored state."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET checked_at = ?, checks = checks + 1, not_modified = not_modified + 1 "
+                "WHERE url_key = ?",
+                (time.time(), url_key(url)),
+            )
+        return self.state(url)
+
+    def observe(self, url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                links: Optional[List[str]] = None) -> ChangeResult:
+        """Record a full fetch of ``url`` and classify it against the last one.
+
+        Args:
+            url (str): Fetched URL.
+            text (str): Extracted text the fingerprints are computed from.
+            etag (Optional[str]): ``ETag`` response header.
+            last_modified (Optional[str]): ``Last-Modified`` response header.
+            links (Optional[List[str]]): Outlinks to keep for 304 responses.
+
+        Returns:
+            ChangeResult: ``new``, ``changed``, ``near_duplicate`` or ``unchanged``.
+        """
+        now = time.time()
+        chash = content_hash(text)
+        previous = self.state(url)
+        fingerprint = None
+        if previous is None:
+            fingerprint = simhash(text)
+            result = ChangeResult(url, NEW, fingerprint=fingerprint)
+        elif previous.content_hash == chash:
+            result = ChangeResult(url, UNCHANGED, distance=0, previous=previous)
+        else:
+            fingerprint = simhash(text)
+            distance = hamming_distance(fingerprint, previous.simhash) if previous.simhash is not None else None
+            near = distance is not None and distance <= self.simhash_threshold
+            result = ChangeResult(url, NEAR_DUPLICATE if near else CHANGED, distance=distance,
+                                  fingerprint=fingerprint, previous=previous)
+
+        changed = result.changed
+        # The SimHash baseline only moves on real changes, so a run of small
+        # edits cannot drift arbitrarily far without being reported.
+        fingerprint = format(fingerprint, "016x") if changed else None
+        links_json = json.dumps(links) if links is not None else None
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO documents (url_key, url, etag, last_modified, content_hash, baseline_hash, simhash,
+                                       content_length, links, first_seen, checked_at, changed_at, checks, changes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 1)
+                ON CONFLICT(url_key) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash,
+                    baseline_hash = CASE WHEN ? THEN excluded.baseline_hash ELSE documents.baseline_hash END,
+                    simhash = CASE WHEN ? THEN excluded.simhash ELSE documents.simhash END,
+                    content_length = excluded.content_length,
+                    links = COALESCE(excluded.links, documents.links),
+                    checked_at = excluded.checked_at,
+                    changed_at = CASE WHEN ? THEN excluded.changed_at ELSE documents.changed_at END,
+                    checks = documents.checks + 1,
+                    changes = documents.changes + ?
+                """,
+                (url_key(url), url, etag, last_modified, chash, chash, fingerprint, len(text or ""), links_json,
+                 now, now, now, changed, changed, changed, 1 if changed else 0),
+            )
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_detector: Optional[ChangeDetector] = None
+_default_lock = threading.Lock()
+
+
+def get_detector() -> ChangeDetector:
+    """The process-wide detector persisted at ``CHANGE_DB_PATH``."""
+    global _default_detector
+    with _default_lock:
+        if _default_detector is None:
+            _default_detector = ChangeDetector(CHANGE_DB_PATH)
+        return _default_detector
+
+
+def detect_changes(documents: List[str]) -> List[str]:
+    """Detect changes using the process-wide default detector."""
+    return get_detector().detect_changes(documents)
 
 
 if __name__ == "__main__":
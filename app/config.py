@@ -8,6 +8,9 @@ OUTPUT_DIR = os.path.abspath(
 )
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# HTML extraction backend: stream, bs4, lxml or selectolax (see app.extractors)
+EXTRACTOR_BACKEND = os.environ.get("EXTRACTOR_BACKEND", "stream")
+
 
 CONFIGS = {
     "real_estate": {
@@ -1,42 +1,197 @@
-from app.scraper import scrape_url
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.scraper import scrape_url_async
+from app.executor import RequestExecutor, executor as default_executor
 from app.config import get_config
+from app.links import in_scope
 from app.sync_orchestrator import orchestrate_sync
-from app.change_detector import detect_changes
-from app.ai_doc_agent import process_document
+from app.change_detector import NOT_MODIFIED, detect_changes
+from app.ai_doc_agent import process_documents
 from app.governance import enforce_policies
+from crawler.snapshot_store import snapshot_store
+from crawler.url_policy import UrlPolicy
 
+MAX_PAGES = 50
+FETCH_CONCURRENCY = 8
 
-def run_crawl(payload: dict):
+
+async def crawl_bfs(seed: str, config: dict, depth: int = 1, max_pages: int = MAX_PAGES,
+                    scope: str = "host", concurrency: int = FETCH_CONCURRENCY,
+                    executor: Optional[RequestExecutor] = None,
+                    on_page: Optional[Callable[[Dict], None]] = None,
+                    policy: Optional[UrlPolicy] = None) -> Dict:
+    """Breadth-first crawl from ``seed`` up to ``depth`` levels.
+
+    Level 1 is the seed itself. Every page of a level is fetched in parallel
+    (bounded by ``concurrency``); links found on it that are in ``scope`` and
+    not seen before form the next level. Pages are parsed in ``executor``'s
+    process pool. ``on_page`` is called with every page (or error entry) as
+    soon as it finishes, before the rest of its level. Pages answered with
+    a 304 (or whose text did not really change) are counted in
+    ``stats["not_modified"]`` (``stats["unchanged"]``), near-copies of
+    another page in ``stats["duplicates"]``.
+
+    Links are canonicalized, and duplicates and crawler traps skipped by
+    ``policy`` (``crawler.url_policy``; built from ``config["url_policy"]``
+    by default). A page whose ``rel=canonical`` names another URL of its
+    host queues that URL ahead of its links. The policy's report is
+    returned as ``stats["url_policy"]``.
+    """
+    policy = policy or UrlPolicy.from_dict(config.get("url_policy"))
+    sem = asyncio.Semaphore(concurrency)
+    level = [policy.admit(seed).url]
+    admitted = 1
+    pages: List[Dict] = []
+    stats = {"pages": 0, "errors": 0, "bytes": 0, "not_modified": 0, "unchanged": 0,
+             "duplicates": 0}
+    start = time.monotonic()
+
+    async def _fetch(url: str, level_no: int) -> Dict:
+        async with sem:
+            try:
+                # Links of pages on the last level are never followed.
+                result = await scrape_url_async(url, config, level_no < depth, executor=executor)
+            except Exception as e:
+                page = {"url": url, "depth": level_no, "error": str(e)}
+            else:
+                page = {**result, "depth": level_no}
+        if on_page is not None:
+            on_page(page)
+        return page
+
+    for level_no in range(1, depth + 1):
+        if not level:
+            break
+        results = await asyncio.gather(*(_fetch(u, level_no) for u in level))
+        next_level = []
+        # Aliases declared anywhere on this level are known, and their
+        # canonicals queued, before any of its links.
+        for page in results:
+            if "error" in page:
+                continue
+            canonical = policy.observe_canonical(page["url"], page.get("canonical"))
+            if canonical is None or level_no == depth or admitted >= max_pages:
+                continue
+            if in_scope(canonical, seed, scope) and policy.admit(canonical).admitted:
+                admitted += 1
+                next_level.append(canonical)
+        for page in results:
+            pages.append(page)
+            if "error" in page:
+                stats["errors"] += 1
+                continue
+            stats["pages"] += 1
+            stats["bytes"] += page.get("bytes", 0)
+            if page.get("change_status") == NOT_MODIFIED:
+                stats["not_modified"] += 1
+            elif page.get("changed") is False:
+                stats["unchanged"] += 1
+            if page.get("duplicate_of"):
+                stats["duplicates"] += 1
+            if level_no == depth:
+                continue
+            for link in page.get("links", []):
+                if admitted >= max_pages:
+                    break
+                if not in_scope(link, seed, scope):
+                    continue
+                decision = policy.admit(link)
+                if decision.admitted:
+                    admitted += 1
+                    next_level.append(decision.url)
+        level = next_level
+
+    elapsed = time.monotonic() - start
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["pages_per_second"] = round(stats["pages"] / elapsed, 2) if elapsed else 0.0
+    stats["url_policy"] = policy.report()
+    return {"pages": pages, "stats": stats}
+
+
+def _latest_text(url: str) -> Optional[str]:
+    snapshot = snapshot_store.get(url)
+    if snapshot and snapshot.text is None and snapshot.metadata.get("duplicate_of"):
+        snapshot = snapshot_store.get(snapshot.metadata["duplicate_of"])
+    return snapshot.text if snapshot else None
+
+
+def _post_process(page: Dict):
+    changed = detect_changes([page["url"]])
+    enforce_policies(page["url"])
+    orchestrate_sync(changed)
+
+
+async def run_crawl_async(payload: dict, executor: Optional[RequestExecutor] = None,
+                          on_page: Optional[Callable[[Dict], None]] = None):
+    """Crawl ``payload["seed_url"]`` without blocking the event loop.
+
+    ``on_page`` is forwarded to ``crawl_bfs``. Downstream processing only
+    runs for pages that changed since the previous crawl and are not copies
+    of another page; their texts are analyzed in one ``process_documents``
+    batch.
+
+    Raises:
+        ExecutorBusy: If the executor has no crawl slot or queue space left.
+    """
+    executor = executor or default_executor
     seed = payload.get("seed_url")
     industry = payload.get("industry", "generic")
     try:
-        int(payload.get("depth", 1))
+        depth = max(1, int(payload.get("depth", 1)))
     except Exception:
-        pass
+        depth = 1
 
     if not seed:
         return {"error": "seed_url required"}
+    seed = str(seed)
 
-    try:
-        # Existing scraping logic
-        config = get_config(industry)
-        result = scrape_url(seed, config)
-
-        # New integration: Document processing and governance
-        processed_doc = process_document(result.get("content"))
-        changes = detect_changes(processed_doc)
-        enforce_policies(processed_doc, changes)
+    async with executor.admit():
+        try:
+            config = get_config(industry)
+            crawl = await crawl_bfs(
+                seed,
+                {**config, "url_policy": payload.get("url_policy") or config.get("url_policy")},
+                depth=depth,
+                max_pages=int(payload.get("max_pages") or MAX_PAGES),
+                scope=payload.get("scope") or "host",
+                executor=executor,
+                on_page=on_page,
+            )
+            root = crawl["pages"][0]
+            if "error" in root:
+                raise RuntimeError(root["error"])
 
-        orchestrate_sync(processed_doc)
-    except Exception as e:
-        return {"error": "crawl_failed", "reason": str(e)}
+            fresh = [page for page in crawl["pages"]
+                     if "error" not in page and page.get("changed", True) and not page.get("duplicate_of")]
+            if fresh:
+                await executor.io(process_documents, [page.get("content") for page in fresh])
+            for page in fresh:
+                await executor.io(_post_process, page)
+            content = root.get("content")
+            if content is None:
+                # 304: the text is the latest snapshot.
+                content = await executor.io(_latest_text, root["url"])
+        except Exception as e:
+            return {"error": "crawl_failed", "reason": str(e)}
 
     return {
         "seed_url": seed,
         "industry": industry,
-        "pages_crawled": 1,
-        "content": result.get("content"),
+        "depth": depth,
+        "pages_crawled": crawl["stats"]["pages"],
+        "content": content,
         "metadata": {
-            "content_length": result.get("content_length"),
-        }
+            "content_length": root.get("content_length"),
+        },
+        "pages": [
+            {k: v for k, v in page.items() if k != "links"}
+            for page in crawl["pages"]
+        ],
+        "stats": crawl["stats"],
     }
+
+
+def run_crawl(payload: dict):
+    return asyncio.run(run_crawl_async(payload))
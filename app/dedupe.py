@@ -0,0 +1,232 @@
+"""Near-duplicate index over crawled pages.
+
+Pages are fingerprinted with the 64-bit SimHash of their normalized text
+(``app.fingerprint``). Two fingerprints within ``max_distance`` bits of each
+other are near-duplicates. Splitting the fingerprint into
+``max_distance + 1`` bands guarantees (pigeonhole) that such a pair agrees
+exactly on at least one band, so a lookup only reads the few documents
+sharing a band value instead of scanning the index.
+
+Only canonical documents - the first copy of a text - are banded; later
+copies are stored as links to their canonical, so boilerplate served under
+thousands of URLs does not grow the buckets.
+
+The index lives in SQLite; ``cache_mb`` bounds the memory it may use
+regardless of the number of documents.
+
+Settings (env): DEDUPE_DB_PATH, DEDUPE_MAX_DISTANCE, DEDUPE_MIN_CHARS,
+DEDUPE_CACHE_MB.
+"""
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.config import OUTPUT_DIR
+from app.fingerprint import SIMHASH_BITS, content_hash, hamming_distance, simhash
+
+DEDUPE_DB_PATH = os.environ.get("DEDUPE_DB_PATH", os.path.join(os.path.dirname(OUTPUT_DIR), "dedupe.sqlite3"))
+DEDUPE_MAX_DISTANCE = int(os.environ.get("DEDUPE_MAX_DISTANCE", 3))
+# Short texts (error pages, "coming soon") are too generic to be linked.
+DEDUPE_MIN_CHARS = int(os.environ.get("DEDUPE_MIN_CHARS", 200))
+DEDUPE_CACHE_MB = int(os.environ.get("DEDUPE_CACHE_MB", 64))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    simhash INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    canonical_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS docs_content_hash ON docs (content_hash) WHERE canonical_id IS NULL;
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (band, value, doc_id)
+) WITHOUT ROWID;
+"""
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit.
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+@dataclass
+class DuplicateMatch:
+    url: str
+    canonical_url: str
+    distance: int
+
+    @property
+    def exact(self) -> bool:
+        return self.distance == 0
+
+
+class NearDuplicateIndex:
+    """
+    Near-Duplicate Index
+    SimHash band index that links copies of a page to its canonical URL.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_distance: int = DEDUPE_MAX_DISTANCE,
+                 min_chars: int = DEDUPE_MIN_CHARS, cache_mb: int = DEDUPE_CACHE_MB):
+        """
+        Args:
+            db_path (Optional[str]): SQLite file holding the index; in-memory
+                when omitted.
+            max_distance (int): Max SimHash distance (bits) of a near-duplicate.
+            min_chars (int): Texts shorter than this are never matched or indexed.
+            cache_mb (int): SQLite page cache size.
+        """
+        if not 0 <= max_distance < SIMHASH_BITS:
+            raise ValueError(f"max_distance must be in [0, {SIMHASH_BITS})")
+        self.db_path = db_path or ":memory:"
+        self.max_distance = max_distance
+        self.min_chars = min_chars
+        self.bands = max_distance + 1
+        self._band_bits = -(-SIMHASH_BITS // self.bands)
+        self._band_sql = " UNION ALL ".join(
+            ["SELECT d.id, d.url, d.simhash FROM bands b JOIN docs d ON d.id = b.doc_id "
+             "WHERE b.band = ? AND b.value = ?"] * self.bands
+        )
+        if db_path and os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        self.counters = {"added": 0, "duplicates": 0, "exact": 0, "candidates": 0, "skipped_short": 0}
+        with self._lock:
+            if db_path:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(f"PRAGMA cache_size=-{max(1, cache_mb) * 1024}")
+            self._conn.executescript(_SCHEMA)
+
+    def band_values(self, fingerprint: int) -> List[int]:
+        mask = (1 << self._band_bits) - 1
+        return [_signed((fingerprint >> (i * self._band_bits)) & mask) for i in range(self.bands)]
+
+    def query(self, text: str, fingerprint: Optional[int] = None, exclude_url: Optional[str] = None
+              ) -> Optional[DuplicateMatch]:
+        """Closest canonical document to ``text``, if any is within ``max_distance``."""
+        if len(text or "") < self.min_chars:
+            return None
+        with self._lock:
+            return self._match(content_hash(text), simhash(text) if fingerprint is None else fingerprint,
+                               exclude_url)[0]
+
+    def add(self, url: str, text: str, fingerprint: Optional[int] = None) -> Optional[DuplicateMatch]:
+        """Index ``url`` and report the canonical page it duplicates.
+
+        Args:
+            url (str): Page URL; a re-added URL replaces its previous entry
+                and keeps its copies.
+            text (str): Normalized page text.
+            fingerprint (Optional[int]): ``simhash(text)`` if already computed.
+
+        Returns:
+            Optional[DuplicateMatch]: The match when ``url`` is a copy (it is
+            then stored as a link, not banded), otherwise ``None``.
+        """
+        if len(text or "") < self.min_chars:
+            self.counters["skipped_short"] += 1
+            return None
+        return self.add_fingerprint(url, simhash(text) if fingerprint is None else fingerprint, content_hash(text))
+
+    def add_fingerprint(self, url: str, fingerprint: int, chash: str) -> Optional[DuplicateMatch]:
+        """``add`` for a precomputed SimHash and content hash."""
+        with self._lock:
+            match, canonical_id = self._match(chash, fingerprint, url)
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute("SELECT id FROM docs WHERE url = ?", (url,)).fetchone()
+                if row is None:
+                    doc_id = self._conn.execute(
+                        "INSERT INTO docs (url, simhash, content_hash, canonical_id) VALUES (?, ?, ?, ?)",
+                        (url, _signed(fingerprint), chash, canonical_id),
+                    ).lastrowid
+                else:
+                    # A re-crawled page keeps its id, so its copies stay linked
+                    # to it; if it became a copy itself they follow it.
+                    doc_id = row[0]
+                    self._conn.execute(
+                        "UPDATE docs SET simhash = ?, content_hash = ?, canonical_id = ? WHERE id = ?",
+                        (_signed(fingerprint), chash, canonical_id, doc_id),
+                    )
+                    self._conn.execute("DELETE FROM bands WHERE doc_id = ?", (doc_id,))
+                    if canonical_id is not None:
+                        self._conn.execute(
+                            "UPDATE docs SET canonical_id = ? WHERE canonical_id = ?", (canonical_id, doc_id)
+                        )
+                if match is None:
+                    self._conn.executemany(
+                        "INSERT INTO bands (band, value, doc_id) VALUES (?, ?, ?)",
+                        [(i, v, doc_id) for i, v in enumerate(self.band_values(fingerprint))],
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.counters["added"] += 1
+            if match is not None:
+                self.counters["duplicates"] += 1
+                self.counters["exact"] += match.exact
+            return match
+
+    def canonical(self, url: str) -> Optional[str]:
+        """Canonical URL recorded for ``url`` (itself when it is canonical)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(c.url, d.url) FROM docs d LEFT JOIN docs c ON c.id = d.canonical_id "
+                "WHERE d.url = ?",
+                (url,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _match(self, chash: str, fingerprint: int, exclude_url: Optional[str]):
+        """``(match, canonical doc id)`` of the closest canonical document."""
+        row = self._conn.execute(
+            "SELECT id, url FROM docs WHERE content_hash = ? AND canonical_id IS NULL AND url IS NOT ? LIMIT 1",
+            (chash, exclude_url),
+        ).fetchone()
+        if row:
+            return DuplicateMatch(url=exclude_url or "", canonical_url=row[1], distance=0), row[0]
+        params = [v for band in enumerate(self.band_values(fingerprint)) for v in band]
+        best, best_id = None, None
+        seen = set()
+        for doc_id, url, other in self._conn.execute(self._band_sql, params):
+            if doc_id in seen or url == exclude_url:
+                continue
+            seen.add(doc_id)
+            distance = hamming_distance(fingerprint, other & ((1 << 64) - 1))
+            if distance <= self.max_distance and (best is None or distance < best.distance):
+                best, best_id = DuplicateMatch(url=exclude_url or "", canonical_url=url, distance=distance), doc_id
+        self.counters["candidates"] += len(seen)
+        return best, best_id
+
+    def stats(self) -> Dict:
+        with self._lock:
+            docs, canonical = self._conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(canonical_id) FROM docs"
+            ).fetchone()
+        return {**self.counters, "documents": docs, "canonical": canonical, "bands": self.bands}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_index: Optional[NearDuplicateIndex] = None
+_default_lock = threading.Lock()
+
+
+def get_index() -> NearDuplicateIndex:
+    """The process-wide index persisted at ``DEDUPE_DB_PATH``."""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = NearDuplicateIndex(DEDUPE_DB_PATH)
+        return _default_index
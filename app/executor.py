@@ -0,0 +1,185 @@
+"""Request execution layer for the API.
+
+Network I/O stays on the event loop and small blocking I/O (snapshot files,
+post-processing) runs in threads, while CPU-bound work - HTML parsing and
+normalization - is shipped to a bounded process pool. A large page therefore
+never holds the GIL of the loop that also serves ``/health`` and every other
+``/run`` call.
+
+Two gates bound the work in flight:
+
+* at most ``parse_queue_depth`` parse jobs are submitted to the pool at once;
+  further callers wait for a slot, so memory for queued bodies stays bounded;
+* at most ``run_concurrency`` crawls execute at once and ``run_queue_depth``
+  more may wait for a slot. Beyond that ``admit`` raises ``ExecutorBusy``
+  (the API answers 503) instead of letting latency grow without bound.
+
+Settings (env): PARSE_WORKERS (0 parses in a thread instead of a process
+pool), PARSE_QUEUE_DEPTH, PARSE_START_METHOD, RUN_CONCURRENCY,
+RUN_QUEUE_DEPTH.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from crawler.metrics import metrics
+
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+PARSE_QUEUE_DEPTH = int(os.environ.get("PARSE_QUEUE_DEPTH", max(PARSE_WORKERS, 1) * 4))
+# Forking a process that already runs an event loop and client threads is
+# unsafe, so workers are spawned by default.
+PARSE_START_METHOD = os.environ.get("PARSE_START_METHOD", "spawn")
+RUN_CONCURRENCY = int(os.environ.get("RUN_CONCURRENCY", 16))
+RUN_QUEUE_DEPTH = int(os.environ.get("RUN_QUEUE_DEPTH", 64))
+
+
+class ExecutorBusy(Exception):
+    """Raised when a crawl cannot even be queued."""
+
+
+class RequestExecutor:
+    """
+    Request Executor
+    Owns the parse process pool and the admission gates for crawl requests.
+    """
+
+    def __init__(
+        self,
+        parse_workers: int = PARSE_WORKERS,
+        parse_queue_depth: int = PARSE_QUEUE_DEPTH,
+        run_concurrency: int = RUN_CONCURRENCY,
+        run_queue_depth: int = RUN_QUEUE_DEPTH,
+        start_method: str = PARSE_START_METHOD,
+    ):
+        self.parse_workers = max(0, parse_workers)
+        self.parse_queue_depth = max(1, parse_queue_depth)
+        self.run_concurrency = max(1, run_concurrency)
+        self.run_queue_depth = max(0, run_queue_depth)
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._parse_sem: Optional[asyncio.Semaphore] = None
+        self._run_sem: Optional[asyncio.Semaphore] = None
+        self._parsing = 0
+        self._running = 0
+        self._waiting = 0
+        self.counters = {"parsed": 0, "parse_errors": 0, "pool_restarts": 0, "runs": 0, "rejected": 0}
+        metrics.add_collector("executor", RequestExecutor.stats, owner=self)
+
+    def start(self):
+        """Start the worker processes (a no-op when already started or with 0 workers)."""
+        with self._lock:
+            if self._pool is None and self.parse_workers:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.parse_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _gates(self):
+        # Like the pooled fetch client, gates belong to the running loop and
+        # are recreated when a new loop (e.g. another asyncio.run) shows up.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._parse_sem = asyncio.Semaphore(self.parse_queue_depth)
+            self._run_sem = asyncio.Semaphore(self.run_concurrency)
+            self._parsing = self._running = self._waiting = 0
+        return self._parse_sem, self._run_sem
+
+    async def parse(self, fn: Callable, *args):
+        """Run the CPU-bound ``fn(*args)`` in the process pool.
+
+        ``fn`` and its arguments must be picklable (a module-level function).
+        A crashed worker breaks the pool; it is replaced for later calls and
+        the current call fails.
+        """
+        parse_sem, _ = self._gates()
+        async with parse_sem:
+            self._parsing += 1
+            try:
+                if not self.parse_workers:
+                    return await asyncio.to_thread(fn, *args)
+                self.start()
+                pool = self._pool
+                try:
+                    result = await asyncio.get_running_loop().run_in_executor(pool, functools.partial(fn, *args))
+                except BrokenProcessPool:
+                    self._restart(pool)
+                    raise RuntimeError("parse worker crashed")
+                except Exception:
+                    self.counters["parse_errors"] += 1
+                    raise
+                self.counters["parsed"] += 1
+                return result
+            finally:
+                self._parsing -= 1
+
+    async def io(self, fn: Callable, *args):
+        """Run blocking I/O ``fn(*args)`` in a thread."""
+        return await asyncio.to_thread(fn, *args)
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Hold one crawl slot for the duration of the block.
+
+        Raises:
+            ExecutorBusy: If all slots are taken and the wait queue is full.
+        """
+        _, run_sem = self._gates()
+        if run_sem.locked() and self._waiting >= self.run_queue_depth:
+            self.counters["rejected"] += 1
+            raise ExecutorBusy(
+                f"{self._running} crawls running and {self._waiting} queued; try again later"
+            )
+        self._waiting += 1
+        try:
+            await run_sem.acquire()
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        self.counters["runs"] += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            run_sem.release()
+
+    def _restart(self, broken: Optional[ProcessPoolExecutor]):
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = None
+        self.counters["pool_restarts"] += 1
+        logging.warning("Parse pool broke; starting a new one")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "parse_workers": self.parse_workers,
+            "parse_in_flight": self._parsing,
+            "parse_queue_depth": self.parse_queue_depth,
+            "runs_in_flight": self._running,
+            "runs_queued": self._waiting,
+            "run_concurrency": self.run_concurrency,
+            "run_queue_depth": self.run_queue_depth,
+        }
+
+
+executor = RequestExecutor()
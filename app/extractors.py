@@ -0,0 +1,294 @@
+"""Pluggable HTML text/link extraction backends.
+
+Every backend returns the same ``Extraction`` for a document: visible text
+(script, style and noscript dropped, text runs stripped and joined with single
+spaces, cut at ``max_chars``) and, optionally, the ``http(s)`` links of its
+``<a href>`` tags resolved against ``<base href>`` and the page URL, plus its
+``<link rel="canonical">`` URL. After
+``normalize_text`` the text is identical across backends.
+
+Backends:
+
+* ``stream`` - incremental ``TextBudgetParser``; stops reading the body once
+  the text budget is met (default, stdlib only).
+* ``bs4`` - BeautifulSoup with ``html.parser`` (the original implementation).
+* ``lxml`` - libxml2 via ``lxml.html``.
+* ``selectolax`` - lexbor via ``selectolax.lexbor``.
+
+``lxml`` and ``selectolax`` are optional; ``available_extractors()`` lists the
+backends that can be used in this environment.
+"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Type
+from urllib.parse import urljoin
+
+from app.config import EXTRACTOR_BACKEND
+from app.html_stream import MAX_LINKS, SKIP_TAGS, TextBudgetParser, resolve_canonical
+
+DEFAULT_MAX_CHARS = 20000
+
+
+@dataclass
+class Extraction:
+    text: str
+    links: List[str] = field(default_factory=list)
+    canonical: Optional[str] = None
+
+
+class _LinkCollector:
+    """Resolves, filters and de-duplicates hrefs the way ``TextBudgetParser`` does."""
+
+    def __init__(self, base_url: str, max_links: int = MAX_LINKS):
+        self.base_url = base_url
+        self.max_links = max_links
+        self.links: List[str] = []
+        self._seen = set()
+
+    def set_base(self, href: Optional[str]):
+        if href:
+            self.base_url = urljoin(self.base_url, href.strip())
+
+    def add(self, href: Optional[str]):
+        if href is None or len(self.links) >= self.max_links:
+            return
+        link = urljoin(self.base_url, href.strip())
+        if link.startswith(("http://", "https://")) and link not in self._seen:
+            self._seen.add(link)
+            self.links.append(link)
+
+
+def _join(strings, max_chars: int) -> str:
+    return " ".join(s for s in (s.strip() for s in strings) if s)[:max_chars]
+
+
+class Extractor(ABC):
+    """
+    Extractor
+    Base class for backends that parse a complete document.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def extract(self, html: str, base_url: str = "", max_chars: int = DEFAULT_MAX_CHARS,
+                collect_links: bool = False) -> Extraction:
+        ...
+
+    def session(self, base_url: str = "", max_chars: int = DEFAULT_MAX_CHARS,
+                collect_links: bool = False) -> "ExtractionSession":
+        """Return an object that is fed decoded chunks of one document."""
+        return ExtractionSession(self, base_url, max_chars, collect_links)
+
+
+class ExtractionSession:
+    """
+    Extraction Session
+    Buffers a document until ``close()`` and extracts it in one pass.
+    ``done`` never turns true, so the whole (capped) body is read.
+    """
+
+    done = False
+
+    def __init__(self, extractor: Extractor, base_url: str, max_chars: int, collect_links: bool):
+        self.extractor = extractor
+        self.base_url = base_url
+        self.max_chars = max_chars
+        self.collect_links = collect_links
+        self._chunks: List[str] = []
+
+    def feed(self, data: str):
+        if data:
+            self._chunks.append(data)
+
+    def close(self) -> Extraction:
+        html = "".join(self._chunks)
+        self._chunks = []
+        return self.extractor.extract(html, self.base_url, self.max_chars, self.collect_links)
+
+
+class _StreamSession:
+    def __init__(self, base_url: str, max_chars: int, collect_links: bool):
+        self._parser = TextBudgetParser(max_chars, base_url=base_url, collect_links=collect_links)
+
+    @property
+    def done(self) -> bool:
+        return self._parser.done
+
+    def feed(self, data: str):
+        self._parser.feed(data)
+
+    def close(self) -> Extraction:
+        self._parser.close()
+        return Extraction(self._parser.text, self._parser.links, self._parser.canonical)
+
+
+class StreamExtractor(Extractor):
+    """
+    Stream Extractor
+    Incremental ``html.parser`` backend that can stop mid-document.
+    """
+
+    name = "stream"
+
+    def extract(self, html, base_url="", max_chars=DEFAULT_MAX_CHARS, collect_links=False):
+        session = self.session(base_url, max_chars, collect_links)
+        session.feed(html)
+        return session.close()
+
+    def session(self, base_url="", max_chars=DEFAULT_MAX_CHARS, collect_links=False):
+        return _StreamSession(base_url, max_chars, collect_links)
+
+
+class BeautifulSoupExtractor(Extractor):
+    """
+    BeautifulSoup Extractor
+    Reference backend: ``html.parser`` tree, skipped tags decomposed.
+    """
+
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def extract(self, html, base_url="", max_chars=DEFAULT_MAX_CHARS, collect_links=False):
+        soup = self._soup(html, "html.parser")
+        for tag in soup(list(SKIP_TAGS)):
+            tag.decompose()
+        links, canonical = [], None
+        if collect_links:
+            collector = _LinkCollector(base_url)
+            base = soup.find("base", href=True)
+            if base is not None:
+                collector.set_base(base["href"])
+            for a in soup.find_all("a", href=True):
+                collector.add(a["href"])
+            links = collector.links
+            link = soup.find("link", rel=lambda rel: rel is not None and rel.lower() == "canonical", href=True)
+            if link is not None:
+                canonical = resolve_canonical(collector.base_url, link["href"])
+        return Extraction(soup.get_text(separator=" ", strip=True)[:max_chars], links, canonical)
+
+
+class LxmlExtractor(Extractor):
+    """
+    lxml Extractor
+    libxml2 HTML parser; skipped elements are removed before ``itertext``.
+    """
+
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml import etree
+        self._html = lxml.html
+        self._etree = etree
+        # Parsing UTF-8 bytes sidesteps lxml's refusal of str input that
+        # carries an XML encoding declaration.
+        self._parser = lxml.html.HTMLParser(encoding="utf-8")
+
+    def extract(self, html, base_url="", max_chars=DEFAULT_MAX_CHARS, collect_links=False):
+        if not html or not html.strip():
+            return Extraction("")
+        try:
+            root = self._html.document_fromstring(html.encode("utf-8", "replace"), parser=self._parser)
+        except self._etree.ParserError:
+            return Extraction("")
+        # Tails belong to the surrounding text, so they are kept.
+        self._etree.strip_elements(root, *SKIP_TAGS, with_tail=False)
+        links, canonical = [], None
+        if collect_links:
+            collector = _LinkCollector(base_url)
+            for base in root.iter("base"):
+                if base.get("href"):
+                    collector.set_base(base.get("href"))
+                    break
+            for a in root.iter("a"):
+                collector.add(a.get("href"))
+            links = collector.links
+            for link in root.iter("link"):
+                if "canonical" in (link.get("rel") or "").lower().split():
+                    canonical = resolve_canonical(collector.base_url, link.get("href"))
+                    break
+        return Extraction(_join(root.itertext(), max_chars), links, canonical)
+
+
+class SelectolaxExtractor(Extractor):
+    """
+    Selectolax Extractor
+    lexbor HTML5 parser exposed through ``selectolax.lexbor``.
+    """
+
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def extract(self, html, base_url="", max_chars=DEFAULT_MAX_CHARS, collect_links=False):
+        tree = self._parser(html or "")
+        if tree.root is None:
+            return Extraction("")
+        tree.strip_tags(list(SKIP_TAGS))
+        links, canonical = [], None
+        if collect_links:
+            collector = _LinkCollector(base_url)
+            base = tree.css_first("base[href]")
+            if base is not None:
+                collector.set_base(base.attributes.get("href"))
+            for a in tree.css("a[href]"):
+                collector.add(a.attributes.get("href"))
+            links = collector.links
+            for link in tree.css("link[rel][href]"):
+                if "canonical" in (link.attributes.get("rel") or "").lower().split():
+                    canonical = resolve_canonical(collector.base_url, link.attributes.get("href"))
+                    break
+        # ``Node.text(strip=True)`` keeps empty runs as extra separators, which
+        # moves the ``max_chars`` cut; join the text nodes like the others do.
+        strings = (n.text_content for n in tree.root.traverse(include_text=True) if n.tag == "-text")
+        return Extraction(_join(strings, max_chars), links, canonical)
+
+
+EXTRACTORS: Dict[str, Type[Extractor]] = {
+    cls.name: cls
+    for cls in (StreamExtractor, BeautifulSoupExtractor, LxmlExtractor, SelectolaxExtractor)
+}
+_instances: Dict[str, Extractor] = {}
+
+
+def get_extractor(name: Optional[str] = None) -> Extractor:
+    """Return the (shared) extractor for ``name``, defaulting to ``EXTRACTOR_BACKEND``.
+
+    Args:
+        name: Backend name, one of ``EXTRACTORS``.
+
+    Returns:
+        An ``Extractor`` instance.
+
+    Raises:
+        ValueError: If the backend is unknown or its library is not installed.
+    """
+    name = (name or EXTRACTOR_BACKEND).lower()
+    if name not in _instances:
+        if name not in EXTRACTORS:
+            raise ValueError(f"Unknown extractor backend {name!r}; choose from {sorted(EXTRACTORS)}")
+        try:
+            _instances[name] = EXTRACTORS[name]()
+        except ImportError as e:
+            raise ValueError(f"Extractor backend {name!r} is not available: {e}")
+    return _instances[name]
+
+
+def available_extractors() -> List[str]:
+    """Names of the backends whose libraries can be imported here."""
+    names = []
+    for name in EXTRACTORS:
+        try:
+            get_extractor(name)
+        except ValueError:
+            continue
+        names.append(name)
+    return names
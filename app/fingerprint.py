@@ -0,0 +1,66 @@
+"""Content fingerprints for change and near-duplicate detection.
+
+* ``content_hash`` - sha256 of the whitespace-normalized text; equal only for
+  identical content.
+* ``simhash`` - 64-bit Charikar SimHash over word shingles; pages that differ
+  by a timestamp, a counter or a rotated ad stay within a few bits of each
+  other (see ``hamming_distance``).
+"""
+import hashlib
+import re
+from typing import Iterator, List
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokens(text: str) -> List[str]:
+    """Lower-cased word tokens of ``text``."""
+    return _WORD.findall((text or "").lower())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Iterator[str]:
+    """Overlapping ``size``-word shingles (the whole text if it is shorter)."""
+    words = tokens(text)
+    if len(words) <= size:
+        if words:
+            yield " ".join(words)
+        return
+    for i in range(len(words) - size + 1):
+        yield " ".join(words[i:i + size])
+
+
+def _digest64(value: str) -> bytes:
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+
+
+def hash64(value: str) -> int:
+    """Stable 64-bit hash of ``value`` (independent of ``PYTHONHASHSEED``)."""
+    return int.from_bytes(_digest64(value), "big")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(" ".join((text or "").split()).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str, size: int = SHINGLE_SIZE) -> int:
+    """64-bit SimHash of ``text``'s shingles (0 for empty text)."""
+    packed = b"".join(_digest64(s) for s in shingles(text, size))
+    count = len(packed) // 8
+    if not count:
+        return 0
+    # Bit i of every shingle hash sits at i, i+64, i+128, ... in one binary
+    # string, so each column is counted by a C-level slice instead of a
+    # Python loop over shingles.
+    bits = format(int.from_bytes(packed, "big"), f"0{count * SIMHASH_BITS}b")
+    value = 0
+    for i in range(SIMHASH_BITS):
+        if bits[i::SIMHASH_BITS].count("1") * 2 > count:
+            value |= 1 << (SIMHASH_BITS - 1 - i)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
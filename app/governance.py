@@ -1,4 +1,5 @@
 import logging
+import os
 
 # Moved from doc_evolution_system/guards/governance.py
 # Placeholder for governance logic
@@ -29,11 +30,24 @@ class Governance:
         Returns:
             bool: True if the document complies with policies, False otherwise.
         """
-        logging.info(f"Enforcing policies on document: {document}")
         # Placeholder for actual policy enforcement logic
-        logging.info(f"Enforcing policies on document: {document}")
+        logging.debug(f"Enforcing policies on document: {document}")
         return True
 
+
+_default_governance = None
+
+
+def enforce_policies(document: str) -> bool:
+    """Enforce policies using the process-wide default governance."""
+    global _default_governance
+    if _default_governance is None:
+        _default_governance = Governance(
+            policy_path=os.environ.get("GOVERNANCE_POLICY_PATH", "policies.json")
+        )
+    return _default_governance.enforce_policies(document)
+
+
 # Example usage
 if __name__ == "__main__":
     governance = Governance(policy_path="/path/to/policies.json")
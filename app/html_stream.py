@@ -0,0 +1,117 @@
+from html.parser import HTMLParser
+from typing import List, Optional
+from urllib.parse import urljoin
+
+SKIP_TAGS = {"script", "style", "noscript"}
+MAX_LINKS = 2000
+
+
+class TextBudgetParser(HTMLParser):
+    """
+    Incremental HTML text extractor.
+    Fed decoded chunks as they arrive, it keeps visible text (script, style
+    and noscript content is dropped) until ``max_chars`` characters are
+    collected, and optionally ``<a href>`` links (and the
+    ``<link rel="canonical">`` URL) resolved against ``base_url``. Text runs are joined with single spaces, matching
+    ``BeautifulSoup.get_text(separator=" ", strip=True)``.
+    """
+
+    def __init__(self, max_chars: int, base_url: str = "", collect_links: bool = False,
+                 max_links: int = MAX_LINKS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.base_url = base_url
+        self.collect_links = collect_links
+        self.max_links = max_links
+        self.links: List[str] = []
+        self.canonical: Optional[str] = None
+        self._seen_links = set()
+        self._parts: List[str] = []
+        self._length = 0
+        self._pending: List[str] = []
+        self._skip_depth = 0
+
+    @property
+    def text_done(self) -> bool:
+        return self._length >= self.max_chars
+
+    @property
+    def done(self) -> bool:
+        """True once nothing more is wanted from the rest of the document."""
+        return self.text_done and (not self.collect_links or len(self.links) >= self.max_links)
+
+    @property
+    def text(self) -> str:
+        self._flush()
+        return " ".join(self._parts)[:self.max_chars]
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = "".join(self._pending).strip()
+        self._pending = []
+        if data and not self.text_done:
+            self._parts.append(data)
+            self._length += len(data) + (1 if len(self._parts) > 1 else 0)
+
+    def handle_starttag(self, tag: str, attrs):
+        self._flush()
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "base" and not self.links:
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href.strip())
+        elif tag == "a" and self.collect_links and len(self.links) < self.max_links:
+            self._add_link(dict(attrs).get("href"))
+        elif tag == "link" and self.collect_links:
+            self._set_canonical(attrs)
+
+    def handle_startendtag(self, tag: str, attrs):
+        # Void forms like <script/> never open a skipped section.
+        self._flush()
+        if tag == "base" and not self.links:
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href.strip())
+        elif tag == "a" and self.collect_links and len(self.links) < self.max_links:
+            self._add_link(dict(attrs).get("href"))
+        elif tag == "link" and self.collect_links:
+            self._set_canonical(attrs)
+
+    def handle_endtag(self, tag: str):
+        self._flush()
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_comment(self, data: str):
+        self._flush()
+
+    def handle_data(self, data: str):
+        if not self._skip_depth and not self.text_done:
+            self._pending.append(data)
+
+    def _add_link(self, href: Optional[str]):
+        if href is None:
+            return
+        link = urljoin(self.base_url, href.strip())
+        if link.startswith(("http://", "https://")) and link not in self._seen_links:
+            self._seen_links.add(link)
+            self.links.append(link)
+
+    def _set_canonical(self, attrs):
+        attrs = dict(attrs)
+        if self.canonical is None and "canonical" in (attrs.get("rel") or "").lower().split():
+            self.canonical = resolve_canonical(self.base_url, attrs.get("href"))
+
+
+def resolve_canonical(base_url: str, href: Optional[str]) -> Optional[str]:
+    """Absolute ``http(s)`` URL of a ``<link rel="canonical">`` href, or None."""
+    if not href:
+        return None
+    link = urljoin(base_url, href.strip())
+    return link if link.startswith(("http://", "https://")) else None
@@ -0,0 +1,707 @@
+"""Asynchronous crawl jobs.
+
+``POST /jobs`` stores a job and returns at once. A fixed number of worker
+tasks claim queued jobs and run them through the existing crawl paths:
+
+* ``crawl`` jobs reuse ``run_crawl_async`` (static BFS crawl from a seed),
+* ``render`` jobs reuse ``crawler.engine.crawl_urls`` (Playwright).
+
+Every finished page is appended to the job as it completes, so clients can
+poll ``GET /jobs/{id}`` for progress or follow ``GET /jobs/{id}/stream``.
+
+Jobs live in a ``JobStore``: ``MemoryJobStore`` (default, lost on restart;
+finished jobs and their pages are dropped ``JOB_RETENTION_SECONDS`` after they
+finish, or sooner once more than ``JOB_MAX_FINISHED`` are kept) or
+``SqliteJobStore`` (``JOB_STORE=sqlite``), which survives restarts and can be
+shared by several API processes on one host. Claiming is atomic, so a job runs
+once no matter how many processes poll the same database.
+
+A claim is a lease held by one manager (``owner``) for ``JOB_LEASE_SECONDS``.
+Every manager renews the leases of the jobs it runs a few times per lease
+and regularly queues again the jobs whose lease expired, i.e. whose process
+died. A manager that finds one of its leases taken over stops that job.
+Store calls run in worker threads so a busy database never blocks the
+event loop.
+
+Settings (env): JOB_STORE, JOB_DB_PATH, JOB_WORKERS, JOB_QUEUE_MAX,
+JOB_POLL_INTERVAL, JOB_LEASE_SECONDS, JOB_RETENTION_SECONDS, JOB_MAX_FINISHED.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set
+
+from app.config import OUTPUT_DIR
+from app.executor import ExecutorBusy
+from crawler.metrics import metrics
+
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(os.path.dirname(OUTPUT_DIR), "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", 1000))
+# How often idle workers and open streams look at the store for changes
+# made by other processes.
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+# A claimed job whose lease was not renewed for this long is considered
+# orphaned by a dead process and is queued again.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+# How long, and how many, finished jobs the memory store keeps for clients.
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", 3600))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", 1000))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+class JobQueueFull(Exception):
+    """Raised by ``submit`` when ``max_queued`` jobs are already waiting."""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Dict
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pages: int = 0
+    errors: int = 0
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    owner: Optional[str] = None
+    lease_until: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class JobStore(ABC):
+    """
+    Job Store
+    Persists jobs and their page results; implementations must make
+    ``claim`` atomic.
+
+    Methods taking an ``owner`` only act on a running job leased by that
+    owner (any job when ``owner`` is None) and report whether they did.
+    """
+
+    @abstractmethod
+    def add(self, job: Job):
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def claim(self, owner: Optional[str] = None, lease: float = JOB_LEASE_SECONDS) -> Optional[Job]:
+        """Lease the oldest queued job to ``owner`` for ``lease`` seconds and return it."""
+
+    @abstractmethod
+    def finish(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None,
+               owner: Optional[str] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def add_pages(self, job_id: str, pages: List[Dict], owner: Optional[str] = None) -> bool:
+        """Append page results and bump the job's progress counters."""
+
+    def add_page(self, job_id: str, page: Dict, owner: Optional[str] = None) -> bool:
+        return self.add_pages(job_id, [page], owner)
+
+    @abstractmethod
+    def pages(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def count(self, status: str) -> int:
+        ...
+
+    @abstractmethod
+    def requeue(self, job_id: str, owner: Optional[str] = None) -> bool:
+        """Put a claimed job back in the queue, dropping its partial pages."""
+
+    @abstractmethod
+    def heartbeat(self, owner: str, job_ids: Iterable[str], lease: float = JOB_LEASE_SECONDS) -> List[str]:
+        """Renew ``owner``'s leases on ``job_ids``; returns the ids it still holds."""
+
+    @abstractmethod
+    def requeue_expired(self, now: Optional[float] = None) -> int:
+        """Queue again running jobs whose lease expired; returns how many."""
+
+    def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """
+    Memory Job Store
+    Process-local store; jobs are lost when the process exits. Finished jobs
+    are dropped with their pages ``retention`` seconds after they finish,
+    oldest first once more than ``max_finished`` are kept.
+    """
+
+    def __init__(self, retention: float = JOB_RETENTION_SECONDS, max_finished: int = JOB_MAX_FINISHED):
+        self.retention = retention
+        self.max_finished = max(0, max_finished)
+        self._jobs: Dict[str, Job] = {}
+        self._pages: Dict[str, List[Dict]] = {}
+        self._queue: Deque[str] = deque()
+        # Finished job ids in the order they finished, with their finish time.
+        self._finished: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        cutoff = now - self.retention
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at >= cutoff and len(self._finished) <= self.max_finished:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+            self._pages.pop(job_id, None)
+
+    def add(self, job: Job):
+        with self._lock:
+            self._evict(time.time())
+            self._jobs[job.id] = job
+            self._pages[job.id] = []
+            self._queue.append(job.id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return Job(**job.to_dict()) if job is not None else None
+
+    def _held(self, job_id: str, owner: Optional[str]) -> Optional[Job]:
+        job = self._jobs[job_id]
+        if owner is not None and (job.status != RUNNING or job.owner != owner):
+            return None
+        return job
+
+    def claim(self, owner=None, lease=JOB_LEASE_SECONDS):
+        with self._lock:
+            while self._queue:
+                job = self._jobs[self._queue.popleft()]
+                if job.status == QUEUED:
+                    job.status, job.owner = RUNNING, owner
+                    job.started_at = job.updated_at = time.time()
+                    job.lease_until = job.started_at + lease
+                    return Job(**job.to_dict())
+            return None
+
+    def finish(self, job_id, status, result=None, error=None, owner=None):
+        with self._lock:
+            job = self._held(job_id, owner)
+            if job is None:
+                return False
+            job.status, job.result, job.error = status, result, error
+            job.finished_at = job.updated_at = time.time()
+            job.owner = job.lease_until = None
+            self._finished[job_id] = job.finished_at
+            self._evict(job.finished_at)
+            return True
+
+    def add_pages(self, job_id, pages, owner=None):
+        with self._lock:
+            job = self._held(job_id, owner)
+            if job is None:
+                return False
+            self._pages[job_id].extend(pages)
+            job.pages += len(pages)
+            job.errors += sum(1 for page in pages if "error" in page)
+            job.updated_at = time.time()
+            return True
+
+    def pages(self, job_id, offset=0, limit=100):
+        with self._lock:
+            return list(self._pages.get(job_id, [])[offset:offset + limit])
+
+    def count(self, status):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def _requeue(self, job: Job):
+        job.status, job.started_at, job.pages, job.errors = QUEUED, None, 0, 0
+        job.owner = job.lease_until = None
+        self._pages[job.id] = []
+        self._queue.appendleft(job.id)
+
+    def requeue(self, job_id, owner=None):
+        with self._lock:
+            job = self._held(job_id, owner)
+            if job is None:
+                return False
+            self._requeue(job)
+            return True
+
+    def heartbeat(self, owner, job_ids, lease=JOB_LEASE_SECONDS):
+        held = []
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is not None and job.status == RUNNING and job.owner == owner:
+                    job.lease_until = time.time() + lease
+                    held.append(job_id)
+        return held
+
+    def requeue_expired(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.status == RUNNING and job.lease_until is not None and job.lease_until < now]
+            for job in expired:
+                self._requeue(job)
+        return len(expired)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL,
+    finished_at REAL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_pages (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    page TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class SqliteJobStore(JobStore):
+    """
+    SQLite Job Store
+    Durable store in one database file (WAL mode) shared by all processes.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            # Databases created before leases were introduced.
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def _write(self, fn: Callable[[], bool]) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = fn()
+                self._conn.execute("COMMIT" if done else "ROLLBACK")
+                return done
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _held(self, job_id: str, owner: Optional[str]) -> bool:
+        if owner is None:
+            return True
+        return self._conn.execute(
+            "SELECT 1 FROM jobs WHERE id = ? AND status = ? AND owner = ?", (job_id, RUNNING, owner),
+        ).fetchone() is not None
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Job:
+        data = dict(row)
+        data["payload"] = json.loads(data["payload"])
+        data["result"] = json.loads(data["result"]) if data["result"] else None
+        return Job(**data)
+
+    def add(self, job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, job.kind, json.dumps(job.payload), job.status, job.created_at),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def claim(self, owner=None, lease=JOB_LEASE_SECONDS):
+        now = time.time()
+        with self._lock:
+            # A single UPDATE ... RETURNING is atomic across processes.
+            row = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, updated_at = ?, owner = ?, lease_until = ? WHERE id = ("
+                " SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1"
+                ") AND status = ? RETURNING *",
+                (RUNNING, now, now, owner, now + lease, QUEUED, QUEUED),
+            ).fetchone()
+        return self._job(row) if row else None
+
+    def finish(self, job_id, status, result=None, error=None, owner=None):
+        now = time.time()
+
+        def write():
+            if not self._held(job_id, owner):
+                return False
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ?, "
+                "owner = NULL, lease_until = NULL WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, now, job_id),
+            )
+            return True
+        return self._write(write)
+
+    def add_pages(self, job_id, pages, owner=None):
+        def write():
+            if not self._held(job_id, owner):
+                return False
+            seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM job_pages WHERE job_id = ?", (job_id,),
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO job_pages (job_id, seq, page) VALUES (?, ?, ?)",
+                [(job_id, seq + i, json.dumps(page, ensure_ascii=False)) for i, page in enumerate(pages)],
+            )
+            self._conn.execute(
+                "UPDATE jobs SET pages = pages + ?, errors = errors + ?, updated_at = ? WHERE id = ?",
+                (len(pages), sum(1 for page in pages if "error" in page), time.time(), job_id),
+            )
+            return True
+        return self._write(write)
+
+    def pages(self, job_id, offset=0, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page FROM job_pages WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [json.loads(row["page"]) for row in rows]
+
+    def count(self, status):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def _requeue(self, job_ids: List[str]):
+        for job_id in job_ids:
+            # A restarted job streams its pages from the beginning.
+            self._conn.execute("DELETE FROM job_pages WHERE job_id = ?", (job_id,))
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, pages = 0, errors = 0, owner = NULL, "
+                "lease_until = NULL WHERE id = ?",
+                (QUEUED, job_id),
+            )
+
+    def requeue(self, job_id, owner=None):
+        def write():
+            if not self._held(job_id, owner):
+                return False
+            self._requeue([job_id])
+            return True
+        return self._write(write)
+
+    def heartbeat(self, owner, job_ids, lease=JOB_LEASE_SECONDS):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE status = ? AND owner = ? "
+                f"AND id IN ({','.join('?' * len(job_ids))}) RETURNING id",
+                (time.time() + lease, RUNNING, owner, *job_ids),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def requeue_expired(self, now=None):
+        now = time.time() if now is None else now
+        ids: List[str] = []
+
+        def write():
+            ids.extend(row["id"] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND COALESCE(lease_until, 0) < ?", (RUNNING, now),
+            ))
+            self._requeue(ids)
+            return True
+        self._write(write)
+        return len(ids)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_store(kind: str = JOB_STORE) -> JobStore:
+    if kind == "memory":
+        return MemoryJobStore()
+    if kind == "sqlite":
+        return SqliteJobStore()
+    raise ValueError(f"Unknown JOB_STORE {kind!r}; use 'memory' or 'sqlite'")
+
+
+async def run_job(job: Job, on_page: Callable[[Dict], None]) -> Dict:
+    """Default job runner: dispatch on ``job.kind`` to the crawl paths.
+
+    Returns the job's result summary; raises on failure.
+    """
+    if job.kind == "render":
+        from crawler.engine import crawl_urls
+
+        def _on_result(url, snap, error):
+            if error is not None:
+                on_page({"url": url, "error": str(error)})
+            elif snap is not None:
+                text = snap.get("text") or ""
+                on_page({"url": url, "content": text, "content_length": len(text)})
+
+        return await crawl_urls(job.payload["urls"], on_result=_on_result)
+
+    from app.crawler import run_crawl_async
+
+    def _on_page(page):
+        on_page({k: v for k, v in page.items() if k != "links"})
+
+    result = await run_crawl_async(job.payload, on_page=_on_page)
+    if "error" in result:
+        raise RuntimeError(result.get("reason") or result["error"])
+    return {k: v for k, v in result.items() if k not in ("pages", "content")}
+
+
+class JobManager:
+    """
+    Job Manager
+    Accepts jobs, runs them on ``workers`` asyncio tasks and streams progress.
+    """
+
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        workers: int = JOB_WORKERS,
+        max_queued: int = JOB_QUEUE_MAX,
+        runner: Callable[[Job, Callable[[Dict], None]], Awaitable[Dict]] = run_job,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+    ):
+        self.store = store or make_store()
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.runner = runner
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        # Job id -> the task running it.
+        self._claimed: Dict[str, asyncio.Task] = {}
+        self._lost: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        # Job id -> one event per open stream of that job.
+        self._progress: Dict[str, Set[asyncio.Event]] = {}
+        metrics.add_collector("jobs", JobManager._gauges, owner=self)
+
+    def _gauges(self) -> Dict:
+        return {"queued": self.store.count(QUEUED), "running": len(self._claimed)}
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        await self._requeue_expired()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running go back to the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._claimed):
+            try:
+                await asyncio.to_thread(self.store.requeue, job_id, self.owner)
+            except Exception as e:
+                # Its lease expires and another manager queues it again.
+                logging.warning(f"job {job_id} could not be re-queued: {e}")
+        self._claimed.clear()
+        self._lost.clear()
+
+    async def submit(self, kind: str, payload: Dict) -> Job:
+        """Queue a job and return it.
+
+        Raises:
+            JobQueueFull: If ``max_queued`` jobs are already waiting.
+        """
+        if await asyncio.to_thread(self.store.count, QUEUED) >= self.max_queued:
+            raise JobQueueFull(f"{self.max_queued} jobs already queued")
+        job = Job(id=uuid.uuid4().hex, kind=kind, payload=payload)
+        await asyncio.to_thread(self.store.add, job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def stream(self, job_id: str, offset: int = 0) -> AsyncIterator[Dict]:
+        """Yield ``page`` events from ``offset`` on, then one ``end`` event."""
+        event: Optional[asyncio.Event] = None
+        try:
+            while True:
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is None:
+                    return
+                for page in await asyncio.to_thread(self.store.pages, job_id, offset):
+                    yield {"event": "page", "seq": offset, "page": page}
+                    offset += 1
+                if job.status in FINISHED and offset >= job.pages:
+                    yield {"event": "end", "status": job.status, "pages": job.pages,
+                           "errors": job.errors, "result": job.result, "error": job.error}
+                    return
+                if offset < job.pages:
+                    continue
+                if event is None and job.status == RUNNING:
+                    event = asyncio.Event()
+                    self._progress.setdefault(job_id, set()).add(event)
+                if event is None:
+                    # Queued: nothing will be notified before a worker claims it.
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            if event is not None:
+                events = self._progress.get(job_id)
+                if events is not None:
+                    events.discard(event)
+                    if not events:
+                        del self._progress[job_id]
+
+    def _notify(self, job_id: str):
+        for event in self._progress.get(job_id, ()):
+            event.set()
+
+    async def _requeue_expired(self):
+        requeued = await asyncio.to_thread(self.store.requeue_expired)
+        if requeued:
+            logging.info(f"Re-queued {requeued} job(s) with an expired lease")
+            self._wakeup.set()
+
+    async def _maintain(self):
+        """Renew the leases of running jobs and recover jobs of dead processes."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                claimed = list(self._claimed)
+                held = set(await asyncio.to_thread(self.store.heartbeat, self.owner, claimed,
+                                                   self.lease_seconds))
+                for job_id in claimed:
+                    task = self._claimed.get(job_id)
+                    if job_id not in held and task is not None:
+                        logging.warning(f"job {job_id}: lease lost, stopping it")
+                        self._lost.add(job_id)
+                        task.cancel()
+                await self._requeue_expired()
+            except Exception as e:
+                logging.warning(f"job lease maintenance failed: {e}")
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.owner, self.lease_seconds)
+            except Exception as e:
+                logging.warning(f"claiming a job failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _write_pages(self, job_id: str, pages: asyncio.Queue):
+        """Store pages reported by the runner in order until ``None`` arrives."""
+        while True:
+            batch = [await pages.get()]
+            while not pages.empty():
+                batch.append(pages.get_nowait())
+            end = batch[-1] is None
+            batch = [page for page in batch if page is not None]
+            if batch:
+                await asyncio.to_thread(self.store.add_pages, job_id, batch, self.owner)
+                self._notify(job_id)
+            if end:
+                return
+
+    async def _run(self, job: Job):
+        pages: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(self._write_pages(job.id, pages))
+        run = asyncio.create_task(self.runner(job, pages.put_nowait))
+        self._claimed[job.id] = run
+        status, result, error = DONE, None, None
+        try:
+            result = await run
+        except ExecutorBusy:
+            # The API is saturated by /run traffic; try again later.
+            status = QUEUED
+        except asyncio.CancelledError:
+            if job.id not in self._lost:
+                # Shutdown: the job stays in ``_claimed`` so ``stop`` re-queues it.
+                writer.cancel()
+                raise
+            status = None
+        except Exception as e:
+            logging.warning(f"job {job.id} failed: {e}")
+            status, error = FAILED, str(e)
+        pages.put_nowait(None)
+        try:
+            await writer
+        except Exception as e:
+            if status == DONE:
+                status, result, error = FAILED, None, f"storing pages failed: {e}"
+        try:
+            if status == QUEUED:
+                await asyncio.to_thread(self.store.requeue, job.id, self.owner)
+            elif status is not None and not await asyncio.to_thread(
+                    self.store.finish, job.id, status, result, error, self.owner):
+                logging.warning(f"job {job.id}: lease lost before it finished")
+        except Exception as e:
+            # The lease runs out and the job is queued again.
+            logging.warning(f"job {job.id}: could not record its outcome: {e}")
+        self._claimed.pop(job.id, None)
+        self._lost.discard(job.id)
+        self._notify(job.id)
+        if status == QUEUED:
+            await asyncio.sleep(self.poll_interval)
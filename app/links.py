@@ -0,0 +1,36 @@
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings dedupe to one key.
+
+    Lowercases scheme and host, drops default ports and fragments and gives
+    an empty path a trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def _bare_host(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def in_scope(url: str, seed_url: str, scope: str = "host") -> bool:
+    """Check whether ``url`` may be followed from a crawl seeded at ``seed_url``.
+
+    ``host`` keeps the crawl on the seed's host (``www.`` is ignored);
+    ``domain`` also allows its subdomains.
+    """
+    host, seed_host = _bare_host(url), _bare_host(seed_url)
+    if not host:
+        return False
+    if scope == "domain":
+        return host == seed_host or host.endswith("." + seed_host)
+    return host == seed_host
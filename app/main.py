@@ -1,16 +1,54 @@
+import json
 import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, HttpUrl, Field
-from app.crawler import run_crawl
+from app.crawler import run_crawl_async, MAX_PAGES
+from app.executor import ExecutorBusy, executor
+from app.jobs import JobManager, JobQueueFull
+from crawler.fetch_client import fetch_client
+from crawler.metrics import metrics
 
-app = FastAPI(title="Infinity Modular Crawler")
+MAX_JOB_URLS = 1000
+
+jobs = JobManager()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Spawn parse workers before the first request instead of inside it.
+    executor.start()
+    await jobs.start()
+    try:
+        yield
+    finally:
+        await jobs.stop()
+        executor.shutdown()
+        await fetch_client.aclose()
+
+
+app = FastAPI(title="Infinity Modular Crawler", lifespan=lifespan)
 
 
 class RunPayload(BaseModel):
     seed_url: HttpUrl
     industry: str = Field(default="generic")
     depth: int = Field(default=1, ge=1, le=5)
+    max_pages: int = Field(default=MAX_PAGES, ge=1, le=500)
+    scope: str = Field(default="host", pattern="^(host|domain)$")
+
+
+class JobPayload(BaseModel):
+    seed_url: Optional[HttpUrl] = None
+    urls: Optional[List[HttpUrl]] = Field(default=None, max_length=MAX_JOB_URLS)
+    render: bool = False
+    industry: str = Field(default="generic")
+    depth: int = Field(default=1, ge=1, le=5)
+    max_pages: int = Field(default=MAX_PAGES, ge=1, le=500)
+    scope: str = Field(default="host", pattern="^(host|domain)$")
 
 
 @app.get("/health")
@@ -18,14 +56,70 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Crawl metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/run")
 async def run(payload: RunPayload):
     try:
-        result = run_crawl(payload.dict())
+        result = await run_crawl_async(payload.dict())
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     return result
 
+
+@app.post("/jobs", status_code=202)
+async def submit_job(payload: JobPayload):
+    """Queue a crawl (``seed_url``) or, with ``render``, a browser render of ``urls``."""
+    if payload.render:
+        urls = [str(u) for u in (payload.urls or ([payload.seed_url] if payload.seed_url else []))]
+        if not urls:
+            raise HTTPException(status_code=400, detail="render jobs need urls or seed_url")
+        kind, job_payload = "render", {"urls": urls}
+    else:
+        if payload.seed_url is None:
+            raise HTTPException(status_code=400, detail="seed_url required")
+        kind, job_payload = "crawl", payload.model_dump(mode="json", exclude={"urls", "render"})
+    try:
+        job = await jobs.submit(kind, job_payload)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return {
+        "id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "stream_url": f"/jobs/{job.id}/stream",
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, offset: int = 0):
+    """NDJSON stream: one ``page`` event per finished page, then an ``end`` event.
+
+    Reconnect with ``offset`` set to the next expected ``seq`` to resume.
+    """
+    if await jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    async def lines():
+        async for event in jobs.stream(job_id, offset=max(0, offset)):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
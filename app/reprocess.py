@@ -0,0 +1,269 @@
+"""Offline reprocessing of stored snapshots.
+
+Rebuilds derived text and metadata from the snapshot store
+(``crawler.snapshot_store``) without fetching anything: every snapshot goes
+through extraction (HTML snapshots; text-only ones are re-normalized),
+``app.normalizer.normalize_text``, change detection against the previous
+snapshot of the same URL, and governance. Results are written as JSON lines
+to ``<out>/pages.jsonl`` and a throughput report to ``<out>/report.json``::
+
+    python -m app.reprocess --out crawler_scraper_output/reprocessed --workers 8
+    python -m app.reprocess --out ... --resume          # continue an interrupted run
+
+Work is split into ``buckets`` ranges of the URL-hash space. A bucket holds
+the complete history of its URLs, so each worker process reads its own
+index rows and segment records (``batch`` rows at a time) and runs change
+detection locally; nothing is shared between workers and throughput grows
+with the number of cores until the disk becomes the limit.
+
+Output is in bucket order by default (URLs sorted by hash, snapshots oldest
+first); ``--unordered`` writes buckets as they finish, which keeps all
+workers busy when buckets differ in size. After each bucket the output is
+fsynced and ``progress.json`` updated, so ``--resume`` skips finished
+buckets and drops a partially written one. Resuming requires the same
+options as the interrupted run.
+
+Settings (env): REPROCESS_WORKERS, REPROCESS_BUCKETS, PARSE_START_METHOD.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.change_detector import ChangeDetector
+from app.executor import PARSE_START_METHOD
+from app.governance import enforce_policies
+from app.normalizer import normalize_text
+from app.scraper import _extract_timed
+from crawler.snapshot_store import SNAPSHOT_DIR, SnapshotStore
+
+REPROCESS_WORKERS = int(os.environ.get("REPROCESS_WORKERS", os.cpu_count() or 1))
+REPROCESS_BUCKETS = int(os.environ.get("REPROCESS_BUCKETS", 256))
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+STAGES = ("read", "parse", "normalize", "change", "governance")
+_KEY_SPACE = 16 ** 8
+_REPORT_EVERY = 5.0
+
+# Per-process state of a pool worker, set by ``_init_worker``.
+_store: Optional[SnapshotStore] = None
+_options: Dict = {}
+
+
+def bucket_range(bucket: int, buckets: int) -> Tuple[str, Optional[str]]:
+    """``url_key`` bounds of ``bucket``; the last bucket is open-ended."""
+    lo = format(bucket * _KEY_SPACE // buckets, "08x")
+    hi = format((bucket + 1) * _KEY_SPACE // buckets, "08x") if bucket + 1 < buckets else None
+    return lo, hi
+
+
+def _init_worker(root: str, options: Dict):
+    global _store, _options
+    _store = SnapshotStore(root)
+    _options = options
+
+
+def _timed_snapshots(store: SnapshotStore, lo: str, hi: Optional[str], options: Dict,
+                     timings: Dict[str, float]) -> Iterator:
+    it = store.iter_key_range(lo, hi, source=options.get("source"), batch=options.get("batch", 500))
+    while True:
+        start = time.perf_counter()
+        snap = next(it, None)
+        timings["read"] += time.perf_counter() - start
+        if snap is None:
+            return
+        yield snap
+
+
+def process_bucket(bucket: int) -> Tuple[int, List[str], Dict]:
+    """Reprocess every snapshot of ``bucket``; returns its output lines and counters.
+
+    Runs in a pool worker (or inline with ``workers=0``).
+    """
+    options = _options
+    lo, hi = bucket_range(bucket, options["buckets"])
+    timings = dict.fromkeys(STAGES, 0.0)
+    counts = {"snapshots": 0, "bytes": 0, "errors": 0, "changed": 0, "non_compliant": 0, "duplicates": 0}
+    detector = ChangeDetector()
+    lines = []
+    cpu = time.process_time()
+    for snap in _timed_snapshots(_store, lo, hi, options, timings):
+        counts["snapshots"] += 1
+        record = {"id": snap.id, "url": snap.url, "fetched_at": snap.fetched_at, "source": snap.source,
+                  "content_hash": snap.content_hash}
+        try:
+            if snap.metadata.get("duplicate_of") and snap.html is None and snap.text is None:
+                counts["duplicates"] += 1
+                lines.append(json.dumps({**record, "duplicate_of": snap.metadata["duplicate_of"]},
+                                        ensure_ascii=False))
+                continue
+            links = None
+            if snap.html is not None:
+                body = snap.html.encode("utf-8", "surrogatepass")
+                counts["bytes"] += len(body)
+                extracted, stage_seconds = _extract_timed(body, HTML_CONTENT_TYPE, snap.url,
+                                                          options["collect_links"], options.get("backend"))
+                timings["parse"] += stage_seconds["parse"]
+                timings["normalize"] += stage_seconds["normalize"]
+                text, links = extracted["content"], extracted["links"]
+            else:
+                counts["bytes"] += len((snap.text or "").encode("utf-8", "surrogatepass"))
+                start = time.perf_counter()
+                text = normalize_text(snap.text or "")
+                timings["normalize"] += time.perf_counter() - start
+            start = time.perf_counter()
+            change = detector.observe(snap.url, text)
+            timings["change"] += time.perf_counter() - start
+            start = time.perf_counter()
+            compliant = enforce_policies(snap.url)
+            timings["governance"] += time.perf_counter() - start
+        except Exception as e:
+            counts["errors"] += 1
+            lines.append(json.dumps({**record, "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False))
+            continue
+        counts["changed"] += change.changed
+        counts["non_compliant"] += not compliant
+        record.update({"content_length": len(text), "change_status": change.status, "distance": change.distance,
+                       "compliant": compliant})
+        if options["collect_links"] and links is not None:
+            record["links"] = links
+        if options["include_text"]:
+            record["content"] = text
+        lines.append(json.dumps(record, ensure_ascii=False))
+    detector.close()
+    return bucket, lines, {**counts, "cpu_seconds": time.process_time() - cpu, "stages": timings}
+
+
+class _Progress:
+    """``progress.json``: options, finished buckets and the output size after them."""
+
+    def __init__(self, path: Path, options: Dict):
+        self.path = path
+        self.options = options
+        self.done: List[int] = []
+        self.offset = 0
+
+    def load(self):
+        state = json.loads(self.path.read_text())
+        if state["options"] != self.options:
+            raise ValueError(f"{self.path} was written with different options {state['options']}; "
+                             f"rerun them or start over without --resume")
+        self.done, self.offset = state["done"], state["offset"]
+
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"options": self.options, "done": self.done, "offset": self.offset}))
+        os.replace(tmp, self.path)
+
+
+def reprocess(out_dir: os.PathLike, root: os.PathLike = SNAPSHOT_DIR, workers: int = REPROCESS_WORKERS,
+              buckets: int = REPROCESS_BUCKETS, ordered: bool = True, resume: bool = False,
+              collect_links: bool = True, include_text: bool = True, backend: Optional[str] = None,
+              source: Optional[str] = None, batch: int = 500) -> Dict:
+    """Reprocess the snapshot store at ``root`` into ``out_dir``; returns the report.
+
+    Args:
+        out_dir: Receives ``pages.jsonl``, ``progress.json`` and ``report.json``.
+        workers: Worker processes; 0 runs everything in this process.
+        buckets: URL-hash ranges the work is split into (the unit of progress).
+        ordered: Write buckets in order instead of as they finish.
+        resume: Continue after the buckets a previous run finished.
+        collect_links, include_text: Add ``links`` / ``content`` to each line.
+        backend: HTML extractor backend (``app.extractors``).
+        source: Only snapshots stored with this ``source`` (e.g. ``render``).
+        batch: Index rows read per query.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    options = {"buckets": max(1, buckets), "ordered": ordered, "collect_links": collect_links,
+               "include_text": include_text, "backend": backend, "source": source, "batch": batch}
+    progress = _Progress(out_dir / "progress.json", {k: v for k, v in options.items() if k != "batch"})
+    if resume and progress.path.exists():
+        progress.load()
+    pending = [b for b in range(options["buckets"]) if b not in set(progress.done)]
+    pages_path = out_dir / "pages.jsonl"
+
+    totals = {"snapshots": 0, "bytes": 0, "errors": 0, "changed": 0, "non_compliant": 0, "duplicates": 0,
+              "cpu_seconds": 0.0}
+    stages = dict.fromkeys(STAGES, 0.0)
+    start = last_report = time.perf_counter()
+    with open(pages_path, "ab" if progress.done else "wb") as out:
+        # Lines past the recorded offset belong to a bucket that was not finished.
+        out.truncate(progress.offset)
+        out.seek(progress.offset)
+        for bucket, lines, counts in _run(pending, str(root), options, workers):
+            if lines:
+                out.write(("\n".join(lines) + "\n").encode("utf-8", "surrogatepass"))
+            out.flush()
+            os.fsync(out.fileno())
+            progress.done.append(bucket)
+            progress.offset = out.tell()
+            progress.save()
+            for key in totals:
+                totals[key] += counts[key]
+            for key in STAGES:
+                stages[key] += counts["stages"][key]
+            if time.perf_counter() - last_report >= _REPORT_EVERY:
+                last_report = time.perf_counter()
+                logging.info(f"reprocess: {len(progress.done)}/{options['buckets']} buckets, "
+                             f"{totals['snapshots']} snapshots, "
+                             f"{totals['snapshots'] / (last_report - start):.1f}/s")
+
+    seconds = time.perf_counter() - start
+    pool_size = max(1, workers)
+    report = {
+        "buckets": options["buckets"],
+        "buckets_processed": len(pending),
+        **{k: round(v, 3) if isinstance(v, float) else v for k, v in totals.items()},
+        "seconds": round(seconds, 3),
+        "workers": workers,
+        "snapshots_per_second": round(totals["snapshots"] / seconds, 2) if seconds else 0.0,
+        "mb_per_second": round(totals["bytes"] / seconds / 1e6, 3) if seconds else 0.0,
+        # Share of the pool's wall time spent on CPU work; near 1.0 means the
+        # run is CPU-bound and more cores would help.
+        "cpu_utilization": round(totals["cpu_seconds"] / (seconds * pool_size), 3) if seconds else 0.0,
+        "stage_seconds": {k: round(v, 3) for k, v in stages.items()},
+        "output": str(pages_path),
+    }
+    (out_dir / "report.json").write_text(json.dumps(report, indent=2))
+    return report
+
+
+def _run(pending: List[int], root: str, options: Dict, workers: int) -> Iterator[Tuple[int, List[str], Dict]]:
+    if workers <= 0:
+        _init_worker(root, options)
+        yield from (process_bucket(b) for b in pending)
+        return
+    ctx = multiprocessing.get_context(PARSE_START_METHOD)
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(root, options)) as pool:
+        mapper = pool.imap if options["ordered"] else pool.imap_unordered
+        yield from mapper(process_bucket, pending)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Rebuild derived text and metadata from stored snapshots.")
+    p.add_argument("--out", type=Path, required=True)
+    p.add_argument("--snapshots", type=Path, default=SNAPSHOT_DIR, help="snapshot store directory")
+    p.add_argument("--workers", type=int, default=REPROCESS_WORKERS)
+    p.add_argument("--buckets", type=int, default=REPROCESS_BUCKETS)
+    p.add_argument("--unordered", action="store_true", help="write buckets as they finish")
+    p.add_argument("--resume", action="store_true")
+    p.add_argument("--source", default=None, help="only snapshots with this source")
+    p.add_argument("--backend", default=None, help="HTML extractor backend")
+    p.add_argument("--no-links", action="store_true")
+    p.add_argument("--no-text", action="store_true")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    report = reprocess(args.out, args.snapshots, workers=args.workers, buckets=args.buckets,
+                       ordered=not args.unordered, resume=args.resume, collect_links=not args.no_links,
+                       include_text=not args.no_text, backend=args.backend, source=args.source)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,220 @@
-import os
-import json
-import requests
-from bs4 import BeautifulSoup
+import time
+from typing import Optional
+from crawler.fetch_client import (
+    BodyDecoder,
+    MAX_BODY_BYTES,
+    aiter_capped,
+    ensure_content_type,
+    fetch_client,
+    iter_capped,
+)
+from app.change_detector import NOT_MODIFIED, get_detector
+from app.dedupe import get_index
+from app.extractors import get_extractor
 from app.normalizer import normalize_text
-from app.config import OUTPUT_DIR
+from crawler.metrics import STAGE_SECONDS, record_error, stage
+from crawler.snapshot_store import snapshot_store
+from app.executor import RequestExecutor, executor as default_executor
 
 DEFAULT_TIMEOUT = 10
 MAX_CHARS = 20000
-RESULTS_DIR = OUTPUT_DIR
-os.makedirs(RESULTS_DIR, exist_ok=True)
+PARSE_SLICE_BYTES = 64 * 1024
 
-def scrape_url(url: str, config: dict) -> dict:
-    headers = {
-        "User-Agent": config.get("user_agent", "InfinityCrawler/1.0")
-    }
+
+def scrape_url(url: str, config: dict, collect_links: bool = True) -> dict:
+    """Fetch ``url`` and extract its normalized text.
+
+    The body is streamed: non-HTML responses are rejected from their headers,
+    at most ``MAX_BODY_BYTES`` are read, and reading stops as soon as
+    ``MAX_CHARS`` characters of text (and, with ``collect_links``, all links
+    up to the parser's cap) have been collected. The HTML backend comes from
+    ``config["extractor"]``, falling back to ``EXTRACTOR_BACKEND``; only the
+    ``stream`` backend can stop before the end of the body.
+
+    Requests are conditional on the validators of the previous fetch: a 304
+    returns the stored ``content_length`` and ``links`` with ``content`` set
+    to ``None`` and nothing is parsed. ``changed`` is ``False`` for 304s and
+    for bodies whose text is unchanged or a near-duplicate (see
+    ``app.change_detector``); only changed pages are snapshotted. A changed
+    page that is a near-copy of another URL (``app.dedupe``) gets
+    ``duplicate_of`` and is stored as a link to it instead. With
+    ``collect_links`` the ``<link rel="canonical">`` URL comes back as
+    ``canonical``.
+    """
+    headers = _request_headers(url, config, collect_links)
+    extractor = get_extractor(config.get("extractor"))
+    read = 0
+    try:
+        with fetch_client.stream_sync("GET", url, headers=headers, timeout=DEFAULT_TIMEOUT) as r:
+            if r.status_code == 304:
+                return _not_modified(url)
+            r.raise_for_status()
+            ensure_content_type(r)
+            session = extractor.session(str(r.url), MAX_CHARS, collect_links)
+            decoder = BodyDecoder(r.headers.get("Content-Type", ""))
+            parsing = 0.0
+            try:
+                for chunk in iter_capped(r, MAX_BODY_BYTES):
+                    read += len(chunk)
+                    # Parsing is interleaved with the download; only the
+                    # feeding counts as parse time.
+                    start = time.perf_counter()
+                    session.feed(decoder.feed(chunk))
+                    parsing += time.perf_counter() - start
+                    if session.done:
+                        break
+                start = time.perf_counter()
+                session.feed(decoder.flush())
+                extraction = session.close()
+                STAGE_SECONDS.observe(parsing + time.perf_counter() - start, stage="parse")
+                with stage("normalize"):
+                    normalized_text = normalize_text(extraction.text)
+            except Exception as e:
+                record_error("parse", e)
+                raise RuntimeError(f"Failed to parse HTML from {url}: {e}")
+            validators = _validators(r.headers)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Request failed for {url}: {e}")
+
+    page = _record(url, normalized_text, extraction.links, validators, collect_links, config.get("dedupe", True))
+    return {**page, 'bytes': read, 'canonical': extraction.canonical}
+
+
+def extract_body(body: bytes, content_type: str, base_url: str, collect_links: bool = True,
+                 backend: Optional[str] = None) -> dict:
+    """Decode and extract a complete response body.
+
+    Module-level so it can run in a parse worker process.
+
+    Returns:
+        ``{"content": normalized text, "links": [...]}``, plus ``canonical``
+        when the page declares a ``<link rel="canonical">``.
+    """
+    return _extract_timed(body, content_type, base_url, collect_links, backend)[0]
+
+
+def _extract_timed(body: bytes, content_type: str, base_url: str, collect_links: bool = True,
+                   backend: Optional[str] = None) -> tuple:
+    """``extract_body`` plus its ``{"parse": s, "normalize": s}`` timings.
+
+    Metrics recorded in a parse worker would stay in that process, so the
+    timings travel back with the result.
+    """
+    start = time.perf_counter()
+    decoder = BodyDecoder(content_type)
+    session = get_extractor(backend).session(base_url, MAX_CHARS, collect_links)
+    # Fed in slices so a streaming backend can stop once its budget is met.
+    for offset in range(0, len(body), PARSE_SLICE_BYTES):
+        session.feed(decoder.feed(body[offset:offset + PARSE_SLICE_BYTES]))
+        if session.done:
+            break
+    session.feed(decoder.flush())
+    extraction = session.close()
+    parsed = time.perf_counter()
+    content = normalize_text(extraction.text)
+    timings = {'parse': parsed - start, 'normalize': time.perf_counter() - parsed}
+    parsed = {'content': content, 'links': extraction.links}
+    if extraction.canonical:
+        parsed['canonical'] = extraction.canonical
+    return parsed, timings
+
+
+async def scrape_url_async(url: str, config: dict, collect_links: bool = True,
+                           executor: Optional[RequestExecutor] = None) -> dict:
+    """Event-loop friendly ``scrape_url``.
+
+    The (capped) body is read on the loop and parsed by ``executor``'s
+    process pool, so neither the download nor the parse blocks other
+    requests. Unlike the streaming sync path the whole capped body is read
+    before parsing starts.
+    """
+    executor = executor or default_executor
+    headers = await executor.io(_request_headers, url, config, collect_links)
+    chunks = []
+    read = 0
     try:
-        r = requests.get(url, headers=headers, timeout=DEFAULT_TIMEOUT)
-        r.raise_for_status()
+        async with fetch_client.stream("GET", url, headers=headers, timeout=DEFAULT_TIMEOUT) as r:
+            if r.status_code == 304:
+                return await executor.io(_not_modified, url)
+            r.raise_for_status()
+            ensure_content_type(r)
+            async for chunk in aiter_capped(r, MAX_BODY_BYTES):
+                chunks.append(chunk)
+                read += len(chunk)
+            content_type, base_url = r.headers.get("Content-Type", ""), str(r.url)
+            validators = _validators(r.headers)
     except Exception as e:
         raise RuntimeError(f"Request failed for {url}: {e}")
 
     try:
-        soup = BeautifulSoup(r.text, "html.parser")
-        for tag in soup(["script", "style", "noscript"]):
-            tag.decompose()
-        text = soup.get_text(separator=" ", strip=True)
-        normalized_text = normalize_text(text[:MAX_CHARS])
+        parsed, timings = await executor.parse(_extract_timed, b"".join(chunks), content_type, base_url,
+                                               collect_links, config.get("extractor"))
     except Exception as e:
+        record_error("parse", e)
         raise RuntimeError(f"Failed to parse HTML from {url}: {e}")
+    for name, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    page = await executor.io(_record, url, parsed['content'], parsed['links'], validators, collect_links,
+                             config.get("dedupe", True))
+    return {**page, 'bytes': read, 'canonical': parsed.get('canonical')}
+
+
+def _request_headers(url: str, config: dict, collect_links: bool) -> dict:
+    headers = {
+        "User-Agent": config.get("user_agent", "InfinityCrawler/1.0")
+    }
+    if config.get("conditional", True):
+        headers.update(get_detector().validators(url, require_links=collect_links))
+    return headers
+
+
+def _validators(response_headers) -> dict:
+    return {
+        'etag': response_headers.get("ETag"),
+        'last_modified': response_headers.get("Last-Modified"),
+    }
 
-    # Save snapshot
+
+def _not_modified(url: str) -> dict:
+    state = get_detector().not_modified(url)
+    return {
+        'url': url,
+        'content': None,
+        'content_length': state.content_length if state else 0,
+        'links': (state.links if state else None) or [],
+        'bytes': 0,
+        'changed': False,
+        'change_status': NOT_MODIFIED,
+    }
+
+
+def _record(url: str, normalized_text: str, links: list, validators: dict, collect_links: bool,
+            dedupe: bool = True) -> dict:
+    """Classify the fetch against the previous one and snapshot new text.
+
+    Near-duplicates are snapshotted too (the detector already stored their
+    hash) but keep ``changed`` False.
+    """
+    change = get_detector().observe(url, normalized_text, links=links if collect_links else None, **validators)
+    page = {'url': url, 'content': normalized_text, 'content_length': len(normalized_text)}
+    if change.content_changed:
+        duplicate = get_index().add(url, normalized_text, change.fingerprint) if dedupe else None
+        if duplicate is not None:
+            snapshot_store.put(url, metadata={'duplicate_of': duplicate.canonical_url}, source="scrape")
+            page['duplicate_of'] = duplicate.canonical_url
+        else:
+            page = _save_snapshot(url, normalized_text)
+    return {**page, 'links': links, 'changed': change.changed, 'change_status': change.status}
+
+
+def _save_snapshot(url: str, normalized_text: str) -> dict:
     snapshot = {
         'url': url,
         'content': normalized_text,
         'content_length': len(normalized_text),
     }
-    fname = os.path.join(RESULTS_DIR, f"scrape_{abs(hash(url))}.json")
-    with open(fname, 'w', encoding='utf-8') as f:
-        json.dump(snapshot, f, ensure_ascii=False, indent=2)
-
+    snapshot_store.put(url, text=normalized_text, source="scrape")
     return snapshot
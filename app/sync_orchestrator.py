@@ -33,6 +33,23 @@ class SyncOrchestrator:
         # Placeholder for actual synchronization logic
         logging.info(f"Synchronizing document: {document}")
 
+
+_default_orchestrator = None
+
+
+def orchestrate_sync(documents: List[str]) -> None:
+    """Synchronize documents through the process-wide default orchestrator."""
+    global _default_orchestrator
+    if _default_orchestrator is None:
+        from app.config import OUTPUT_DIR
+        _default_orchestrator = SyncOrchestrator(
+            sync_dir=os.environ.get(
+                "SYNC_DIR", os.path.join(os.path.dirname(OUTPUT_DIR), "sync")
+            )
+        )
+    _default_orchestrator.synchronize(documents)
+
+
 # Example usage
 if __name__ == "__main__":
     orchestrator = SyncOrchestrator(sync_dir="/path/to/sync")
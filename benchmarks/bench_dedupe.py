@@ -0,0 +1,139 @@
+"""Benchmark the near-duplicate index at crawl scale.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_dedupe
+    python -m benchmarks.bench_dedupe --docs 100000 --dup-rate 0.2 --db /tmp/dedupe.sqlite3
+
+Two parts:
+
+* fingerprinting - SimHash of the normalized text of the fixture pages;
+* indexing - ``--docs`` synthetic fingerprints are added one at a time, as a
+  crawl would. ``--dup-rate`` of them are copies of an earlier document with
+  up to ``max_distance`` bits flipped (0 flips = exact copy); the rest are
+  random. Reported: add throughput, latency percentiles for the first and
+  last 10% of adds (flat when lookups are sub-linear), recall on the
+  injected copies, false matches, index size on disk and peak RSS.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import Dict
+
+from app.dedupe import DEDUPE_CACHE_MB, DEDUPE_MAX_DISTANCE, NearDuplicateIndex
+from app.extractors import get_extractor
+from app.fingerprint import simhash
+from app.normalizer import normalize_text
+from benchmarks.bench_extractors import BASE_URL, FIXTURE_PAGES, load_corpus
+
+
+def bench_fingerprint(corpus: Path, repeat: int) -> Dict:
+    extractor = get_extractor("stream")
+    texts = [normalize_text(extractor.extract(html, BASE_URL).text) for html in load_corpus(corpus).values()]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            simhash(text)
+        best = min(best, time.perf_counter() - start)
+    return {"pages": len(texts), "ms_per_page": round(best * 1000 / max(1, len(texts)), 3)}
+
+
+def _percentiles(latencies) -> Dict:
+    ordered = sorted(latencies)
+    return {
+        "p50_us": round(ordered[len(ordered) // 2] * 1e6, 1),
+        "p99_us": round(ordered[int(len(ordered) * 0.99)] * 1e6, 1),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 1),
+    }
+
+
+def bench_index(docs: int, dup_rate: float, max_distance: int, db_path: str, cache_mb: int, seed: int) -> Dict:
+    rng = random.Random(seed)
+    index = NearDuplicateIndex(db_path, max_distance=max_distance, cache_mb=cache_mb)
+    canonicals = array("Q")
+    latencies = array("d")
+    injected = found = false_matches = 0
+    start = time.perf_counter()
+    for i in range(docs):
+        copy = bool(canonicals) and rng.random() < dup_rate
+        if copy:
+            fingerprint = canonicals[rng.randrange(len(canonicals))]
+            flips = rng.randint(0, max_distance)
+            chash = format(fingerprint, "016x") if flips == 0 else f"copy-{i}"
+            for bit in rng.sample(range(64), flips):
+                fingerprint ^= 1 << bit
+            injected += 1
+        else:
+            fingerprint = rng.getrandbits(64)
+            chash = format(fingerprint, "016x")
+        t = time.perf_counter()
+        match = index.add_fingerprint(f"https://example.com/{i}", fingerprint, chash)
+        latencies.append(time.perf_counter() - t)
+        if match is None:
+            canonicals.append(fingerprint)
+        elif copy:
+            found += 1
+        else:
+            false_matches += 1
+    elapsed = time.perf_counter() - start
+    stats = index.stats()
+    index.close()
+    tenth = max(1, docs // 10)
+    size = sum(os.path.getsize(p) for p in (db_path, db_path + "-wal") if os.path.exists(p))
+    return {
+        "docs": docs,
+        "seconds": round(elapsed, 2),
+        "adds_per_second": round(docs / elapsed, 1) if elapsed else 0.0,
+        "first_10pct": _percentiles(latencies[:tenth]),
+        "last_10pct": _percentiles(latencies[-tenth:]),
+        "injected_copies": injected,
+        "recall": round(found / injected, 4) if injected else 1.0,
+        "false_matches": false_matches,
+        "candidates_per_add": round(stats["candidates"] / docs, 2),
+        "canonical": stats["canonical"],
+        "index_mb": round(size / 1e6, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--docs", type=int, default=1_000_000)
+    p.add_argument("--dup-rate", type=float, default=0.1)
+    p.add_argument("--max-distance", type=int, default=DEDUPE_MAX_DISTANCE)
+    p.add_argument("--cache-mb", type=int, default=DEDUPE_CACHE_MB)
+    p.add_argument("--db", default=None, help="index file (default: a temporary file, removed afterwards)")
+    p.add_argument("--corpus", type=Path, default=FIXTURE_PAGES)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", action="store_true", help="print results as JSON")
+    args = p.parse_args()
+
+    fingerprint = bench_fingerprint(args.corpus, max(1, args.repeat))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "dedupe.sqlite3")
+        index = bench_index(args.docs, args.dup_rate, args.max_distance, db_path, args.cache_mb, args.seed)
+
+    if args.json:
+        print(json.dumps({"fingerprint": fingerprint, "index": index}, indent=2))
+        return
+    print(f"simhash: {fingerprint['ms_per_page']} ms/page over {fingerprint['pages']} fixture pages")
+    print(f"index: {index['docs']} docs in {index['seconds']}s ({index['adds_per_second']} adds/s), "
+          f"{index['canonical']} canonical, {index['index_mb']} MB on disk, peak RSS {index['peak_rss_mb']} MB")
+    for part in ("first_10pct", "last_10pct"):
+        lat = index[part]
+        print(f"  {part:<12} p50 {lat['p50_us']}us  p99 {lat['p99_us']}us  mean {lat['mean_us']}us")
+    print(f"  recall {index['recall']} on {index['injected_copies']} injected copies, "
+          f"{index['false_matches']} false matches, {index['candidates_per_add']} candidates/add")
+
+
+if __name__ == "__main__":
+    main()
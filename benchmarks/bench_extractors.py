@@ -0,0 +1,105 @@
+"""Compare HTML extraction backends on a corpus of saved pages.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_extractors
+    python -m benchmarks.bench_extractors --corpus /path/to/pages --repeat 10 --backends lxml selectolax
+
+Every ``*.html`` file under ``--corpus`` is extracted by each available
+backend ``--repeat`` times (best run reported). Output is also checked
+against the ``bs4`` reference after ``normalize_text``; a backend that
+differs on any page is flagged in the ``identical`` column.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.extractors import DEFAULT_MAX_CHARS, available_extractors, get_extractor
+from app.normalizer import normalize_text
+
+FIXTURE_PAGES = Path(__file__).parent / "fixtures" / "pages"
+BASE_URL = "https://www.example.com/"
+
+
+def load_corpus(corpus: Path) -> Dict[str, str]:
+    pages = {}
+    for path in sorted(corpus.rglob("*.html")):
+        pages[str(path.relative_to(corpus))] = path.read_text(encoding="utf-8", errors="replace")
+    return pages
+
+
+def bench_backend(name: str, pages: Dict[str, str], repeat: int, max_chars: int,
+                  collect_links: bool) -> Dict:
+    extractor = get_extractor(name)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages.values():
+            extractor.extract(html, BASE_URL, max_chars, collect_links)
+        best = min(best, time.perf_counter() - start)
+    size = sum(len(html.encode("utf-8")) for html in pages.values())
+    return {
+        "backend": name,
+        "seconds": round(best, 4),
+        "pages_per_second": round(len(pages) / best, 1) if best else 0.0,
+        "mb_per_second": round(size / best / 1e6, 2) if best else 0.0,
+        "ms_per_page": round(best * 1000 / len(pages), 3),
+    }
+
+
+def mismatches(name: str, pages: Dict[str, str], max_chars: int, collect_links: bool) -> List[str]:
+    """Pages on which ``name`` disagrees with the bs4 reference."""
+    reference, extractor = get_extractor("bs4"), get_extractor(name)
+    bad = []
+    for page, html in pages.items():
+        expected = reference.extract(html, BASE_URL, max_chars, collect_links)
+        got = extractor.extract(html, BASE_URL, max_chars, collect_links)
+        if normalize_text(expected.text) != normalize_text(got.text) or expected.links != got.links:
+            bad.append(page)
+    return bad
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--corpus", type=Path, default=FIXTURE_PAGES)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--backends", nargs="*", default=None)
+    p.add_argument("--max-chars", type=int, default=DEFAULT_MAX_CHARS,
+                   help="text budget per page (the stream backend stops early once it is met)")
+    p.add_argument("--no-links", action="store_true")
+    p.add_argument("--json", action="store_true", help="print results as JSON")
+    args = p.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        raise SystemExit(f"No *.html pages found under {args.corpus}")
+    available = available_extractors()
+    backends = [b for b in (args.backends or available) if b in available]
+    skipped = sorted(set(args.backends or []) - set(available))
+    collect_links = not args.no_links
+
+    results = []
+    for name in backends:
+        row = bench_backend(name, pages, max(1, args.repeat), args.max_chars, collect_links)
+        bad = mismatches(name, pages, args.max_chars, collect_links) if "bs4" in available else []
+        row["identical"] = not bad
+        row["mismatched_pages"] = bad
+        results.append(row)
+
+    if args.json:
+        print(json.dumps({"pages": len(pages), "skipped": skipped, "results": results}, indent=2))
+        return
+    size_mb = sum(len(h.encode("utf-8")) for h in pages.values()) / 1e6
+    print(f"{len(pages)} pages, {size_mb:.2f} MB, best of {args.repeat} runs, max_chars={args.max_chars}")
+    print(f"{'backend':<12}{'pages/s':>10}{'MB/s':>9}{'ms/page':>10}  identical")
+    for row in sorted(results, key=lambda r: r["seconds"]):
+        flag = "yes" if row["identical"] else "NO: " + ", ".join(row["mismatched_pages"])
+        print(f"{row['backend']:<12}{row['pages_per_second']:>10}{row['mb_per_second']:>9}{row['ms_per_page']:>10}  {flag}")
+    for name in skipped:
+        print(f"{name:<12}not installed")
+
+
+if __name__ == "__main__":
+    main()
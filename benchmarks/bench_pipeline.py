@@ -0,0 +1,358 @@
+"""End-to-end crawl pipeline benchmarks against a local fixture site.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --pages 500 --latency 0.05 --targets scrape_url fetch_url
+    python -m benchmarks.bench_pipeline --check              # exit 1 on a regression
+    python -m benchmarks.bench_pipeline --update-baseline    # accept the current numbers
+
+A ``benchmarks.fixture_site`` site is started in this process and every
+target runs in its own spawned process, so CPU time and peak RSS are the
+target's alone and its stores (snapshots, change detector, dedupe index)
+start empty in a temporary directory. Targets:
+
+* ``scrape_url`` - ``app.scraper.scrape_url`` from ``--concurrency`` threads;
+* ``fetch_url`` - ``headless_team.fetch_url`` from ``--concurrency`` threads;
+* ``crawl_urls`` - ``crawler.engine.crawl_urls`` (Chromium renders every page);
+* ``orchestrate_from_seed`` - static triage plus rendering of the JS pages.
+
+Reported per target: pages/s, p50/p99 latency (per call for the threaded
+targets; from ``crawler.metrics`` histograms - fetch latency for the
+orchestrator, render time for ``crawl_urls`` - otherwise), CPU seconds,
+CPU ms per page, peak RSS and the stage breakdown from ``crawl_stage_seconds``.
+Without the ``resource`` module (Windows) CPU time covers the target's own
+process only and peak RSS is not reported.
+Targets that need a browser are reported as skipped when Chromium cannot be
+launched.
+
+Results are written as JSON (``--out``) and compared with the stored
+baseline (``--baseline``): a metric worse than the baseline by more than its
+tolerance is flagged as a regression. Baselines are machine specific;
+refresh them with ``--update-baseline`` when the hardware changes.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.fixture_site import FixtureSite
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "pipeline.json"
+TARGETS = ("scrape_url", "fetch_url", "crawl_urls", "orchestrate_from_seed")
+
+# metric: (direction, relative tolerance, absolute slack). Differences within
+# the slack are noise on any machine (a millisecond, a few MB).
+TOLERANCES = {
+    "pages_per_second": ("higher", 0.20, 0.0),
+    "p50_ms": ("lower", 0.25, 1.0),
+    "p99_ms": ("lower", 0.50, 2.0),
+    "cpu_ms_per_page": ("lower", 0.25, 0.5),
+    "peak_rss_mb": ("lower", 0.15, 5.0),
+}
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def _threaded(call: Callable[[str], Dict], urls: List[str], concurrency: int) -> Dict:
+    latencies, errors = [], 0
+
+    def _one(url):
+        start = time.perf_counter()
+        try:
+            call(url)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, error in pool.map(_one, urls):
+            latencies.append(latency)
+            errors += error is not None
+    return {
+        "seconds": time.perf_counter() - start,
+        "errors": errors,
+        "p50_ms": _ms(_percentile(latencies, 0.5)),
+        "p99_ms": _ms(_percentile(latencies, 0.99)),
+    }
+
+
+def run_scrape_url(urls: List[str], options: Dict) -> Dict:
+    from app.config import get_config
+    from app.scraper import scrape_url
+    config = get_config("generic")
+    return _threaded(lambda u: scrape_url(u, config), urls, options["concurrency"])
+
+
+def run_fetch_url(urls: List[str], options: Dict) -> Dict:
+    from vision_cortex.integration.headless_team import fetch_url
+
+    def _fetch(url):
+        result = fetch_url(url)
+        if result["status"] != "ok":
+            raise RuntimeError(result.get("error") or result["status"])
+    return _threaded(_fetch, urls, options["concurrency"])
+
+
+def _histogram_latency(histogram) -> Dict:
+    total = histogram.total()
+    return {"p50_ms": _ms(total.get("p50", 0.0)), "p99_ms": _ms(total.get("p99", 0.0))}
+
+
+def run_crawl_urls(urls: List[str], options: Dict) -> Dict:
+    from crawler.engine import crawl_urls
+    from crawler.metrics import metrics
+    errors = 0
+
+    def _count(url, snap, error):
+        nonlocal errors
+        errors += error is not None
+
+    start = time.perf_counter()
+    asyncio.run(crawl_urls(urls, concurrency=options["concurrency"], min_delay=0, on_result=_count))
+    seconds = time.perf_counter() - start
+    render = metrics.summary().get("crawl_stage_seconds", {}).get("render", {})
+    return {"seconds": seconds, "errors": errors,
+            "p50_ms": _ms(render.get("p50", 0.0)), "p99_ms": _ms(render.get("p99", 0.0))}
+
+
+def run_orchestrate_from_seed(urls: List[str], options: Dict) -> Dict:
+    import yaml
+    from crawler.metrics import HOST_FETCH_SECONDS
+    from orchestrator import orchestrate_from_seed
+    seed = Path(os.environ["BENCH_TMP"]) / "seed.yaml"
+    seed.write_text(yaml.safe_dump({"sources": [{"url": u} for u in urls]}))
+    start = time.perf_counter()
+    report = orchestrate_from_seed(str(seed), concurrency=options["concurrency"],
+                                   fetch_concurrency=options["fetch_concurrency"], min_delay=0)
+    seconds = time.perf_counter() - start
+    errors = report["triage"]["errors"] + report["render"]["errors"]
+    return {"seconds": seconds, "errors": errors, **_histogram_latency(HOST_FETCH_SECONDS)}
+
+
+RUNNERS = {
+    "scrape_url": run_scrape_url,
+    "fetch_url": run_fetch_url,
+    "crawl_urls": run_crawl_urls,
+    "orchestrate_from_seed": run_orchestrate_from_seed,
+}
+
+
+def chromium_available() -> bool:
+    try:
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as p:
+            return os.path.exists(p.chromium.executable_path)
+    except Exception:
+        return False
+
+
+def _target_main(name: str, urls: List[str], options: Dict, env: Dict, conn):
+    # Runs in a fresh (spawned) process: the stores pick up their paths from
+    # the environment at import time.
+    os.environ.update(env)
+    has_browser = chromium_available()
+    if name == "crawl_urls" and not has_browser:
+        conn.send({"skipped": "Chromium is not installed (playwright install chromium)"})
+        return
+    try:
+        result = RUNNERS[name](urls, options)
+    except Exception as e:
+        conn.send({"failed": f"{type(e).__name__}: {e}"})
+        return
+    if name == "orchestrate_from_seed" and not has_browser:
+        result["warning"] = "Chromium is not installed: every render failed, numbers cover triage only"
+    from crawler.metrics import STAGE_SECONDS
+    if resource is not None:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+        # ru_maxrss is in KiB on Linux and bytes on macOS.
+        peak_rss = round(own.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    else:
+        # Without getrusage only this process is measured, and not its RSS.
+        cpu, peak_rss = time.process_time(), None
+    pages = len(urls)
+    result.update({
+        "pages": pages,
+        "pages_per_second": round(pages / result["seconds"], 2) if result["seconds"] else 0.0,
+        "seconds": round(result["seconds"], 3),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_ms_per_page": round(cpu * 1000 / pages, 3),
+        "peak_rss_mb": peak_rss,
+        "stages": {stage: {"count": s["count"], "p50_ms": _ms(s["p50"]), "p99_ms": _ms(s["p99"])}
+                   for stage, s in STAGE_SECONDS.summary().items()},
+    })
+    conn.send(result)
+
+
+def run_target(name: str, urls: List[str], options: Dict) -> Dict:
+    """Run one target in a spawned process with its own output directory."""
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as tmp:
+        env = {
+            "BENCH_TMP": tmp,
+            "SNAPSHOT_DIR": os.path.join(tmp, "snapshots"),
+            "CHANGE_DB_PATH": os.path.join(tmp, "changes.sqlite3"),
+            "DEDUPE_DB_PATH": os.path.join(tmp, "dedupe.sqlite3"),
+            "RECRAWL_DB_PATH": os.path.join(tmp, "recrawl.sqlite3"),
+            "FRONTIER_DIR": os.path.join(tmp, "frontier"),
+        }
+        parent, child = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_target_main, args=(name, urls, options, env, child), name=f"bench-{name}")
+        proc.start()
+        child.close()
+        try:
+            result = parent.recv()
+        except EOFError:
+            result = {"failed": f"benchmark process exited with code {proc.join() or proc.exitcode}"}
+        proc.join()
+    return result
+
+
+def run_suite(targets: List[str], site_options: Dict, options: Dict, repeat: int = 1) -> Dict:
+    """Serve the fixture site and benchmark every target; median run by pages/s."""
+    results = {}
+    with FixtureSite(**site_options) as site:
+        urls = site.urls()
+        for name in targets:
+            runs = [run_target(name, urls, options) for _ in range(max(1, repeat))]
+            ok = sorted((r for r in runs if "pages_per_second" in r), key=lambda r: r["pages_per_second"])
+            results[name] = ok[len(ok) // 2] if ok else runs[0]
+        hosts = len(site.hosts)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "site": {**site_options, "hosts": hosts},
+            "options": options,
+            "repeat": repeat,
+            "timestamp": round(time.time()),
+        },
+        "targets": results,
+    }
+
+
+def compare(baseline: Dict, results: Dict, scale: float = 1.0) -> List[Dict]:
+    """Metrics of ``results`` worse than ``baseline`` beyond their tolerance.
+
+    Args:
+        baseline: A previous ``run_suite`` result.
+        results: The current ``run_suite`` result.
+        scale: Multiplies every relative tolerance (e.g. 2 on a noisy machine).
+    """
+    regressions = []
+    for name, current in results.get("targets", {}).items():
+        previous = baseline.get("targets", {}).get(name)
+        if not previous or "pages_per_second" not in previous or "pages_per_second" not in current:
+            continue
+        for metric, (direction, tolerance, slack) in TOLERANCES.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            worse = (old - new) if direction == "higher" else (new - old)
+            if worse > slack and worse > abs(old) * tolerance * scale:
+                regressions.append({
+                    "target": name,
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": round((new - old) / old, 3) if old else None,
+                })
+    return regressions
+
+
+def _print_table(results: Dict, regressions: List[Dict]):
+    flagged = {(r["target"], r["metric"]) for r in regressions}
+    print(f"{'target':<24}{'pages/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'cpu ms/pg':>11}{'rss MB':>9}{'errors':>8}")
+    for name, r in results["targets"].items():
+        if "pages_per_second" not in r:
+            print(f"{name:<24}  {r.get('skipped') and 'skipped: ' + r['skipped'] or 'failed: ' + r.get('failed', '?')}")
+            continue
+        cells = []
+        for metric, width in (("pages_per_second", 10), ("p50_ms", 10), ("p99_ms", 10),
+                              ("cpu_ms_per_page", 11), ("peak_rss_mb", 9)):
+            cell = f"{r[metric]}{'!' if (name, metric) in flagged else ''}"
+            cells.append(f"{cell:>{width}}")
+        print(f"{name:<24}{''.join(cells)}{r['errors']:>8}")
+        if r.get("warning"):
+            print(f"{'':<24}  warning: {r['warning']}")
+    for r in regressions:
+        print(f"REGRESSION {r['target']} {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.0%})"
+              if r["change"] is not None else f"REGRESSION {r['target']} {r['metric']}: {r['current']}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--page-bytes", type=int, default=20_000)
+    p.add_argument("--fanout", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.01, help="server delay per response (seconds)")
+    p.add_argument("--js-fraction", type=float, default=0.1)
+    p.add_argument("--disallow-fraction", type=float, default=0.05)
+    p.add_argument("--hosts", type=int, default=4)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--fetch-concurrency", type=int, default=16)
+    p.add_argument("--repeat", type=int, default=3, help="runs per target; the median run is reported")
+    p.add_argument("--out", type=Path, default=None, help="write the results JSON here")
+    p.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    p.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    p.add_argument("--tolerance-scale", type=float, default=1.0)
+    p.add_argument("--check", action="store_true", help="exit with status 1 when a regression is found")
+    p.add_argument("--json", action="store_true", help="print results as JSON")
+    args = p.parse_args()
+
+    site_options = {
+        "pages": args.pages, "page_bytes": args.page_bytes, "fanout": args.fanout, "latency": args.latency,
+        "js_fraction": args.js_fraction, "disallow_fraction": args.disallow_fraction, "hosts": args.hosts,
+    }
+    options = {"concurrency": args.concurrency, "fetch_concurrency": args.fetch_concurrency}
+    results = run_suite(args.targets, site_options, options, args.repeat)
+
+    baseline: Optional[Dict] = None
+    if args.baseline.exists() and not args.update_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("meta", {}).get("site") != results["meta"]["site"]:
+            print(f"note: baseline {args.baseline} was recorded with different site settings", file=sys.stderr)
+    regressions = compare(baseline, results, args.tolerance_scale) if baseline else []
+    results["regressions"] = regressions
+
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(results, indent=2))
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({k: v for k, v in results.items() if k != "regressions"}, indent=2) + "\n")
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results, regressions)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
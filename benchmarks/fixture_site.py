@@ -0,0 +1,206 @@
+"""Synthetic web site for benchmarks, served from local threads.
+
+Usage::
+
+    with FixtureSite(pages=200, page_bytes=20_000, fanout=10, latency=0.02, js_fraction=0.1) as site:
+        urls = site.urls()
+
+or standalone (prints the URLs and serves until interrupted)::
+
+    python -m benchmarks.fixture_site --pages 50 --hosts 2
+
+Pages are generated deterministically from their number: paragraphs of
+words from a fixed vocabulary up to ``page_bytes``, ``fanout`` links to
+other pages and, for ``js_fraction`` of them, an empty ``#root`` container
+filled by a script (so ``render_detect`` sends them to the browser).
+``disallow_fraction`` of the pages live under ``/private/``, which
+robots.txt disallows. Every response is delayed by ``latency`` seconds.
+
+The site is spread over ``hosts`` loopback addresses (127.0.0.1,
+127.0.0.2, ...; Linux routes all of 127/8 to ``lo``) so per-host politeness
+does not serialize the crawl. Where only 127.0.0.1 can be bound the site
+falls back to a single host.
+"""
+import argparse
+import http.server
+import logging
+import random
+import threading
+import time
+from typing import List, Optional
+
+WORDS = (
+    "loan rate business credit lender capital term line equipment invoice revenue cash flow "
+    "approval application fee interest small market growth funding bank score report annual "
+    "merchant advance payment schedule collateral personal guarantee document review offer"
+).split()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = "FixtureSite/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        site: "FixtureSite" = self.server.site
+        site.requests += 1
+        if site.latency:
+            time.sleep(site.latency)
+        if self.path == "/robots.txt":
+            return self._send(200, site.robots_txt(), "text/plain")
+        page = site.page_number(self.path)
+        if page is None:
+            return self._send(404, "not found", "text/plain")
+        return self._send(200, site.html(page), "text/html; charset=utf-8")
+
+    def _send(self, status: int, body: str, content_type: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FixtureSite:
+    """
+    Fixture Site
+    Deterministic multi-host HTML site on local HTTP servers.
+    """
+
+    def __init__(self, pages: int = 100, page_bytes: int = 20_000, fanout: int = 10, latency: float = 0.0,
+                 js_fraction: float = 0.0, disallow_fraction: float = 0.0, hosts: int = 4,
+                 crawl_delay: Optional[float] = None, seed: int = 1):
+        self.pages = max(1, pages)
+        self.page_bytes = page_bytes
+        self.fanout = fanout
+        self.latency = latency
+        self.js_fraction = js_fraction
+        self.disallow_fraction = disallow_fraction
+        self.crawl_delay = crawl_delay
+        self.seed = seed
+        self.requests = 0
+        self._wanted_hosts = max(1, hosts)
+        self.hosts: List[str] = []
+        self.port: Optional[int] = None
+        self._servers: List[http.server.ThreadingHTTPServer] = []
+
+    # -- content -------------------------------------------------------------
+
+    def is_js(self, page: int) -> bool:
+        return self.js_fraction > 0 and page % max(1, round(1 / self.js_fraction)) == 0
+
+    def is_private(self, page: int) -> bool:
+        return self.disallow_fraction > 0 and page % max(1, round(1 / self.disallow_fraction)) == 1
+
+    def path(self, page: int) -> str:
+        return f"{'/private' if self.is_private(page) else ''}/p/{page}.html"
+
+    def url(self, page: int) -> str:
+        return f"http://{self.hosts[page % len(self.hosts)]}:{self.port}{self.path(page)}"
+
+    def urls(self) -> List[str]:
+        return [self.url(i) for i in range(self.pages)]
+
+    def page_number(self, path: str) -> Optional[int]:
+        path = path.split("?", 1)[0]
+        if path.startswith("/private"):
+            path = path[len("/private"):]
+        if not (path.startswith("/p/") and path.endswith(".html")):
+            return None
+        try:
+            page = int(path[3:-5])
+        except ValueError:
+            return None
+        return page if 0 <= page < self.pages else None
+
+    def robots_txt(self) -> str:
+        lines = ["User-agent: *", "Disallow: /private/"]
+        if self.crawl_delay:
+            lines.append(f"Crawl-delay: {self.crawl_delay}")
+        return "\n".join(lines) + "\n"
+
+    def html(self, page: int) -> str:
+        rng = random.Random(self.seed * 1_000_003 + page)
+        links = "".join(
+            f'<li><a href="{self.url(rng.randrange(self.pages))}">Related {j}</a></li>' for j in range(self.fanout)
+        )
+        paragraphs, size = [], 0
+        while size < self.page_bytes:
+            paragraph = "<p>" + " ".join(rng.choice(WORDS) for _ in range(60)) + ".</p>"
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        body = "\n".join(paragraphs)
+        if self.is_js(page):
+            # The text only exists inside the script: static extraction sees an empty app shell.
+            escaped = body.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ").replace("</", "<\\/")
+            main = (f'<div id="root"></div>\n'
+                    f'<script>document.getElementById("root").innerHTML = "{escaped}";</script>')
+        else:
+            main = f"<main><h1>Page {page}</h1>\n{body}</main>"
+        return (f"<!doctype html><html><head><title>Fixture page {page}</title></head>"
+                f"<body><nav><ul>{links}</ul></nav>\n{main}\n</body></html>")
+
+    # -- serving -------------------------------------------------------------
+
+    def start(self) -> "FixtureSite":
+        first = self._serve("127.0.0.1", 0)
+        self.port = first.server_address[1]
+        self.hosts = ["127.0.0.1"]
+        for i in range(2, self._wanted_hosts + 1):
+            host = f"127.0.0.{i}"
+            try:
+                self._serve(host, self.port)
+            except OSError as e:
+                logging.warning(f"fixture site: cannot bind {host} ({e}); serving {len(self.hosts)} host(s)")
+                break
+            self.hosts.append(host)
+        return self
+
+    def _serve(self, host: str, port: int) -> http.server.ThreadingHTTPServer:
+        server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        server.site = self
+        threading.Thread(target=server.serve_forever, name=f"fixture-{host}", daemon=True).start()
+        self._servers.append(server)
+        return server
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self) -> "FixtureSite":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Serve a synthetic site for benchmarks.")
+    p.add_argument("--pages", type=int, default=100)
+    p.add_argument("--page-bytes", type=int, default=20_000)
+    p.add_argument("--fanout", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--js-fraction", type=float, default=0.0)
+    p.add_argument("--disallow-fraction", type=float, default=0.0)
+    p.add_argument("--hosts", type=int, default=4)
+    args = p.parse_args()
+    with FixtureSite(args.pages, args.page_bytes, args.fanout, args.latency, args.js_fraction,
+                     args.disallow_fraction, args.hosts) as site:
+        for url in site.urls()[:10]:
+            print(url)
+        print(f"... {site.pages} pages on {', '.join(site.hosts)} port {site.port}; Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Long-lived Playwright browser pool shared by the crawl paths.
+
+A pool owns ``size`` Chromium processes for the lifetime of a run and hands
+out pages that live in their own browser context. Contexts are kept warm and
+reused across tasks: between leases the cookies, permissions and the storage
+of the origin the page is on (localStorage, sessionStorage, IndexedDB and
+service workers) are cleared and the page is blanked. Storage of other
+origins cannot be reached from the page, so a context whose page visited
+more than one origin during a lease is recycled instead, as is one that has
+served ``max_navigations`` tasks or whose JS heap grew past ``max_heap_mb``. A browser that crashes or disconnects
+is relaunched transparently on the next lease. Contexts are only reused by
+leases asking for the same context options (e.g. ``java_script_enabled``).
+
+Usage::
+
+    async with BrowserPool(size=2) as pool:
+        async with pool.page() as page:
+            await page.goto(url)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from playwright.async_api import Browser, BrowserContext, Page, async_playwright
+
+from crawler.metrics import metrics
+
+POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 2))
+CONTEXTS_PER_BROWSER = int(os.environ.get("BROWSER_CONTEXTS_PER_BROWSER", 4))
+MAX_NAVIGATIONS = int(os.environ.get("BROWSER_MAX_NAVIGATIONS", 50))
+MAX_HEAP_MB = float(os.environ.get("BROWSER_MAX_HEAP_MB", 256))
+
+_HEAP_JS = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+_CLEAR_STORAGE_JS = """async () => {
+    try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}
+    try { for (const db of await indexedDB.databases()) indexedDB.deleteDatabase(db.name); } catch (e) {}
+    try { for (const r of await navigator.serviceWorker.getRegistrations()) await r.unregister(); } catch (e) {}
+}"""
+
+
+@dataclass
+class _Slot:
+    context: BrowserContext
+    page: Page
+    key: Tuple = ()
+    navigations: int = 0
+    # Origins the page's main frame navigated to during the current lease.
+    origins: Set[str] = field(default_factory=set)
+
+    def track_origins(self):
+        def _navigated(frame):
+            if frame == self.page.main_frame:
+                parts = urlsplit(frame.url)
+                if parts.scheme in ("http", "https"):
+                    self.origins.add(f"{parts.scheme}://{parts.netloc}")
+
+        self.page.on("framenavigated", _navigated)
+
+
+class _BrowserHandle:
+    def __init__(self, index: int):
+        self.index = index
+        self.browser: Optional[Browser] = None
+        self.idle: List[_Slot] = []
+        self.leased = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    Browser Pool
+    Keeps ``size`` browsers running and leases recycled pages to callers.
+    At most ``size * contexts_per_browser`` pages are leased at once; further
+    callers wait for a free slot.
+    """
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        contexts_per_browser: int = CONTEXTS_PER_BROWSER,
+        max_navigations: int = MAX_NAVIGATIONS,
+        max_heap_mb: float = MAX_HEAP_MB,
+        launch_options: Optional[Dict] = None,
+    ):
+        self.size = max(1, size)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.max_navigations = max(1, max_navigations)
+        self.max_heap_bytes = int(max_heap_mb * 1024 * 1024)
+        self.launch_options = {"headless": True, **(launch_options or {})}
+        self._playwright_cm = None
+        self._playwright = None
+        self._started = False
+        self._handles = [_BrowserHandle(i) for i in range(self.size)]
+        self._capacity = asyncio.Semaphore(self.size * self.contexts_per_browser)
+        metrics.add_collector("browser_pool", BrowserPool.stats, owner=self)
+        self._start_lock = asyncio.Lock()
+        self._stats = {"launches": 0, "crashes": 0, "contexts_created": 0, "contexts_recycled": 0, "leases": 0}
+
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Start Playwright and launch every browser in the pool."""
+        async with self._start_lock:
+            if self._started:
+                return
+            self._playwright_cm = async_playwright()
+            self._playwright = await self._playwright_cm.__aenter__()
+            for handle in self._handles:
+                async with handle.lock:
+                    await self._launch(handle)
+            self._started = True
+
+    async def close(self):
+        """Close all contexts, browsers and the Playwright driver."""
+        for handle in self._handles:
+            for slot in handle.idle:
+                await _safe_close(slot.context)
+            handle.idle.clear()
+            if handle.browser is not None:
+                await _safe_close(handle.browser)
+                handle.browser = None
+        if self._playwright_cm is not None:
+            await self._playwright_cm.__aexit__(None, None, None)
+        self._playwright_cm = None
+        self._playwright = None
+        self._started = False
+
+    def stats(self) -> Dict:
+        """Return counters plus current utilization of the pool."""
+        leased = sum(h.leased for h in self._handles)
+        return {
+            **self._stats,
+            "browsers": self.size,
+            "browsers_alive": sum(1 for h in self._handles if h.alive),
+            "capacity": self.size * self.contexts_per_browser,
+            "leased": leased,
+            "idle": sum(len(h.idle) for h in self._handles),
+        }
+
+    @asynccontextmanager
+    async def page(self, **context_options) -> AsyncIterator[Page]:
+        """Lease a page for the duration of one task.
+
+        A pool that was never started is started by its first lease, so
+        callers that may not need a browser at all pay nothing for it.
+        ``context_options`` are passed to ``Browser.new_context``.
+        """
+        if not self._started:
+            await self.start()
+        async with self._capacity:
+            handle = min(self._handles, key=lambda h: h.leased)
+            handle.leased += 1
+            try:
+                slot = await self._checkout(handle, context_options)
+                try:
+                    yield slot.page
+                finally:
+                    await self._checkin(handle, slot)
+            finally:
+                handle.leased -= 1
+
+    async def _launch(self, handle: _BrowserHandle):
+        if handle.browser is not None:
+            self._stats["crashes"] += 1
+            logging.warning(f"Relaunching crashed browser #{handle.index}")
+            await _safe_close(handle.browser)
+        handle.idle.clear()
+        handle.browser = await self._playwright.chromium.launch(**self.launch_options)
+        self._stats["launches"] += 1
+
+    async def _checkout(self, handle: _BrowserHandle, context_options: Dict) -> _Slot:
+        key = tuple(sorted(context_options.items()))
+        async with handle.lock:
+            if not handle.alive:
+                await self._launch(handle)
+            for i in range(len(handle.idle) - 1, -1, -1):
+                if handle.idle[i].key != key:
+                    continue
+                slot = handle.idle.pop(i)
+                if not slot.page.is_closed():
+                    break
+                await _safe_close(slot.context)
+            else:
+                context = await handle.browser.new_context(**context_options)
+                slot = _Slot(context=context, page=await context.new_page(), key=key)
+                slot.track_origins()
+                self._stats["contexts_created"] += 1
+        slot.origins.clear()
+        self._stats["leases"] += 1
+        return slot
+
+    async def _checkin(self, handle: _BrowserHandle, slot: _Slot):
+        slot.navigations += 1
+        if not handle.alive:
+            # The browser died under this task; its contexts are gone with it
+            # and the next checkout relaunches it.
+            return
+        if (slot.page.is_closed() or len(slot.origins) > 1 or slot.navigations >= self.max_navigations
+                or await self._over_heap(slot.page)):
+            self._stats["contexts_recycled"] += 1
+            await _safe_close(slot.context)
+            return
+        try:
+            # Storage is cleared from the origin the page is still on.
+            await slot.page.evaluate(_CLEAR_STORAGE_JS)
+            await slot.context.clear_cookies()
+            await slot.context.clear_permissions()
+            await slot.page.goto("about:blank")
+        except Exception:
+            await _safe_close(slot.context)
+            return
+        if len(handle.idle) >= self.contexts_per_browser:
+            # Leases with other context options left these behind.
+            self._stats["contexts_recycled"] += 1
+            await _safe_close(handle.idle.pop(0).context)
+        handle.idle.append(slot)
+
+    async def _over_heap(self, page: Page) -> bool:
+        try:
+            return (await page.evaluate(_HEAP_JS) or 0) > self.max_heap_bytes
+        except Exception:
+            return True
+
+
+async def _safe_close(obj):
+    try:
+        await obj.close()
+    except Exception:
+        pass
@@ -0,0 +1,585 @@
+"""Coordinator/worker crawling over a shared broker.
+
+URLs are partitioned by host: ``shard_of(url)`` hashes the host into one of
+``shards`` buckets, and every shard is leased to exactly one live worker.
+A worker only claims URLs of shards it holds, so a host is never fetched by
+two workers at once and each worker's ``CrawlScheduler`` (per-host delay,
+robots ``Crawl-delay``) enforces politeness for the whole crawl. A shard
+handed to another worker stays idle for ``handoff_delay`` seconds so the
+new owner cannot hit the host sooner than the old one would have.
+
+Fault tolerance: workers heartbeat every ``heartbeat_interval`` seconds,
+renewing their shard and URL leases and taking a fair share
+(``ceil(shards / live workers)``) of the shards. A worker silent for
+``lease_seconds`` is reaped by any other worker: its shards are released and
+the URLs it had claimed are queued again. URLs that keep failing are
+dropped after ``max_attempts``.
+
+The broker is a SQLite database (WAL, ``BEGIN IMMEDIATE`` for every state
+change), which any number of processes on one machine - or on several
+machines sharing a filesystem with working locks - can use. Results go to
+the shared ``snapshot_store``, in which each process writes its own segments.
+
+Usage::
+
+    python -m crawler.distributed run --seed crawler/seeds/business_loans.yaml --workers 4
+    python -m crawler.distributed worker --broker path/to/broker.sqlite3   # on another node
+    python -m crawler.distributed status
+
+Settings (env): DIST_BROKER_PATH, DIST_SHARDS, DIST_LEASE_SECONDS,
+DIST_HEARTBEAT_INTERVAL, DIST_MAX_ATTEMPTS.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from crawler.browser_pool import BrowserPool
+from crawler.engine import allowed_by_robots, load_seed, render_and_save
+from crawler.fetch_client import BodyDecoder, aiter_capped, ensure_content_type, fetch_client
+from crawler.metrics import metrics, stage
+from crawler.render_detect import render_detector, visible_text
+from crawler.render_profiles import RenderProfiles
+from crawler.robots import robots_store
+from crawler.scheduler import DEFAULT_MIN_DELAY, CrawlScheduler, host_of
+from crawler.snapshot_store import snapshot_store
+
+BROKER_PATH = Path(os.environ.get(
+    "DIST_BROKER_PATH",
+    Path(__file__).resolve().parent.parent / "crawler_scraper_output" / "broker.sqlite3",
+))
+SHARDS = int(os.environ.get("DIST_SHARDS", 64))
+LEASE_SECONDS = float(os.environ.get("DIST_LEASE_SECONDS", 30))
+HEARTBEAT_INTERVAL = float(os.environ.get("DIST_HEARTBEAT_INTERVAL", 5))
+MAX_ATTEMPTS = int(os.environ.get("DIST_MAX_ATTEMPTS", 3))
+
+PENDING, IN_FLIGHT, DONE, FAILED = 0, 1, 2, 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    shard INTEGER NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS urls_next ON urls (state, shard, priority, id);
+CREATE INDEX IF NOT EXISTS urls_owner ON urls (owner, state);
+CREATE TABLE IF NOT EXISTS shards (
+    shard INTEGER PRIMARY KEY,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    node TEXT,
+    pid INTEGER,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def shard_of(url: str, shards: int = SHARDS) -> int:
+    """Stable shard of ``url``'s host (independent of ``PYTHONHASHSEED``)."""
+    digest = hashlib.blake2b(host_of(url).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+class Broker:
+    """
+    Broker
+    SQLite work queue shared by the coordinator and every worker.
+    """
+
+    def __init__(self, path: Optional[Path] = None, shards: int = SHARDS, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, handoff_delay: float = DEFAULT_MIN_DELAY):
+        self.path = Path(path or BROKER_PATH)
+        self.shards = max(1, shards)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.handoff_delay = handoff_delay
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Waiting on a lock for longer than a lease would let the
+            # worker's leases run out while it is blocked.
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None,
+                                         timeout=max(1.0, self.lease_seconds / 2))
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT OR IGNORE INTO shards (shard) VALUES (?)",
+                                   [(s,) for s in range(self.shards)])
+            count = self._conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+            self._conn.execute("COMMIT")
+            if count != self.shards:
+                raise ValueError(f"broker {self.path} was created with {count} shards, not {self.shards}")
+        return self._conn
+
+    def _write(self, fn: Callable[[sqlite3.Connection], object]):
+        """Run ``fn(conn)`` in one write transaction."""
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+
+    def add_urls(self, urls: Iterable[str], priority: int = 0) -> int:
+        """Queue URLs not queued before; returns how many were new."""
+        rows = [(u, shard_of(u, self.shards), priority) for u in urls]
+
+        def _add(conn):
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO urls (url, shard, priority) VALUES (?, ?, ?)", rows)
+            return conn.total_changes - before
+        return self._write(_add)
+
+    def register(self, worker_id: str, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO workers (id, node, pid, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+            (worker_id, socket.gethostname(), os.getpid(), now, now),
+        ))
+
+    def heartbeat(self, worker_id: str, now: Optional[float] = None,
+                  urls: Optional[Iterable[str]] = None) -> List[int]:
+        """Renew ``worker_id``'s leases, reap dead workers and rebalance shards.
+
+        Args:
+            urls: The claimed URLs the worker is still working on; only
+                their leases are renewed (all of its URLs when None), so a
+                URL whose outcome could not be recorded expires and is
+                queued again.
+
+        Returns:
+            List[int]: Shards the worker holds after rebalancing.
+        """
+        now = time.time() if now is None else now
+        lease_until = now + self.lease_seconds
+        urls = None if urls is None else list(urls)
+
+        def _beat(conn):
+            conn.execute("UPDATE workers SET heartbeat_at = ? WHERE id = ?", (now, worker_id))
+            self._reap(conn, now)
+            live = conn.execute("SELECT COUNT(*) FROM workers").fetchone()[0] or 1
+            share = math.ceil(self.shards / live)
+            conn.execute("UPDATE shards SET lease_until = ? WHERE owner = ?", (lease_until, worker_id))
+            if urls is None:
+                conn.execute("UPDATE urls SET lease_until = ? WHERE owner = ? AND state = ?",
+                             (lease_until, worker_id, IN_FLIGHT))
+            else:
+                conn.executemany("UPDATE urls SET lease_until = ? WHERE url = ? AND owner = ? AND state = ?",
+                                 [(lease_until, url, worker_id, IN_FLIGHT) for url in urls])
+            owned = [r[0] for r in conn.execute("SELECT shard FROM shards WHERE owner = ? ORDER BY shard",
+                                                (worker_id,))]
+            if len(owned) > share:
+                # Give back surplus shards, but only idle ones: a shard with a
+                # URL in flight would otherwise have two workers on one host.
+                busy = {r[0] for r in conn.execute(
+                    "SELECT DISTINCT shard FROM urls WHERE owner = ? AND state = ?", (worker_id, IN_FLIGHT))}
+                surplus = [s for s in reversed(owned) if s not in busy][:len(owned) - share]
+                conn.executemany(
+                    "UPDATE shards SET owner = NULL, lease_until = 0, available_at = ? WHERE shard = ?",
+                    [(now + self.handoff_delay, s) for s in surplus],
+                )
+                owned = [s for s in owned if s not in surplus]
+            elif len(owned) < share:
+                free = [r[0] for r in conn.execute(
+                    "SELECT shard FROM shards WHERE owner IS NULL ORDER BY shard LIMIT ?", (share - len(owned),))]
+                conn.executemany("UPDATE shards SET owner = ?, lease_until = ? WHERE shard = ?",
+                                 [(worker_id, lease_until, s) for s in free])
+                owned = sorted(owned + free)
+            return owned
+        return self._write(_beat)
+
+    def _reap(self, conn: sqlite3.Connection, now: float):
+        dead = [r[0] for r in conn.execute("SELECT id FROM workers WHERE heartbeat_at < ?",
+                                           (now - self.lease_seconds,))]
+        for worker_id in dead:
+            logging.info(f"reaping worker {worker_id}: no heartbeat for {self.lease_seconds}s")
+            self._release(conn, worker_id, now)
+        # Leases can also run out while the owner is still registered (a
+        # stalled process); those shards become free as well.
+        conn.execute("UPDATE shards SET owner = NULL, available_at = ? WHERE owner IS NOT NULL AND lease_until < ?",
+                     (now + self.handoff_delay, now))
+        conn.execute("UPDATE urls SET state = ?, owner = NULL, lease_until = NULL WHERE state = ? AND lease_until < ?",
+                     (PENDING, IN_FLIGHT, now))
+
+    def _release(self, conn: sqlite3.Connection, worker_id: str, now: float):
+        conn.execute("UPDATE urls SET state = ?, owner = NULL, lease_until = NULL WHERE owner = ? AND state = ?",
+                     (PENDING, worker_id, IN_FLIGHT))
+        conn.execute("UPDATE shards SET owner = NULL, lease_until = 0, available_at = ? WHERE owner = ?",
+                     (now + self.handoff_delay, worker_id))
+        conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def unregister(self, worker_id: str, now: Optional[float] = None):
+        """Leave the crawl: claimed URLs are queued again and shards freed."""
+        now = time.time() if now is None else now
+        self._write(lambda conn: self._release(conn, worker_id, now))
+
+    def claim(self, worker_id: str, n: int = 1, now: Optional[float] = None) -> List[str]:
+        """Lease up to ``n`` pending URLs from shards ``worker_id`` holds."""
+        now = time.time() if now is None else now
+
+        def _claim(conn):
+            rows = conn.execute(
+                """
+                UPDATE urls SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT u.id FROM urls u JOIN shards s ON s.shard = u.shard
+                    WHERE u.state = ? AND s.owner = ? AND s.available_at <= ?
+                    ORDER BY u.priority, u.id LIMIT ?
+                )
+                RETURNING id, url
+                """,
+                (IN_FLIGHT, worker_id, now + self.lease_seconds, PENDING, worker_id, now, max(0, n)),
+            ).fetchall()
+            return [url for _, url in sorted(rows)]
+        return self._write(_claim)
+
+    def done(self, worker_id: str, url: str, now: Optional[float] = None):
+        now = time.time() if now is None else now
+
+        def _done(conn):
+            if conn.execute("UPDATE urls SET state = ?, owner = NULL, lease_until = NULL, finished_at = ? "
+                            "WHERE url = ? AND owner = ?", (DONE, now, url, worker_id)).rowcount:
+                conn.execute("UPDATE workers SET done = done + 1 WHERE id = ?", (worker_id,))
+        self._write(_done)
+
+    def failed(self, worker_id: str, url: str, error: str = "", now: Optional[float] = None) -> bool:
+        """Record a failure; True if the URL goes back in the queue."""
+        now = time.time() if now is None else now
+
+        def _failed(conn):
+            row = conn.execute("SELECT attempts FROM urls WHERE url = ? AND owner = ?", (url, worker_id)).fetchone()
+            if row is None:
+                return False
+            retry = row[0] < self.max_attempts
+            conn.execute(
+                "UPDATE urls SET state = ?, owner = NULL, lease_until = NULL, last_error = ?, finished_at = ? "
+                "WHERE url = ?",
+                (PENDING if retry else FAILED, error[:500], None if retry else now, url),
+            )
+            conn.execute("UPDATE workers SET failed = failed + 1 WHERE id = ?", (worker_id,))
+            return retry
+        return self._write(_failed)
+
+    def release(self, worker_id: str, url: str):
+        """Put a URL ``worker_id`` claimed back in the queue without recording an outcome."""
+        self._write(lambda conn: conn.execute(
+            "UPDATE urls SET state = ?, owner = NULL, lease_until = NULL WHERE url = ? AND owner = ? AND state = ?",
+            (PENDING, url, worker_id, IN_FLIGHT),
+        ))
+
+    def idle(self) -> bool:
+        """True when no URL is waiting or in flight."""
+        with self._lock:
+            return self._open().execute(
+                "SELECT 1 FROM urls WHERE state IN (?, ?) LIMIT 1", (PENDING, IN_FLIGHT)
+            ).fetchone() is None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._open()
+            states = dict(conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+            workers = [
+                {"id": r[0], "node": r[1], "pid": r[2], "heartbeat_age": round(time.time() - r[3], 1),
+                 "done": r[4], "failed": r[5],
+                 "shards": conn.execute("SELECT COUNT(*) FROM shards WHERE owner = ?", (r[0],)).fetchone()[0]}
+                for r in conn.execute("SELECT id, node, pid, heartbeat_at, done, failed FROM workers ORDER BY id")
+            ]
+        return {
+            "pending": states.get(PENDING, 0),
+            "in_flight": states.get(IN_FLIGHT, 0),
+            "done": states.get(DONE, 0),
+            "failed": states.get(FAILED, 0),
+            "shards": self.shards,
+            "workers": workers,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+Handler = Callable[[str], Awaitable[Optional[Dict]]]
+
+
+async def fetch_static(url: str) -> Optional[Dict]:
+    """Fetch ``url`` without a browser and store its snapshot."""
+    if not await robots_store.can_fetch(url):
+        logging.info(f"blocked by robots: {url}")
+        return None
+    async with fetch_client.stream("GET", url) as r:
+        r.raise_for_status()
+        ensure_content_type(r)
+        decoder = BodyDecoder(r.headers.get("Content-Type", ""))
+        parts = [decoder.feed(chunk) async for chunk in aiter_capped(r)]
+        parts.append(decoder.flush())
+    html = "".join(parts)
+    with stage("parse"):
+        text = visible_text(html)
+    await asyncio.to_thread(snapshot_store.put, url, html=html, text=text,
+                            metadata={"fetched_at": time.time(), "worker_pid": os.getpid()}, source="distributed")
+    return {"url": url, "html": html, "text": text}
+
+
+def make_handler(mode: str, pool: Optional[BrowserPool] = None, profiles: Optional[RenderProfiles] = None) -> Handler:
+    """Page handler for ``mode``: ``static``, ``render`` or ``auto``.
+
+    ``auto`` fetches statically and renders only pages that need a browser;
+    the browser pool starts with the first such page. ``profiles`` picks the
+    render profile of each rendered URL.
+    """
+    if mode != "static" and pool is None:
+        raise ValueError(f"mode {mode!r} needs a browser pool")
+
+    async def _render(url: str) -> Optional[Dict]:
+        if not await allowed_by_robots(url):
+            logging.info(f"blocked by robots: {url}")
+            return None
+        return await render_and_save(pool, url, profiles.for_url(url) if profiles is not None else None)
+
+    async def _auto(url: str) -> Optional[Dict]:
+        cached = render_detector.cached(url)
+        if cached is not None and cached.needs_render:
+            return await _render(url)
+        page = await fetch_static(url)
+        if page is not None and render_detector.classify(url, page["html"]).needs_render:
+            return await _render(url)
+        return page
+
+    handlers = {"static": fetch_static, "render": _render, "auto": _auto}
+    if mode not in handlers:
+        raise ValueError(f"unknown worker mode {mode!r}; expected one of {sorted(handlers)}")
+    return handlers[mode]
+
+
+class Worker:
+    """
+    Worker
+    Crawls the URLs of the shards it holds until the broker runs dry.
+    """
+
+    def __init__(self, broker: Broker, handler: Handler, worker_id: Optional[str] = None,
+                 concurrency: int = 4, per_host_concurrency: int = 1, min_delay: float = DEFAULT_MIN_DELAY,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, poll_interval: float = 0.5,
+                 batch: Optional[int] = None):
+        self.broker = broker
+        self.handler = handler
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.min_delay = min_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.batch = batch or 2 * concurrency
+        self._stopping = False
+        # Claimed URLs whose outcome is not recorded yet.
+        self._active: Set[str] = set()
+        self._writes: Set[asyncio.Task] = set()
+
+    def stop(self):
+        self._stopping = True
+
+    async def _record(self, url: str, error: Optional[BaseException]):
+        try:
+            if error is None:
+                await asyncio.to_thread(self.broker.done, self.id, url)
+            else:
+                await asyncio.to_thread(self.broker.failed, self.id, url, str(error) or type(error).__name__)
+        except Exception as e:
+            logging.warning(f"worker {self.id}: could not record {url}: {e}")
+            try:
+                await asyncio.to_thread(self.broker.release, self.id, url)
+            except Exception as e:
+                # No longer renewed, its lease expires and it is queued again.
+                logging.warning(f"worker {self.id}: could not release {url}: {e}")
+        finally:
+            self._active.discard(url)
+
+    def _finish(self, url: str, result, error: Optional[BaseException]):
+        task = asyncio.create_task(self._record(url, error))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _heartbeat(self):
+        try:
+            await asyncio.to_thread(self.broker.heartbeat, self.id, None, list(self._active))
+        except Exception as e:
+            logging.warning(f"worker {self.id}: heartbeat failed: {e}")
+
+    async def run(self, exit_when_idle: bool = True) -> Dict:
+        """Claim and crawl URLs; returns the scheduler stats.
+
+        With ``exit_when_idle`` the worker stops once the broker has no URL
+        waiting or in flight anywhere; otherwise it runs until ``stop``.
+        """
+        await asyncio.to_thread(self.broker.register, self.id)
+        scheduler = CrawlScheduler(
+            self.handler,
+            concurrency=self.concurrency,
+            per_host_concurrency=self.per_host_concurrency,
+            min_delay=self.min_delay,
+            host_delay=robots_store.crawl_delay,
+            on_result=self._finish,
+        )
+        last_beat = 0.0
+        try:
+            async with scheduler:
+                while not self._stopping:
+                    if time.monotonic() - last_beat >= self.heartbeat_interval:
+                        await self._heartbeat()
+                        last_beat = time.monotonic()
+                    urls = []
+                    try:
+                        if scheduler.pending < self.batch:
+                            urls = await asyncio.to_thread(self.broker.claim, self.id,
+                                                           self.batch - scheduler.pending)
+                        idle = (exit_when_idle and not urls and scheduler.pending == 0 and not self._writes
+                                and await asyncio.to_thread(self.broker.idle))
+                    except sqlite3.OperationalError as e:
+                        logging.warning(f"worker {self.id}: broker busy: {e}")
+                        urls, idle = [], False
+                    self._active.update(urls)
+                    for url in urls:
+                        await scheduler.submit(url)
+                    if urls:
+                        continue
+                    if idle:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+            if self._writes:
+                await asyncio.gather(*self._writes)
+        finally:
+            await asyncio.to_thread(self.broker.unregister, self.id)
+            await asyncio.to_thread(snapshot_store.flush)
+        return dict(scheduler.stats)
+
+
+def _worker_main(broker_path: str, shards: int, mode: str, concurrency: int, min_delay: float):
+    # Entry point of a spawned local worker process.
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(message)s")
+    broker = Broker(Path(broker_path), shards=shards, handoff_delay=min_delay)
+
+    async def _run():
+        pool = BrowserPool() if mode != "static" else None
+        try:
+            worker = Worker(broker, make_handler(mode, pool), concurrency=concurrency, min_delay=min_delay)
+            stats = await worker.run()
+            logging.info(f"worker {worker.id} finished: {stats}")
+            logging.info(f"metrics: {json.dumps(metrics.summary())}")
+        finally:
+            if pool is not None:
+                await pool.close()
+            await fetch_client.aclose()
+
+    asyncio.run(_run())
+    broker.close()
+
+
+def run_local(urls: Iterable[str], workers: int = 4, broker: Optional[Broker] = None, mode: str = "auto",
+              concurrency: int = 4, min_delay: float = DEFAULT_MIN_DELAY, poll_interval: float = 1.0) -> Dict:
+    """Coordinator for one machine: queue ``urls`` and crawl them with ``workers`` processes.
+
+    Workers are spawned (not forked) and share the broker file; the call
+    returns the broker stats once every worker has exited.
+    """
+    broker = broker or Broker()
+    added = broker.add_urls(urls)
+    logging.info(f"coordinator: {added} new URLs queued in {broker.path}")
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=_worker_main, args=(str(broker.path), broker.shards, mode, concurrency, min_delay),
+                    name=f"crawl-worker-{i}")
+        for i in range(max(1, workers))
+    ]
+    for proc in procs:
+        proc.start()
+    try:
+        while any(proc.is_alive() for proc in procs):
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+        raise
+    finally:
+        for proc in procs:
+            proc.join()
+    crashed = [p.name for p in procs if p.exitcode]
+    if crashed:
+        logging.warning(f"workers exited with errors: {crashed}")
+    return broker.stats()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Distributed crawl coordinator and worker.")
+    p.add_argument("--broker", type=Path, default=BROKER_PATH)
+    p.add_argument("--shards", type=int, default=SHARDS)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="queue a seed file and crawl it with local worker processes")
+    r.add_argument("--seed", default="crawler/seeds/business_loans.yaml")
+    r.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    w = sub.add_parser("worker", help="join a crawl as one worker")
+    for sp in (r, w):
+        sp.add_argument("--mode", choices=["auto", "static", "render"], default="auto")
+        sp.add_argument("--concurrency", type=int, default=4)
+        sp.add_argument("--min-delay", type=float, default=DEFAULT_MIN_DELAY)
+    a = sub.add_parser("add", help="queue URLs (one per line on stdin)")
+    a.add_argument("--priority", type=int, default=0)
+    sub.add_parser("status")
+    args = p.parse_args()
+
+    broker = Broker(args.broker, shards=args.shards)
+    if args.cmd == "run":
+        urls = [s["url"] for s in load_seed(args.seed).get("sources", []) if s.get("url")]
+        broker.handoff_delay = args.min_delay
+        print(json.dumps(run_local(urls, workers=args.workers, broker=broker, mode=args.mode,
+                                   concurrency=args.concurrency, min_delay=args.min_delay), indent=2))
+    elif args.cmd == "worker":
+        _worker_main(str(args.broker), args.shards, args.mode, args.concurrency, args.min_delay)
+    elif args.cmd == "add":
+        import sys
+        print(f"queued {broker.add_urls((line.strip() for line in sys.stdin if line.strip()), args.priority)} URLs")
+    else:
+        print(json.dumps(broker.stats(), indent=2))
+    broker.close()
+
+
+if __name__ == "__main__":
+    main()
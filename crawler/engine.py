@@ -1,68 +1,199 @@
 import logging
 
 import asyncio
-import json
 import time
-from pathlib import Path
-from typing import List, Dict
-import aiofiles
+from typing import AsyncIterable, Callable, Iterable, Dict, Optional, Set, Union
 import httpx
-from playwright.async_api import async_playwright
+from crawler.browser_pool import BrowserPool
+from crawler.fetch_cache import FetchCacheMiss, fetch_cache
+from crawler.frontier import Frontier
+from crawler.metrics import record_error, stage
+from crawler.render_profiles import (RENDER_SECONDS, RenderProfile, RenderProfiles, apply_profile,
+                                     default_profile, wait_until_ready)
+from crawler.robots import robots_store
+from crawler.scheduler import CrawlScheduler, DEFAULT_MIN_DELAY
+from crawler.sitemaps import SitemapDiscovery, sitemap_sources
+from crawler.recrawl import RecrawlStore, recrawl_store
+from crawler.snapshot_store import SnapshotRef, content_hash, snapshot_store
+from crawler.url_policy import UrlPolicy, find_canonical
 
-RAW_OUT = Path("crawler_scraper_output/raw")
-RAW_OUT.mkdir(parents=True, exist_ok=True)
+_FRONTIER_BATCH = 500
 
 
-async def fetch_robots_txt(url: str, client: httpx.AsyncClient, timeout: int = 10) -> str:
-    try:
-        r = await client.get(url.rstrip("/") + "/robots.txt", timeout=timeout)
-        return r.text
-    except Exception:
-        return ""
-
+async def allowed_by_robots(url: str, client: Optional[httpx.AsyncClient] = None) -> bool:
+    return await robots_store.can_fetch(url, client=client)
 
-async def allowed_by_robots(url: str, client: httpx.AsyncClient) -> bool:
-    robots = await fetch_robots_txt(url, client)
-    return "Disallow: /" not in robots
 
+async def save_snapshot(url: str, html: str, text: str, metadata: Dict) -> SnapshotRef:
+    """Store a snapshot in the shared snapshot store."""
+    return await asyncio.to_thread(snapshot_store.put, url, html=html, text=text, metadata=metadata,
+                                   source=metadata.get("source", "render"))
 
-async def save_snapshot(url: str, html: str, text: str, metadata: Dict):
-    ts = int(time.time())
-    fname = RAW_OUT / f"{ts}_{abs(hash(url))}.json"
-    async with aiofiles.open(fname, "w", encoding="utf-8") as f:
-        await f.write(json.dumps({"url": url, "html": html, "text": text, "metadata": metadata}, ensure_ascii=False))
 
+async def crawl_page(pool: BrowserPool, url: str, timeout: int = 60,
+                     profile: Optional[RenderProfile] = None) -> Dict:
+    """Render ``url`` under ``profile`` (see ``crawler.render_profiles``).
 
-async def crawl_page(playwright, url: str, timeout: int = 60) -> Dict:
-    browser = await playwright.chromium.launch(headless=True)
-    page = await browser.new_page()
-    await page.set_default_navigation_timeout(timeout * 1000)
-    await page.goto(url)
-    html = await page.content()
-    try:
-        text = await page.inner_text("body")
-    except Exception:
-        text = ""
-    await browser.close()
-    return {"url": url, "html": html, "text": text}
-
-
-async def crawl_urls(urls: List[str], concurrency: int = 4):
-    async with httpx.AsyncClient() as client:
-        async with async_playwright() as p:
-            asyncio.Semaphore(concurrency)
-
-            async def _crawl(u):
-                if not await allowed_by_robots(u, client):
-                    logging.info("blocked by robots", u)
-                    return
+    In ``FETCH_CACHE`` replay mode the DOM recorded for ``url`` and
+    ``profile`` is returned without a browser; record mode stores it.
+    """
+    profile = profile or default_profile()
+    if fetch_cache.replaying:
+        snap = await asyncio.to_thread(fetch_cache.get_render, url, profile.name)
+        if snap is None:
+            raise FetchCacheMiss(f"no recorded render of {url} ({profile.name})")
+        return snap
+    async with pool.page(**profile.context_options) as page:
+        page.set_default_navigation_timeout(timeout * 1000)
+        async with apply_profile(page, profile, url):
+            with stage("render"), RENDER_SECONDS.time(profile=profile.name):
                 try:
-                    snap = await crawl_page(p, u)
-                    await save_snapshot(u, snap["html"], snap["text"], {"fetched_at": time.time()})
+                    await page.goto(url, wait_until=profile.wait_until)
                 except Exception as e:
-                    logging.info("crawl error", u, e)
+                    record_error("render", e)
+                    raise
+                await wait_until_ready(page, profile)
+                html = await page.content()
+                try:
+                    text = await page.inner_text("body")
+                except Exception:
+                    text = ""
+    if fetch_cache.recording:
+        await asyncio.to_thread(fetch_cache.put_render, url, profile.name, html, text)
+    return {"url": url, "html": html, "text": text, "render_profile": profile.name}
+
+
+async def render_and_save(pool: BrowserPool, url: str, profile: Optional[RenderProfile] = None) -> Dict:
+    """Render ``url`` and store its snapshot; errors propagate to the caller."""
+    snap = await crawl_page(pool, url, profile=profile)
+    await save_snapshot(url, snap["html"], snap["text"],
+                        {"fetched_at": time.time(), "render_profile": snap["render_profile"]})
+    return snap
+
+
+async def _render(pool: BrowserPool, url: str, profiles: Optional[RenderProfiles]) -> Dict:
+    if profiles is None:
+        return await render_and_save(pool, url)
+    return await render_and_save(pool, url, profiles.for_url(url))
+
+
+async def crawl_urls(urls: Union[Iterable[str], AsyncIterable[str]], concurrency: int = 4, pool: Optional[BrowserPool] = None,
+                     per_host_concurrency: int = 1, min_delay: float = DEFAULT_MIN_DELAY,
+                     on_result: Optional[Callable[[str, Optional[Dict], Optional[BaseException]], None]] = None,
+                     profiles: Optional[RenderProfiles] = None, policy: Optional[UrlPolicy] = None) -> Dict:
+    """Render every URL through the scheduler; returns scheduler stats.
+
+    ``urls`` may be any iterable (including a generator or an async
+    iterable such as ``SitemapDiscovery.stream``): at most
+    ``concurrency`` pages render at once and only ``DEFAULT_MAX_PENDING``
+    URLs are buffered ahead of them. ``on_result(url, snapshot, error)`` is
+    called as each URL finishes; ``snapshot`` is None for URLs blocked by
+    robots.txt. ``profiles`` picks each URL's render profile.
+
+    URLs are canonicalized and duplicates and crawler traps skipped by
+    ``policy`` (``crawler.url_policy``; a default policy per call), so
+    ``on_result`` sees canonical URLs; a page's ``rel=canonical`` never
+    removes URLs from ``urls``. The policy's report is returned under
+    ``url_policy``.
+    """
+    policy = policy or UrlPolicy()
+    if pool is None:
+        async with BrowserPool() as own_pool:
+            return await crawl_urls(urls, concurrency=concurrency, pool=own_pool,
+                                    per_host_concurrency=per_host_concurrency, min_delay=min_delay,
+                                    on_result=on_result, profiles=profiles, policy=policy)
+
+    async def _crawl(u):
+        if not await allowed_by_robots(u):
+            logging.info(f"blocked by robots: {u}")
+            return None
+        snap = await _render(pool, u, profiles)
+        policy.observe_canonical(u, find_canonical(snap.get("html"), u))
+        return snap
+
+    scheduler = CrawlScheduler(
+        _crawl,
+        concurrency=concurrency,
+        per_host_concurrency=per_host_concurrency,
+        min_delay=min_delay,
+        host_delay=robots_store.crawl_delay,
+        on_result=on_result,
+    )
+    stats = await scheduler.run(policy.filter(urls))
+    return {**stats, "url_policy": policy.report()}
+
+
+async def crawl_frontier(frontier: Frontier, concurrency: int = 4, pool: Optional[BrowserPool] = None,
+                         per_host_concurrency: int = 1, min_delay: float = DEFAULT_MIN_DELAY,
+                         on_result: Optional[Callable[[str, Optional[Dict], Optional[BaseException]], None]] = None,
+                         batch: Optional[int] = None, profiles: Optional[RenderProfiles] = None) -> Dict:
+    """Render URLs claimed from ``frontier`` until it is empty.
+
+    At most ``batch`` URLs (default ``2 * concurrency``) are leased at a
+    time, so leases do not run out while URLs wait for a slot. URLs are
+    marked done or failed in the frontier as soon as they finish, so a
+    crawl that is killed can be resumed with ``frontier.recover()`` without
+    rendering finished pages again. Failed URLs are retried up to the
+    frontier's ``max_attempts``.
+    """
+    if pool is None:
+        async with BrowserPool() as own_pool:
+            return await crawl_frontier(frontier, concurrency=concurrency, pool=own_pool,
+                                        per_host_concurrency=per_host_concurrency, min_delay=min_delay,
+                                        on_result=on_result, batch=batch, profiles=profiles)
 
-            await asyncio.gather(*(_crawl(u) for u in urls))
+    async def _crawl(u):
+        if not await allowed_by_robots(u):
+            logging.info(f"blocked by robots: {u}")
+            return None
+        return await _render(pool, u, profiles)
+
+    writes: Set[asyncio.Task] = set()
+
+    async def _mark(url: str, error: Optional[BaseException]):
+        try:
+            if error is None:
+                await asyncio.to_thread(frontier.done, url)
+            else:
+                await asyncio.to_thread(frontier.failed, url, str(error) or type(error).__name__)
+        except Exception as e:
+            # The URL stays leased; ``recover`` hands it out again.
+            logging.warning(f"frontier: could not record {url}: {e}")
+
+    def _finish(url: str, snap: Optional[Dict], error: Optional[BaseException]):
+        task = asyncio.create_task(_mark(url, error))
+        writes.add(task)
+        task.add_done_callback(writes.discard)
+        if on_result is not None:
+            on_result(url, snap, error)
+
+    batch = max(1, batch or 2 * concurrency)
+    scheduler = CrawlScheduler(
+        _crawl,
+        concurrency=concurrency,
+        per_host_concurrency=per_host_concurrency,
+        min_delay=min_delay,
+        host_delay=robots_store.crawl_delay,
+        on_result=_finish,
+        max_pending=batch,
+    )
+    async with scheduler:
+        while True:
+            # Top up to ``batch`` outstanding URLs; when full, the one claimed
+            # URL waits in ``submit`` for a free slot.
+            items = await asyncio.to_thread(frontier.claim, max(1, batch - scheduler.pending))
+            if items:
+                for item in items:
+                    await scheduler.submit(item.url, priority=item.depth)
+                continue
+            if scheduler.pending:
+                await scheduler.join()
+            elif writes:
+                # Failures being recorded may put retries back in the queue.
+                await asyncio.gather(*writes)
+            else:
+                break
+    return {**scheduler.stats, "frontier": await asyncio.to_thread(frontier.stats)}
 
 
 def load_seed(seed_path: str) -> Dict:
@@ -71,10 +202,110 @@ def load_seed(seed_path: str) -> Dict:
         return yaml.safe_load(f)
 
 
-async def run_from_seed(seed_file: str):
+async def run_from_seed(seed_file: str, incremental: bool = False, budget: Optional[int] = None,
+                        recrawl: Optional[RecrawlStore] = None, frontier: Optional[Frontier] = None,
+                        discovery: Optional[SitemapDiscovery] = None) -> Dict:
+    """Render the seed URLs.
+
+    With ``incremental`` only the URLs the recrawl store considers due are
+    rendered (at most ``budget``, most likely changed first), and every
+    outcome is recorded so the next run's schedule adapts to it.
+
+    With a ``frontier`` the URLs go through it: URLs left in flight by a
+    previous, interrupted run are queued again, URLs it already finished
+    are skipped and progress survives a crash. Due and sitemap URLs are
+    fetched again even if a previous run finished them.
+
+    Sources that enable ``sitemap`` (``crawler.sitemaps``) and whose site
+    publishes sitemaps are replaced by the pages those list, minus the ones
+    whose ``lastmod`` is not newer than their last recorded fetch; these
+    outcomes are always recorded in the recrawl store. ``budget`` caps the
+    due and sitemap URLs together.
+
+    Pages render under the profiles the seed's ``render`` section and
+    ``render_profile`` keys select (``crawler.render_profiles``). URLs are
+    canonicalized and filtered by the seed's ``url_policy``
+    (``crawler.url_policy``) before anything else.
+    """
     seed = load_seed(seed_file)
-    urls = [s["url"] for s in seed.get("sources", [])]
-    await crawl_urls(urls)
+    policy = UrlPolicy.from_seed(seed)
+    urls = list(dict.fromkeys(policy.canonicalize(s["url"]) for s in seed.get("sources", [])))
+    profiles = RenderProfiles.from_seed(seed)
+    recrawl = recrawl or recrawl_store
+    sources = sitemap_sources(seed)
+    published = []
+    if sources:
+        discovery = discovery or SitemapDiscovery(recrawl=recrawl, canonicalize=policy.canonicalize)
+        published = await discovery.locate(sources)
+        replaced = {policy.canonicalize(u) for u in published}
+        urls = [u for u in urls if u not in replaced]
+    if not incremental and not published:
+        return await _crawl_seed(urls, frontier, profiles=profiles, policy=policy)
+
+    due = urls
+    if incremental:
+        await asyncio.to_thread(recrawl.add, urls)
+        due = await asyncio.to_thread(recrawl.due, budget, None, urls)
+        logging.info(f"incremental: {len(due)} of {len(urls)} URLs due")
+
+    writes: Set[asyncio.Task] = set()
+
+    async def _write(url: str, **outcome):
+        try:
+            await asyncio.to_thread(recrawl.record, url, **outcome)
+        except Exception as e:
+            logging.warning(f"recrawl: could not record {url}: {e}")
+
+    def _record(url: str, snap: Optional[Dict], error: Optional[BaseException]):
+        # Called on the loop by the scheduler; the SQLite write runs in a thread.
+        if error is not None:
+            outcome = {"error": str(error) or type(error).__name__}
+        elif snap is not None:
+            # Rendered markup carries nonces and timestamps; the text does not.
+            outcome = {"content_hash": content_hash(None, snap["text"])}
+        else:
+            return
+        task = asyncio.create_task(_write(url, **outcome))
+        writes.add(task)
+        task.add_done_callback(writes.discard)
+
+    try:
+        stats = await _crawl_seed(discovery.stream(due, budget) if published else due, frontier,
+                                  on_result=_record, profiles=profiles, policy=policy, requeue=True)
+    finally:
+        if writes:
+            await asyncio.gather(*writes)
+    if published:
+        if not stats.get("failed"):
+            await asyncio.to_thread(discovery.commit)
+        stats["sitemaps"] = dict(discovery.stats)
+    if not incremental:
+        return stats
+    return {**stats, "due": len(due), "skipped": len(urls) - len(due)}
+
+
+async def _crawl_seed(urls: Union[Iterable[str], AsyncIterable[str]], frontier: Optional[Frontier],
+                      on_result=None, profiles: Optional[RenderProfiles] = None,
+                      policy: Optional[UrlPolicy] = None, requeue: bool = False) -> Dict:
+    policy = policy or UrlPolicy()
+    if frontier is None:
+        return await crawl_urls(urls, on_result=on_result, profiles=profiles, policy=policy)
+    recovered = await asyncio.to_thread(frontier.recover)
+    urls = policy.filter(urls)
+    if isinstance(urls, AsyncIterable):
+        # Discovered URLs go to disk as they arrive; the frontier drops duplicates.
+        added, batch = 0, []
+        async for url in urls:
+            batch.append(url)
+            if len(batch) >= _FRONTIER_BATCH:
+                added += await asyncio.to_thread(frontier.add_many, batch, requeue=requeue)
+                batch = []
+        added += await asyncio.to_thread(frontier.add_many, batch, requeue=requeue)
+    else:
+        added = await asyncio.to_thread(frontier.add_many, urls, requeue=requeue)
+    logging.info(f"frontier: {added} URLs queued, {recovered} resumed from an interrupted run")
+    stats = await crawl_frontier(frontier, on_result=on_result, profiles=profiles)
+    return {**stats, "url_policy": policy.report()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,422 @@
+"""Record/replay cache of HTTP responses and rendered pages.
+
+With ``FETCH_CACHE=record`` every GET that goes through ``fetch_client``
+(``fetch_url``, ``scrape_url``, robots.txt, the orchestrator's triage, ...)
+is stored with its status, headers and raw body, and ``crawl_page`` stores
+the DOM and text it rendered. With ``FETCH_CACHE=replay`` the same calls are
+answered from the cache and never touch the network or start a browser; a
+request that was not recorded raises ``FetchCacheMiss``. That makes
+iterating on extraction and classification deterministic and CPU-bound::
+
+    FETCH_CACHE=record python orchestrator.py seeds.yaml   # once, online
+    FETCH_CACHE=replay python orchestrator.py seeds.yaml   # as often as needed
+
+Responses are keyed by the canonical request: method, URL (lowercased scheme
+and host, no default port or fragment) and the ``Accept`` and
+``Accept-Language`` headers. The ``User-Agent`` is not part of the key.
+Conditional requests are recorded unconditionally; both modes answer them
+with a 304 when the stored ``ETag``/``Last-Modified`` matches, as the origin
+would have. Redirects are cached hop by hop. Bodies larger than
+``FETCH_CACHE_MAX_ENTRY_BYTES`` pass through unrecorded.
+
+Entries live in one SQLite file (bodies zlib-compressed unless the server
+already compressed them). Once the file holds more than
+``FETCH_CACHE_MAX_MB`` the least recently used entries are evicted.
+
+Settings (env): FETCH_CACHE (off, record, replay), FETCH_CACHE_PATH,
+FETCH_CACHE_MAX_MB, FETCH_CACHE_MAX_ENTRY_BYTES.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from crawler.metrics import metrics
+
+MODES = ("off", "record", "replay")
+FETCH_CACHE = os.environ.get("FETCH_CACHE", "off").lower()
+FETCH_CACHE_PATH = Path(os.environ.get(
+    "FETCH_CACHE_PATH",
+    Path(__file__).resolve().parent.parent / "crawler_scraper_output" / "fetch_cache.sqlite3",
+))
+MAX_MB = float(os.environ.get("FETCH_CACHE_MAX_MB", 2048))
+MAX_ENTRY_BYTES = int(os.environ.get("FETCH_CACHE_MAX_ENTRY_BYTES", 8 * 1024 * 1024))
+CACHEABLE_METHODS = ("GET", "HEAD")
+KEY_HEADERS = ("accept", "accept-language")
+# Last-access times are written back in batches instead of on every hit.
+_TOUCH_BATCH = 256
+_COMPRESS_MIN = 512
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+"""
+
+
+class FetchCacheMiss(Exception):
+    """Raised in replay mode for a request or render that was never recorded."""
+
+
+def canonical_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def request_key(method: str, url: str, headers: Optional[httpx.Headers] = None) -> str:
+    varies = [f"{name}={headers[name]}" for name in KEY_HEADERS if headers is not None and name in headers]
+    return " ".join([method.upper(), canonical_url(url), *varies])
+
+
+def render_key(url: str, profile: str) -> str:
+    return f"RENDER {profile} {canonical_url(url)}"
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+    def header(self, name: str) -> Optional[str]:
+        name = name.lower()
+        return next((v for k, v in self.headers if k.lower() == name), None)
+
+    def not_modified_for(self, request: httpx.Request) -> bool:
+        if self.status != 200:
+            return False
+        etag, modified = self.header("etag"), self.header("last-modified")
+        if etag and request.headers.get("if-none-match"):
+            return etag in [t.strip() for t in request.headers["if-none-match"].split(",")]
+        return bool(modified and request.headers.get("if-modified-since") == modified)
+
+    def to_response(self, request: httpx.Request) -> httpx.Response:
+        if self.not_modified_for(request):
+            kept = [(k, v) for k, v in self.headers if k.lower() in ("etag", "last-modified", "cache-control", "date")]
+            return httpx.Response(304, headers=kept, stream=httpx.ByteStream(b""), request=request)
+        body = b"" if request.method == "HEAD" else self.body
+        return httpx.Response(self.status, headers=self.headers, stream=httpx.ByteStream(body), request=request)
+
+
+def _unconditional(request: httpx.Request) -> httpx.Request:
+    if "if-none-match" not in request.headers and "if-modified-since" not in request.headers:
+        return request
+    headers = request.headers.copy()
+    headers.pop("if-none-match", None)
+    headers.pop("if-modified-since", None)
+    return httpx.Request(request.method, request.url, headers=headers, extensions=request.extensions)
+
+
+class FetchCache:
+    """
+    Fetch Cache
+    Disk-backed response and render store with a size cap and LRU eviction.
+    """
+
+    def __init__(self, path: Optional[Path] = None, mode: str = FETCH_CACHE, max_mb: float = MAX_MB,
+                 max_entry_bytes: int = MAX_ENTRY_BYTES):
+        self.path = Path(path or FETCH_CACHE_PATH)
+        self.mode = mode
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entry_bytes = max_entry_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._entries = 0
+        self._touched: Dict[str, float] = {}
+        self.counters = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "too_large": 0}
+        metrics.add_collector("fetch_cache", FetchCache.stats, owner=self)
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"unknown fetch cache mode {mode!r}; expected one of {MODES}")
+        self._mode = mode
+
+    @property
+    def recording(self) -> bool:
+        return self._mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self._mode == "replay"
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._entries, self._bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return self._conn
+
+    # -- entries -------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._open().execute(
+                "SELECT url, status, headers, body, compressed FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= _TOUCH_BATCH:
+                self._flush_touched()
+        url, status, headers, body, compressed = row
+        return CachedResponse(url, status, [tuple(h) for h in json.loads(headers)],
+                              zlib.decompress(body) if compressed else bytes(body))
+
+    def put(self, key: str, url: str, status: int, headers: List[Tuple[str, str]], body: bytes,
+            kind: str = "http") -> bool:
+        """Store an entry, replacing an older one; False when it is too large."""
+        if len(body) > self.max_entry_bytes:
+            self.counters["too_large"] += 1
+            return False
+        encoded = any(k.lower() == "content-encoding" for k, _ in headers)
+        compressed = not encoded and len(body) >= _COMPRESS_MIN
+        blob = zlib.compress(body, 1) if compressed else body
+        header_json = json.dumps(headers)
+        size = len(blob) + len(header_json) + len(key)
+        now = time.time()
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, kind, url, status, headers, body, compressed, size, "
+                    "stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, url, status, header_json, sqlite3.Binary(blob), int(compressed), size, now, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._bytes += size - (old[0] if old else 0)
+            self._entries += 0 if old else 1
+            self.counters["stored"] += 1
+            if self._bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?",
+                                   [(t, k) for k, t in self._touched.items()])
+            self._touched = {}
+
+    def _evict(self):
+        # Down to 90% of the cap so a full cache does not evict on every put.
+        self._flush_touched()
+        excess = self._bytes - int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+            self._bytes -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self._entries -= len(victims)
+        self.counters["evicted"] += len(victims)
+
+    # -- rendered pages --------------------------------------------------------
+
+    def get_render(self, url: str, profile: str) -> Optional[Dict]:
+        entry = self.get(render_key(url, profile))
+        if entry is None:
+            return None
+        return {**json.loads(entry.body), "url": url, "render_profile": profile}
+
+    def put_render(self, url: str, profile: str, html: str, text: str) -> bool:
+        body = json.dumps({"html": html, "text": text}).encode("utf-8")
+        return self.put(render_key(url, profile), canonical_url(url), 200, [], body, kind="render")
+
+    # -- maintenance -----------------------------------------------------------
+
+    def stats(self) -> Dict:
+        return {**self.counters, "entries": self._entries, "bytes": self._bytes, "mode": self._mode}
+
+    def clear(self):
+        with self._lock:
+            self._open().execute("DELETE FROM entries")
+            self._touched = {}
+            self._bytes = self._entries = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touched()
+                self._conn.close()
+                self._conn = None
+
+
+class _PrefixedStream(httpx.SyncByteStream):
+    """Chunks already read while recording, then the rest of the original stream."""
+
+    def __init__(self, prefix: List[bytes], rest: Iterator[bytes], stream: httpx.SyncByteStream):
+        self._prefix, self._rest, self._stream = prefix, rest, stream
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._prefix
+        yield from self._rest
+
+    def close(self):
+        self._stream.close()
+
+
+class _AsyncPrefixedStream(httpx.AsyncByteStream):
+    def __init__(self, prefix: List[bytes], rest: AsyncIterator[bytes], stream: httpx.AsyncByteStream):
+        self._prefix, self._rest, self._stream = prefix, rest, stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for chunk in self._prefix:
+            yield chunk
+        async for chunk in self._rest:
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+def _cacheable(request: httpx.Request) -> bool:
+    return request.method in CACHEABLE_METHODS
+
+
+def _miss(request: httpx.Request) -> FetchCacheMiss:
+    return FetchCacheMiss(f"not in fetch cache: {request.method} {request.url}")
+
+
+class CachingTransport(httpx.BaseTransport):
+    """
+    Caching Transport
+    Records or replays the responses of the wrapped transport.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, cache: FetchCache):
+        self._transport = transport
+        self.cache = cache
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        cache = self.cache
+        if cache.replaying:
+            if not _cacheable(request):
+                raise _miss(request)
+            entry = cache.get(request_key(request.method, str(request.url), request.headers))
+            if entry is None:
+                raise _miss(request)
+            return entry.to_response(request)
+        if not (cache.recording and _cacheable(request)):
+            return self._transport.handle_request(request)
+        response = self._transport.handle_request(_unconditional(request))
+        chunks, size, it = [], 0, iter(response.stream)
+        for chunk in it:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > cache.max_entry_bytes:
+                cache.counters["too_large"] += 1
+                return httpx.Response(response.status_code, headers=response.headers,
+                                      stream=_PrefixedStream(chunks, it, response.stream),
+                                      extensions=response.extensions, request=request)
+        response.stream.close()
+        entry = CachedResponse(str(request.url), response.status_code, response.headers.multi_items(),
+                               b"".join(chunks))
+        cache.put(request_key(request.method, str(request.url), request.headers), entry.url, entry.status,
+                  entry.headers, entry.body)
+        return entry.to_response(request)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncCachingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, cache: FetchCache):
+        self._transport = transport
+        self.cache = cache
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        cache = self.cache
+        if cache.replaying:
+            if not _cacheable(request):
+                raise _miss(request)
+            entry = await asyncio.to_thread(cache.get, request_key(request.method, str(request.url), request.headers))
+            if entry is None:
+                raise _miss(request)
+            return entry.to_response(request)
+        if not (cache.recording and _cacheable(request)):
+            return await self._transport.handle_async_request(request)
+        response = await self._transport.handle_async_request(_unconditional(request))
+        chunks, size, it = [], 0, response.stream.__aiter__()
+        async for chunk in it:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > cache.max_entry_bytes:
+                cache.counters["too_large"] += 1
+                return httpx.Response(response.status_code, headers=response.headers,
+                                      stream=_AsyncPrefixedStream(chunks, it, response.stream),
+                                      extensions=response.extensions, request=request)
+        await response.stream.aclose()
+        entry = CachedResponse(str(request.url), response.status_code, response.headers.multi_items(),
+                               b"".join(chunks))
+        await asyncio.to_thread(cache.put, request_key(request.method, str(request.url), request.headers),
+                                entry.url, entry.status, entry.headers, entry.body)
+        return entry.to_response(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+fetch_cache = FetchCache()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect or clear the fetch cache.")
+    p.add_argument("command", choices=("stats", "clear"))
+    p.add_argument("--path", type=Path, default=FETCH_CACHE_PATH)
+    args = p.parse_args()
+    cache = FetchCache(args.path, mode="off")
+    if args.command == "clear":
+        cache.clear()
+    else:
+        cache._open()
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
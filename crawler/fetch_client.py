@@ -0,0 +1,635 @@
+"""Shared, connection-pooled HTTP fetch layer.
+
+Every static fetch in the project goes through ``fetch_client``:
+
+* one pooled ``httpx.AsyncClient`` per event loop plus a pooled
+  ``httpx.Client`` behind the blocking ``*_sync`` facade,
+* a cap on in-flight requests per host (``FETCH_PER_HOST_CONNECTIONS``) on
+  top of the global pool limits,
+* HTTP/2 when ``FETCH_HTTP2`` is set and the optional ``h2`` package is
+  installed,
+* a TTL'd DNS cache in front of the connection pool,
+* retries with exponential backoff (and ``Retry-After``) for transport
+  errors and 429/502/503/504 responses,
+* helpers for streamed, size-capped body reads: content types are checked
+  from the headers before any body is downloaded, the charset is sniffed
+  from the header, a BOM or ``<meta charset>`` in the first bytes, and
+  bodies are cut off at ``FETCH_MAX_BODY_BYTES``.
+
+``fetch_client.stats()`` reports request and connection counts so
+connection reuse can be measured and tuned. DNS, connect, time-to-first-byte
+and download times, per-host latency and bytes go to ``crawler.metrics``.
+Both clients sit on top of ``crawler.fetch_cache``, which records or replays
+responses when ``FETCH_CACHE`` asks for it.
+"""
+from __future__ import annotations
+
+import asyncio
+import codecs
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+
+from crawler.fetch_cache import AsyncCachingTransport, CachingTransport, FetchCache, fetch_cache
+from crawler.metrics import BYTES, HOST_FETCH_SECONDS, STAGE_SECONDS, metrics, record_error, stage
+
+DEFAULT_USER_AGENT = "InfinityCrawler/1.0"
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_BODY_BYTES = int(os.environ.get("FETCH_MAX_BODY_BYTES", 5 * 1024 * 1024))
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+SNIFF_BYTES = 1024
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([a-zA-Z0-9_.:-]+)', re.I)
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+
+class UnsupportedContentType(Exception):
+    """Raised before download when a response is not of an accepted type."""
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+@dataclass
+class FetchSettings:
+    timeout: float = float(os.environ.get("FETCH_TIMEOUT", 15))
+    max_connections: int = int(os.environ.get("FETCH_MAX_CONNECTIONS", 100))
+    max_keepalive: int = int(os.environ.get("FETCH_MAX_KEEPALIVE", 50))
+    keepalive_expiry: float = float(os.environ.get("FETCH_KEEPALIVE_EXPIRY", 30))
+    per_host_connections: int = int(os.environ.get("FETCH_PER_HOST_CONNECTIONS", 6))
+    http2: bool = _env_flag("FETCH_HTTP2")
+    retries: int = int(os.environ.get("FETCH_RETRIES", 2))
+    backoff: float = float(os.environ.get("FETCH_BACKOFF", 0.5))
+    max_backoff: float = float(os.environ.get("FETCH_MAX_BACKOFF", 30))
+    dns_ttl: float = float(os.environ.get("FETCH_DNS_TTL", 300))
+    user_agent: str = os.environ.get("FETCH_USER_AGENT", DEFAULT_USER_AGENT)
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class DnsCache:
+    """Thread-safe TTL cache of ``getaddrinfo`` results keyed by (host, port)."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host: str, port: int) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, host: str, port: int, infos) -> List[str]:
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        cached = self.get(host, port)
+        if cached is not None:
+            return cached
+        with stage("dns"):
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return self.put(host, port, infos)
+
+    async def resolve_async(self, host: str, port: int) -> List[str]:
+        cached = self.get(host, port)
+        if cached is not None:
+            return cached
+        with stage("dns"):
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return self.put(host, port, infos)
+
+
+def _is_ip(host: str) -> bool:
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except OSError:
+            pass
+    return False
+
+
+class _CachingAsyncBackend(httpcore.AsyncNetworkBackend):
+    """Resolves through the DNS cache, then delegates to the anyio backend.
+
+    TLS still verifies against the original hostname: httpcore passes the
+    request's host as ``server_hostname`` when it upgrades the stream.
+    """
+
+    def __init__(self, dns: DnsCache, counters: Dict[str, int]):
+        self._dns = dns
+        self._counters = counters
+        self._backend = httpcore.AnyIOBackend()
+        # Open streams, so their sockets can be closed once the loop is gone.
+        self.streams: "weakref.WeakSet[httpcore.AsyncNetworkStream]" = weakref.WeakSet()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self._counters["connections_opened"] += 1
+        addresses = [host] if _is_ip(host) else await self._dns.resolve_async(host, port)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                with stage("connect"):
+                    stream = await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+                self.streams.add(stream)
+                return stream
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error or httpcore.ConnectError(f"no addresses for {host}")
+
+    def close_sockets(self) -> int:
+        """Close the sockets of all open streams; returns how many were open."""
+        closed = 0
+        for stream in list(self.streams):
+            sock = stream.get_extra_info("socket")
+            # asyncio hands out a TransportSocket wrapper without close().
+            sock = getattr(sock, "_sock", sock)
+            if sock is not None and sock.fileno() != -1:
+                sock.close()
+                closed += 1
+        return closed
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class _CachingSyncBackend(httpcore.NetworkBackend):
+    def __init__(self, dns: DnsCache, counters: Dict[str, int]):
+        self._dns = dns
+        self._counters = counters
+        self._backend = httpcore.SyncBackend()
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self._counters["connections_opened"] += 1
+        addresses = [host] if _is_ip(host) else self._dns.resolve(host, port)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                with stage("connect"):
+                    return self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error or httpcore.ConnectError(f"no addresses for {host}")
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value and value.strip().isdigit():
+        return float(value)
+    return None
+
+
+def media_type(response: httpx.Response) -> str:
+    return response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+
+def ensure_content_type(response: httpx.Response, accept: Iterable[str] = HTML_CONTENT_TYPES):
+    """Reject a response from its headers alone; a missing type is allowed."""
+    kind = media_type(response)
+    if kind and kind not in accept:
+        raise UnsupportedContentType(f"unsupported content type {kind!r} for {response.url}")
+
+
+def sniff_charset(content_type: str, head: bytes, default: str = "utf-8") -> str:
+    """Pick a charset from the Content-Type header, a BOM or a meta tag."""
+    candidates = []
+    for bom, name in _BOMS:
+        if head.startswith(bom):
+            return name
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            candidates.append(value.strip().strip('"\''))
+    match = _META_CHARSET.search(head[:SNIFF_BYTES])
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+    for name in candidates:
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return default
+
+
+class BodyDecoder:
+    """Incrementally decodes a body, choosing the charset once enough bytes
+    have arrived to sniff it."""
+
+    def __init__(self, content_type: str = ""):
+        self.content_type = content_type
+        self.encoding: Optional[str] = None
+        self._head = b""
+        self._decoder = None
+
+    def feed(self, chunk: bytes) -> str:
+        if self._decoder is None:
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES:
+                return ""
+            chunk, self._head = self._head, b""
+            self._start()
+        return self._decoder.decode(chunk)
+
+    def flush(self) -> str:
+        if self._decoder is None:
+            chunk, self._head = self._head, b""
+            self._start(chunk)
+            return self._decoder.decode(chunk, final=True)
+        return self._decoder.decode(b"", final=True)
+
+    def _start(self, head: Optional[bytes] = None):
+        self.encoding = sniff_charset(self.content_type, head if head is not None else self._head or b"")
+        self._decoder = codecs.getincrementaldecoder(self.encoding)("replace")
+
+
+_STARTED = "crawl_started"
+
+
+def _on_request(request: httpx.Request):
+    request.extensions[_STARTED] = time.perf_counter()
+
+
+def _on_response(response: httpx.Response):
+    started = response.request.extensions.get(_STARTED)
+    if started is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="ttfb")
+
+
+async def _on_request_async(request: httpx.Request):
+    _on_request(request)
+
+
+async def _on_response_async(response: httpx.Response):
+    _on_response(response)
+
+
+def observe_body(response: httpx.Response, nbytes: int, waited: Optional[float] = None):
+    """Record a finished body read: bytes, download time and per-host latency.
+
+    ``waited`` is the time spent waiting for chunks, when the caller
+    streamed the body.
+    """
+    host = metrics.host(response.request.url.host)
+    BYTES.inc(nbytes, host=host)
+    if waited is not None:
+        STAGE_SECONDS.observe(waited, stage="download")
+    started = response.request.extensions.get(_STARTED)
+    if started is not None:
+        HOST_FETCH_SECONDS.observe(time.perf_counter() - started, host=host)
+
+
+def iter_capped(response: httpx.Response, max_bytes: int = MAX_BODY_BYTES) -> Iterator[bytes]:
+    """Yield body chunks until ``max_bytes`` have been read."""
+    remaining = max_bytes
+    # Only the time spent inside the network read counts as download; the
+    # caller's work between chunks (parsing) is its own stage.
+    waited, read = 0.0, 0
+    mark = time.perf_counter()
+    try:
+        for chunk in response.iter_bytes():
+            waited += time.perf_counter() - mark
+            read += len(chunk)
+            if len(chunk) >= remaining:
+                yield chunk[:remaining]
+                return
+            remaining -= len(chunk)
+            yield chunk
+            mark = time.perf_counter()
+    finally:
+        observe_body(response, read, waited)
+
+
+async def aiter_capped(response: httpx.Response, max_bytes: int = MAX_BODY_BYTES) -> AsyncIterator[bytes]:
+    remaining = max_bytes
+    waited, read = 0.0, 0
+    mark = time.perf_counter()
+    try:
+        async for chunk in response.aiter_bytes():
+            waited += time.perf_counter() - mark
+            read += len(chunk)
+            if len(chunk) >= remaining:
+                yield chunk[:remaining]
+                return
+            remaining -= len(chunk)
+            yield chunk
+            mark = time.perf_counter()
+    finally:
+        observe_body(response, read, waited)
+
+
+class FetchClient:
+    """
+    Fetch Client
+    Process-wide pooled HTTP client with an async API and a sync facade.
+    """
+
+    def __init__(self, settings: Optional[FetchSettings] = None, cache: Optional[FetchCache] = None):
+        self.settings = settings or FetchSettings()
+        self.cache = cache or fetch_cache
+        self.http2 = self.settings.http2 and _h2_available()
+        if self.settings.http2 and not self.http2:
+            logging.warning("FETCH_HTTP2 requested but the 'h2' package is not installed; using HTTP/1.1")
+        self.dns = DnsCache(self.settings.dns_ttl)
+        self.counters = {"requests": 0, "retries": 0, "errors": 0, "connections_opened": 0}
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_backend: Optional[_CachingAsyncBackend] = None
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_sems: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        metrics.add_collector("fetch", FetchClient.stats, owner=self)
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.settings.max_connections,
+            max_keepalive_connections=self.settings.max_keepalive,
+            keepalive_expiry=self.settings.keepalive_expiry,
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {"User-Agent": self.settings.user_agent, **self.settings.headers}
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """The pooled client for the running event loop.
+
+        Pooled connections are bound to the loop that opened them, so a new
+        pool is started when called from a different loop (e.g. a second
+        ``asyncio.run``) and the previous one is closed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop or self._async_client.is_closed:
+            self._retire_async_client()
+            transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self._limits())
+            # httpx has no public hook for the network backend; swap it on the
+            # underlying httpcore pool so new connections use the DNS cache.
+            self._async_backend = _CachingAsyncBackend(self.dns, self.counters)
+            transport._pool._network_backend = self._async_backend
+            self._async_client = httpx.AsyncClient(
+                transport=AsyncCachingTransport(transport, self.cache),
+                timeout=self.settings.timeout,
+                headers=self._headers(),
+                follow_redirects=True,
+                event_hooks={"request": [_on_request_async], "response": [_on_response_async]},
+            )
+            self._async_loop = loop
+            self._host_sems = {}
+        return self._async_client
+
+    def _retire_async_client(self):
+        client, loop, backend = self._async_client, self._async_loop, self._async_backend
+        self._async_client = self._async_loop = self._async_backend = None
+        if client is None or client.is_closed:
+            return
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            # Still serving another thread: close it there.
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        elif backend is not None:
+            # Its loop is gone, so the pool cannot be closed cleanly; at least
+            # release the sockets.
+            closed = backend.close_sockets()
+            if closed:
+                logging.debug(f"closed {closed} pooled connection(s) of a finished event loop")
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                transport = httpx.HTTPTransport(http2=self.http2, limits=self._limits())
+                transport._pool._network_backend = _CachingSyncBackend(self.dns, self.counters)
+                self._sync_client = httpx.Client(
+                    transport=CachingTransport(transport, self.cache),
+                    timeout=self.settings.timeout,
+                    headers=self._headers(),
+                    follow_redirects=True,
+                    event_hooks={"request": [_on_request], "response": [_on_response]},
+                )
+            return self._sync_client
+
+    def _host_sem(self, url: str) -> asyncio.Semaphore:
+        host = (urlsplit(url).hostname or "").lower()
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = self._host_sems[host] = asyncio.Semaphore(self.settings.per_host_connections)
+        return sem
+
+    def _host_sem_sync(self, url: str) -> threading.BoundedSemaphore:
+        host = (urlsplit(url).hostname or "").lower()
+        with self._lock:
+            sem = self._sync_sems.get(host)
+            if sem is None:
+                sem = self._sync_sems[host] = threading.BoundedSemaphore(self.settings.per_host_connections)
+            return sem
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        delay = self.settings.backoff * (2 ** attempt) * (1 + random.random() / 2)
+        if response is not None:
+            delay = max(delay, _retry_after(response) or 0.0)
+        return min(delay, self.settings.max_backoff)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request with per-host limiting and retry/backoff."""
+        client = self.async_client
+        attempt = 0
+        while True:
+            self.counters["requests"] += 1
+            try:
+                async with self._host_sem(url):
+                    response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= self.settings.retries:
+                    self.counters["errors"] += 1
+                    record_error("fetch", e)
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.settings.retries:
+                    observe_body(response, len(response.content))
+                    return response
+                delay = self._backoff(attempt, response)
+            attempt += 1
+            self.counters["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Open a response without reading its body.
+
+        Transport errors and retryable statuses are retried like in
+        ``request`` until the headers of a final response arrive; the
+        per-host slot is held from then until the caller leaves the block,
+        but not while backing off.
+        """
+        client = self.async_client
+        sem = self._host_sem(url)
+        attempt = 0
+        while True:
+            self.counters["requests"] += 1
+            await sem.acquire()
+            try:
+                response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+            except httpx.TransportError as e:
+                sem.release()
+                if attempt >= self.settings.retries:
+                    self.counters["errors"] += 1
+                    record_error("fetch", e)
+                    raise
+                delay = self._backoff(attempt)
+            except BaseException:
+                sem.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.settings.retries:
+                    break
+                delay = self._backoff(attempt, response)
+                try:
+                    await response.aclose()
+                finally:
+                    sem.release()
+            attempt += 1
+            self.counters["retries"] += 1
+            await asyncio.sleep(delay)
+        try:
+            yield response
+        finally:
+            try:
+                await response.aclose()
+            finally:
+                sem.release()
+
+    def request_sync(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Blocking twin of ``request`` for synchronous callers."""
+        client = self.sync_client
+        attempt = 0
+        while True:
+            self.counters["requests"] += 1
+            try:
+                with self._host_sem_sync(url):
+                    response = client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= self.settings.retries:
+                    self.counters["errors"] += 1
+                    record_error("fetch", e)
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.settings.retries:
+                    observe_body(response, len(response.content))
+                    return response
+                delay = self._backoff(attempt, response)
+            attempt += 1
+            self.counters["retries"] += 1
+            time.sleep(delay)
+
+    def get_sync(self, url: str, **kwargs) -> httpx.Response:
+        return self.request_sync("GET", url, **kwargs)
+
+    @contextmanager
+    def stream_sync(self, method: str, url: str, **kwargs) -> Iterator[httpx.Response]:
+        """Blocking twin of ``stream``."""
+        client = self.sync_client
+        sem = self._host_sem_sync(url)
+        attempt = 0
+        while True:
+            self.counters["requests"] += 1
+            sem.acquire()
+            try:
+                response = client.send(client.build_request(method, url, **kwargs), stream=True)
+            except httpx.TransportError as e:
+                sem.release()
+                if attempt >= self.settings.retries:
+                    self.counters["errors"] += 1
+                    record_error("fetch", e)
+                    raise
+                delay = self._backoff(attempt)
+            except BaseException:
+                sem.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.settings.retries:
+                    break
+                delay = self._backoff(attempt, response)
+                try:
+                    response.close()
+                finally:
+                    sem.release()
+            attempt += 1
+            self.counters["retries"] += 1
+            time.sleep(delay)
+        try:
+            yield response
+        finally:
+            try:
+                response.close()
+            finally:
+                sem.release()
+
+    def stats(self) -> Dict:
+        requests = self.counters["requests"]
+        opened = self.counters["connections_opened"]
+        return {
+            **self.counters,
+            "connection_reuse_ratio": round(1 - opened / requests, 3) if requests else 0.0,
+            "dns_hits": self.dns.hits,
+            "dns_misses": self.dns.misses,
+            "http2": self.http2,
+        }
+
+    async def aclose(self):
+        if self._async_client is not None:
+            if self._async_loop is asyncio.get_running_loop():
+                await self._async_client.aclose()
+                self._async_client = self._async_loop = self._async_backend = None
+            else:
+                self._retire_async_client()
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+fetch_client = FetchClient()
@@ -0,0 +1,272 @@
+"""Persistent crawl frontier.
+
+The frontier is a directory holding one SQLite database with
+
+* ``queue`` - URLs waiting to be fetched or being fetched, with priority,
+  depth, attempt count and, for claimed URLs, a lease expiry. Finished URLs
+  are deleted, so the table only ever holds outstanding work;
+* ``seen`` - the 64-bit hash of every URL ever added, as an integer primary
+  key: a sorted hash array on disk, 8 bytes per URL plus B-tree overhead.
+  A URL whose hash is present is not queued again, so a resumed crawl
+  does not refetch pages that already finished. ``add_many(...,
+  requeue=True)`` re-arms finished URLs that are due for another fetch.
+
+Every state change is committed when it happens (WAL, ``synchronous=NORMAL``),
+which makes claimed work the checkpoint: after a crash ``recover`` puts
+URLs that were in flight back in the queue. Multiple workers may share a
+frontier; a claim expires after ``lease_seconds`` so a dead worker's URLs
+are eventually handed out again.
+
+Memory use is bounded by the SQLite page cache (``cache_mb``) and the claim
+batch size, not by the size of the frontier.
+
+Usage::
+
+    frontier = Frontier("crawler_scraper_output/frontier/loans")
+    frontier.recover()
+    frontier.add_many(seed_urls)
+    for item in frontier.claim(10):
+        ...
+        frontier.done(item.url)   # or frontier.failed(item.url, str(error))
+
+Settings (env): FRONTIER_DIR, FRONTIER_LEASE_SECONDS, FRONTIER_MAX_ATTEMPTS,
+FRONTIER_CACHE_MB.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+FRONTIER_DIR = Path(os.environ.get(
+    "FRONTIER_DIR",
+    Path(__file__).resolve().parent.parent / "crawler_scraper_output" / "frontier",
+))
+LEASE_SECONDS = float(os.environ.get("FRONTIER_LEASE_SECONDS", 300))
+MAX_ATTEMPTS = int(os.environ.get("FRONTIER_MAX_ATTEMPTS", 3))
+CACHE_MB = int(os.environ.get("FRONTIER_CACHE_MB", 16))
+
+PENDING, IN_FLIGHT = 0, 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    depth INTEGER NOT NULL DEFAULT 0,
+    state INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_next ON queue (state, priority DESC, id);
+CREATE UNIQUE INDEX IF NOT EXISTS queue_url ON queue (url);
+CREATE TABLE IF NOT EXISTS seen (
+    hash INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def url_hash(url: str) -> int:
+    """Stable signed 64-bit hash of ``url`` (SQLite integer range)."""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest(),
+                          "big", signed=True)
+
+
+@dataclass
+class FrontierItem:
+    url: str
+    depth: int
+    priority: float
+    attempts: int
+
+
+class Frontier:
+    """
+    Frontier
+    Disk-backed URL queue with a persistent seen-set and leased claims.
+    """
+
+    def __init__(self, path: Optional[Path] = None, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, cache_mb: int = CACHE_MB):
+        self.path = Path(path or FRONTIER_DIR)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.cache_mb = max(1, cache_mb)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path / "frontier.sqlite3"), check_same_thread=False,
+                                         isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(f"PRAGMA cache_size=-{self.cache_mb * 1024}")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def _count(self, conn: sqlite3.Connection, name: str, n: int = 1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, n),
+        )
+
+    def add(self, url: str, depth: int = 0, priority: float = 0.0) -> bool:
+        """Queue ``url`` unless it was ever added before; True if queued."""
+        return self.add_many([url], depth, priority) == 1
+
+    def add_many(self, urls: Iterable[str], depth: int = 0, priority: float = 0.0, requeue: bool = False) -> int:
+        """Queue every URL not seen before, in one transaction; returns how many were queued.
+
+        With ``requeue`` URLs that were seen but are no longer queued (done,
+        or failed for good) are queued again too; URLs still queued or in
+        flight are left alone.
+        """
+        added = requeued = 0
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN")
+            try:
+                for url in urls:
+                    new = conn.execute("INSERT OR IGNORE INTO seen (hash) VALUES (?)", (url_hash(url),)).rowcount
+                    if (new or requeue) and conn.execute(
+                            "INSERT OR IGNORE INTO queue (url, priority, depth) VALUES (?, ?, ?)",
+                            (url, priority, depth)).rowcount:
+                        added += 1
+                        requeued += not new
+                if added - requeued:
+                    self._count(conn, "added", added - requeued)
+                if requeued:
+                    self._count(conn, "requeued", requeued)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def seen(self, url: str) -> bool:
+        with self._lock:
+            return self._open().execute("SELECT 1 FROM seen WHERE hash = ?", (url_hash(url),)).fetchone() is not None
+
+    def claim(self, n: int = 1, now: Optional[float] = None) -> List[FrontierItem]:
+        """Lease up to ``n`` pending URLs, highest priority (then oldest) first."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._open().execute(
+                """
+                UPDATE queue SET state = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id IN (SELECT id FROM queue WHERE state = ? ORDER BY priority DESC, id LIMIT ?)
+                RETURNING id, url, depth, priority, attempts
+                """,
+                (IN_FLIGHT, now + self.lease_seconds, PENDING, max(0, n)),
+            ).fetchall()
+        # RETURNING does not preserve the subquery's order.
+        rows.sort(key=lambda r: (-r[3], r[0]))
+        return [FrontierItem(url=r[1], depth=r[2], priority=r[3], attempts=r[4]) for r in rows]
+
+    def done(self, url: str):
+        """Mark ``url`` finished; it leaves the queue but stays seen."""
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN")
+            if conn.execute("DELETE FROM queue WHERE url = ?", (url,)).rowcount:
+                self._count(conn, "done")
+            conn.execute("COMMIT")
+
+    def failed(self, url: str, error: str = "", retry: bool = True) -> bool:
+        """Record a failed fetch; the URL is queued again until ``max_attempts``.
+
+        Returns:
+            bool: True if the URL will be retried.
+        """
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT attempts FROM queue WHERE url = ?", (url,)).fetchone()
+            retried = bool(row) and retry and row[0] < self.max_attempts
+            if retried:
+                conn.execute("UPDATE queue SET state = ?, lease_until = NULL, last_error = ? WHERE url = ?",
+                             (PENDING, error[:500], url))
+                self._count(conn, "retried")
+            elif row:
+                conn.execute("DELETE FROM queue WHERE url = ?", (url,))
+                self._count(conn, "failed")
+            conn.execute("COMMIT")
+        return retried
+
+    def recover(self, expired_only: bool = False, now: Optional[float] = None) -> int:
+        """Put claimed URLs back in the queue; returns how many.
+
+        A single crawler resuming after a crash recovers everything; with
+        several workers on one frontier use ``expired_only``.
+        """
+        now = time.time() if now is None else now
+        sql = "UPDATE queue SET state = ?, lease_until = NULL WHERE state = ?"
+        params = [PENDING, IN_FLIGHT]
+        if expired_only:
+            sql += " AND lease_until < ?"
+            params.append(now)
+        with self._lock:
+            conn = self._open()
+            recovered = conn.execute(sql, params).rowcount
+            if recovered:
+                self._count(conn, "recovered", recovered)
+        return recovered
+
+    def pending(self) -> int:
+        """URLs waiting or in flight."""
+        with self._lock:
+            return self._open().execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._open()
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM queue GROUP BY state").fetchall())
+            seen = conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "queued": counts.get(PENDING, 0),
+            "in_flight": counts.get(IN_FLIGHT, 0),
+            "seen": seen,
+            **{k: counters.get(k, 0) for k in ("added", "requeued", "done", "failed", "retried", "recovered")},
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect a crawl frontier.")
+    p.add_argument("path", nargs="?", default=str(FRONTIER_DIR))
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("recover", help="requeue URLs left in flight by a crashed crawl")
+    args = p.parse_args()
+
+    frontier = Frontier(Path(args.path))
+    if args.cmd == "stats":
+        print(json.dumps(frontier.stats(), indent=2))
+    else:
+        print(f"recovered {frontier.recover()} URLs")
+    frontier.close()
+
+
+if __name__ == "__main__":
+    main()
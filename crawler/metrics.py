@@ -0,0 +1,380 @@
+"""Process-wide crawl metrics.
+
+Counters, gauges and histograms with labels, kept in memory and exposed in
+the Prometheus text format (``metrics.render()``, served on ``/metrics`` by
+``app.main``) and as a JSON summary (``metrics.summary()``, logged at the end
+of ``crawler.run`` and ``orchestrator`` runs).
+
+Hot-path instrumentation:
+
+* ``crawl_stage_seconds{stage}`` - ``dns``, ``connect``, ``ttfb`` (request
+  sent to headers received), ``download`` (time spent waiting for body
+  chunks), ``parse``, ``normalize``, ``render`` and ``save``;
+* ``crawl_host_fetch_seconds{host}`` - request start to last body byte;
+* ``crawl_bytes_total{host}`` - body bytes downloaded;
+* ``crawl_errors_total{stage,error}`` - failures by stage and exception type.
+
+Components that already keep counters (fetch client, browser pools,
+schedulers, executor, job manager, snapshot store) register collectors that
+are read at scrape time; their numeric fields are exported as gauges named
+``<prefix>_<field>``, summed over live instances. Pool utilization and
+queue depths come from these (``browser_pool_leased``, ``scheduler_pending``,
+``jobs_queued``, ...), so the hot path pays nothing for them.
+
+Host labels are capped at ``METRICS_MAX_HOSTS`` distinct hosts (later ones
+are counted as ``other``) so a broad crawl cannot blow up the series count.
+
+Settings (env): METRICS_MAX_HOSTS.
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+MAX_HOSTS = int(os.environ.get("METRICS_MAX_HOSTS", 200))
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+OTHER_HOST = "other"
+
+_NAME_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    Counter
+    Monotonically increasing value per label set.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        return self._header() + [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+                                 for k, v in sorted(self.samples().items())]
+
+    def summary(self):
+        samples = self.samples()
+        if not self.labels:
+            return samples.get((), 0)
+        return {",".join(k): v for k, v in sorted(samples.items())}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """
+    Gauge
+    Value per label set that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self, n: int):
+        self.buckets = [0] * n
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """
+    Histogram
+    Bucketed distribution of observations (seconds unless noted) per label set.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            series.count += 1
+            series.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.buckets[i] += 1
+                    break
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], int, float]]:
+        with self._lock:
+            return {k: (list(s.buckets), s.count, s.sum) for k, s in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, (buckets, count, total) in sorted(self._snapshot().items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), buckets + [count - sum(buckets)]):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def _quantile(self, q: float, buckets: List[int], count: int) -> float:
+        # Linear interpolation inside the bucket, as Prometheus' histogram_quantile.
+        rank = q * count
+        cumulative, lower = 0, 0.0
+        for bound, n in zip(self.buckets, buckets):
+            if n and cumulative + n >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = bound
+        return self.buckets[-1]
+
+    def _describe(self, buckets: List[int], count: int, total: float) -> Dict:
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6),
+            "p50": round(self._quantile(0.5, buckets, count), 6),
+            "p95": round(self._quantile(0.95, buckets, count), 6),
+            "p99": round(self._quantile(0.99, buckets, count), 6),
+        }
+
+    def summary(self):
+        out = {}
+        for key, (buckets, count, total) in sorted(self._snapshot().items()):
+            if count:
+                out[",".join(key) or self.name] = self._describe(buckets, count, total)
+        return out if self.labels else out.get(self.name, {})
+
+    def total(self) -> Dict:
+        """``summary`` of all label sets merged (e.g. latency over every host)."""
+        merged, count, total = [0] * len(self.buckets), 0, 0.0
+        for buckets, n, s in self._snapshot().values():
+            merged = [a + b for a, b in zip(merged, buckets)]
+            count += n
+            total += s
+        return self._describe(merged, count, total) if count else {}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class _Collector:
+    def __init__(self, prefix: str, fn: Callable, owner=None):
+        self.prefix = prefix
+        self.fn = fn
+        self.owner = weakref.ref(owner) if owner is not None else None
+
+    def collect(self) -> Optional[Dict]:
+        if self.owner is None:
+            return self.fn()
+        owner = self.owner()
+        return None if owner is None else self.fn(owner)
+
+
+class MetricsRegistry:
+    """
+    Metrics Registry
+    Named metrics plus stats collectors, rendered for Prometheus or as JSON.
+    """
+
+    def __init__(self, max_hosts: int = MAX_HOSTS):
+        self.max_hosts = max_hosts
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[_Collector] = []
+        self._hosts: set = set()
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _get(self, cls, name: str, help: str, labels: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            elif type(metric) is not cls or metric.labels != tuple(labels):
+                raise ValueError(f"metric {name} already registered as {metric.kind} {metric.labels}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def add_collector(self, prefix: str, fn: Callable, owner=None):
+        """Export the numeric fields of ``fn()`` (``fn(owner)`` with an owner) as gauges.
+
+        With ``owner`` the collector is held through a weak reference and
+        disappears with the object, so short-lived pools need no unregistering.
+        """
+        with self._lock:
+            self._collectors.append(_Collector(prefix, fn, owner))
+
+    def host(self, url_or_host: str) -> str:
+        """Host label for a URL or host, bounded by ``max_hosts``."""
+        host = (urlsplit(url_or_host).hostname or "") if "//" in url_or_host else url_or_host
+        host = host.lower() or "unknown"
+        with self._lock:
+            if host in self._hosts:
+                return host
+            if len(self._hosts) >= self.max_hosts:
+                return OTHER_HOST
+            self._hosts.add(host)
+            return host
+
+    def collected(self) -> Dict[str, float]:
+        """Current values of every collector field, summed over instances."""
+        with self._lock:
+            collectors = list(self._collectors)
+        values: Dict[str, float] = {}
+        dead = []
+        for collector in collectors:
+            try:
+                stats = collector.collect()
+            except Exception:
+                continue
+            if stats is None:
+                dead.append(collector)
+                continue
+            for field, value in stats.items():
+                if isinstance(value, (int, float)):
+                    name = _NAME_UNSAFE.sub("_", f"{collector.prefix}_{field}")
+                    values[name] = values.get(name, 0) + value
+        if dead:
+            with self._lock:
+                self._collectors = [c for c in self._collectors if c not in dead]
+        return values
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, value in sorted(self.collected().items()):
+            lines += [f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        """JSON-friendly snapshot: histograms as count/sum/mean/percentiles."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        out = {"uptime_seconds": round(time.time() - self.started_at, 3)}
+        for metric in metrics:
+            value = metric.summary()
+            if value or not metric.labels:
+                out[metric.name] = value
+        out["collected"] = self.collected()
+        return out
+
+    def reset(self):
+        """Zero every metric (collectors stay registered)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            self._hosts.clear()
+            self.started_at = time.time()
+        for metric in metrics:
+            metric.reset()
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram("crawl_stage_seconds", "Time spent per crawl stage.", ("stage",))
+HOST_FETCH_SECONDS = metrics.histogram("crawl_host_fetch_seconds",
+                                       "Request start to last body byte, per host.", ("host",))
+BYTES = metrics.counter("crawl_bytes_total", "Response body bytes downloaded, per host.", ("host",))
+ERRORS = metrics.counter("crawl_errors_total", "Failures by stage and exception type.", ("stage", "error"))
+
+
+def stage(name: str):
+    """``with stage("parse"): ...`` times the block into ``crawl_stage_seconds``."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def record_error(stage_name: str, error: BaseException):
+    ERRORS.inc(stage=stage_name, error=type(error).__name__)
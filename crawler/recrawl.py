@@ -0,0 +1,309 @@
+"""Adaptive recrawl scheduling.
+
+Every URL keeps a short change history: how many times it was re-fetched,
+how many of those fetches found a change and over how much time. Pages are
+modelled as Poisson processes; the change rate is estimated with Cho &
+Garcia-Molina's bias-reduced estimator, which stays sensible when a page
+changes more often than it is visited (most fetches then see a change)::
+
+    rate = -ln((n - x + 0.5) / (n + 0.5)) / mean_interval
+
+for ``n`` re-fetches ``mean_interval`` apart of which ``x`` saw a change.
+The probability that a page changed since its last fetch ``age`` seconds ago
+is ``1 - exp(-rate * age)``; ``due`` returns the URLs with the highest
+probability first, up to the fetch budget of the run. New URLs and URLs not
+fetched for ``max_interval`` always come first; URLs fetched less than
+``min_interval`` ago are never due. Each consecutive failed fetch halves
+a URL's priority, so dead pages stop eating the budget.
+
+Whether a fetch changed the page is decided by the caller (for example from
+``app.change_detector`` results, where a 304 or a near-duplicate counts as
+unchanged) or, given only a content hash, by comparing it with the hash of
+the previous fetch.
+
+Usage::
+
+    from crawler.recrawl import recrawl_store
+    recrawl_store.add(urls)
+    for url in recrawl_store.due(budget=500): ...
+    recrawl_store.record(url, changed=True)
+
+Settings (env): RECRAWL_DB_PATH, RECRAWL_MIN_INTERVAL, RECRAWL_MAX_INTERVAL.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+RECRAWL_DB_PATH = Path(os.environ.get(
+    "RECRAWL_DB_PATH",
+    Path(__file__).resolve().parent.parent / "crawler_scraper_output" / "recrawl.sqlite3",
+))
+MIN_INTERVAL = float(os.environ.get("RECRAWL_MIN_INTERVAL", 3600))
+MAX_INTERVAL = float(os.environ.get("RECRAWL_MAX_INTERVAL", 30 * 86400))
+# Bound on the host parameters of one ``IN (...)`` query.
+_IN_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    added_at REAL NOT NULL,
+    last_fetch REAL,
+    last_change REAL,
+    content_hash TEXT,
+    fetches INTEGER NOT NULL DEFAULT 0,
+    revisits INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    revisit_seconds REAL NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS sitemaps (
+    url TEXT PRIMARY KEY,
+    read_at REAL NOT NULL
+);
+"""
+
+
+def change_rate(revisits: int, changes: int, revisit_seconds: float) -> Optional[float]:
+    """Estimated changes per second, or None without any re-fetch."""
+    if revisits <= 0 or revisit_seconds <= 0:
+        return None
+    changes = min(changes, revisits)
+    return -math.log((revisits - changes + 0.5) / (revisits + 0.5)) / (revisit_seconds / revisits)
+
+
+@dataclass
+class PageHistory:
+    url: str
+    added_at: float
+    last_fetch: Optional[float]
+    last_change: Optional[float]
+    content_hash: Optional[str]
+    fetches: int
+    revisits: int
+    changes: int
+    revisit_seconds: float
+    errors: int
+    failures: int
+    last_error: Optional[str]
+
+    @property
+    def rate(self) -> Optional[float]:
+        return change_rate(self.revisits, self.changes, self.revisit_seconds)
+
+
+class RecrawlStore:
+    """
+    Recrawl Store
+    Per-URL change history and the budgeted due-list derived from it.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None, min_interval: float = MIN_INTERVAL,
+                 max_interval: float = MAX_INTERVAL):
+        self.db_path = Path(db_path or RECRAWL_DB_PATH)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None,
+                                         timeout=30)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def add(self, urls: Iterable[str], now: Optional[float] = None) -> int:
+        """Register ``urls`` (already known ones are kept); returns how many were new."""
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._open()
+            before = conn.total_changes
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR IGNORE INTO pages (url, added_at) VALUES (?, ?)",
+                             [(u, now) for u in urls])
+            conn.execute("COMMIT")
+            return conn.total_changes - before
+
+    def record(self, url: str, changed: Optional[bool] = None, content_hash: Optional[str] = None,
+               error: Optional[str] = None, fetched_at: Optional[float] = None):
+        """Record the outcome of fetching ``url``.
+
+        Args:
+            url: The fetched URL (registered if unknown).
+            changed: Whether the page changed since the previous fetch; when
+                omitted it is derived from ``content_hash``.
+            content_hash: Fingerprint of the fetched content.
+            error: Failure message; failed fetches do not count as visits.
+            fetched_at: Fetch time (default now).
+        """
+        now = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            conn = self._open()
+            conn.execute("INSERT OR IGNORE INTO pages (url, added_at) VALUES (?, ?)", (url, now))
+            if error is not None:
+                conn.execute("UPDATE pages SET errors = errors + 1, failures = failures + 1, last_error = ? WHERE url = ?",
+                             (str(error)[:500], url))
+                return
+            row = conn.execute("SELECT last_fetch, content_hash FROM pages WHERE url = ?", (url,)).fetchone()
+            if changed is None:
+                changed = content_hash is None or content_hash != row["content_hash"]
+            if row["last_fetch"] is None:
+                # The first fetch has nothing to compare with.
+                conn.execute(
+                    "UPDATE pages SET last_fetch = ?, last_change = ?, content_hash = COALESCE(?, content_hash), "
+                    "fetches = fetches + 1, failures = 0, last_error = NULL WHERE url = ?",
+                    (now, now, content_hash, url),
+                )
+                return
+            conn.execute(
+                """
+                UPDATE pages SET
+                    revisit_seconds = revisit_seconds + MAX(0, ? - last_fetch),
+                    last_fetch = ?,
+                    last_change = CASE WHEN ? THEN ? ELSE last_change END,
+                    content_hash = COALESCE(?, content_hash),
+                    fetches = fetches + 1,
+                    revisits = revisits + 1,
+                    changes = changes + ?,
+                    failures = 0,
+                    last_error = NULL
+                WHERE url = ?
+                """,
+                (now, now, changed, now, content_hash, 1 if changed else 0, url),
+            )
+
+    def history(self, url: str) -> Optional[PageHistory]:
+        with self._lock:
+            row = self._open().execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        return PageHistory(**dict(row)) if row else None
+
+    def last_fetches(self, urls: Iterable[str]) -> Dict[str, float]:
+        """``last_fetch`` of every URL in ``urls`` that was fetched before."""
+        urls = list(urls)
+        found = {}
+        with self._lock:
+            conn = self._open()
+            for i in range(0, len(urls), _IN_BATCH):
+                chunk = urls[i:i + _IN_BATCH]
+                rows = conn.execute(
+                    f"SELECT url, last_fetch FROM pages WHERE last_fetch IS NOT NULL "
+                    f"AND url IN ({','.join('?' * len(chunk))})", chunk,
+                ).fetchall()
+                found.update((row["url"], row["last_fetch"]) for row in rows)
+        return found
+
+    def sitemap_read_at(self, url: str) -> Optional[float]:
+        """When the sitemap at ``url`` was last read completely (``crawler.sitemaps``)."""
+        with self._lock:
+            row = self._open().execute("SELECT read_at FROM sitemaps WHERE url = ?", (url,)).fetchone()
+        return row["read_at"] if row else None
+
+    def record_sitemaps(self, read: Dict[str, float]):
+        """Remember when each sitemap in ``read`` (url -> time) was read."""
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO sitemaps (url, read_at) VALUES (?, ?)", list(read.items()))
+            conn.execute("COMMIT")
+
+    def priority(self, page: PageHistory, now: float) -> Optional[float]:
+        """Probability that ``page`` changed since its last fetch; None when not due."""
+        penalty = 0.5 ** page.failures
+        if page.last_fetch is None:
+            return penalty
+        age = now - page.last_fetch
+        if age >= self.max_interval:
+            return penalty
+        if age < self.min_interval:
+            return None
+        # Pages never seen to change (or fetched once) get the slowest rate,
+        # which makes them due again by max_interval at the latest.
+        rate = max(page.rate or 0.0, 1 / self.max_interval)
+        return penalty * (1 - math.exp(-rate * age))
+
+    def due(self, budget: Optional[int] = None, now: Optional[float] = None,
+            urls: Optional[Iterable[str]] = None) -> List[str]:
+        """URLs to fetch this run, most likely changed first.
+
+        Args:
+            budget: Max number of URLs (all due URLs when None).
+            now: Reference time (default now).
+            urls: Only consider these URLs (default: every known URL).
+        """
+        return [url for url, _ in self.ranked(budget, now, urls)]
+
+    def ranked(self, budget: Optional[int] = None, now: Optional[float] = None,
+               urls: Optional[Iterable[str]] = None) -> List[tuple]:
+        """``due`` with the priority of every URL."""
+        now = time.time() if now is None else now
+        wanted = set(urls) if urls is not None else None
+        with self._lock:
+            rows = self._open().execute("SELECT * FROM pages").fetchall()
+        scored = []
+        for row in rows:
+            page = PageHistory(**dict(row))
+            if wanted is not None and page.url not in wanted:
+                continue
+            p = self.priority(page, now)
+            if p is not None:
+                # Ties (new pages) go to the one waiting longest.
+                scored.append((p, -(page.last_fetch or page.added_at), page.url))
+        scored.sort(reverse=True)
+        if budget is not None:
+            scored = scored[:max(0, budget)]
+        return [(url, round(p, 4)) for p, _, url in scored]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            row = self._open().execute(
+                "SELECT COUNT(*) AS urls, COUNT(last_fetch) AS fetched, COALESCE(SUM(fetches), 0) AS fetches, "
+                "COALESCE(SUM(changes), 0) AS changes, COALESCE(SUM(errors), 0) AS errors FROM pages"
+            ).fetchone()
+        return dict(row)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+recrawl_store = RecrawlStore()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect the recrawl schedule.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    d = sub.add_parser("due", help="print the next due-list with priorities")
+    d.add_argument("--budget", type=int, default=None)
+    h = sub.add_parser("history")
+    h.add_argument("url")
+    args = p.parse_args()
+
+    if args.cmd == "stats":
+        print(json.dumps(recrawl_store.stats(), indent=2))
+    elif args.cmd == "due":
+        for url, priority in recrawl_store.ranked(args.budget):
+            print(f"{priority:.4f}  {url}")
+    else:
+        page = recrawl_store.history(args.url)
+        print(json.dumps(page.__dict__ if page else None, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Decide whether a statically fetched page needs a browser render.
+
+``analyze_html`` inspects the full response body once and looks at three
+signals:
+
+* client-side framework markers (React/Next, Vue/Nuxt, Angular, Svelte,
+  Ember, Gatsby) and serialized app state,
+* empty mount points such as ``<div id="root"></div>``,
+* the ratio of visible text to markup, together with script weight.
+
+SSR'd framework pages that already carry their text are left static; pages
+whose content only appears after hydration are sent to Playwright.
+
+``RenderDetector`` caches decisions per host so a site is analyzed once and
+later pages on it are routed without looking at their bodies.
+"""
+from __future__ import annotations
+
+import html as htmllib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+MIN_TEXT_CHARS = 200
+MIN_TEXT_RATIO = 0.02
+MAX_CACHED_HOSTS = 10000
+
+FRAMEWORK_MARKERS = [
+    ("next", re.compile(r'id=["\']__next["\']|__NEXT_DATA__', re.I)),
+    ("nuxt", re.compile(r'id=["\']__nuxt["\']|window\.__NUXT__', re.I)),
+    ("react", re.compile(r'data-reactroot|react-dom(\.production)?(\.min)?\.js', re.I)),
+    ("angular", re.compile(r'\bng-version=|\bng-app\b|<app-root', re.I)),
+    ("vue", re.compile(r'\bdata-v-app\b|vue(\.runtime)?(\.global)?(\.prod)?(\.min)?\.js', re.I)),
+    ("svelte", re.compile(r'id=["\']svelte["\']|svelte-[a-z0-9]{5,}', re.I)),
+    ("ember", re.compile(r'ember-application|id=["\']ember\d+', re.I)),
+    ("gatsby", re.compile(r'id=["\']___gatsby["\']', re.I)),
+    ("app-state", re.compile(r'window\.__(INITIAL|PRELOADED|APOLLO)_STATE__', re.I)),
+]
+
+EMPTY_ROOT = re.compile(
+    r'<(div|main|section|body)\b[^>]*\bid=["\'](root|app|__next|__nuxt|svelte|___gatsby|main-app|application)["\'][^>]*>'
+    r'\s*(<!--.*?-->\s*)*</\1>',
+    re.I | re.S,
+)
+NOSCRIPT_JS_WARNING = re.compile(r'<noscript[^>]*>[^<]*(enable|requires?)\s+javascript', re.I)
+
+_SCRIPT_OR_STYLE = re.compile(r'<(script|style|noscript|template)\b.*?</\1\s*>', re.I | re.S)
+_SCRIPT_BLOCK = re.compile(r'<script\b.*?</script\s*>', re.I | re.S)
+_COMMENT = re.compile(r'<!--.*?-->', re.S)
+_TAG = re.compile(r'<[^>]+>')
+
+
+def visible_text(html: str) -> str:
+    """Cheap regex approximation of the page's visible text."""
+    text = _COMMENT.sub(" ", html)
+    text = _SCRIPT_OR_STYLE.sub(" ", text)
+    text = _TAG.sub(" ", text)
+    return " ".join(htmllib.unescape(text).split())
+
+
+@dataclass
+class RenderDecision:
+    needs_render: bool
+    reasons: List[str] = field(default_factory=list)
+    framework: Optional[str] = None
+    text_chars: int = 0
+    text_ratio: float = 0.0
+    script_ratio: float = 0.0
+    cached: bool = False
+
+
+def analyze_html(html: str) -> RenderDecision:
+    """Classify a full HTML document as static-sufficient or render-required."""
+    html = html or ""
+    size = max(len(html), 1)
+    text = visible_text(html)
+    script_chars = sum(len(m.group(0)) for m in _SCRIPT_BLOCK.finditer(html))
+    decision = RenderDecision(
+        needs_render=False,
+        text_chars=len(text),
+        text_ratio=round(len(text) / size, 4),
+        script_ratio=round(script_chars / size, 4),
+    )
+    for name, pattern in FRAMEWORK_MARKERS:
+        if pattern.search(html):
+            decision.framework = name
+            break
+
+    thin = len(text) < MIN_TEXT_CHARS
+    if EMPTY_ROOT.search(html):
+        decision.reasons.append("empty_root_container")
+    if NOSCRIPT_JS_WARNING.search(html) and thin:
+        decision.reasons.append("noscript_javascript_required")
+    if decision.framework and thin:
+        decision.reasons.append(f"framework_without_content:{decision.framework}")
+    if decision.text_ratio < MIN_TEXT_RATIO and decision.script_ratio > 0.5:
+        decision.reasons.append("script_heavy_low_text")
+    decision.needs_render = bool(decision.reasons)
+    return decision
+
+
+def host_key(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+class RenderDetector:
+    """
+    Render Detector
+    Caches one ``RenderDecision`` per host (LRU bounded).
+    """
+
+    def __init__(self, max_hosts: int = MAX_CACHED_HOSTS):
+        self.max_hosts = max_hosts
+        self._decisions: "OrderedDict[str, RenderDecision]" = OrderedDict()
+        self.stats = {"analyzed": 0, "cache_hits": 0}
+
+    def cached(self, url: str) -> Optional[RenderDecision]:
+        """Return the host's cached decision without needing a body."""
+        host = host_key(url)
+        decision = self._decisions.get(host)
+        if decision is None:
+            return None
+        self._decisions.move_to_end(host)
+        return RenderDecision(**{**decision.__dict__, "cached": True})
+
+    def classify(self, url: str, html: str) -> RenderDecision:
+        decision = self.cached(url)
+        if decision is not None:
+            self.stats["cache_hits"] += 1
+            return decision
+        decision = analyze_html(html)
+        self.stats["analyzed"] += 1
+        self._decisions[host_key(url)] = decision
+        while len(self._decisions) > self.max_hosts:
+            self._decisions.popitem(last=False)
+        return decision
+
+
+render_detector = RenderDetector()
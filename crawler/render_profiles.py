@@ -0,0 +1,378 @@
+"""Render profiles: how much of a page the browser loads before extraction.
+
+A profile decides which requests a page may make (resource types and domain
+deny-lists, enforced with Playwright request interception), when navigation
+counts as finished (``domcontentloaded``, ``load``, ``networkidle`` and/or a
+CSS selector) and whether JavaScript runs at all. Built-in profiles:
+
+* ``full`` - everything loads, wait for ``load``; the default (override it
+  with ``RENDER_PROFILE``) and the behaviour before profiles existed;
+* ``text`` - no images, media, fonts, stylesheets or trackers, wait for
+  ``domcontentloaded``. Without stylesheets, text hidden by CSS shows up in
+  ``inner_text``;
+* ``spa`` - no images, media, fonts or trackers, wait for ``networkidle`` so
+  client-side apps finish loading their data;
+* ``nojs`` - JavaScript disabled and nothing but documents loaded.
+
+Seeds choose profiles per domain (subdomains included)::
+
+    render:
+      default: text
+      domains:
+        app.example.com: spa
+      profiles:
+        spa-lite: {base: spa, block_domains: [cdn.example.net], wait_for_selector: "#root > *"}
+    sources:
+      - url: https://docs.example.com/
+        render_profile: nojs    # applies to docs.example.com
+
+Every render is measured per profile in ``crawler.metrics``: time, bytes
+received and blocked requests. ``profile_report()`` turns those into
+savings; bytes of blocked requests are estimated from the average size of
+received responses of the same type. For a direct measurement render the
+same pages under several profiles::
+
+    python -m crawler.render_profiles https://example.com/ --profiles full text nojs
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+from playwright.async_api import Page, Route, TimeoutError as PlaywrightTimeoutError
+
+from crawler.metrics import metrics
+
+DEFAULT_PROFILE = os.environ.get("RENDER_PROFILE", "full")
+SELECTOR_TIMEOUT = float(os.environ.get("RENDER_SELECTOR_TIMEOUT", 10))
+
+RESOURCE_TYPES = frozenset({
+    "document", "stylesheet", "image", "media", "font", "script", "texttrack", "xhr", "fetch",
+    "eventsource", "websocket", "manifest", "other",
+})
+WAIT_STATES = ("commit", "domcontentloaded", "load", "networkidle")
+# Hosts that serve only tracking and ads. They are matched with their
+# subdomains, so sites that also serve pages of their own (linkedin.com,
+# bing.com, hubspot.com, ...) are listed by their tracker hosts only.
+TRACKER_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "connect.facebook.net", "static.hotjar.com", "script.hotjar.com",
+    "cdn.segment.com", "api.segment.io", "cdn.mxpnl.com", "api-js.mixpanel.com", "cdn.amplitude.com",
+    "edge.fullstory.com", "clarity.ms", "bat.bing.com", "px.ads.linkedin.com", "snap.licdn.com",
+    "static.ads-twitter.com", "adsrvr.org", "criteo.net", "static.criteo.com", "cdn.taboola.com",
+    "widgets.outbrain.com", "js-agent.newrelic.com", "nr-data.net", "cdn.optimizely.com",
+    "widget.intercom.io", "js.intercomcdn.com", "js.hs-scripts.com", "js.hs-analytics.net",
+)
+# Typical transfer sizes, used for savings estimates until responses of a
+# type have been seen.
+_TYPICAL_BYTES = {"image": 40_000, "media": 500_000, "font": 30_000, "stylesheet": 20_000, "script": 30_000}
+_OTHER_BYTES = 5_000
+
+RENDER_SECONDS = metrics.histogram("crawl_render_seconds", "Page render time per render profile.", ("profile",))
+RENDER_BYTES = metrics.counter("crawl_render_bytes_total", "Bytes received while rendering, per profile.",
+                               ("profile",))
+BLOCKED = metrics.counter("crawl_render_blocked_total", "Requests blocked by render profiles.", ("profile", "type"))
+RESOURCE_BYTES = metrics.counter("crawl_render_resource_bytes_total",
+                                 "Bytes received while rendering, per resource type.", ("type",))
+RESOURCES = metrics.counter("crawl_render_resources_total",
+                            "Sized responses received while rendering, per resource type.", ("type",))
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    name: str
+    block_resource_types: FrozenSet[str] = frozenset()
+    block_domains: Tuple[str, ...] = ()
+    wait_until: str = "load"
+    wait_for_selector: Optional[str] = None
+    javascript: bool = True
+
+    def __post_init__(self):
+        unknown = set(self.block_resource_types) - RESOURCE_TYPES
+        if unknown:
+            raise ValueError(f"render profile {self.name!r}: unknown resource types {sorted(unknown)}")
+        if self.wait_until not in WAIT_STATES:
+            raise ValueError(f"render profile {self.name!r}: wait_until must be one of {WAIT_STATES}")
+
+    @property
+    def intercepts(self) -> bool:
+        return bool(self.block_resource_types or self.block_domains)
+
+    @property
+    def context_options(self) -> Dict:
+        """Browser context options; pages are pooled per distinct options."""
+        return {} if self.javascript else {"java_script_enabled": False}
+
+    def blocks(self, resource_type: str, url: str, first_party: Iterable[str] = ()) -> bool:
+        """Whether a subresource request is blocked.
+
+        Domain rules never apply to ``first_party`` hosts (the page's own
+        host, its subdomains and parents), so a site listed as a tracker
+        still loads its own resources. Main-frame navigations are not
+        subresources; ``apply_profile`` never asks about them.
+        """
+        if resource_type in self.block_resource_types:
+            return True
+        if not self.block_domains:
+            return False
+        host = (urlsplit(url).hostname or "").lower()
+        if any(_related(host, site) for site in first_party):
+            return False
+        return any(host == d or host.endswith("." + d) for d in self.block_domains)
+
+    @classmethod
+    def from_dict(cls, name: str, spec: Dict, base: Optional["RenderProfile"] = None) -> "RenderProfile":
+        """Build a profile from its seed YAML mapping, starting from ``base``."""
+        unknown = set(spec) - {"base", "block_resource_types", "block_domains", "block_trackers", "wait_until",
+                               "wait_for_selector", "javascript"}
+        if unknown:
+            raise ValueError(f"render profile {name!r}: unknown keys {sorted(unknown)}")
+        profile = replace(base, name=name) if base is not None else cls(name)
+        changes = {}
+        if "block_resource_types" in spec:
+            changes["block_resource_types"] = frozenset(spec["block_resource_types"] or ())
+        domains = list(profile.block_domains)
+        if "block_domains" in spec:
+            domains = [d.lower().lstrip(".") for d in spec["block_domains"] or ()]
+        if spec.get("block_trackers"):
+            domains += [d for d in TRACKER_DOMAINS if d not in domains]
+        changes["block_domains"] = tuple(domains)
+        for key in ("wait_until", "wait_for_selector", "javascript"):
+            if key in spec:
+                changes[key] = spec[key]
+        return replace(profile, **changes)
+
+
+def _related(host: str, site: str) -> bool:
+    return host == site or host.endswith("." + site) or site.endswith("." + host)
+
+
+_HEAVY = frozenset({"image", "media", "font"})
+
+BUILTIN_PROFILES: Dict[str, RenderProfile] = {
+    "full": RenderProfile("full"),
+    "text": RenderProfile("text", _HEAVY | {"stylesheet"}, TRACKER_DOMAINS, wait_until="domcontentloaded"),
+    "spa": RenderProfile("spa", _HEAVY, TRACKER_DOMAINS, wait_until="networkidle"),
+    "nojs": RenderProfile("nojs", RESOURCE_TYPES - {"document"}, wait_until="domcontentloaded", javascript=False),
+}
+
+
+class RenderProfiles:
+    """
+    Render Profiles
+    Picks the render profile of a URL from its host, falling back to a default.
+    """
+
+    def __init__(self, default: Union[str, RenderProfile] = DEFAULT_PROFILE,
+                 domains: Optional[Dict[str, str]] = None, profiles: Optional[Dict[str, RenderProfile]] = None):
+        self.profiles = {**BUILTIN_PROFILES, **(profiles or {})}
+        self.default = self.get(default)
+        self.domains = {d.lower().lstrip("."): self.get(p) for d, p in (domains or {}).items()}
+
+    def get(self, profile: Union[str, RenderProfile]) -> RenderProfile:
+        if isinstance(profile, RenderProfile):
+            return profile
+        try:
+            return self.profiles[profile]
+        except KeyError:
+            raise ValueError(f"unknown render profile {profile!r}; expected one of {sorted(self.profiles)}")
+
+    def for_url(self, url: str) -> RenderProfile:
+        host = (urlsplit(url).hostname or "").lower()
+        while host:
+            if host in self.domains:
+                return self.domains[host]
+            host = host.partition(".")[2]
+        return self.default
+
+    @classmethod
+    def from_seed(cls, seed: Dict) -> "RenderProfiles":
+        """Profiles from the ``render`` section and ``render_profile`` of the sources of a seed."""
+        render = seed.get("render") or {}
+        custom: Dict[str, RenderProfile] = {}
+        for name, spec in (render.get("profiles") or {}).items():
+            spec = spec or {}
+            base = None
+            if spec.get("base"):
+                base = custom.get(spec["base"]) or BUILTIN_PROFILES.get(spec["base"])
+                if base is None:
+                    raise ValueError(f"render profile {name!r}: unknown base {spec['base']!r}")
+            custom[name] = RenderProfile.from_dict(name, spec, base)
+        domains = dict(render.get("domains") or {})
+        for source in seed.get("sources") or []:
+            host = urlsplit(source.get("url") or "").hostname
+            if host and source.get("render_profile"):
+                domains[host] = source["render_profile"]
+        return cls(render.get("default", DEFAULT_PROFILE), domains, custom)
+
+
+def default_profile() -> RenderProfile:
+    return RenderProfiles().default
+
+
+def _content_length(response) -> int:
+    try:
+        return int(response.headers.get("content-length") or 0)
+    except ValueError:
+        return 0
+
+
+@asynccontextmanager
+async def apply_profile(page: Page, profile: RenderProfile, url: Optional[str] = None) -> AsyncIterator[None]:
+    """Enforce ``profile`` on ``page`` for one render of ``url`` and account for its traffic.
+
+    Main-frame navigations are never blocked, and the hosts they go to
+    (``url`` and any redirect targets) count as first party. Bytes are
+    taken from ``Content-Length``, so chunked responses are not counted.
+    Interception is removed again on exit because pooled pages are reused
+    by renders with other profiles.
+    """
+    received = 0
+    first_party: Set[str] = set()
+    if url:
+        first_party.add((urlsplit(url).hostname or "").lower())
+
+    def _on_response(response):
+        nonlocal received
+        size = _content_length(response)
+        if size:
+            received += size
+            RESOURCE_BYTES.inc(size, type=response.request.resource_type)
+            RESOURCES.inc(type=response.request.resource_type)
+
+    async def _route(route: Route):
+        request = route.request
+        if request.is_navigation_request() and request.frame == page.main_frame:
+            first_party.add((urlsplit(request.url).hostname or "").lower())
+            await route.continue_()
+        elif profile.blocks(request.resource_type, request.url, first_party):
+            BLOCKED.inc(profile=profile.name, type=request.resource_type)
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    page.on("response", _on_response)
+    if profile.intercepts:
+        await page.route("**/*", _route)
+    try:
+        yield
+    finally:
+        page.remove_listener("response", _on_response)
+        if profile.intercepts:
+            try:
+                await page.unroute("**/*", _route)
+            except Exception:
+                pass
+        RENDER_BYTES.inc(received, profile=profile.name)
+
+
+async def wait_until_ready(page: Page, profile: RenderProfile):
+    """Wait for the profile's selector, if any; extraction proceeds without it."""
+    if not profile.wait_for_selector:
+        return
+    try:
+        await page.wait_for_selector(profile.wait_for_selector, timeout=SELECTOR_TIMEOUT * 1000)
+    except PlaywrightTimeoutError:
+        logging.info(f"render profile {profile.name}: {profile.wait_for_selector!r} not found on {page.url}")
+
+
+def average_resource_bytes(resource_type: str) -> float:
+    count = RESOURCES.value(type=resource_type)
+    if count:
+        return RESOURCE_BYTES.value(type=resource_type) / count
+    return _TYPICAL_BYTES.get(resource_type, _OTHER_BYTES)
+
+
+def profile_report() -> Dict[str, Dict]:
+    """Renders, time, bytes and savings per profile since the metrics were reset.
+
+    Seconds saved compare a profile's mean render time with the ``full``
+    profile's and are only reported when ``full`` rendered pages too; they
+    are meaningful when both rendered similar pages.
+    """
+    seconds = RENDER_SECONDS.summary()
+    blocked: Dict[str, Dict[str, int]] = {}
+    for (name, resource_type), n in BLOCKED.samples().items():
+        blocked.setdefault(name, {})[resource_type] = int(n)
+    full = seconds.get("full")
+    report = {}
+    for name, s in seconds.items():
+        by_type = blocked.get(name, {})
+        report[name] = {
+            "renders": s["count"],
+            "seconds": round(s["sum"], 3),
+            "mean_seconds": s["mean"],
+            "bytes_received": int(RENDER_BYTES.value(profile=name)),
+            "blocked_requests": sum(by_type.values()),
+            "blocked_by_type": by_type,
+            "estimated_bytes_saved": int(sum(n * average_resource_bytes(t) for t, n in by_type.items())),
+            "estimated_seconds_saved": (round((full["mean"] - s["mean"]) * s["count"], 3)
+                                        if full and name != "full" else None),
+        }
+    return report
+
+
+async def compare_profiles(urls: Iterable[str], profiles: Iterable[Union[str, RenderProfile]],
+                           timeout: int = 60) -> Dict[str, Dict]:
+    """Render ``urls`` under each profile and measure time, bytes and text kept.
+
+    Each profile gets a fresh browser so no profile profits from another's
+    HTTP cache; pages render one at a time.
+    """
+    from crawler.browser_pool import BrowserPool
+    from crawler.engine import crawl_page
+    urls = list(urls)
+    selector = RenderProfiles()
+    results = {}
+    for profile in (selector.get(p) for p in profiles):
+        bytes_before = RENDER_BYTES.value(profile=profile.name)
+        blocked_before = sum(n for (name, _), n in BLOCKED.samples().items() if name == profile.name)
+        seconds, text_chars, errors = 0.0, 0, 0
+        async with BrowserPool(size=1, contexts_per_browser=1) as pool:
+            for url in urls:
+                start = time.perf_counter()
+                try:
+                    snap = await crawl_page(pool, url, timeout=timeout, profile=profile)
+                    text_chars += len(snap["text"])
+                except Exception as e:
+                    errors += 1
+                    logging.warning(f"{profile.name}: {url} failed: {e}")
+                seconds += time.perf_counter() - start
+        blocked_after = sum(n for (name, _), n in BLOCKED.samples().items() if name == profile.name)
+        results[profile.name] = {
+            "pages": len(urls),
+            "errors": errors,
+            "seconds": round(seconds, 3),
+            "bytes_received": int(RENDER_BYTES.value(profile=profile.name) - bytes_before),
+            "blocked_requests": int(blocked_after - blocked_before),
+            "text_chars": text_chars,
+        }
+    baseline = results.get("full")
+    if baseline:
+        for name, r in results.items():
+            if name != "full":
+                r["bytes_saved"] = baseline["bytes_received"] - r["bytes_received"]
+                r["seconds_saved"] = round(baseline["seconds"] - r["seconds"], 3)
+    return results
+
+
+def main():
+    p = argparse.ArgumentParser(description="Render pages under several render profiles and compare the cost.")
+    p.add_argument("urls", nargs="+")
+    p.add_argument("--profiles", nargs="+", default=list(BUILTIN_PROFILES))
+    p.add_argument("--timeout", type=int, default=60)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(asyncio.run(compare_profiles(args.urls, args.profiles, args.timeout)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Shared robots.txt store used by every fetch path.
+
+Rules are fetched once per origin and cached as parsed
+``urllib.robotparser.RobotFileParser`` objects in an LRU with a TTL. Outcomes
+follow RFC 9309:
+
+* 2xx: the file is parsed and cached for ``ttl`` seconds,
+* 4xx (typically 404): everything is allowed, cached for ``ttl`` seconds,
+* 5xx, timeouts and network errors: everything is disallowed, cached for
+  the shorter ``error_ttl`` so the host is retried soon.
+
+Concurrent lookups for one origin share a single fetch, both for the async
+API (``can_fetch``/``crawl_delay``/``sitemaps``) and its blocking twin
+(``can_fetch_sync``) used by the synchronous agents.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+import urllib.robotparser
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from crawler.fetch_client import fetch_client
+
+DEFAULT_USER_AGENT = "*"
+DEFAULT_TTL = 3600
+DEFAULT_ERROR_TTL = 300
+DEFAULT_MAX_HOSTS = 2048
+DEFAULT_TIMEOUT = 10
+
+
+@dataclass
+class RobotsRules:
+    parser: urllib.robotparser.RobotFileParser
+    status: str
+    expires_at: float
+
+    def can_fetch(self, url: str, user_agent: str = DEFAULT_USER_AGENT) -> bool:
+        return self.parser.can_fetch(user_agent, url)
+
+    def crawl_delay(self, user_agent: str = DEFAULT_USER_AGENT) -> Optional[float]:
+        delay = self.parser.crawl_delay(user_agent)
+        return float(delay) if delay is not None else None
+
+    @property
+    def sitemaps(self) -> List[str]:
+        return list(self.parser.site_maps() or [])
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+def parse_rules(status_code: Optional[int], text: str, ttl: float, error_ttl: float) -> RobotsRules:
+    parser = urllib.robotparser.RobotFileParser()
+    now = time.time()
+    if status_code is not None and 200 <= status_code < 300:
+        parser.parse(text.splitlines())
+        return RobotsRules(parser, "ok", now + ttl)
+    parser.modified()
+    if status_code is not None and 400 <= status_code < 500:
+        parser.allow_all = True
+        return RobotsRules(parser, "missing", now + ttl)
+    parser.disallow_all = True
+    return RobotsRules(parser, "unreachable", now + error_ttl)
+
+
+class _FetchAbandoned(Exception):
+    """The task fetching an origin's rules was cancelled before it finished."""
+
+
+class RobotsStore:
+    """
+    Robots Store
+    Per-origin LRU/TTL cache of parsed robots.txt rules with single-flight
+    fetching.
+    """
+
+    def __init__(
+        self,
+        max_hosts: int = DEFAULT_MAX_HOSTS,
+        ttl: float = DEFAULT_TTL,
+        error_ttl: float = DEFAULT_ERROR_TTL,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.max_hosts = max_hosts
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        self._cache: "OrderedDict[str, RobotsRules]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Per-origin fetch locks of ``get_sync`` with the number of threads
+        # using each; an entry is dropped once the last of them is done.
+        self._sync_locks: Dict[str, List] = {}
+        self.stats = {"hits": 0, "fetches": 0, "errors": 0}
+
+    def _cached(self, origin: str) -> Optional[RobotsRules]:
+        with self._lock:
+            rules = self._cache.get(origin)
+            if rules is None:
+                return None
+            if rules.expires_at <= time.time():
+                del self._cache[origin]
+                return None
+            self._cache.move_to_end(origin)
+            self.stats["hits"] += 1
+            return rules
+
+    def _store(self, origin: str, rules: RobotsRules) -> RobotsRules:
+        with self._lock:
+            self._cache[origin] = rules
+            self._cache.move_to_end(origin)
+            while len(self._cache) > self.max_hosts:
+                self._cache.popitem(last=False)
+        return rules
+
+    def _parse(self, origin: str, status_code: Optional[int], text: str) -> RobotsRules:
+        rules = parse_rules(status_code, text, self.ttl, self.error_ttl)
+        if rules.status == "unreachable":
+            self.stats["errors"] += 1
+            logging.info(f"robots.txt unreachable for {origin} (status={status_code})")
+        return self._store(origin, rules)
+
+    async def get(self, url: str, client: Optional[httpx.AsyncClient] = None) -> RobotsRules:
+        """Return the rules for ``url``'s origin, fetching them at most once."""
+        origin = origin_of(url)
+        rules = self._cached(origin)
+        if rules is not None:
+            return rules
+        pending = self._inflight.get(origin)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except _FetchAbandoned:
+                # The task fetching the rules was cancelled; fetch them here.
+                return await self.get(url, client)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[origin] = future
+        try:
+            rules = await self._fetch_async(origin, client)
+        except BaseException as e:
+            # Waiters see the error, never the cancellation of another task.
+            future.set_exception(e if isinstance(e, Exception) else _FetchAbandoned())
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(origin, None)
+        future.set_result(rules)
+        return rules
+
+    async def _fetch_async(self, origin: str, client: Optional[httpx.AsyncClient]) -> RobotsRules:
+        self.stats["fetches"] += 1
+        status_code, text = None, ""
+        try:
+            if client is None:
+                r = await fetch_client.get(origin + "/robots.txt", timeout=self.timeout)
+            else:
+                r = await client.get(origin + "/robots.txt", timeout=self.timeout, follow_redirects=True)
+            status_code, text = r.status_code, r.text
+        except Exception as e:
+            logging.info(f"robots.txt fetch failed for {origin}: {e}")
+        return self._parse(origin, status_code, text)
+
+    def get_sync(self, url: str) -> RobotsRules:
+        """Blocking variant of ``get`` sharing the same cache."""
+        origin = origin_of(url)
+        rules = self._cached(origin)
+        if rules is not None:
+            return rules
+        with self._lock:
+            entry = self._sync_locks.setdefault(origin, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                rules = self._cached(origin)
+                if rules is None:
+                    rules = self._fetch_sync(origin)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._sync_locks[origin]
+        return rules
+
+    def _fetch_sync(self, origin: str) -> RobotsRules:
+        self.stats["fetches"] += 1
+        status_code, text = None, ""
+        try:
+            r = fetch_client.get_sync(origin + "/robots.txt", timeout=self.timeout)
+            status_code, text = r.status_code, r.text
+        except Exception as e:
+            logging.info(f"robots.txt fetch failed for {origin}: {e}")
+        return self._parse(origin, status_code, text)
+
+    async def can_fetch(self, url: str, user_agent: str = DEFAULT_USER_AGENT,
+                        client: Optional[httpx.AsyncClient] = None) -> bool:
+        return (await self.get(url, client)).can_fetch(url, user_agent)
+
+    async def crawl_delay(self, url: str, user_agent: str = DEFAULT_USER_AGENT,
+                          client: Optional[httpx.AsyncClient] = None) -> Optional[float]:
+        return (await self.get(url, client)).crawl_delay(user_agent)
+
+    async def sitemaps(self, url: str, client: Optional[httpx.AsyncClient] = None) -> List[str]:
+        return (await self.get(url, client)).sitemaps
+
+    def can_fetch_sync(self, url: str, user_agent: str = DEFAULT_USER_AGENT) -> bool:
+        return self.get_sync(url).can_fetch(url, user_agent)
+
+    def crawl_delay_sync(self, url: str, user_agent: str = DEFAULT_USER_AGENT) -> Optional[float]:
+        return self.get_sync(url).crawl_delay(user_agent)
+
+
+robots_store = RobotsStore()
@@ -1,13 +1,33 @@
 import argparse
 import asyncio
+import json
+import logging
 from crawler.engine import run_from_seed
+from crawler.frontier import Frontier
+from crawler.metrics import metrics
 
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--seed", default="crawler/seeds/business_loans.yaml")
+    p.add_argument("--incremental", action="store_true",
+                   help="only crawl URLs the recrawl schedule considers due")
+    p.add_argument("--budget", type=int, default=None,
+                   help="max URLs to fetch this run (with --incremental)")
+    p.add_argument("--frontier", default=None,
+                   help="directory of a persistent frontier; rerun with the same one to resume a crawl")
     args = p.parse_args()
-    asyncio.run(run_from_seed(args.seed))
+    if args.budget is not None and not args.incremental:
+        p.error("--budget requires --incremental")
+    frontier = Frontier(args.frontier) if args.frontier else None
+    try:
+        stats = asyncio.run(run_from_seed(args.seed, incremental=args.incremental, budget=args.budget,
+                                          frontier=frontier))
+    finally:
+        if frontier is not None:
+            frontier.close()
+    logging.info(f"crawl finished: {stats}")
+    logging.info(f"metrics: {json.dumps(metrics.summary())}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+"""Async crawl scheduler with global and per-host politeness limits.
+
+URLs are queued per host and dispatched in priority order (lower value runs
+first) subject to:
+
+* a global cap on concurrently running tasks,
+* a per-host cap on concurrently running tasks,
+* a minimum delay between task starts on the same host, raised to the
+  host's robots ``Crawl-delay`` when a ``host_delay`` resolver is given; the
+  delay is looked up in the background, so ``submit`` never waits on it and
+  only the new host's URLs are held back until it is known,
+* a bound on queued + running URLs: ``submit`` blocks once ``max_pending``
+  URLs are outstanding, so memory stays flat regardless of seed size.
+
+While ``crawler.fetch_cache`` replays recorded responses no request reaches
+a host, so the per-host delays and caps are lifted.
+
+Usage::
+
+    async with CrawlScheduler(handler, concurrency=4) as sched:
+        for url in urls:
+            await sched.submit(url)
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from crawler.fetch_cache import fetch_cache
+from crawler.metrics import metrics, record_error
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PER_HOST_CONCURRENCY = 1
+DEFAULT_MIN_DELAY = 1.0
+DEFAULT_MAX_PENDING = 1000
+
+Handler = Callable[[str], Awaitable[Any]]
+DelayResolver = Callable[[str], Awaitable[Optional[float]]]
+
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+class _HostState:
+    __slots__ = ("queue", "active", "next_at", "delay", "queued", "resolving")
+
+    def __init__(self, delay: float, resolving: bool = False):
+        self.queue: List[Tuple[int, int, str]] = []
+        self.active = 0
+        self.next_at = 0.0
+        self.delay = delay
+        self.queued = False
+        self.resolving = resolving
+
+
+class CrawlScheduler:
+    """
+    Crawl Scheduler
+    Runs ``handler(url)`` for submitted URLs under global and per-host limits.
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        per_host_concurrency: int = DEFAULT_PER_HOST_CONCURRENCY,
+        min_delay: float = DEFAULT_MIN_DELAY,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        host_delay: Optional[DelayResolver] = None,
+        on_result: Optional[Callable[[str, Any, Optional[BaseException]], Any]] = None,
+    ):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+        self.min_delay = max(0.0, min_delay)
+        self.max_pending = max(1, max_pending)
+        self.host_delay = host_delay
+        if fetch_cache.replaying:
+            self.per_host_concurrency, self.min_delay, self.host_delay = self.concurrency, 0.0, None
+        self.on_result = on_result
+
+        self._hosts: Dict[str, _HostState] = {}
+        self._ready: List[Tuple[int, int, str]] = []
+        self._delayed: List[Tuple[float, int, str]] = []
+        self._expiring: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._outstanding = 0
+        self._tasks: set = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._closing = False
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "max_running": 0}
+        metrics.add_collector("scheduler", CrawlScheduler._gauges, owner=self)
+
+    async def __aenter__(self) -> "CrawlScheduler":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.join()
+        await self.close()
+
+    def start(self):
+        if self._dispatcher is not None:
+            return
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    def _gauges(self) -> Dict:
+        return {"pending": self._outstanding, "running": self._running, "hosts": len(self._hosts),
+                "completed": self.stats["completed"], "failed": self.stats["failed"]}
+
+    @property
+    def pending(self) -> int:
+        """Number of URLs submitted but not yet finished."""
+        return self._outstanding
+
+    async def submit(self, url: str, priority: int = 0):
+        """Queue ``url``; waits while ``max_pending`` URLs are outstanding."""
+        if self._dispatcher is None:
+            self.start()
+        await self._slots.acquire()
+        host = host_of(url)
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.min_delay, resolving=self.host_delay is not None)
+            if state.resolving:
+                self._spawn(self._resolve_delay(host, url, state))
+        heapq.heappush(state.queue, (priority, next(self._seq), url))
+        self._outstanding += 1
+        self.stats["submitted"] += 1
+        self._idle.clear()
+        self._enqueue_host(host, state)
+        self._wakeup.set()
+
+    async def run(self, urls: Union[Iterable[str], AsyncIterable[str]], priority: int = 0) -> Dict:
+        """Submit every URL from ``urls`` (sync or async iterable) and wait until all have finished."""
+        async with self:
+            if isinstance(urls, AsyncIterable):
+                async for url in urls:
+                    await self.submit(url, priority=priority)
+            else:
+                for url in urls:
+                    await self.submit(url, priority=priority)
+        return dict(self.stats)
+
+    async def join(self):
+        """Wait until every submitted URL has been handled."""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def close(self):
+        self._closing = True
+        if self._dispatcher is not None:
+            self._wakeup.set()
+            await self._dispatcher
+            self._dispatcher = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve_delay(self, host: str, url: str, state: _HostState):
+        try:
+            state.delay = max(state.delay, float(await self.host_delay(url) or 0.0))
+        except Exception as e:
+            logging.info(f"crawl-delay lookup failed for {host}: {e}")
+        finally:
+            state.resolving = False
+        self._enqueue_host(host, state)
+        self._wakeup.set()
+
+    def _enqueue_host(self, host: str, state: _HostState):
+        if state.queued or state.resolving or not state.queue or state.active >= self.per_host_concurrency:
+            return
+        state.queued = True
+        if state.next_at <= time.monotonic():
+            heapq.heappush(self._ready, (state.queue[0][0], next(self._seq), host))
+        else:
+            heapq.heappush(self._delayed, (state.next_at, next(self._seq), host))
+
+    async def _dispatch_loop(self):
+        while not self._closing:
+            now = time.monotonic()
+            while self._expiring and self._expiring[0][0] <= now:
+                _, _, host = heapq.heappop(self._expiring)
+                state = self._hosts.get(host)
+                if state is not None and not state.queue and state.active == 0 and state.next_at <= now:
+                    del self._hosts[host]
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, host = heapq.heappop(self._delayed)
+                state = self._hosts[host]
+                heapq.heappush(self._ready, (state.queue[0][0], next(self._seq), host))
+
+            while self._ready and self._running < self.concurrency:
+                _, _, host = heapq.heappop(self._ready)
+                state = self._hosts[host]
+                state.queued = False
+                _, _, url = heapq.heappop(state.queue)
+                state.active += 1
+                state.next_at = now + state.delay
+                self._running += 1
+                self.stats["max_running"] = max(self.stats["max_running"], self._running)
+                self._spawn(self._run_one(host, url))
+                self._enqueue_host(host, state)
+
+            timeout = None
+            if self._delayed and self._running < self.concurrency:
+                timeout = max(0.0, self._delayed[0][0] - time.monotonic())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_one(self, host: str, url: str):
+        error: Optional[BaseException] = None
+        result = None
+        try:
+            result = await self.handler(url)
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+            self.stats["failed"] += 1
+            record_error("task", e)
+            logging.info(f"crawl task failed for {url}: {e}")
+        finally:
+            state = self._hosts[host]
+            state.active -= 1
+            self._running -= 1
+            self._outstanding -= 1
+            self._slots.release()
+            if not state.queue and state.active == 0:
+                # Keep the idle host until its politeness delay has run out so
+                # a later submit cannot skip it; the dispatcher drops it then.
+                heapq.heappush(self._expiring, (state.next_at, next(self._seq), host))
+            else:
+                self._enqueue_host(host, state)
+            if self._outstanding == 0:
+                self._idle.set()
+            self._wakeup.set()
+        if self.on_result is not None:
+            self.on_result(url, result, error)
@@ -0,0 +1,398 @@
+"""Sitemap discovery for seed expansion.
+
+Sites list their pages in sitemaps (https://www.sitemaps.org/protocol.html)
+and announce them with ``Sitemap:`` lines in robots.txt. For seed sources
+that enable it, ``SitemapDiscovery`` crawls the pages a site's sitemaps list
+instead of the seed URL alone:
+
+* sitemap locations come from robots.txt (``crawler.robots``) or from the
+  seed; sitemap indexes are followed up to ``SITEMAP_MAX_DEPTH`` levels,
+* each sitemap is downloaded through ``fetch_client`` into a spooled
+  temporary file (so no connection is held while the crawl queue applies
+  backpressure) and parsed incrementally, gzip'd or not; every entry is
+  dropped from the tree once read, so a 50k-URL sitemap parses in the same
+  memory as a ten-URL one,
+* with a ``RecrawlStore``, page entries whose ``<lastmod>`` is not newer
+  than the previous fetch of the page are skipped, and child sitemaps whose
+  index ``<lastmod>`` is older than their last complete read are not
+  downloaded at all. Entries without ``<lastmod>`` are always kept.
+
+Seed options::
+
+    sitemaps: true              # default for every source (default false)
+    sources:
+      - url: https://example.com
+        sitemap: true           # from robots.txt; or a URL / list of URLs; false disables
+
+Sources whose site publishes no sitemap are crawled from their seed URL as
+before. Sitemap reads are only remembered by ``commit``, which callers run
+once the crawl of the discovered URLs finished without failures, so pages
+of an interrupted run are offered again.
+
+Usage::
+
+    discovery = SitemapDiscovery(recrawl=recrawl_store)
+    published = await discovery.locate(sitemap_sources(seed))
+    await scheduler.run(discovery.stream(u for u in seed_urls if u not in published))
+    discovery.commit()
+
+Settings (env): SITEMAP_MAX_DEPTH, SITEMAP_MAX_MB, SITEMAP_MAX_URLS.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import calendar
+import logging
+import os
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
+
+import httpx
+
+from crawler.fetch_cache import FetchCacheMiss
+from crawler.fetch_client import FetchClient, aiter_capped, fetch_client
+from crawler.recrawl import RecrawlStore
+from crawler.robots import robots_store
+
+SITEMAP_MAX_DEPTH = int(os.environ.get("SITEMAP_MAX_DEPTH", 3))
+# The protocol caps a sitemap at 50 MB uncompressed; the cap also applies
+# to the decompressed size of gzip'd sitemaps.
+SITEMAP_MAX_BYTES = int(float(os.environ.get("SITEMAP_MAX_MB", 50)) * 1024 * 1024)
+# Max page URLs taken from one site per run (0: no limit); one full sitemap.
+SITEMAP_MAX_URLS = int(os.environ.get("SITEMAP_MAX_URLS", 50000))
+_GZIP_MAGIC = b"\x1f\x8b"
+_READ_CHUNK = 64 * 1024
+_SPOOL_BYTES = 1024 * 1024
+_FILTER_BATCH = 500
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of a W3C datetime ``<lastmod>``; None when missing or invalid.
+
+    Dates without a time (``2024-05-01``, ``2024-05``, ``2024``) count as
+    the end of that period, so a page changed later on the day of the
+    previous crawl is not taken as unchanged.
+    """
+    value = (value or "").strip()
+    try:
+        if len(value) == 4:
+            return float(calendar.timegm((int(value) + 1, 1, 1, 0, 0, 0)))
+        if len(value) == 7:
+            year, month = int(value[:4]), int(value[5:])
+            return float(calendar.timegm((year + month // 12, month % 12 + 1, 1, 0, 0, 0)))
+        if len(value) == 10:
+            day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            return (day + timedelta(days=1)).timestamp()
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _local(tag) -> str:
+    return tag.rpartition("}")[2] if isinstance(tag, str) else ""
+
+
+def _site(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+@dataclass
+class SitemapEntry:
+    url: str
+    lastmod: Optional[float] = None
+
+
+class SitemapParser:
+    """
+    Sitemap Parser
+    Incremental parser for ``urlset`` and ``sitemapindex`` documents, plain or gzip'd.
+    """
+
+    def __init__(self, max_bytes: int = SITEMAP_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.kind: Optional[str] = None
+        self.bytes = 0
+        self._xml = ElementTree.XMLPullParser(events=("start", "end"))
+        self._gunzip = None
+        self._head = b""
+        self._root = None
+
+    def feed(self, chunk: bytes) -> List[SitemapEntry]:
+        """Parse the next chunk of the raw body; returns the entries it completed."""
+        if self._head is not None:
+            # Sniff gzip from the magic bytes: servers label .xml.gz files inconsistently.
+            self._head += chunk
+            if len(self._head) < len(_GZIP_MAGIC):
+                return []
+            chunk, self._head = self._head, None
+            if chunk.startswith(_GZIP_MAGIC):
+                self._gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._gunzip is None:
+            self._count(len(chunk))
+            self._xml.feed(chunk)
+            return self._entries()
+        entries = []
+        while chunk:
+            # Bounded output so a gzip bomb fails at the cap instead of in memory.
+            data = self._gunzip.decompress(chunk, _READ_CHUNK)
+            self._count(len(data))
+            self._xml.feed(data)
+            entries.extend(self._entries())
+            chunk = self._gunzip.unconsumed_tail
+        return entries
+
+    def close(self) -> List[SitemapEntry]:
+        if self._head:
+            self._xml.feed(self._head)
+            self._head = None
+        self._xml.close()
+        return self._entries()
+
+    def _count(self, n: int):
+        self.bytes += n
+        if self.bytes > self.max_bytes:
+            raise ValueError(f"sitemap exceeds {self.max_bytes} bytes")
+
+    def _entries(self) -> List[SitemapEntry]:
+        entries = []
+        for event, elem in self._xml.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                    self.kind = _local(elem.tag)
+                continue
+            if _local(elem.tag) not in ("url", "sitemap") or elem is self._root:
+                continue
+            fields = {_local(child.tag): (child.text or "").strip() for child in elem}
+            if fields.get("loc", "").startswith(("http://", "https://")):
+                entries.append(SitemapEntry(fields["loc"], parse_lastmod(fields.get("lastmod"))))
+            # Drop finished entries (and anything between them) from the tree.
+            self._root.clear()
+        return entries
+
+
+def sitemap_sources(seed: Dict) -> Dict[str, Optional[List[str]]]:
+    """Seed URLs that take part in sitemap discovery, mapped to their
+    configured sitemap URLs (None: look them up in robots.txt)."""
+    default = bool(seed.get("sitemaps", False))
+    sources = {}
+    for source in seed.get("sources", []):
+        url, option = source.get("url"), source.get("sitemap", default)
+        if not url or option is False or option is None:
+            continue
+        if option is True:
+            sources[url] = None
+        else:
+            sources[url] = [option] if isinstance(option, str) else list(option)
+    return sources
+
+
+class SitemapDiscovery:
+    """
+    Sitemap Discovery
+    Streams the page URLs of seed sites' sitemaps, skipping pages unchanged since the previous crawl.
+    """
+
+    def __init__(self, recrawl: Optional[RecrawlStore] = None, client: Optional[FetchClient] = None,
+                 max_depth: int = SITEMAP_MAX_DEPTH, max_bytes: int = SITEMAP_MAX_BYTES,
+                 max_urls: int = SITEMAP_MAX_URLS, canonicalize: Optional[Callable[[str], str]] = None):
+        self.recrawl = recrawl
+        self.canonicalize = canonicalize
+        self.client = client or fetch_client
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.max_urls = max_urls
+        self.sites: Dict[str, List[str]] = {}
+        self.stats = {"sites": 0, "sitemaps": 0, "sitemaps_skipped": 0, "errors": 0, "entries": 0,
+                      "unchanged": 0, "offsite": 0, "urls": 0, "truncated": False}
+        self._read: Dict[str, float] = {}
+        self._seen = set()
+
+    async def locate(self, sources: Dict[str, Optional[List[str]]]) -> List[str]:
+        """Find the sitemaps of ``sources`` (see ``sitemap_sources``); returns
+        the seed URLs whose site publishes at least one."""
+        for url, configured in sources.items():
+            located = configured if configured is not None else await robots_store.sitemaps(url)
+            if located:
+                self.sites[url] = list(located)
+        self.stats["sites"] = len(self.sites)
+        logging.info(f"sitemaps: {len(self.sites)} of {len(sources)} sites publish sitemaps")
+        return list(self.sites)
+
+    async def stream(self, first: Iterable[str] = (), limit: Optional[int] = None) -> AsyncIterator[str]:
+        """``first``, then the page URLs of every located site; at most
+        ``limit`` distinct URLs in all.
+
+        A stream cut short by ``limit`` leaves sitemap entries unread, so
+        ``commit`` then remembers no sitemap and they are offered again.
+        """
+        if limit is None:
+            async for url in self._stream(first):
+                yield url
+            return
+        emitted = set()
+        source = self._stream(first)
+        try:
+            async for url in source:
+                if url in emitted:
+                    continue
+                if len(emitted) >= limit:
+                    self.stats["truncated"] = True
+                    return
+                emitted.add(url)
+                yield url
+        finally:
+            await source.aclose()
+
+    async def _stream(self, first: Iterable[str]) -> AsyncIterator[str]:
+        for url in first:
+            yield url
+        for site, sitemaps in self.sites.items():
+            async for url in self.urls(site, sitemaps):
+                yield url
+
+    async def urls(self, site: str, sitemaps: Iterable[str]) -> AsyncIterator[str]:
+        """Page URLs of ``site`` listed in ``sitemaps`` that changed since they were last fetched."""
+        home, taken, batch = _site(site), 0, []
+        async for entry in self.entries(sitemaps):
+            if _site(entry.url) != home:
+                self.stats["offsite"] += 1
+                continue
+            if self.canonicalize is not None:
+                # Look pages up under the URL their fetches are recorded with.
+                entry = SitemapEntry(self.canonicalize(entry.url), entry.lastmod)
+            batch.append(entry)
+            if len(batch) < _FILTER_BATCH:
+                continue
+            for url in await self._changed(batch):
+                yield url
+                taken += 1
+                if self.max_urls and taken >= self.max_urls:
+                    return
+            batch = []
+        for url in await self._changed(batch):
+            if self.max_urls and taken >= self.max_urls:
+                return
+            yield url
+            taken += 1
+
+    async def entries(self, sitemaps: Iterable[str]) -> AsyncIterator[SitemapEntry]:
+        """Page entries of ``sitemaps`` and of the sitemaps they index, in document order."""
+        stack = [(url, 0, None) for url in reversed(list(sitemaps))]
+        while stack:
+            url, depth, lastmod = stack.pop()
+            if url in self._seen:
+                continue
+            self._seen.add(url)
+            if lastmod is not None and self.recrawl is not None:
+                read_at = await asyncio.to_thread(self.recrawl.sitemap_read_at, url)
+                if read_at is not None and lastmod <= read_at:
+                    self.stats["sitemaps_skipped"] += 1
+                    continue
+            children = []
+            for kind, entry in await self._parse(url):
+                if kind == "sitemapindex":
+                    if depth < self.max_depth:
+                        children.append((entry.url, depth + 1, entry.lastmod))
+                    continue
+                self.stats["entries"] += 1
+                yield entry
+            stack.extend(reversed(children))
+
+    async def _parse(self, url: str) -> Iterator:
+        started = time.time()
+        spool = await self._download(url)
+        if spool is None:
+            return iter(())
+        return self._parse_spool(url, spool, started)
+
+    def _parse_spool(self, url: str, spool, started: float) -> Iterator:
+        parser = SitemapParser(self.max_bytes)
+        try:
+            with spool:
+                while True:
+                    chunk = spool.read(_READ_CHUNK)
+                    entries = parser.feed(chunk) if chunk else parser.close()
+                    for entry in entries:
+                        yield parser.kind, entry
+                    if not chunk:
+                        break
+        except (ValueError, ElementTree.ParseError) as e:
+            self.stats["errors"] += 1
+            logging.info(f"sitemap {url}: {e}")
+            return
+        self._read[url] = started
+
+    async def _download(self, url: str):
+        self.stats["sitemaps"] += 1
+        spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES)
+        try:
+            async with self.client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request,
+                                                response=response)
+                async for chunk in aiter_capped(response, self.max_bytes):
+                    spool.write(chunk)
+        except (httpx.HTTPError, FetchCacheMiss) as e:
+            spool.close()
+            self.stats["errors"] += 1
+            logging.info(f"sitemap {url}: {e}")
+            return None
+        spool.seek(0)
+        return spool
+
+    async def _changed(self, batch: List[SitemapEntry]) -> List[str]:
+        if not batch:
+            return []
+        if self.recrawl is None:
+            fetched = {}
+        else:
+            fetched = await asyncio.to_thread(self.recrawl.last_fetches, [e.url for e in batch])
+        urls = []
+        for entry in batch:
+            last = fetched.get(entry.url)
+            if last is not None and entry.lastmod is not None and entry.lastmod <= last:
+                self.stats["unchanged"] += 1
+                continue
+            urls.append(entry.url)
+        self.stats["urls"] += len(urls)
+        return urls
+
+    def commit(self):
+        """Remember the sitemaps read completely, so unchanged ones are skipped next run."""
+        if self.recrawl is not None and self._read and not self.stats["truncated"]:
+            self.recrawl.record_sitemaps(self._read)
+        self._read = {}
+
+
+def main():
+    from crawler.recrawl import recrawl_store
+    p = argparse.ArgumentParser(description="List the page URLs a site's sitemaps publish.")
+    p.add_argument("site", help="site URL; sitemaps are read from its robots.txt")
+    p.add_argument("--sitemap", action="append", default=None, help="sitemap URL (repeatable)")
+    p.add_argument("--changed", action="store_true", help="only pages changed since their last recorded fetch")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    async def _list():
+        discovery = SitemapDiscovery(recrawl=recrawl_store if args.changed else None)
+        await discovery.locate({args.site: args.sitemap})
+        async for url in discovery.stream():
+            print(url)
+        logging.info(f"sitemaps: {discovery.stats}")
+    asyncio.run(_list())
+
+
+if __name__ == "__main__":
+    main()
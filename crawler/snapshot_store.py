@@ -0,0 +1,478 @@
+"""Content-addressed snapshot store.
+
+Snapshots (URL, fetch time, HTML and/or text, metadata) are kept in two
+places:
+
+* **segments** - append-only ``seg-<writer>-<n>.jsonl.gz`` files. Each body is
+  one JSON line compressed as its own gzip member (zstd frames with
+  ``SNAPSHOT_COMPRESSION=zstd`` when ``zstandard`` is installed), so a record
+  can be read back from its offset without touching the rest of the file.
+  Segments roll over at ``SNAPSHOT_SEGMENT_BYTES``; every writer (process)
+  appends to its own segments.
+* **index** - ``index.sqlite3`` with one row per snapshot, keyed by a stable
+  URL hash (sha1 of the URL, unlike the per-process salted ``hash()``), and
+  one row per distinct body keyed by its sha256. A body that was stored
+  before is not written again; the new snapshot just points at it.
+
+Writes are batched: records go to the segment at once, but the segment is
+fsynced and the index rows committed together every ``fsync_every`` records
+or ``fsync_interval`` seconds (and on ``flush``/``close``). The index is only
+committed after the data it points to is on disk.
+
+Usage::
+
+    from crawler.snapshot_store import snapshot_store
+    ref = snapshot_store.put(url, html=html, text=text, metadata={...})
+    snap = snapshot_store.get(url)          # latest snapshot or None
+    for snap in snapshot_store.iter_snapshots(): ...
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from crawler.metrics import metrics, stage
+
+SNAPSHOT_DIR = Path(os.environ.get(
+    "SNAPSHOT_DIR",
+    Path(__file__).resolve().parent.parent / "crawler_scraper_output" / "snapshots",
+))
+SNAPSHOT_COMPRESSION = os.environ.get("SNAPSHOT_COMPRESSION", "gzip")
+SEGMENT_BYTES = int(os.environ.get("SNAPSHOT_SEGMENT_BYTES", 256 * 1024 * 1024))
+FSYNC_EVERY = int(os.environ.get("SNAPSHOT_FSYNC_EVERY", 100))
+FSYNC_INTERVAL = float(os.environ.get("SNAPSHOT_FSYNC_INTERVAL", 1.0))
+
+_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    source TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_url ON snapshots (url_key, fetched_at);
+"""
+
+
+def url_key(url: str) -> str:
+    """Stable identifier of ``url`` (same in every process and run)."""
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def content_hash(html: Optional[str], text: Optional[str]) -> str:
+    digest = hashlib.sha256()
+    digest.update((html or "").encode("utf-8", "surrogatepass"))
+    digest.update(b"\0")
+    digest.update((text or "").encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(segment: str, data: bytes) -> bytes:
+    if segment.endswith(_SUFFIXES["zstd"]):
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError(f"segment {segment} needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+@dataclass
+class SnapshotRef:
+    url: str
+    url_key: str
+    fetched_at: float
+    content_hash: str
+    source: Optional[str] = None
+    metadata: Dict = field(default_factory=dict)
+    id: Optional[int] = None
+    deduplicated: bool = False
+
+
+@dataclass
+class Snapshot:
+    url: str
+    fetched_at: float
+    html: Optional[str]
+    text: Optional[str]
+    content_hash: str
+    source: Optional[str] = None
+    metadata: Dict = field(default_factory=dict)
+    id: Optional[int] = None
+
+
+@dataclass
+class _Blob:
+    segment: str
+    offset: int
+    length: int
+    size: int
+
+
+class SnapshotStore:
+    """
+    Snapshot Store
+    Deduplicating, compressed, append-only storage with a SQLite index.
+    Thread-safe; opened lazily and reopened after a fork.
+    """
+
+    def __init__(
+        self,
+        root: os.PathLike = SNAPSHOT_DIR,
+        compression: str = SNAPSHOT_COMPRESSION,
+        segment_bytes: int = SEGMENT_BYTES,
+        fsync_every: int = FSYNC_EVERY,
+        fsync_interval: float = FSYNC_INTERVAL,
+        writer_id: Optional[str] = None,
+    ):
+        self.root = Path(root)
+        if compression not in _SUFFIXES:
+            raise ValueError(f"Unknown snapshot compression {compression!r}")
+        if compression == "zstd" and _zstd() is None:
+            logging.warning("SNAPSHOT_COMPRESSION=zstd requested but 'zstandard' is not installed; using gzip")
+            compression = "gzip"
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self._writer_id = writer_id
+        self._lock = threading.RLock()
+        self._pid: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._segment_file = None
+        self._segment_name: Optional[str] = None
+        self._pending_blobs: Dict[str, _Blob] = {}
+        self._pending_refs: List[SnapshotRef] = []
+        self._last_flush = time.monotonic()
+        self._timer: Optional[threading.Timer] = None
+        self.counters = {"puts": 0, "deduplicated": 0, "bytes_written": 0, "flushes": 0}
+        metrics.add_collector("snapshots", lambda store: store.counters, owner=self)
+
+    @property
+    def writer_id(self) -> str:
+        return self._writer_id or f"{os.getpid()}"
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def _open(self):
+        if self._conn is not None and self._pid == os.getpid():
+            return
+        # A forked child must not share the parent's file handles.
+        self._conn = None
+        self._segment_file = None
+        self._segment_name = None
+        self._pending_blobs, self._pending_refs = {}, []
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / "segments").mkdir(exist_ok=True)
+        conn = sqlite3.connect(self.root / "index.sqlite3", check_same_thread=False,
+                               isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+        self._pid = os.getpid()
+
+    def flush(self):
+        """fsync the current segment and commit the pending index rows."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._conn is None or self._pid != os.getpid():
+                return
+            if self._segment_file is not None:
+                self._segment_file.flush()
+                os.fsync(self._segment_file.fileno())
+            if self._pending_refs or self._pending_blobs:
+                self._commit()
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._segment_file is not None and self._pid == os.getpid():
+                self._segment_file.close()
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._segment_file = self._segment_name = self._conn = None
+
+    def __enter__(self) -> "SnapshotStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- writing ---------------------------------------------------------------
+
+    def put(self, url: str, html: Optional[str] = None, text: Optional[str] = None,
+            metadata: Optional[Dict] = None, source: Optional[str] = None,
+            fetched_at: Optional[float] = None) -> SnapshotRef:
+        """Record a snapshot of ``url``; the body is stored only if new."""
+        metadata = dict(metadata or {})
+        fetched_at = float(fetched_at or metadata.get("fetched_at") or time.time())
+        with stage("save"):
+            chash = content_hash(html, text)
+            with self._lock:
+                self._open()
+                ref = SnapshotRef(url=url, url_key=url_key(url), fetched_at=fetched_at,
+                                  content_hash=chash, source=source, metadata=metadata)
+                if chash in self._pending_blobs or self._blob_row(chash) is not None:
+                    ref.deduplicated = True
+                    self.counters["deduplicated"] += 1
+                else:
+                    record = json.dumps({"content_hash": chash, "url": url, "fetched_at": fetched_at,
+                                         "html": html, "text": text}, ensure_ascii=False) + "\n"
+                    self._pending_blobs[chash] = self._append(record.encode("utf-8", "surrogatepass"))
+                self._pending_refs.append(ref)
+                self.counters["puts"] += 1
+                if (len(self._pending_refs) >= self.fsync_every
+                        or time.monotonic() - self._last_flush >= self.fsync_interval):
+                    self.flush()
+                elif self._timer is None and self.fsync_interval > 0:
+                    # Idle writers still get their batch committed.
+                    self._timer = threading.Timer(self.fsync_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return ref
+
+    def _append(self, data: bytes) -> _Blob:
+        payload = _compress(self.compression, data)
+        if self._segment_file is None or self._segment_file.tell() + len(payload) > self.segment_bytes:
+            self._roll()
+        offset = self._segment_file.tell()
+        self._segment_file.write(payload)
+        self.counters["bytes_written"] += len(payload)
+        return _Blob(self._segment_name, offset, len(payload), len(data))
+
+    def _roll(self):
+        if self._segment_file is not None:
+            self.flush()
+            self._segment_file.close()
+        prefix = f"seg-{self.writer_id}-"
+        suffix = _SUFFIXES[self.compression]
+        existing = [p.name for p in (self.root / "segments").glob(f"{prefix}*{suffix}")]
+        numbers = [int(n[len(prefix):-len(suffix)]) for n in existing if n[len(prefix):-len(suffix)].isdigit()]
+        self._segment_name = f"{prefix}{max(numbers, default=0) + 1:06d}{suffix}"
+        self._segment_file = open(self.root / "segments" / self._segment_name, "ab")
+
+    def _commit(self):
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO blobs (content_hash, segment, offset, length, size) VALUES (?, ?, ?, ?, ?)",
+                [(h, b.segment, b.offset, b.length, b.size) for h, b in self._pending_blobs.items()],
+            )
+            for ref in self._pending_refs:
+                cur = conn.execute(
+                    "INSERT INTO snapshots (url_key, url, fetched_at, content_hash, source, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (ref.url_key, ref.url, ref.fetched_at, ref.content_hash, ref.source,
+                     json.dumps(ref.metadata, ensure_ascii=False, default=str)),
+                )
+                ref.id = cur.lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._pending_blobs, self._pending_refs = {}, []
+        self.counters["flushes"] += 1
+
+    # -- reading ---------------------------------------------------------------
+
+    def _blob_row(self, chash: str) -> Optional[_Blob]:
+        blob = self._pending_blobs.get(chash)
+        if blob is not None:
+            return blob
+        row = self._conn.execute(
+            "SELECT segment, offset, length, size FROM blobs WHERE content_hash = ?", (chash,)
+        ).fetchone()
+        return _Blob(**dict(row)) if row else None
+
+    @staticmethod
+    def _ref(row: sqlite3.Row) -> SnapshotRef:
+        return SnapshotRef(url=row["url"], url_key=row["url_key"], fetched_at=row["fetched_at"],
+                           content_hash=row["content_hash"], source=row["source"],
+                           metadata=json.loads(row["metadata"] or "{}"), id=row["id"])
+
+    def history(self, url: str) -> List[SnapshotRef]:
+        """All snapshots of ``url``, oldest first."""
+        with self._lock:
+            self._open()
+            rows = self._conn.execute(
+                "SELECT * FROM snapshots WHERE url_key = ? ORDER BY fetched_at, id", (url_key(url),)
+            ).fetchall()
+            key = url_key(url)
+            pending = [r for r in self._pending_refs if r.url_key == key]
+        refs = [self._ref(row) for row in rows] + pending
+        return sorted(refs, key=lambda r: r.fetched_at)
+
+    def read(self, ref: SnapshotRef) -> Snapshot:
+        """Load the body a ``SnapshotRef`` points to."""
+        with self._lock:
+            self._open()
+            blob = self._blob_row(ref.content_hash)
+            if blob is None:
+                raise KeyError(f"no body stored for {ref.content_hash}")
+            if self._segment_file is not None and blob.segment == self._segment_name:
+                self._segment_file.flush()
+        with open(self.root / "segments" / blob.segment, "rb") as f:
+            f.seek(blob.offset)
+            record = json.loads(_decompress(blob.segment, f.read(blob.length)))
+        return Snapshot(url=ref.url, fetched_at=ref.fetched_at, html=record.get("html"),
+                        text=record.get("text"), content_hash=ref.content_hash,
+                        source=ref.source, metadata=ref.metadata, id=ref.id)
+
+    def get(self, url: str, at: Optional[float] = None) -> Optional[Snapshot]:
+        """Latest snapshot of ``url`` (taken at or before ``at`` if given)."""
+        refs = [r for r in self.history(url) if at is None or r.fetched_at <= at]
+        return self.read(refs[-1]) if refs else None
+
+    def iter_snapshots(self, source: Optional[str] = None, after_id: int = 0,
+                       batch: int = 500) -> Iterator[Snapshot]:
+        """Committed snapshots in insertion order, starting after ``after_id``."""
+        last = after_id
+        while True:
+            with self._lock:
+                self._open()
+                sql = "SELECT * FROM snapshots WHERE id > ?"
+                args: list = [last]
+                if source is not None:
+                    sql += " AND source = ?"
+                    args.append(source)
+                rows = self._conn.execute(sql + " ORDER BY id LIMIT ?", (*args, batch)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                last = row["id"]
+                yield self.read(self._ref(row))
+
+    def iter_key_range(self, lo: str = "", hi: Optional[str] = None, source: Optional[str] = None,
+                       batch: int = 500) -> Iterator[Snapshot]:
+        """Committed snapshots with ``lo <= url_key < hi``, grouped by URL, oldest first.
+
+        Disjoint ranges partition the store by URL, so they can be read by
+        separate processes; rows are fetched ``batch`` at a time.
+        """
+        last = (lo, -1.0, 0)
+        while True:
+            with self._lock:
+                self._open()
+                sql = ("SELECT * FROM snapshots WHERE (url_key, fetched_at, id) > (?, ?, ?)"
+                       + (" AND url_key < ?" if hi is not None else "")
+                       + (" AND source = ?" if source is not None else ""))
+                args = [*last] + ([hi] if hi is not None else []) + ([source] if source is not None else [])
+                rows = self._conn.execute(sql + " ORDER BY url_key, fetched_at, id LIMIT ?", (*args, batch)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                last = (row["url_key"], row["fetched_at"], row["id"])
+                yield self.read(self._ref(row))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._open()
+            snapshots = self._conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+            blobs, stored, raw = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(size), 0) FROM blobs"
+            ).fetchone()
+            return {
+                **self.counters,
+                "snapshots": snapshots + len(self._pending_refs),
+                "bodies": blobs + len(self._pending_blobs),
+                "stored_bytes": stored,
+                "raw_bytes": raw,
+                "pending": len(self._pending_refs),
+            }
+
+
+snapshot_store = SnapshotStore()
+atexit.register(snapshot_store.close)
+
+
+def import_json_files(store: SnapshotStore, directory: os.PathLike, source: str = "legacy") -> int:
+    """Load the old one-file-per-page JSON snapshots from ``directory``."""
+    count = 0
+    for path in sorted(Path(directory).glob("*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logging.warning(f"skipping {path}: {e}")
+            continue
+        if not isinstance(data, dict) or not data.get("url"):
+            continue
+        metadata = data.get("metadata") or {}
+        store.put(
+            data["url"],
+            html=data.get("html"),
+            text=data.get("text") or data.get("content"),
+            metadata=metadata,
+            source=source,
+            fetched_at=metadata.get("fetched_at") or data.get("fetched_at") or path.stat().st_mtime,
+        )
+        count += 1
+    store.flush()
+    return count
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect or import into the snapshot store")
+    p.add_argument("--root", default=str(SNAPSHOT_DIR))
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    get = sub.add_parser("get")
+    get.add_argument("url")
+    imp = sub.add_parser("import", help="import legacy per-page JSON files")
+    imp.add_argument("directory")
+    args = p.parse_args()
+
+    with SnapshotStore(args.root) as store:
+        if args.cmd == "stats":
+            print(json.dumps(store.stats(), indent=2))
+        elif args.cmd == "get":
+            snap = store.get(args.url)
+            if snap is None:
+                raise SystemExit(f"no snapshot of {args.url}")
+            print(json.dumps(snap.__dict__, ensure_ascii=False, indent=2))
+        else:
+            print(f"imported {import_json_files(store, args.directory)} snapshots")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""URL canonicalization and crawler-trap detection.
+
+Every URL passes ``UrlPolicy.admit`` before it is fetched. The URL is first
+rewritten to its canonical form (``canonicalize``), which is also the URL
+that gets fetched, so the rewrite only drops what servers ignore:
+
+* scheme and host lowercased, default port, fragment and ``;jsessionid=``
+  style path parameters dropped, dot segments resolved, percent-escapes of
+  unreserved characters decoded in the path, an empty path becomes ``/``,
+* tracking parameters (``utm_*``, ``gclid``, ``fbclid``, ...) and session IDs
+  (``sessionid``, ``phpsessid``, ``sid``, ...) removed from the query and the
+  remaining parameters sorted; they are kept as written (``?flag``, ``%20``),
+* the trailing slash kept as linked (``trailing_slash: keep``); ``strip`` and
+  ``add`` merge ``/docs`` and ``/docs/`` at the price of a redirect per page
+  on servers that prefer the other form,
+* optionally the path lowercased and ``index.html``-style files dropped.
+
+The canonical URL is then skipped when it was admitted before in the same
+crawl or when it looks like a crawler trap:
+
+* ``path_repetition`` - a path segment occurs more than ``max_segment_repeats``
+  times (``/a/b/a/b/a/b``),
+* ``path_depth`` - the path is deeper than ``max_path_depth``,
+* ``query_params`` / ``query_variants`` - more than ``max_query_params``
+  parameters, or more than ``max_query_variants`` distinct queries for one
+  path (faceted navigation, sort/filter combinations),
+* ``calendar`` - a year in the path or query more than ``max_future_years``
+  ahead of now or before ``min_year`` (endless "next month" links),
+* ``host_cap`` - ``max_pages_per_host`` URLs of the host were admitted.
+
+A fetched page that names another URL of its host with ``<link
+rel="canonical">`` is an alias (``observe_canonical``): the declared URL is
+returned for the crawl to queue, and the alias is skipped as ``canonical``
+if it comes up again. Canonicals on other hosts are ignored.
+
+Seeds configure the policy in a ``url_policy`` section (all keys optional)::
+
+    url_policy:
+      drop_params: [ref, sort]      # on top of the tracking and session lists
+      keep_params: [id, page]       # when set, every other parameter is dropped
+      trailing_slash: strip
+      max_pages_per_host: 2000
+
+Skipped URLs are counted per reason in ``crawl_urls_skipped_total`` and in
+``report()``, the fetches the policy avoided.
+
+Settings (env): URL_POLICY_MAX_PER_HOST, URL_POLICY_MAX_QUERY_VARIANTS.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field, fields, replace
+from typing import AsyncIterable, AsyncIterator, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple, Union
+from urllib.parse import parse_qsl, unquote_plus, urljoin, urlsplit, urlunsplit
+
+from crawler.metrics import metrics
+
+MAX_PAGES_PER_HOST = int(os.environ.get("URL_POLICY_MAX_PER_HOST", 10000))
+MAX_QUERY_VARIANTS = int(os.environ.get("URL_POLICY_MAX_QUERY_VARIANTS", 100))
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = frozenset({
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "twclid", "igshid", "mc_cid", "mc_eid", "_ga",
+    "_gl", "_hsenc", "_hsmi", "mkt_tok", "ref_src", "spm", "trk", "si",
+})
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+SESSION_PARAMS = frozenset({
+    "sid", "sessid", "sessionid", "session_id", "phpsessid", "jsessionid", "aspsessionid", "cfid", "cftoken",
+})
+TRAILING_SLASH = ("strip", "keep", "add")
+
+DUPLICATE = "duplicate"
+CANONICAL = "canonical"
+PATH_REPETITION = "path_repetition"
+PATH_DEPTH = "path_depth"
+QUERY_PARAMS = "query_params"
+QUERY_VARIANTS = "query_variants"
+CALENDAR = "calendar"
+HOST_CAP = "host_cap"
+TRAPS = (PATH_REPETITION, PATH_DEPTH, QUERY_PARAMS, QUERY_VARIANTS, CALENDAR, HOST_CAP)
+
+SKIPPED = metrics.counter("crawl_urls_skipped_total", "URLs not fetched by the URL policy, per reason.", ("reason",))
+
+_PATH_SESSION = re.compile(r";(?:jsessionid|phpsessid|sid|sessionid)=[^/]*", re.I)
+_ESCAPE = re.compile(r"%([0-9a-fA-F]{2})")
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+_INDEX_FILE = re.compile(r"/(?:index|default)\.(?:html?|php|aspx?|jsp)$", re.I)
+_DATE = re.compile(r"^((?:19|20)\d\d)([-/]\d\d?){0,2}$")
+_MONTH = re.compile(r"^(?:0?[1-9]|1[0-2])$")
+# ``start``/``from``/``end``/``to`` are left out: they are pagination offsets
+# as often as dates, and real dates in them (``2024-05``) are caught anyway.
+_DATE_PARAMS = frozenset({"year", "y", "date", "month", "day", "cal", "calendar"})
+_LINK_TAG = re.compile(r"<link\b[^>]*>", re.I)
+_ATTR = re.compile(r"""([a-zA-Z_:][-\w:.]*)\s*=\s*("[^"]*"|'[^']*'|[^\s"'>]+)""")
+_HEAD_END = re.compile(r"</head\s*>|<body[\s>]", re.I)
+_HEAD_BYTES = 256 * 1024
+
+
+def _unescape_unreserved(match) -> str:
+    char = chr(int(match.group(1), 16))
+    return char if char in _UNRESERVED else "%" + match.group(1).upper()
+
+
+def _remove_dot_segments(path: str) -> str:
+    if "." not in path:
+        return path
+    out = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(out) > 1:
+                out.pop()
+        elif segment != ".":
+            out.append(segment)
+    if path.endswith(("/.", "/..")):
+        out.append("")
+    return "/".join(out) or "/"
+
+
+@dataclass(frozen=True)
+class CanonicalRules:
+    drop_params: FrozenSet[str] = TRACKING_PARAMS | SESSION_PARAMS
+    drop_prefixes: Tuple[str, ...] = TRACKING_PREFIXES
+    keep_params: Optional[FrozenSet[str]] = None
+    sort_query: bool = True
+    trailing_slash: str = "keep"
+    lowercase_path: bool = False
+    drop_index: bool = False
+
+    def __post_init__(self):
+        if self.trailing_slash not in TRAILING_SLASH:
+            raise ValueError(f"url policy: trailing_slash must be one of {TRAILING_SLASH}")
+
+    def _keeps(self, name: str) -> bool:
+        name = name.lower()
+        if self.keep_params is not None:
+            return name in self.keep_params
+        return name not in self.drop_params and not name.startswith(self.drop_prefixes)
+
+    def canonicalize(self, url: str) -> str:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower().rstrip(".")
+        if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{parts.port}"
+        path = _ESCAPE.sub(_unescape_unreserved, _PATH_SESSION.sub("", parts.path))
+        path = _remove_dot_segments(path) or "/"
+        if self.lowercase_path:
+            path = path.lower()
+        if self.drop_index:
+            path = _INDEX_FILE.sub("/", path)
+        if self.trailing_slash == "strip" and len(path) > 1:
+            path = path.rstrip("/") or "/"
+        elif self.trailing_slash == "add" and not path.endswith("/") and "." not in path.rpartition("/")[2]:
+            path += "/"
+        query = ""
+        if parts.query:
+            # Parameters are filtered by their decoded name but kept as
+            # written: re-encoding turns ``?flag`` into ``?flag=`` and
+            # ``%20`` into ``+``, which not every server treats alike.
+            params = [p for p in parts.query.split("&")
+                      if p and self._keeps(unquote_plus(p.partition("=")[0]))]
+            if self.sort_query:
+                params.sort()
+            query = "&".join(params)
+        return urlunsplit((scheme, host, path, query, ""))
+
+
+@dataclass(frozen=True)
+class TrapRules:
+    max_segment_repeats: int = 2
+    max_path_depth: int = 16
+    max_query_params: int = 8
+    max_query_variants: int = MAX_QUERY_VARIANTS
+    max_future_years: int = 1
+    min_year: int = 1990
+    max_pages_per_host: int = MAX_PAGES_PER_HOST
+
+    def static_trap(self, parts) -> Optional[str]:
+        """Trap reason found in the URL itself (no crawl state needed)."""
+        segments = [s for s in parts.path.split("/") if s]
+        if len(segments) > self.max_path_depth:
+            return PATH_DEPTH
+        counts: Dict[str, int] = {}
+        for segment in segments:
+            counts[segment] = counts.get(segment, 0) + 1
+            if counts[segment] > self.max_segment_repeats:
+                return PATH_REPETITION
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        if len(params) > self.max_query_params:
+            return QUERY_PARAMS
+        latest = time.gmtime().tm_year + self.max_future_years
+        for year in _years(segments, params):
+            if not self.min_year <= year <= latest:
+                return CALENDAR
+        return None
+
+
+def _years(segments, params) -> Iterator[int]:
+    """Years of the dates in a URL: ``2024-05``-style values, a year segment
+    followed by a month segment, or a year in a date-named parameter."""
+    for i, segment in enumerate(segments):
+        match = _DATE.match(segment)
+        if match and match.group(2):
+            yield int(match.group(1))
+        elif match and i + 1 < len(segments) and _MONTH.match(segments[i + 1]):
+            yield int(match.group(1))
+    for name, value in params:
+        match = _DATE.match(value)
+        if match and (match.group(2) or name.lower() in _DATE_PARAMS):
+            yield int(match.group(1))
+
+
+_RULE_KEYS = {f.name for f in fields(CanonicalRules)}
+_TRAP_KEYS = {f.name for f in fields(TrapRules)}
+
+
+@dataclass
+class Admission:
+    url: str
+    reason: Optional[str] = None
+
+    @property
+    def admitted(self) -> bool:
+        return self.reason is None
+
+
+@dataclass
+class _HostState:
+    pages: int = 0
+    variants: Dict[str, int] = field(default_factory=dict)
+
+
+class UrlPolicy:
+    """
+    URL Policy
+    Canonicalizes URLs and skips duplicates and crawler traps for one crawl.
+    """
+
+    def __init__(self, rules: Optional[CanonicalRules] = None, traps: Optional[TrapRules] = None):
+        self.rules = rules or CanonicalRules()
+        self.traps = traps or TrapRules()
+        self._seen = set()
+        # Fetched URLs whose page declared another URL as its canonical.
+        self._aliases: Dict[str, str] = {}
+        self._hosts: Dict[str, _HostState] = {}
+        self.stats = {"admitted": 0, "rewritten": 0, "canonical_declared": 0,
+                      "skipped": dict.fromkeys((DUPLICATE, CANONICAL) + TRAPS, 0)}
+
+    @classmethod
+    def from_dict(cls, spec: Optional[Dict]) -> "UrlPolicy":
+        """Build a policy from a seed's ``url_policy`` mapping."""
+        spec = dict(spec or {})
+        unknown = set(spec) - _RULE_KEYS - _TRAP_KEYS
+        if unknown:
+            raise ValueError(f"url policy: unknown keys {sorted(unknown)}")
+        rules = {k: v for k, v in spec.items() if k in _RULE_KEYS}
+        base = CanonicalRules()
+        if "drop_params" in rules:
+            rules["drop_params"] = base.drop_params | {p.lower() for p in rules["drop_params"] or ()}
+        if "drop_prefixes" in rules:
+            rules["drop_prefixes"] = base.drop_prefixes + tuple(p.lower() for p in rules["drop_prefixes"] or ())
+        if rules.get("keep_params") is not None:
+            rules["keep_params"] = frozenset(p.lower() for p in rules["keep_params"])
+        traps = {k: v for k, v in spec.items() if k in _TRAP_KEYS}
+        return cls(replace(base, **rules), replace(TrapRules(), **traps))
+
+    @classmethod
+    def from_seed(cls, seed: Dict) -> "UrlPolicy":
+        return cls.from_dict(seed.get("url_policy"))
+
+    def canonicalize(self, url: str) -> str:
+        return self.rules.canonicalize(url)
+
+    def admit(self, url: str) -> Admission:
+        """Canonicalize ``url`` and decide whether to fetch it; admitted URLs count as seen."""
+        canonical = self.canonicalize(url)
+        if canonical != url:
+            self.stats["rewritten"] += 1
+        parts = urlsplit(canonical)
+        if canonical in self._seen:
+            return self._skip(canonical, CANONICAL if canonical in self._aliases else DUPLICATE)
+        reason = self.traps.static_trap(parts)
+        if reason is not None:
+            return self._skip(canonical, reason)
+        state = self._hosts.setdefault(parts.netloc, _HostState())
+        if state.pages >= self.traps.max_pages_per_host:
+            return self._skip(canonical, HOST_CAP)
+        if parts.query:
+            variants = state.variants.get(parts.path, 0)
+            if variants >= self.traps.max_query_variants:
+                return self._skip(canonical, QUERY_VARIANTS)
+            state.variants[parts.path] = variants + 1
+        state.pages += 1
+        self._seen.add(canonical)
+        self.stats["admitted"] += 1
+        return Admission(canonical)
+
+    def _skip(self, url: str, reason: str) -> Admission:
+        self.stats["skipped"][reason] += 1
+        SKIPPED.inc(reason=reason)
+        return Admission(url, reason)
+
+    def observe_canonical(self, url: str, canonical: Optional[str]) -> Optional[str]:
+        """Note that the page fetched as ``url`` declared ``canonical``.
+
+        Returns the canonical URL when it is another URL of the same host
+        that was not admitted yet; the crawl should queue it in place of
+        the alias. Canonicals on other hosts are not trusted.
+        """
+        if not canonical:
+            return None
+        canonical, url = self.canonicalize(canonical), self.canonicalize(url)
+        if canonical == url or urlsplit(canonical).netloc != urlsplit(url).netloc:
+            return None
+        self.stats["canonical_declared"] += 1
+        self._aliases[url] = canonical
+        return None if canonical in self._seen else canonical
+
+    def is_alias(self, url: str) -> bool:
+        """Whether the page fetched as ``url`` declared another URL of its host canonical."""
+        return self.canonicalize(url) in self._aliases
+
+    def filter(self, urls: Union[Iterable[str], AsyncIterable[str]]):
+        """The admitted canonical URLs of ``urls``, sync or async like ``urls``."""
+        if isinstance(urls, AsyncIterable):
+            return self._afilter(urls)
+        return self._filter(urls)
+
+    def _filter(self, urls: Iterable[str]) -> Iterator[str]:
+        for url in urls:
+            decision = self.admit(url)
+            if decision.admitted:
+                yield decision.url
+
+    async def _afilter(self, urls: AsyncIterable[str]) -> AsyncIterator[str]:
+        async for url in urls:
+            decision = self.admit(url)
+            if decision.admitted:
+                yield decision.url
+
+    def report(self) -> Dict:
+        skipped = dict(self.stats["skipped"])
+        return {"admitted": self.stats["admitted"], "rewritten": self.stats["rewritten"],
+                "canonical_declared": self.stats["canonical_declared"], "skipped": skipped,
+                "fetches_avoided": sum(skipped.values())}
+
+
+def find_canonical(html: Optional[str], base_url: str) -> Optional[str]:
+    """The absolute ``<link rel="canonical">`` URL in the ``<head>`` of ``html``, if any."""
+    if not html:
+        return None
+    head = html[:_HEAD_BYTES]
+    end = _HEAD_END.search(head)
+    if end is not None:
+        head = head[:end.start()]
+    for tag in _LINK_TAG.finditer(head):
+        attrs = {k.lower(): v.strip("\"'") for k, v in _ATTR.findall(tag.group(0))}
+        if "canonical" in attrs.get("rel", "").lower().split() and attrs.get("href"):
+            link = urljoin(base_url, attrs["href"].strip())
+            return link if link.startswith(("http://", "https://")) else None
+    return None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Show what the URL policy does to a list of URLs.")
+    p.add_argument("file", nargs="?", help="file with one URL per line (default stdin)")
+    p.add_argument("--policy", default=None, help="JSON object with url_policy settings")
+    args = p.parse_args()
+    policy = UrlPolicy.from_dict(json.loads(args.policy) if args.policy else None)
+    lines = open(args.file, encoding="utf-8") if args.file else sys.stdin
+    with lines:
+        for line in lines:
+            if line.strip():
+                decision = policy.admit(line.strip())
+                print(f"{decision.reason or 'fetch':<16} {decision.url}")
+    print(json.dumps(policy.report(), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
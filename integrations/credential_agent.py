@@ -7,6 +7,6 @@ def on_crawl_complete(crawl_result):
     title = f"Crawl Results - {crawl_result.get('seed','unknown')}"
     try:
         sid = create_sheet("sheets-agent@infinity-x-one-systems.iam.gserviceaccount.com", title=title)
-        logging.info("Created sheet", sid)
+        logging.info(f"Created sheet {sid}")
     except Exception as e:
-        logging.info('Failed to create sheet', e)
+        logging.info(f"Failed to create sheet: {e}")
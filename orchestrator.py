@@ -1,14 +1,31 @@
 import logging
 
 import asyncio
-from typing import List
+import json
+import time
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Union
 
-from vision_cortex.integration.headless_team import fetch_url
-from crawler.engine import crawl_urls
+from vision_cortex.integration.headless_team import fetch_url_async
+from app.change_detector import get_detector
+from app.dedupe import get_index
+from crawler.browser_pool import BrowserPool
+from crawler.engine import render_and_save, save_snapshot
+from crawler.metrics import metrics, stage
+from crawler.recrawl import RecrawlStore, recrawl_store
+from crawler.render_detect import render_detector, visible_text
+from crawler.render_profiles import RenderProfiles, profile_report
+from crawler.robots import robots_store
+from crawler.scheduler import DEFAULT_MIN_DELAY, CrawlScheduler
+from crawler.sitemaps import SitemapDiscovery, sitemap_sources
+from crawler.snapshot_store import content_hash
+from crawler.url_policy import UrlPolicy, find_canonical
 
 
 def needs_render(fetch_result: dict) -> bool:
-    # Simple heuristics: scripts present in excerpt or large HTML content implied
+    if fetch_result.get("body") is not None:
+        return render_detector.classify(fetch_result["url"], fetch_result["body"]).needs_render
+    # Without the full body fall back to heuristics on the excerpt:
+    # scripts present in excerpt or large HTML content implied
     excerpt = (fetch_result.get("text_excerpt") or "").lower()
     cl = fetch_result.get("content_length") or 0
     if cl > 10000 and len(excerpt) < 500:
@@ -18,28 +35,241 @@ def needs_render(fetch_result: dict) -> bool:
     return False
 
 
-async def _render_urls(urls: List[str], concurrency: int = 2):
-    await crawl_urls(urls, concurrency=concurrency)
+class PhaseStats:
+    """Throughput counters for one pipeline phase."""
 
+    def __init__(self, name: str):
+        self.name = name
+        self.done = 0
+        self.errors = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
 
-def orchestrate_from_seed(seed_file: str, concurrency: int = 2):
+    def begin(self):
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def record(self, url: str, result, error: Optional[BaseException]):
+        self.done += 1
+        if error is not None:
+            self.errors += 1
+        self.finished = time.monotonic()
+
+    def report(self) -> Dict:
+        elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+        return {
+            "urls": self.done,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "urls_per_second": round(self.done / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+async def _pipeline(urls: Union[Iterable[str], AsyncIterable[str]], concurrency: int = 2,
+                    fetch_concurrency: int = 16, recrawl: Optional[RecrawlStore] = None,
+                    min_delay: float = DEFAULT_MIN_DELAY, profiles: Optional[RenderProfiles] = None,
+                    policy: Optional[UrlPolicy] = None) -> Dict:
+    """Triage URLs with static fetches and stream the ones that need a
+    browser straight into the render scheduler.
+
+    Both phases run at the same time: rendering starts as soon as the first
+    URL is classified instead of after the whole seed list was fetched.
+
+    Static fetches are conditional on the validators of the previous run; a
+    304 skips parsing and rendering, and a static page whose text did not
+    really change is not snapshotted again. Static pages that copy another
+    page (``app.dedupe``) are stored as a link to it.
+
+    With ``recrawl`` every outcome (changed, unchanged or failed) is
+    recorded in its change history. ``profiles`` picks the render profile
+    of each URL sent to the browser. ``urls`` may be an async iterable
+    (``SitemapDiscovery.stream``); triage starts with its first URL.
+
+    ``policy`` (``crawler.url_policy``) canonicalizes the URLs and skips
+    duplicates and crawler traps; its report is returned as ``url_policy``.
+    A static page whose ``rel=canonical`` names another URL of its host is
+    stored with that URL as ``canonical`` in its metadata.
+    """
+    policy = policy or UrlPolicy()
+    triage_stats, render_stats = PhaseStats("triage"), PhaseStats("render")
+    to_render = 0
+    saved_static = 0
+    skipped_fetch = 0
+    not_modified = 0
+    unchanged = 0
+    duplicates = 0
+    detector = get_detector()
+    dedupe_index = get_index()
+    # URLs sent to the browser without a static fetch; their outcome is
+    # only known after rendering.
+    render_only = set()
+
+    async def _record(u, **outcome):
+        if recrawl is not None:
+            await asyncio.to_thread(recrawl.record, u, **outcome)
+
+    # Browsers are launched by the first render, so seeds that are all
+    # static never start Chromium.
+    pool = BrowserPool(size=max(1, concurrency // 2), contexts_per_browser=2)
+    try:
+        async def _render(u):
+            render_stats.begin()
+            try:
+                snap = await render_and_save(pool, u, profiles.for_url(u) if profiles is not None else None)
+            except Exception as e:
+                if u in render_only:
+                    await _record(u, error=str(e) or type(e).__name__)
+                raise
+            policy.observe_canonical(u, find_canonical(snap.get("html"), u))
+            if u in render_only:
+                await _record(u, content_hash=content_hash(None, snap["text"]))
+
+        render = CrawlScheduler(
+            _render,
+            concurrency=concurrency,
+            min_delay=min_delay,
+            host_delay=robots_store.crawl_delay,
+            on_result=render_stats.record,
+        )
+
+        async def _triage(u):
+            nonlocal to_render, saved_static, skipped_fetch, not_modified, unchanged, duplicates
+            triage_stats.begin()
+            if not await robots_store.can_fetch(u):
+                logging.info(f"blocked by robots: {u}")
+                return
+            validators = await asyncio.to_thread(detector.validators, u)
+            cached = render_detector.cached(u)
+            if cached is not None and cached.needs_render and not validators:
+                # The host is known to need a browser; skip the static fetch.
+                # With validators a conditional fetch is cheaper than a render.
+                skipped_fetch += 1
+                to_render += 1
+                render_only.add(u)
+                await render.submit(u)
+                return
+            res = await fetch_url_async(u, keep_body=True, headers=validators)
+            logging.info(f"fetch {u}: status={res.get('status')} http={res.get('http_status')} len={res.get('content_length')}")
+            if res.get("status") == "not_modified":
+                await asyncio.to_thread(detector.not_modified, u)
+                await _record(u, changed=False)
+                not_modified += 1
+                return
+            if res.get("status") != "ok":
+                await _record(u, error=res.get("error") or f"HTTP {res.get('http_status')}")
+                return
+            canonical = find_canonical(res["body"], u)
+            policy.observe_canonical(u, canonical)
+            with stage("parse"):
+                text = visible_text(res["body"])
+            change = await asyncio.to_thread(detector.observe, u, text, res.get("etag"), res.get("last_modified"))
+            await _record(u, changed=change.changed)
+            if needs_render(res):
+                to_render += 1
+                await render.submit(u)
+            elif not change.content_changed:
+                unchanged += 1
+            else:
+                duplicate = await asyncio.to_thread(dedupe_index.add, u, text, change.fingerprint)
+                metadata = {"fetched_at": time.time(), "source": "static"}
+                if canonical is not None and policy.is_alias(u):
+                    metadata["canonical"] = policy.canonicalize(canonical)
+                if duplicate is not None:
+                    await save_snapshot(u, None, None, {**metadata, "duplicate_of": duplicate.canonical_url})
+                    duplicates += 1
+                else:
+                    await save_snapshot(u, res["body"], text, metadata)
+                    saved_static += 1
+
+        async with render:
+            await CrawlScheduler(
+                _triage,
+                concurrency=fetch_concurrency,
+                min_delay=min_delay,
+                host_delay=robots_store.crawl_delay,
+                on_result=triage_stats.record,
+            ).run(policy.filter(urls))
+    finally:
+        await pool.close()
+
+    return {
+        "triage": {
+            **triage_stats.report(),
+            "saved_static": saved_static,
+            "skipped_fetch": skipped_fetch,
+            "not_modified": not_modified,
+            "unchanged": unchanged,
+            "duplicates": duplicates,
+        },
+        "render": {**render_stats.report(), "queued": to_render},
+        "render_detection": dict(render_detector.stats),
+        "url_policy": policy.report(),
+    }
+
+
+async def _orchestrate(urls: List[str], policy: UrlPolicy, profiles: RenderProfiles,
+                       sources: Dict[str, Optional[List[str]]], concurrency: int, fetch_concurrency: int,
+                       incremental: bool, budget: Optional[int], min_delay: float) -> Dict:
+    """Locate sitemaps, pick the due URLs and run the pipeline in one event loop.
+
+    The pooled HTTP client is bound to the loop it was first used on, so
+    discovery and the crawl share it instead of each opening their own.
+    """
+    recrawl = None
+    discovery = None
+    if sources:
+        discovery = SitemapDiscovery(recrawl=recrawl_store, canonicalize=policy.canonicalize)
+        published = {policy.canonicalize(u) for u in await discovery.locate(sources)}
+        urls = [u for u in urls if u not in published]
+        if published:
+            # Sitemap pages are filtered by their last recorded fetch, so
+            # their outcomes are recorded even outside incremental runs.
+            recrawl = recrawl_store
+    if incremental:
+        recrawl = recrawl_store
+        await asyncio.to_thread(recrawl.add, urls)
+        due = await asyncio.to_thread(recrawl.due, budget, None, urls)
+        logging.info(f"incremental: {len(due)} of {len(urls)} URLs due")
+        urls = due
+
+    sitemaps = discovery is not None and bool(discovery.sites)
+    # The budget covers the due seed URLs and the sitemap pages together.
+    stream = discovery.stream(urls, budget) if sitemaps else urls
+    report = await _pipeline(stream, concurrency=concurrency, fetch_concurrency=fetch_concurrency,
+                             recrawl=recrawl, min_delay=min_delay, profiles=profiles, policy=policy)
+    if sitemaps:
+        if not report["triage"]["errors"] and not report["render"]["errors"]:
+            await asyncio.to_thread(discovery.commit)
+        report["sitemaps"] = dict(discovery.stats)
+    return report
+
+
+def orchestrate_from_seed(seed_file: str, concurrency: int = 2, fetch_concurrency: int = 16,
+                          incremental: bool = False, budget: Optional[int] = None,
+                          min_delay: float = DEFAULT_MIN_DELAY) -> Dict:
     import yaml
     with open(seed_file, "r", encoding="utf-8") as f:
         seed = yaml.safe_load(f)
-    urls = [s.get("url") for s in seed.get("sources", []) if s.get("url")]
-
-    to_render = []
-    for u in urls:
-        res = fetch_url(u)
-        logging.info(f"fetch {u}: status={res.get('status')} http={res.get('http_status')} len={res.get('content_length')}")
-        if res.get("status") == "ok" and needs_render(res):
-            to_render.append(u)
-
-    if to_render:
-        logging.info(f"Dispatching {len(to_render)} URLs to Playwright engine")
-        asyncio.run(_render_urls(to_render, concurrency=concurrency))
+    policy = UrlPolicy.from_seed(seed)
+    urls = list(dict.fromkeys(policy.canonicalize(s["url"]) for s in seed.get("sources", []) if s.get("url")))
+    profiles = RenderProfiles.from_seed(seed)
+
+    report = asyncio.run(_orchestrate(urls, policy, profiles, sitemap_sources(seed), concurrency=concurrency,
+                                      fetch_concurrency=fetch_concurrency, incremental=incremental,
+                                      budget=budget, min_delay=min_delay))
+    triage, render = report["triage"], report["render"]
+    logging.info(f"triage: {triage['urls']} URLs in {triage['seconds']}s ({triage['urls_per_second']}/s)")
+    skipped = report["url_policy"]["fetches_avoided"]
+    if skipped:
+        logging.info(f"url policy: {skipped} fetches avoided {report['url_policy']['skipped']}")
+    if render["queued"]:
+        logging.info(f"render: {render['urls']} URLs in {render['seconds']}s ({render['urls_per_second']}/s)")
     else:
         logging.info("No URLs required rendering")
+    report["render_profiles"] = profile_report()
+    report["metrics"] = metrics.summary()
+    logging.info(f"metrics: {json.dumps(report['metrics'])}")
+    return report
 
 
 if __name__ == "__main__":
@@ -47,5 +277,13 @@ if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--seed", default="crawler/seeds/business_loans.yaml")
     p.add_argument("--concurrency", type=int, default=2)
+    p.add_argument("--fetch-concurrency", type=int, default=16)
+    p.add_argument("--incremental", action="store_true",
+                   help="only crawl URLs the recrawl schedule considers due")
+    p.add_argument("--budget", type=int, default=None,
+                   help="max URLs to fetch this run (with --incremental)")
     args = p.parse_args()
-    orchestrate_from_seed(args.seed, concurrency=args.concurrency)
+    if args.budget is not None and not args.incremental:
+        p.error("--budget requires --incremental")
+    orchestrate_from_seed(args.seed, concurrency=args.concurrency, fetch_concurrency=args.fetch_concurrency,
+                          incremental=args.incremental, budget=args.budget)
@@ -1,16 +1,27 @@
+import threading
+import time
 import unittest
 from unittest.mock import patch
-from crawler_scraper.app.ai_doc_agent import AIDocAgent
+from crawler_scraper.app.ai_doc_agent import AIDocAgent, AnalysisCache, chunk_text, unload_model
+
+
+def stub_model(chunks):
+    return [{"words": len(chunk.split())} for chunk in chunks]
+
 
 class TestAIDocAgent(unittest.TestCase):
 
     def setUp(self):
-        with patch.object(AIDocAgent, 'load_model', return_value="Mocked model"):
+        with patch.object(AIDocAgent, 'load_model', return_value=stub_model):
             self.agent = AIDocAgent(model_path="/path/to/mock_model")
 
+    def tearDown(self):
+        self.agent.close()
+        unload_model("/path/to/mock_model")
+
     def test_load_model(self):
         """Test loading the AI model."""
-        self.assertEqual(self.agent.model, "Mocked model")
+        self.assertEqual(self.agent.model, stub_model)
 
     def test_process_document(self):
         """Test processing a document."""
@@ -20,5 +31,101 @@ class TestAIDocAgent(unittest.TestCase):
         self.assertIn("analysis", result)
         self.assertEqual(result["document_length"], len(document))
 
+
+class CountingModel:
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, chunks):
+        self.calls.append(len(chunks))
+        time.sleep(self.delay)
+        return [chunk[:10] for chunk in chunks]
+
+
+class TestBatchingAndCache(unittest.TestCase):
+
+    def setUp(self):
+        self.model = CountingModel()
+        self.loads = 0
+
+    def tearDown(self):
+        unload_model("tiny")
+
+    def _loader(self):
+        self.loads += 1
+        return self.model
+
+    def test_model_is_loaded_lazily_once_per_path(self):
+        first = AIDocAgent("tiny", loader=self._loader)
+        second = AIDocAgent("tiny", loader=self._loader)
+        self.assertEqual(self.loads, 0)
+        first.process_documents(["a b c"])
+        second.process_documents(["d e f"])
+        self.assertEqual(self.loads, 1)
+        with self.assertRaises(FileNotFoundError):
+            AIDocAgent("/missing/model.bin").process_documents(["x"])
+
+    def test_batches_chunks_and_caches_by_content(self):
+        agent = AIDocAgent("tiny", loader=self._loader, batch_size=4, chunk_chars=50, chunk_overlap=10)
+        long_doc = " ".join(f"word{i}" for i in range(40))
+        results = agent.process_documents([long_doc, "short one", "short   one", ""])
+        self.assertGreater(results[0]["chunks"], 1)
+        self.assertEqual(len(results[0]["analysis"]), results[0]["chunks"])
+        self.assertEqual(results[1]["analysis"], results[2]["analysis"])
+        self.assertEqual((results[3]["chunks"], results[3]["analysis"]), (0, []))
+        self.assertTrue(all(n <= 4 for n in self.model.calls))
+        self.assertEqual(sum(self.model.calls), results[0]["chunks"] + 1)
+
+        calls = len(self.model.calls)
+        again = agent.process_documents([long_doc, "short one"])
+        self.assertEqual(len(self.model.calls), calls)
+        self.assertTrue(all(r["cached"] for r in again))
+        self.assertEqual(again[0]["analysis"], results[0]["analysis"])
+        self.assertEqual(agent.stats["analyzed"], 3)
+
+    def test_cache_persists_across_agents(self):
+        cache = AnalysisCache()
+        AIDocAgent("tiny", loader=self._loader, cache=cache).process_documents(["same page"])
+        result = AIDocAgent("tiny", loader=self._loader, cache=cache).process_document("same page")
+        self.assertTrue(result["cached"])
+        self.assertEqual(self.model.calls, [1])
+
+    def test_concurrent_documents_share_micro_batches(self):
+        self.model.delay = 0.01
+        agent = AIDocAgent("tiny", loader=self._loader, batch_size=8, batch_latency_ms=50)
+        results = {}
+
+        def work(i):
+            results[i] = agent.process_document(f"document number {i}")
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        agent.close()
+        self.assertEqual(sorted(results), list(range(16)))
+        self.assertEqual(results[3]["analysis"], ["document n"])
+        self.assertLess(len(self.model.calls), 16)
+        self.assertTrue(all(n <= 8 for n in self.model.calls))
+
+
+class TestChunkText(unittest.TestCase):
+
+    def test_chunks_overlap_at_word_boundaries(self):
+        text = " ".join(f"w{i:02d}" for i in range(30))
+        chunks = chunk_text(text, max_chars=20, overlap=8)
+        self.assertTrue(all(len(c) <= 20 for c in chunks))
+        self.assertEqual(chunks[0], "w00 w01 w02 w03 w04")
+        self.assertTrue(chunks[1].startswith("w03 "))
+        self.assertTrue(chunks[-1].endswith("w29"))
+        self.assertEqual(chunk_text(text, 20, 0)[1], "w05 w06 w07 w08 w09")
+        self.assertEqual(chunk_text("  "), [])
+        with self.assertRaises(ValueError):
+            chunk_text(text, 10, 10)
+
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import urllib.error
+import urllib.request
+from crawler_scraper.benchmarks.bench_pipeline import compare
+from crawler_scraper.benchmarks.fixture_site import FixtureSite
+from crawler_scraper.crawler.render_detect import analyze_html
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return r.status, r.read().decode("utf-8")
+
+
+class TestFixtureSite(unittest.TestCase):
+
+    def test_pages_robots_and_js_shells(self):
+        with FixtureSite(pages=20, page_bytes=2000, fanout=3, js_fraction=0.25, disallow_fraction=0.2, hosts=2) as site:
+            urls = site.urls()
+            self.assertEqual(len(urls), 20)
+            status, robots = _get(f"http://{site.hosts[0]}:{site.port}/robots.txt")
+            self.assertIn("Disallow: /private/", robots)
+            private = [u for i, u in enumerate(urls) if site.is_private(i)]
+            self.assertTrue(private and all("/private/" in u for u in private))
+
+            status, html = _get(site.url(1 if not site.is_js(1) else 2))
+            self.assertEqual(status, 200)
+            self.assertEqual(html.count("<li><a href="), 3)
+            self.assertFalse(analyze_html(html).needs_render)
+            js_page = next(i for i in range(20) if site.is_js(i))
+            self.assertTrue(analyze_html(_get(site.url(js_page))[1]).needs_render)
+            # Pages are generated deterministically.
+            self.assertEqual(_get(site.url(3))[1], site.html(3))
+            with self.assertRaises(urllib.error.HTTPError):
+                _get(f"http://{site.hosts[0]}:{site.port}/p/999.html")
+
+
+class TestCompare(unittest.TestCase):
+
+    def _results(self, **metrics):
+        base = {"pages_per_second": 100.0, "p50_ms": 50.0, "p99_ms": 200.0, "cpu_ms_per_page": 10.0,
+                "peak_rss_mb": 60.0}
+        return {"targets": {"fetch_url": {**base, **metrics}, "crawl_urls": {"skipped": "no browser"}}}
+
+    def test_flags_only_changes_beyond_tolerance(self):
+        baseline = self._results()
+        self.assertEqual(compare(baseline, self._results(pages_per_second=90.0, p50_ms=55.0)), [])
+        regressions = compare(baseline, self._results(pages_per_second=70.0, peak_rss_mb=80.0))
+        self.assertEqual({r["metric"] for r in regressions}, {"pages_per_second", "peak_rss_mb"})
+        self.assertEqual(compare(baseline, self._results(pages_per_second=70.0), scale=2), [])
+
+    def test_absolute_slack_ignores_tiny_latencies(self):
+        baseline = self._results(p50_ms=0.2)
+        self.assertEqual(compare(baseline, self._results(p50_ms=0.9)), [])
+        self.assertEqual(compare(baseline, self._results(p50_ms=3.0))[0]["metric"], "p50_ms")
+
+
+if __name__ == "__main__":
+    unittest.main()
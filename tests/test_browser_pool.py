@@ -0,0 +1,219 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from crawler_scraper.crawler import browser_pool
+from crawler_scraper.crawler.browser_pool import BrowserPool
+
+
+class _Frame:
+    url = "about:blank"
+
+
+class _Page:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+        self.heap = 0
+        self.visited = []
+        self.storage_cleared_on = []
+        self.main_frame = _Frame()
+        self.listeners = {}
+
+    def on(self, event, fn):
+        self.listeners.setdefault(event, []).append(fn)
+
+    def is_closed(self):
+        return self.closed or self.context.closed
+
+    async def goto(self, url, **kwargs):
+        self.visited.append(url)
+        self.main_frame.url = url
+        for fn in self.listeners.get("framenavigated", []):
+            fn(self.main_frame)
+
+    async def evaluate(self, script):
+        if script == browser_pool._CLEAR_STORAGE_JS:
+            self.storage_cleared_on.append(self.main_frame.url)
+            return None
+        return self.heap
+
+
+class _Context:
+    def __init__(self, options):
+        self.options = options
+        self.closed = False
+        self.cookie_clears = 0
+        self.permission_clears = 0
+        self.page = None
+
+    async def new_page(self):
+        self.page = _Page(self)
+        return self.page
+
+    async def clear_cookies(self):
+        self.cookie_clears += 1
+
+    async def clear_permissions(self):
+        self.permission_clears += 1
+
+    async def close(self):
+        self.closed = True
+
+
+class _Browser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **options):
+        self.contexts.append(_Context(options))
+        return self.contexts[-1]
+
+    async def close(self):
+        self.connected = False
+
+
+class _Playwright:
+    """Just enough of ``async_playwright()`` for ``BrowserPool``."""
+
+    def __init__(self):
+        self.browsers = []
+        self.chromium = self
+
+    async def launch(self, **options):
+        self.browsers.append(_Browser())
+        return self.browsers[-1]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class TestBrowserPool(unittest.TestCase):
+
+    def setUp(self):
+        self.playwright = _Playwright()
+        patcher = patch.object(browser_pool, "async_playwright", return_value=self.playwright)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_contexts_are_reused_then_recycled_after_max_navigations(self):
+        async def run():
+            pool = BrowserPool(size=1, contexts_per_browser=2, max_navigations=3)
+            pages = []
+            for _ in range(4):
+                async with pool.page() as page:
+                    pages.append(page)
+            stats = pool.stats()
+            await pool.close()
+            return pages, stats
+
+        pages, stats = asyncio.run(run())
+        self.assertIs(pages[0], pages[1])
+        self.assertIs(pages[1], pages[2])
+        self.assertIsNot(pages[2], pages[3])
+        # Reused contexts are cleaned between leases; the recycled one is closed.
+        self.assertEqual(pages[0].context.cookie_clears, 2)
+        self.assertEqual((len(pages[0].storage_cleared_on), pages[0].context.permission_clears), (2, 2))
+        self.assertEqual(pages[0].visited, ["about:blank"] * 2)
+        self.assertTrue(pages[0].context.closed)
+        self.assertEqual((stats["contexts_created"], stats["contexts_recycled"], stats["leases"]), (2, 1, 4))
+        self.assertEqual((stats["idle"], stats["leased"]), (1, 0))
+
+    def test_storage_is_cleared_and_cross_origin_leases_recycle(self):
+        """A reused context never carries storage over; one that left its origin is not reused."""
+        async def run():
+            pool = BrowserPool(size=1, contexts_per_browser=2)
+            async with pool.page() as first:
+                await first.goto("https://a.test/1")
+            async with pool.page() as second:
+                await second.goto("https://b.test/1")
+                await second.goto("https://c.test/landing")
+            async with pool.page() as third:
+                await third.goto("https://a.test/2")
+            stats = pool.stats()
+            await pool.close()
+            return first, second, third, stats
+
+        first, second, third, stats = asyncio.run(run())
+        # Storage was cleared while the page was still on a.test, then blanked.
+        self.assertEqual(first.storage_cleared_on, ["https://a.test/1"])
+        self.assertEqual(first.visited[:2], ["https://a.test/1", "about:blank"])
+        self.assertIs(first, second)
+        self.assertTrue(second.context.closed)
+        self.assertIsNot(second, third)
+        self.assertEqual((stats["contexts_created"], stats["contexts_recycled"]), (2, 1))
+
+    def test_heap_growth_and_closed_pages_recycle_the_context(self):
+        async def run():
+            pool = BrowserPool(size=1, max_heap_mb=1)
+            async with pool.page() as page:
+                page.heap = 2 * 1024 * 1024
+            async with pool.page() as second:
+                second.closed = True
+            async with pool.page() as third:
+                pass
+            stats = pool.stats()
+            await pool.close()
+            return page, second, third, stats
+
+        page, second, third, stats = asyncio.run(run())
+        self.assertTrue(page.context.closed)
+        self.assertIsNot(page, second)
+        self.assertIsNot(second, third)
+        self.assertEqual((stats["contexts_created"], stats["contexts_recycled"]), (3, 2))
+
+    def test_context_options_are_not_shared_and_crashed_browsers_relaunch(self):
+        async def run():
+            pool = BrowserPool(size=1, contexts_per_browser=2)
+            async with pool.page() as plain:
+                pass
+            async with pool.page(java_script_enabled=False) as nojs:
+                pass
+            async with pool.page() as again:
+                pass
+            self.playwright.browsers[0].connected = False
+            async with pool.page() as relaunched:
+                pass
+            stats = pool.stats()
+            await pool.close()
+            return plain, nojs, again, relaunched, stats
+
+        plain, nojs, again, relaunched, stats = asyncio.run(run())
+        self.assertIsNot(plain, nojs)
+        self.assertEqual(nojs.context.options, {"java_script_enabled": False})
+        self.assertIs(plain, again)
+        self.assertIsNot(again, relaunched)
+        self.assertEqual(len(self.playwright.browsers), 2)
+        self.assertEqual((stats["launches"], stats["crashes"]), (2, 1))
+
+    def test_leases_wait_for_capacity(self):
+        async def run():
+            pool = BrowserPool(size=1, contexts_per_browser=2)
+            active = peak = 0
+
+            async def task():
+                nonlocal active, peak
+                async with pool.page():
+                    active += 1
+                    peak = max(peak, active)
+                    await asyncio.sleep(0.01)
+                    active -= 1
+
+            await asyncio.gather(*(task() for _ in range(6)))
+            stats = pool.stats()
+            await pool.close()
+            return peak, stats
+
+        peak, stats = asyncio.run(run())
+        self.assertEqual(peak, 2)
+        self.assertEqual((stats["contexts_created"], stats["leases"]), (2, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,13 @@
+import os
+import tempfile
 import unittest
+from unittest.mock import patch
+from crawler_scraper.app import scraper
 from crawler_scraper.app.change_detector import ChangeDetector
+from crawler_scraper.app.fingerprint import hamming_distance, simhash
+
+URL = "https://example.com/rates"
+PAGE = " ".join(f"Business loan rates for term {i} start at {i + 3}.5 percent APR." for i in range(40))
 
 class TestChangeDetector(unittest.TestCase):
 
@@ -13,5 +21,80 @@ class TestChangeDetector(unittest.TestCase):
         # Placeholder for actual change detection validation
         self.assertTrue(isinstance(changes, list), "Change detection logic placeholder.")
 
+    def test_simhash_near_duplicates(self):
+        """A small edit stays within a few bits; unrelated text does not."""
+        edited = simhash(PAGE.replace("term 7 start", "term 7 begin"))
+        self.assertLessEqual(hamming_distance(simhash(PAGE), edited), 3)
+        self.assertGreater(hamming_distance(simhash(PAGE), simhash("Completely different words about cats")), 10)
+
+    def test_observe_classifies_fetches(self):
+        """New, unchanged (whitespace only), near-duplicate and changed bodies."""
+        self.detector = ChangeDetector(simhash_threshold=3)
+        self.assertEqual(self.detector.observe(URL, PAGE).status, "new")
+        self.assertEqual(self.detector.observe(URL, PAGE.replace(". ", ".   ")).status, "unchanged")
+        near = self.detector.observe(URL, PAGE.replace("term 7 start", "term 7 begin"))
+        self.assertEqual(near.status, "near_duplicate")
+        self.assertFalse(near.changed)
+        self.assertTrue(near.content_changed)
+        changed = self.detector.observe(URL, "Rates are suspended until further notice.")
+        self.assertEqual(changed.status, "changed")
+        self.assertTrue(changed.changed)
+        self.assertEqual(self.detector.state(URL).changes, 2)
+
+    def test_small_edits_are_changes_by_default(self):
+        self.detector.observe(URL, PAGE)
+        edit = self.detector.observe(URL, PAGE.replace("term 7 start at 10.5", "term 7 start at 10.25"))
+        self.assertEqual(edit.status, "changed")
+
+    def test_one_number_edit_is_snapshotted(self):
+        """Even with near-duplicate matching on, a new content hash gets a snapshot."""
+        page = " ".join(f"Loan product {i} carries an APR of {i % 9 + 4}.5 percent for small businesses."
+                        for i in range(120))
+        puts = []
+
+        class Store:
+            def put(self, url, text=None, **kwargs):
+                puts.append(text)
+
+        detector = ChangeDetector(simhash_threshold=3)
+        with patch.object(scraper, "get_detector", return_value=detector), \
+                patch.object(scraper, "snapshot_store", Store()):
+            scraper._record(URL, page, [], {}, collect_links=False, dedupe=False)
+            edited = page.replace("Loan product 60 carries an APR of 10.5", "Loan product 60 carries an APR of 10.75")
+            page_result = scraper._record(URL, edited, [], {}, collect_links=False, dedupe=False)
+            again = scraper._record(URL, edited, [], {}, collect_links=False, dedupe=False)
+        self.assertEqual(page_result["change_status"], "near_duplicate")
+        self.assertEqual(puts, [page, edited])
+        self.assertEqual(again["change_status"], "unchanged")
+
+    def test_conditional_requests(self):
+        """Validators of the last fetch become request headers; a 304 keeps the stored links."""
+        self.assertEqual(self.detector.validators(URL), {})
+        self.detector.observe(URL, PAGE, etag='"v1"', last_modified="Tue, 01 Sep 2026 10:00:00 GMT")
+        self.assertEqual(self.detector.validators(URL), {
+            "If-None-Match": '"v1"',
+            "If-Modified-Since": "Tue, 01 Sep 2026 10:00:00 GMT",
+        })
+        # Without stored links a 304 could not feed the crawl frontier.
+        self.assertEqual(self.detector.validators(URL, require_links=True), {})
+        self.detector.observe(URL, PAGE, etag='"v1"', links=["https://example.com/a"])
+        self.assertIn("If-None-Match", self.detector.validators(URL, require_links=True))
+        state = self.detector.not_modified(URL)
+        self.assertEqual(state.links, ["https://example.com/a"])
+        self.assertEqual(state.not_modified, 1)
+
+    def test_state_survives_restart(self):
+        """A detector on the same file sees the previous run's fingerprints."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "changes.sqlite3")
+            first = ChangeDetector(path)
+            first.observe(URL, PAGE, etag='"v1"')
+            self.assertEqual(first.detect_changes([URL]), [URL])
+            first.close()
+            second = ChangeDetector(path)
+            self.assertEqual(second.observe(URL, PAGE).status, "unchanged")
+            self.assertEqual(second.detect_changes([URL]), [])
+            second.close()
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
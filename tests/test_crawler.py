@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from crawler_scraper.app import crawler
+from crawler_scraper.app.links import canonicalize_url, in_scope
+
+SITE = {
+    "https://example.com/": ["https://example.com/a", "https://example.com/b#top", "https://other.com/"],
+    "https://example.com/a": ["https://example.com/c", "https://EXAMPLE.com:443/"],
+    "https://example.com/b": [],
+    "https://example.com/c": [],
+}
+
+
+async def fake_scrape(url, config, collect_links=True, executor=None):
+    if url not in SITE:
+        raise RuntimeError(f"Request failed for {url}")
+    return {"url": url, "content": url, "content_length": len(url), "links": SITE[url], "bytes": 100}
+
+
+class TestLinks(unittest.TestCase):
+
+    def test_canonicalize_url(self):
+        """Case, default ports and fragments do not create new URLs."""
+        self.assertEqual(canonicalize_url("HTTPS://Example.COM:443#frag"), "https://example.com/")
+        self.assertEqual(canonicalize_url("http://example.com:8080/a?b=1"), "http://example.com:8080/a?b=1")
+
+    def test_in_scope(self):
+        """Host scope ignores www.; domain scope admits subdomains."""
+        self.assertTrue(in_scope("https://www.example.com/x", "https://example.com/"))
+        self.assertFalse(in_scope("https://blog.example.com/x", "https://example.com/"))
+        self.assertTrue(in_scope("https://blog.example.com/x", "https://example.com/", scope="domain"))
+
+
+class TestCrawlBfs(unittest.TestCase):
+
+    @patch.object(crawler, "scrape_url_async", side_effect=fake_scrape)
+    def test_depth_limits_levels(self, _):
+        """Depth 1 fetches only the seed; depth 3 reaches every in-scope page once."""
+        one = asyncio.run(crawler.crawl_bfs("https://example.com/", {}, depth=1))
+        self.assertEqual([p["url"] for p in one["pages"]], ["https://example.com/"])
+
+        three = asyncio.run(crawler.crawl_bfs("https://example.com/", {}, depth=3))
+        urls = [p["url"] for p in three["pages"]]
+        self.assertEqual(sorted(urls), sorted(SITE))
+        self.assertEqual(three["stats"]["pages"], 4)
+        self.assertEqual(three["stats"]["bytes"], 400)
+
+    @patch.object(crawler, "scrape_url_async", side_effect=fake_scrape)
+    def test_max_pages(self, _):
+        """The frontier never grows past max_pages."""
+        result = asyncio.run(crawler.crawl_bfs("https://example.com/", {}, depth=3, max_pages=2))
+        self.assertEqual(len(result["pages"]), 2)
+
+    @patch.object(crawler, "scrape_url_async", side_effect=fake_scrape)
+    def test_on_page_sees_every_page(self, _):
+        """on_page is called once per page, errors included."""
+        seen = []
+        SITE["https://example.com/b"] = ["https://example.com/missing"]
+        try:
+            asyncio.run(crawler.crawl_bfs("https://example.com/", {}, depth=3, on_page=seen.append))
+        finally:
+            SITE["https://example.com/b"] = []
+        self.assertEqual(len(seen), 5)
+        self.assertEqual([p["url"] for p in seen if "error" in p], ["https://example.com/missing"])
+
+
+if __name__ == "__main__":
+    unittest.main()
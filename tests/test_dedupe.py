@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from crawler_scraper.app.dedupe import NearDuplicateIndex
+from crawler_scraper.app.fingerprint import simhash
+
+LISTING = " ".join(f"Equipment loan {i} from lender {i % 7} at {i + 4}.25 percent over {i % 5 + 1} years."
+                   for i in range(40))
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NearDuplicateIndex(max_distance=3)
+
+    def test_links_copies_to_canonical(self):
+        """Exact and near copies point at the first URL; unrelated pages stay canonical."""
+        self.assertIsNone(self.index.add("https://a.example/loans", LISTING))
+        exact = self.index.add("https://b.example/loans?ref=1", LISTING)
+        self.assertEqual((exact.canonical_url, exact.distance), ("https://a.example/loans", 0))
+        near = self.index.add("https://c.example/loans", LISTING.replace("Equipment loan 3 ", "Equipment loan three "))
+        self.assertEqual(near.canonical_url, "https://a.example/loans")
+        self.assertIsNone(self.index.add("https://d.example/", "An unrelated article about credit scores. " * 10))
+        self.assertEqual(self.index.canonical("https://c.example/loans"), "https://a.example/loans")
+        self.assertEqual(self.index.stats()["canonical"], 2)
+
+    def test_band_lookup_finds_every_fingerprint_within_distance(self):
+        """Pigeonhole banding: any flip of up to max_distance bits is found."""
+        base = simhash(LISTING)
+        self.index.add_fingerprint("https://a.example/", base, "a")
+        for bits in [(0,), (15, 16), (0, 31, 63), (1, 2, 3)]:
+            flipped = base
+            for bit in bits:
+                flipped ^= 1 << bit
+            self.assertIsNotNone(self.index.add_fingerprint(f"https://x.example/{bits}", flipped, str(bits)))
+        far = base ^ 0b1111
+        self.assertIsNone(self.index.add_fingerprint("https://far.example/", far, "far"))
+
+    def test_short_texts_are_not_indexed(self):
+        self.assertIsNone(self.index.add("https://a.example/404", "Page not found"))
+        self.assertIsNone(self.index.add("https://b.example/404", "Page not found"))
+        self.assertEqual(self.index.stats()["documents"], 0)
+
+    def test_readd_keeps_copies_and_persists(self):
+        """A re-crawled canonical keeps its copies; the index survives a restart."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "dedupe.sqlite3")
+            index = NearDuplicateIndex(path)
+            index.add("https://a.example/", LISTING)
+            index.add("https://b.example/", LISTING)
+            self.assertIsNone(index.add("https://a.example/", LISTING))
+            index.close()
+            reopened = NearDuplicateIndex(path)
+            self.assertEqual(reopened.canonical("https://b.example/"), "https://a.example/")
+            self.assertEqual(reopened.add("https://c.example/", LISTING).canonical_url, "https://a.example/")
+            reopened.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import http.server
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from crawler_scraper.crawler import distributed
+from crawler_scraper.crawler.distributed import Broker, Worker, run_local, shard_of
+from crawler_scraper.crawler.snapshot_store import SnapshotStore
+
+
+class TestBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.broker = Broker(Path(self.tmp.name) / "broker.sqlite3", shards=8, lease_seconds=30, handoff_delay=0)
+
+    def tearDown(self):
+        self.broker.close()
+        self.tmp.cleanup()
+
+    def test_shards_are_split_between_live_workers(self):
+        """Every shard has one owner; a joining worker gets its share once the others let go."""
+        self.broker.register("a", now=100)
+        self.assertEqual(self.broker.heartbeat("a", now=100), list(range(8)))
+        self.broker.register("b", now=101)
+        self.assertEqual(self.broker.heartbeat("b", now=101), [])
+        a = self.broker.heartbeat("a", now=102)
+        b = self.broker.heartbeat("b", now=103)
+        self.assertEqual(len(a), 4)
+        self.assertEqual(sorted(a + b), list(range(8)))
+
+    def test_claims_stay_within_owned_shards(self):
+        urls = [f"https://host{i}.example/" for i in range(20)]
+        self.broker.add_urls(urls)
+        self.broker.register("a", now=100)
+        self.broker.register("b", now=100)
+        owned = {w: set(self.broker.heartbeat(w, now=100)) for w in ("a", "b")}
+        self.assertFalse(owned["a"] & owned["b"])
+        claimed = {w: self.broker.claim(w, 20, now=100) for w in ("a", "b")}
+        for worker, got in claimed.items():
+            self.assertTrue(all(shard_of(u, 8) in owned[worker] for u in got))
+        self.assertEqual(sorted(claimed["a"] + claimed["b"]), sorted(u for u in urls
+                                                                      if shard_of(u, 8) in owned["a"] | owned["b"]))
+
+    def test_busy_shards_are_not_handed_over(self):
+        """A shard with a URL in flight stays with its worker, so one host never has two fetchers."""
+        self.broker.add_urls(["https://a.example/"])
+        self.broker.register("a", now=100)
+        self.broker.heartbeat("a", now=100)
+        self.assertEqual(self.broker.claim("a", 1, now=100), ["https://a.example/"])
+        self.broker.register("b", now=101)
+        self.broker.heartbeat("b", now=101)
+        self.assertIn(shard_of("https://a.example/", 8), self.broker.heartbeat("a", now=102))
+
+    def test_dead_worker_is_reaped(self):
+        """URLs claimed by a worker that stops heartbeating are queued again for the others."""
+        self.broker.add_urls(["https://a.example/", "https://b.example/"])
+        self.broker.register("a", now=100)
+        self.broker.heartbeat("a", now=100)
+        self.assertEqual(len(self.broker.claim("a", 5, now=100)), 2)
+        self.broker.register("b", now=200)
+        self.assertEqual(len(self.broker.heartbeat("b", now=200)), 8)
+        self.assertEqual(sorted(self.broker.claim("b", 5, now=200)), ["https://a.example/", "https://b.example/"])
+        self.broker.done("a", "https://a.example/", now=201)  # late result from the dead worker is ignored
+        self.broker.done("b", "https://a.example/", now=201)
+        stats = self.broker.stats()
+        self.assertEqual((stats["done"], stats["in_flight"]), (1, 1))
+        self.assertEqual([w["id"] for w in stats["workers"]], ["b"])
+
+    def test_failures_are_retried_then_dropped(self):
+        broker = Broker(Path(self.tmp.name) / "retry.sqlite3", shards=1, max_attempts=2, handoff_delay=0)
+        broker.add_urls(["https://a.example/"])
+        broker.register("a", now=100)
+        broker.heartbeat("a", now=100)
+        broker.claim("a", 1, now=100)
+        self.assertTrue(broker.failed("a", "https://a.example/", "timeout", now=100))
+        broker.claim("a", 1, now=100)
+        self.assertFalse(broker.failed("a", "https://a.example/", "timeout", now=100))
+        self.assertTrue(broker.idle())
+        self.assertEqual(broker.stats()["failed"], 1)
+        broker.close()
+
+
+    def test_only_active_urls_are_renewed(self):
+        """A URL the worker no longer works on expires and is queued again."""
+        self.broker.add_urls(["https://a.example/", "https://b.example/"])
+        self.broker.register("a", now=100)
+        self.broker.heartbeat("a", now=100)
+        self.assertEqual(len(self.broker.claim("a", 5, now=100)), 2)
+        self.broker.heartbeat("a", now=120, urls=["https://a.example/"])
+        self.broker.heartbeat("a", now=140, urls=["https://a.example/"])
+        self.assertEqual(self.broker.claim("a", 5, now=140), ["https://b.example/"])
+        self.broker.release("a", "https://a.example/")
+        self.assertEqual(self.broker.claim("a", 5, now=141), ["https://a.example/"])
+
+
+class _LockedOnceBroker(Broker):
+    """Fails the first ``done`` like a write that hit a locked database."""
+
+    locked = True
+
+    def done(self, worker_id, url, now=None):
+        if self.locked:
+            self.locked = False
+            raise sqlite3.OperationalError("database is locked")
+        super().done(worker_id, url, now)
+
+
+class TestWorker(unittest.TestCase):
+
+    def test_unrecorded_result_is_released_and_retried(self):
+        fetched = []
+
+        async def handler(url):
+            fetched.append(url)
+            return {"url": url}
+
+        async def no_delay(url):
+            return None
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(distributed.robots_store, "crawl_delay", side_effect=no_delay):
+            broker = _LockedOnceBroker(Path(tmp) / "broker.sqlite3", shards=1, lease_seconds=30, handoff_delay=0)
+            broker.add_urls(["https://a.example/"])
+            worker = Worker(broker, handler, min_delay=0, heartbeat_interval=0, poll_interval=0.01)
+            asyncio.run(asyncio.wait_for(worker.run(), 10))
+            stats = broker.stats()
+            broker.close()
+        self.assertEqual(fetched, ["https://a.example/"] * 2)
+        self.assertEqual((stats["done"], stats["in_flight"], stats["pending"]), (1, 0, 0))
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestRunLocal(unittest.TestCase):
+
+    def test_workers_share_a_crawl(self):
+        """Several worker processes crawl the queued URLs once each into the shared snapshot store."""
+        with tempfile.TemporaryDirectory() as site, tempfile.TemporaryDirectory() as out:
+            for i in range(6):
+                Path(site, f"page{i}.html").write_text(f"<html><body><p>Page number {i}</p></body></html>")
+            server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=site))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            port = server.server_address[1]
+            urls = [f"http://{host}:{port}/page{i}.html" for host in ("127.0.0.1", "localhost") for i in range(3)]
+            snapshots = Path(out) / "snapshots"
+            try:
+                with patch.dict(os.environ, {"SNAPSHOT_DIR": str(snapshots)}):
+                    broker = Broker(Path(out) / "broker.sqlite3", shards=4, handoff_delay=0)
+                    stats = run_local(urls, workers=2, broker=broker, mode="static", min_delay=0,
+                                      poll_interval=0.2)
+                    broker.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+            self.assertEqual((stats["done"], stats["failed"], stats["pending"]), (6, 0, 0))
+            store = SnapshotStore(snapshots)
+            self.assertIn("Page number 2", store.get(urls[2]).text)
+            self.assertEqual(store.stats()["snapshots"], 6)
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import unittest
+from crawler_scraper.app.executor import ExecutorBusy, RequestExecutor
+from crawler_scraper.app.scraper import extract_body
+
+PAGE = (b'<html><head><meta charset="iso-8859-1"><title>Caf\xe9</title><script>x()</script></head>'
+        b'<body><p>Rates <a href="/apply">apply</a></p></body></html>')
+
+
+class TestRequestExecutor(unittest.TestCase):
+
+    def test_parse_in_process_pool(self):
+        """Bodies are decoded and extracted in a worker process."""
+        executor = RequestExecutor(parse_workers=1)
+
+        async def main():
+            parsed = await executor.parse(extract_body, PAGE, "text/html", "https://example.com/", True)
+            pid = await executor.parse(os.getpid)
+            return parsed, pid
+
+        try:
+            parsed, pid = asyncio.run(main())
+        finally:
+            executor.shutdown()
+        self.assertEqual(parsed, {"content": "Café Rates apply", "links": ["https://example.com/apply"]})
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(executor.stats()["parsed"], 2)
+
+    def test_parse_queue_depth_bounds_in_flight(self):
+        """No more than parse_queue_depth jobs run at once."""
+        executor = RequestExecutor(parse_workers=0, parse_queue_depth=2)
+        peak = 0
+
+        def job():
+            nonlocal peak
+            peak = max(peak, executor.stats()["parse_in_flight"])
+            return 1
+
+        async def main():
+            return await asyncio.gather(*(executor.parse(job) for _ in range(10)))
+
+        self.assertEqual(sum(asyncio.run(main())), 10)
+        self.assertLessEqual(peak, 2)
+
+    def test_admit_rejects_when_queue_full(self):
+        """Crawls beyond run_concurrency + run_queue_depth are refused."""
+        executor = RequestExecutor(parse_workers=0, run_concurrency=1, run_queue_depth=1)
+
+        async def crawl(release):
+            async with executor.admit():
+                await release.wait()
+
+        async def main():
+            release = asyncio.Event()
+            running = asyncio.create_task(crawl(release))
+            queued = asyncio.create_task(crawl(release))
+            await asyncio.sleep(0)
+            with self.assertRaises(ExecutorBusy):
+                async with executor.admit():
+                    pass
+            release.set()
+            await asyncio.gather(running, queued)
+
+        asyncio.run(main())
+        self.assertEqual(executor.stats()["rejected"], 1)
+        self.assertEqual(executor.stats()["runs"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from pathlib import Path
+from crawler_scraper.app.extractors import EXTRACTORS, Extractor, available_extractors, get_extractor
+from crawler_scraper.app.normalizer import normalize_text
+
+FIXTURE_PAGES = Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "pages"
+BASE_URL = "https://example.com/"
+PAGE = ('<!doctype html><html><head><title>Loans &amp; Rates</title><style>p{}</style></head>'
+        '<body><base href="https://example.com/dir/"><p>One<b>two</b> three</p><!-- hidden -->'
+        '<script>var s = "<p>not text</p>";</script><noscript><p>enable js</p></noscript>'
+        '<a href="page">caf&eacute;</a> <a href="mailto:x@example.com">mail</a>tail</body></html>')
+
+
+def corpus():
+    pages = {"inline": PAGE}
+    for path in sorted(FIXTURE_PAGES.glob("*.html")):
+        pages[path.name] = path.read_text(encoding="utf-8")
+    return pages
+
+
+class TestExtractors(unittest.TestCase):
+
+    def setUp(self):
+        self.backends = available_extractors()
+        if "bs4" not in self.backends:
+            self.skipTest("bs4 reference backend not installed")
+
+    def test_backends_match_reference(self):
+        """Every installed backend yields the bs4 text and links on the corpus."""
+        reference = get_extractor("bs4")
+        for name in self.backends:
+            for page, html in corpus().items():
+                for max_chars in (20000, 300):
+                    with self.subTest(backend=name, page=page, max_chars=max_chars):
+                        expected = reference.extract(html, BASE_URL, max_chars, collect_links=True)
+                        got = get_extractor(name).extract(html, BASE_URL, max_chars, collect_links=True)
+                        self.assertEqual(normalize_text(got.text), normalize_text(expected.text))
+                        self.assertEqual(got.links, expected.links)
+
+    def test_sessions_match_extract(self):
+        """Chunked sessions give the same result as one-shot extraction."""
+        for name in self.backends:
+            extractor = get_extractor(name)
+            session = extractor.session(BASE_URL, 20000, collect_links=True)
+            for i in range(0, len(PAGE), 13):
+                session.feed(PAGE[i:i + 13])
+            self.assertEqual(session.close(), extractor.extract(PAGE, BASE_URL, 20000, collect_links=True))
+
+    def test_inline_page(self):
+        got = get_extractor("stream").extract(PAGE, BASE_URL, collect_links=True)
+        self.assertEqual(got.text, "Loans & Rates One two three café mail tail")
+        self.assertEqual(got.links, ["https://example.com/dir/page"])
+
+    def test_empty_document(self):
+        for name in self.backends:
+            self.assertEqual(normalize_text(get_extractor(name).extract("").text), "")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_extractor("nope")
+        self.assertIn("selectolax", EXTRACTORS)
+
+
+class TestExtractorBase(unittest.TestCase):
+
+    def test_backend_without_extract_fails_at_instantiation(self):
+        class Incomplete(Extractor):
+            name = "incomplete"
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+if __name__ == "__main__":
+    unittest.main()
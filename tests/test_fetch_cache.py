@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from crawler_scraper.crawler import engine
+from crawler_scraper.crawler.engine import FetchCacheMiss
+from crawler_scraper.crawler.fetch_cache import FetchCache, request_key
+from crawler_scraper.crawler.fetch_client import FetchClient, FetchSettings
+from crawler_scraper.crawler.render_profiles import BUILTIN_PROFILES
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def end_headers(self):
+        self.send_header("ETag", '"v1"')
+        super().end_headers()
+
+
+class TestFetchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = FetchCache(Path(self.tmp.name, "cache.sqlite3"), mode="record")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_lru_eviction_keeps_recently_used_entries(self):
+        self.cache.max_bytes = 3000
+        body = os.urandom(1024)
+        for i in range(3):
+            self.cache.put(f"GET https://a.test/{i}", f"https://a.test/{i}", 200, [], body)
+            self.cache.get("GET https://a.test/0")
+        self.assertEqual(self.cache.stats()["evicted"], 1)
+        self.assertIsNotNone(self.cache.get("GET https://a.test/0"))
+        self.assertIsNone(self.cache.get("GET https://a.test/1"))
+        self.assertLessEqual(self.cache.stats()["bytes"], self.cache.max_bytes)
+
+    def test_key_is_canonical(self):
+        self.assertEqual(request_key("get", "HTTPS://A.test:443/x#frag"), request_key("GET", "https://a.test/x"))
+
+    def test_record_then_replay_without_network(self):
+        site = Path(self.tmp.name, "site")
+        site.mkdir()
+        Path(site, "page.html").write_text("<html><body>" + "recorded " * 500 + "</body></html>")
+        Path(site, "big.html").write_text("x" * 5000)
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Handler, directory=str(site)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        client = FetchClient(FetchSettings(retries=0), cache=self.cache)
+        try:
+            recorded = client.get_sync(f"{base}/page.html")
+            self.cache.max_entry_bytes = 1000
+            self.assertEqual(len(client.get_sync(f"{base}/big.html").content), 5000)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.cache.mode = "replay"
+        replayed = client.get_sync(f"{base}/page.html")
+        self.assertEqual((replayed.status_code, replayed.text), (200, recorded.text))
+        self.assertEqual(client.get_sync(f"{base}/page.html", headers={"If-None-Match": '"v1"'}).status_code, 304)
+        with self.assertRaises(FetchCacheMiss):
+            client.get_sync(f"{base}/big.html")
+
+        async def replay_async():
+            async with client.stream("GET", f"{base}/page.html") as r:
+                return (await r.aread()).decode()
+        self.assertEqual(asyncio.run(replay_async()), recorded.text)
+        self.assertEqual(client.counters["connections_opened"], 1)
+
+    def test_rendered_pages_replay_without_a_browser(self):
+        profile = BUILTIN_PROFILES["text"]
+        self.cache.put_render("https://spa.test/", profile.name, "<div id=root>hi</div>", "hi")
+        self.cache.mode = "replay"
+        with patch.object(engine, "fetch_cache", self.cache):
+            snap = asyncio.run(engine.crawl_page(None, "https://spa.test/", profile=profile))
+            self.assertEqual((snap["text"], snap["render_profile"]), ("hi", "text"))
+            with self.assertRaises(FetchCacheMiss):
+                asyncio.run(engine.crawl_page(None, "https://spa.test/", profile=BUILTIN_PROFILES["full"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import asyncio
+import http.server
+import threading
+import time
+import unittest
+import httpx
+from crawler_scraper.crawler.fetch_client import BodyDecoder, DnsCache, FetchClient, FetchSettings, sniff_charset
+
+
+class MockFetchClient(FetchClient):
+    """FetchClient whose pooled clients talk to an in-process handler."""
+
+    def __init__(self, handler, **settings):
+        super().__init__(FetchSettings(backoff=0, **settings))
+        self._transport_handler = handler
+
+    @property
+    def async_client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self._transport_handler))
+
+    @property
+    def sync_client(self):
+        return httpx.Client(transport=httpx.MockTransport(self._transport_handler))
+
+
+class TestFetchClient(unittest.TestCase):
+
+    def test_retries_retryable_status(self):
+        """503 responses are retried until a success or the retry budget runs out."""
+        statuses = iter([503, 503, 200])
+
+        def handler(request):
+            return httpx.Response(next(statuses))
+
+        client = MockFetchClient(handler, retries=2)
+        self.assertEqual(client.get_sync("https://example.com/").status_code, 200)
+        self.assertEqual(client.counters["retries"], 2)
+
+    def test_gives_up_after_retries(self):
+        """The last response is returned once retries are exhausted."""
+        async def handler(request):
+            return httpx.Response(503)
+
+        client = MockFetchClient(handler, retries=1)
+        response = asyncio.run(client.get("https://example.com/"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(client.counters["requests"], 2)
+
+    def test_stream_retries_retryable_status(self):
+        """Streamed fetches back off and retry 429/5xx before handing out the response."""
+        statuses = iter([429, 200, 503, 200])
+
+        def handler(request):
+            return httpx.Response(next(statuses), headers={"Retry-After": "0"}, text="ok")
+
+        client = MockFetchClient(handler, retries=2)
+        with client.stream_sync("GET", "https://example.com/a") as response:
+            self.assertEqual((response.status_code, response.read()), (200, b"ok"))
+
+        async def fetch():
+            async with client.stream("GET", "https://example.com/b") as response:
+                return response.status_code, await response.aread()
+        self.assertEqual(asyncio.run(fetch()), (200, b"ok"))
+        self.assertEqual(client.counters["retries"], 2)
+        # Host slots are released after retries and after the block.
+        self.assertEqual(client._host_sem_sync("https://example.com/")._value, 6)
+
+
+class _SlowHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            type(self).active += 1
+            type(self).peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            type(self).active -= 1
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+class TestPooledClient(unittest.TestCase):
+    """The real pooled clients, with the DNS-caching network backend."""
+
+    def setUp(self):
+        _SlowHandler.peak = 0
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SlowHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_address[1]}/"
+        self.client = FetchClient(FetchSettings(per_host_connections=2, retries=0))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_dns_cache_and_per_host_limit(self):
+        async def crawl():
+            try:
+                return await asyncio.gather(*(self.client.get(self.url) for _ in range(6)))
+            finally:
+                await self.client.aclose()
+
+        responses = asyncio.run(crawl())
+        self.assertEqual([r.status_code for r in responses], [200] * 6)
+        self.assertEqual(_SlowHandler.peak, 2)
+        stats = self.client.stats()
+        # At most the two connections opened at once look the host up; every
+        # later connection, sync ones included, is served from the cache.
+        self.assertLessEqual(stats["connections_opened"], 2)
+        self.assertLessEqual(stats["dns_misses"], stats["connections_opened"])
+        self.assertEqual(self.client.get_sync(self.url).text, "ok")
+        self.assertEqual(self.client.stats()["dns_misses"], stats["dns_misses"])
+        self.assertGreater(self.client.stats()["dns_hits"], stats["dns_hits"])
+
+    def test_new_event_loop_closes_the_previous_pool(self):
+        async def fetch():
+            return (await self.client.get(self.url)).status_code
+
+        self.assertEqual(asyncio.run(fetch()), 200)
+        first = self.client._async_backend
+        sockets = [stream.get_extra_info("socket") for stream in first.streams]
+        self.assertTrue(sockets)
+        self.assertEqual(asyncio.run(fetch()), 200)
+        self.assertIsNot(self.client._async_backend, first)
+        self.assertTrue(all(sock.fileno() == -1 for sock in sockets))
+
+
+class TestDnsCache(unittest.TestCase):
+
+    def test_entries_expire(self):
+        """Cached addresses are served until the TTL runs out."""
+        cache = DnsCache(ttl=60)
+        cache.put("example.com", 443, [(None, None, None, None, ("93.184.216.34", 443))])
+        self.assertEqual(cache.get("example.com", 443), ["93.184.216.34"])
+        expired = DnsCache(ttl=-1)
+        expired.put("example.com", 443, [(None, None, None, None, ("93.184.216.34", 443))])
+        self.assertIsNone(expired.get("example.com", 443))
+
+
+class TestCharsetSniffing(unittest.TestCase):
+
+    def test_header_meta_and_bom(self):
+        """Header charset wins over <meta>; a BOM wins over both."""
+        self.assertEqual(sniff_charset("text/html; charset=ISO-8859-1", b'<meta charset="utf-8">'), "iso8859-1")
+        self.assertEqual(sniff_charset("text/html", b'<meta charset="windows-1252">'), "cp1252")
+        self.assertEqual(sniff_charset("text/html; charset=latin-1", b"\xef\xbb\xbf<p>"), "utf-8-sig")
+        self.assertEqual(sniff_charset("text/html; charset=bogus", b""), "utf-8")
+
+    def test_decoder_handles_split_multibyte_chars(self):
+        """Multi-byte characters split across chunks decode intact."""
+        decoder = BodyDecoder("text/html; charset=utf-8")
+        data = "caf\u00e9 \u20ac".encode("utf-8")
+        text = "".join(decoder.feed(data[i:i + 1]) for i in range(len(data))) + decoder.flush()
+        self.assertEqual(text, "caf\u00e9 \u20ac")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from crawler_scraper.crawler import engine
+from crawler_scraper.crawler.frontier import Frontier
+from crawler_scraper.crawler.recrawl import RecrawlStore
+
+
+class TestFrontier(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.frontier = Frontier(self.tmp.name, max_attempts=2)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.tmp.cleanup()
+
+    def test_urls_are_queued_once(self):
+        """The seen-set outlives the queue: finished URLs are never queued again."""
+        self.assertEqual(self.frontier.add_many(["https://a.example/", "https://b.example/", "https://a.example/"]), 2)
+        item = self.frontier.claim(1)[0]
+        self.frontier.done(item.url)
+        self.assertFalse(self.frontier.add(item.url))
+        self.assertTrue(self.frontier.seen(item.url))
+        self.assertEqual(self.frontier.stats()["queued"], 1)
+
+    def test_requeue_rearms_finished_urls(self):
+        """``requeue`` queues done URLs again but leaves queued ones alone."""
+        self.frontier.add_many(["https://a.example/", "https://b.example/"])
+        self.frontier.done(self.frontier.claim(1)[0].url)
+        self.assertEqual(self.frontier.add_many(["https://a.example/"]), 0)
+        self.assertEqual(self.frontier.add_many(["https://a.example/", "https://b.example/"], requeue=True), 1)
+        self.assertEqual([i.url for i in self.frontier.claim(5)], ["https://b.example/", "https://a.example/"])
+        self.assertEqual(self.frontier.stats()["requeued"], 1)
+
+    def test_claim_order(self):
+        """Higher priority first, then insertion order; claimed URLs are not handed out twice."""
+        self.frontier.add_many(["https://a.example/1", "https://a.example/2"])
+        self.frontier.add("https://a.example/urgent", priority=5)
+        self.assertEqual([i.url for i in self.frontier.claim(2)], ["https://a.example/urgent", "https://a.example/1"])
+        self.assertEqual([i.url for i in self.frontier.claim(5)], ["https://a.example/2"])
+        self.assertEqual(self.frontier.claim(5), [])
+
+    def test_failed_urls_are_retried_up_to_max_attempts(self):
+        self.frontier.add("https://a.example/")
+        self.frontier.claim(1)
+        self.assertTrue(self.frontier.failed("https://a.example/", "timeout"))
+        self.assertEqual(self.frontier.claim(1)[0].attempts, 2)
+        self.assertFalse(self.frontier.failed("https://a.example/", "timeout"))
+        self.assertEqual(self.frontier.pending(), 0)
+        self.assertEqual(self.frontier.stats()["failed"], 1)
+
+    def test_recover_after_crash(self):
+        """In-flight URLs survive a restart; expired-only recovery respects live leases."""
+        self.frontier.add_many(["https://a.example/", "https://b.example/"])
+        self.frontier.claim(2, now=1000)
+        self.frontier.done("https://a.example/")
+        self.frontier.close()
+        reopened = Frontier(self.tmp.name)
+        self.assertEqual(reopened.recover(expired_only=True, now=1000), 0)
+        self.assertEqual(reopened.recover(), 1)
+        self.assertEqual([i.url for i in reopened.claim(5)], ["https://b.example/"])
+        reopened.close()
+
+
+class TestCrawlFrontier(unittest.TestCase):
+
+    def test_resume_skips_finished_pages(self):
+        """A crawl killed midway renders only the unfinished URLs when resumed."""
+        rendered = []
+        urls = [f"https://a.example/{i}" for i in range(6)]
+        crashed = []
+
+        async def fake_render(pool, url):
+            rendered.append(url)
+            if url.endswith("/3") and not crashed:
+                crashed.append(url)
+                await asyncio.Event().wait()  # hangs until the crawl is killed
+            return {"url": url, "html": "", "text": ""}
+
+        async def allow(url, client=None):
+            return True
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(engine, "render_and_save", side_effect=fake_render), \
+                patch.object(engine, "allowed_by_robots", side_effect=allow):
+            frontier = Frontier(tmp)
+            frontier.add_many(urls)
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(
+                    engine.crawl_frontier(frontier, concurrency=1, pool=object(), min_delay=0, batch=2), 1))
+            frontier.close()
+            finished = [u for u in rendered if not u.endswith("/3")]
+
+            resumed = Frontier(tmp)
+            resumed.recover()
+            rendered.clear()
+            stats = asyncio.run(engine.crawl_frontier(resumed, concurrency=2, pool=object(), min_delay=0))
+            resumed.close()
+        self.assertEqual(sorted(rendered), sorted(set(urls) - set(finished)))
+        self.assertEqual(stats["frontier"]["queued"] + stats["frontier"]["in_flight"], 0)
+
+    def test_leases_stay_within_batch(self):
+        """Only about ``batch`` URLs are leased at a time, however large the frontier."""
+        leased = []
+
+        async def fake_render(pool, url):
+            stats = frontier.stats()
+            leased.append(stats["in_flight"])
+            await asyncio.sleep(0)
+            return {"url": url, "html": "", "text": ""}
+
+        async def allow(url, client=None):
+            return True
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(engine, "render_and_save", side_effect=fake_render), \
+                patch.object(engine, "allowed_by_robots", side_effect=allow):
+            frontier = Frontier(tmp)
+            frontier.add_many([f"https://a.example/{i}" for i in range(40)])
+            stats = asyncio.run(engine.crawl_frontier(frontier, concurrency=2, pool=object(), min_delay=0,
+                                                      per_host_concurrency=2))
+            frontier.close()
+        self.assertEqual(stats["frontier"]["done"], 40)
+        # ``batch`` (4) outstanding, one waiting for a slot, a few being marked done.
+        self.assertLessEqual(max(leased), 8)
+
+    def test_incremental_reruns_fetch_due_urls_again(self):
+        """URLs a previous run finished are crawled again once they are due."""
+        rendered = []
+
+        async def fake_render(pool, url, profile=None):
+            rendered.append(url)
+            return {"url": url, "html": "", "text": f"version {len(rendered)}"}
+
+        async def allow(url, client=None):
+            return True
+
+        class FakePool:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(engine, "render_and_save", side_effect=fake_render), \
+                patch.object(engine, "allowed_by_robots", side_effect=allow), \
+                patch.object(engine, "BrowserPool", FakePool):
+            seed = os.path.join(tmp, "seed.yaml")
+            with open(seed, "w", encoding="utf-8") as f:
+                f.write("sources:\n  - url: https://a.example/\n")
+            recrawl = RecrawlStore(os.path.join(tmp, "recrawl.sqlite3"), min_interval=0)
+            runs = []
+            for _ in range(3):
+                frontier = Frontier(os.path.join(tmp, "frontier"))
+                runs.append(asyncio.run(engine.run_from_seed(seed, incremental=True, recrawl=recrawl,
+                                                             frontier=frontier)))
+                frontier.close()
+            recrawl.close()
+        self.assertEqual([run["due"] for run in runs], [1, 1, 1])
+        self.assertEqual(rendered, ["https://a.example/"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
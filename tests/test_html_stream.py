@@ -0,0 +1,48 @@
+import unittest
+from bs4 import BeautifulSoup
+from crawler_scraper.app.html_stream import TextBudgetParser
+from crawler_scraper.app.normalizer import normalize_text
+
+PAGE = ('<!doctype html><html><head><title>Loans &amp; Rates</title><style>p{}</style></head>'
+        '<body><base href="https://example.com/dir/"><p>One<b>two</b> three</p><!-- hidden -->'
+        '<script>var s = "<p>not text</p>";</script><noscript><p>enable js</p></noscript>'
+        '<a href="page">caf&eacute;</a> <a href="mailto:x@example.com">mail</a>tail</body></html>')
+
+
+def bs4_text(html, max_chars):
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return normalize_text(soup.get_text(separator=" ", strip=True)[:max_chars])
+
+
+def stream_text(html, max_chars, chunk_size, collect_links=False):
+    parser = TextBudgetParser(max_chars, base_url="https://example.com/", collect_links=collect_links)
+    for i in range(0, len(html), chunk_size):
+        parser.feed(html[i:i + chunk_size])
+    parser.close()
+    return parser
+
+
+class TestTextBudgetParser(unittest.TestCase):
+
+    def test_matches_beautifulsoup_output(self):
+        """Chunked parsing yields the same normalized text as the BS4 path."""
+        expected = bs4_text(PAGE, 20000)
+        for chunk_size in (1, 7, 64, len(PAGE)):
+            self.assertEqual(normalize_text(stream_text(PAGE, 20000, chunk_size).text), expected)
+
+    def test_budget_stops_text(self):
+        """Text collection stops at the character budget."""
+        parser = stream_text(PAGE, 10, 5)
+        self.assertTrue(parser.text_done)
+        self.assertEqual(parser.text, bs4_text(PAGE, 10))
+
+    def test_links_respect_base(self):
+        """Links resolve against <base href> and skip non-http schemes."""
+        parser = stream_text(PAGE, 20000, 16, collect_links=True)
+        self.assertEqual(parser.links, ["https://example.com/dir/page"])
+
+
+if __name__ == "__main__":
+    unittest.main()
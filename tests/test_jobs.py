@@ -0,0 +1,210 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from crawler_scraper.app.jobs import (DONE, FAILED, QUEUED, RUNNING, Job, JobManager, JobStore, MemoryJobStore,
+                                      SqliteJobStore)
+
+
+class StoreContract:
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_claim_in_submission_order(self):
+        """Jobs are claimed oldest first and only once."""
+        for i in range(3):
+            self.store.add(Job(id=f"j{i}", kind="crawl", payload={"n": i}, created_at=i))
+        claimed = [self.store.claim() for _ in range(4)]
+        self.assertEqual([j.id for j in claimed[:3]], ["j0", "j1", "j2"])
+        self.assertIsNone(claimed[3])
+        self.assertEqual(self.store.get("j1").status, RUNNING)
+        self.assertEqual(self.store.get("j1").payload, {"n": 1})
+
+    def test_pages_and_progress(self):
+        self.store.add(Job(id="j", kind="crawl", payload={}))
+        self.store.claim()
+        self.store.add_page("j", {"url": "a"})
+        self.store.add_page("j", {"url": "b", "error": "boom"})
+        self.store.finish("j", DONE, result={"pages_crawled": 1})
+        job = self.store.get("j")
+        self.assertEqual((job.status, job.pages, job.errors), (DONE, 2, 1))
+        self.assertEqual(job.result, {"pages_crawled": 1})
+        self.assertEqual([p["url"] for p in self.store.pages("j", offset=1)], ["b"])
+
+    def test_requeue_drops_partial_pages(self):
+        self.store.add(Job(id="j", kind="crawl", payload={}))
+        self.store.claim()
+        self.store.add_page("j", {"url": "a"})
+        self.store.requeue("j")
+        self.assertEqual((self.store.get("j").status, self.store.get("j").pages), (QUEUED, 0))
+        self.assertEqual(self.store.pages("j"), [])
+        self.assertEqual(self.store.claim().id, "j")
+
+    def test_leases(self):
+        """Expired leases are re-queued; a manager that lost its lease cannot write."""
+        for job_id in ("a", "b"):
+            self.store.add(Job(id=job_id, kind="crawl", payload={}, created_at=len(job_id)))
+        a = self.store.claim(owner="p1", lease=60)
+        self.store.claim(owner="p2", lease=-1)
+        self.assertEqual((a.owner, a.status), ("p1", RUNNING))
+        self.assertEqual(self.store.heartbeat("p1", ["a", "b"], lease=60), ["a"])
+        self.assertEqual(self.store.requeue_expired(), 1)
+        self.assertEqual(self.store.get("b").status, QUEUED)
+        self.assertEqual(self.store.claim(owner="p3").id, "b")
+        self.assertFalse(self.store.add_page("b", {"url": "x"}, owner="p2"))
+        self.assertFalse(self.store.finish("b", DONE, owner="p2"))
+        self.assertTrue(self.store.add_page("b", {"url": "x"}, owner="p3"))
+        self.assertTrue(self.store.finish("b", DONE, owner="p3"))
+        self.assertEqual(self.store.get("b").pages, 1)
+        self.assertEqual(self.store.heartbeat("p3", ["b"]), [])
+
+
+class TestMemoryJobStore(StoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return MemoryJobStore()
+
+
+    def _finish(self, store, job_id):
+        store.add(Job(id=job_id, kind="crawl", payload={}))
+        store.claim()
+        store.add_page(job_id, {"url": job_id})
+        store.finish(job_id, DONE)
+
+    def test_finished_jobs_are_evicted(self):
+        """Finished jobs and their pages go once over the cap or past their retention."""
+        capped = MemoryJobStore(retention=3600, max_finished=2)
+        for job_id in ("a", "b", "c"):
+            self._finish(capped, job_id)
+        self.assertIsNone(capped.get("a"))
+        self.assertEqual(capped.pages("a"), [])
+        self.assertEqual([capped.get(j).status for j in ("b", "c")], [DONE, DONE])
+        self.assertEqual(set(capped._pages), {"b", "c"})
+
+        expiring = MemoryJobStore(retention=0.01)
+        self._finish(expiring, "old")
+        time.sleep(0.02)
+        expiring.add(Job(id="new", kind="crawl", payload={}))
+        self.assertIsNone(expiring.get("old"))
+        self.assertEqual(expiring.get("new").status, QUEUED)
+
+
+class TestSqliteJobStore(StoreContract, unittest.TestCase):
+
+    def make_store(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        return SqliteJobStore(os.path.join(self.tmp.name, "jobs.sqlite3"))
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def test_survives_reopen_and_requeues_expired(self):
+        """A job left running by a dead process is queued again once its lease expires."""
+        self.store.add(Job(id="j", kind="crawl", payload={"seed_url": "https://example.com/"}))
+        self.store.claim(owner="dead", lease=30)
+        self.store.close()
+        self.store = SqliteJobStore(os.path.join(self.tmp.name, "jobs.sqlite3"))
+        self.assertEqual(self.store.requeue_expired(), 0)
+        self.assertEqual(self.store.requeue_expired(now=time.time() + 31), 1)
+        self.assertEqual(self.store.claim().payload, {"seed_url": "https://example.com/"})
+
+
+class TestJobManager(unittest.TestCase):
+
+    def test_stream_emits_pages_then_end(self):
+        """Pages are streamed as the runner reports them; failures end the stream."""
+        async def runner(job, on_page):
+            for i in range(3):
+                on_page({"url": f"https://example.com/{i}"})
+                await asyncio.sleep(0)
+            if job.payload.get("fail"):
+                raise RuntimeError("boom")
+            return {"pages_crawled": 3}
+
+        async def main():
+            manager = JobManager(store=MemoryJobStore(), workers=2, runner=runner, poll_interval=0.05)
+            await manager.start()
+            try:
+                ok = await manager.submit("crawl", {})
+                bad = await manager.submit("crawl", {"fail": True})
+                ok_events = [e async for e in manager.stream(ok.id)]
+                bad_events = [e async for e in manager.stream(bad.id)]
+                resumed = [e async for e in manager.stream(ok.id, offset=2)]
+            finally:
+                await manager.stop()
+            return ok_events, bad_events, resumed, await manager.get(ok.id), manager._progress
+
+        ok_events, bad_events, resumed, job, progress = asyncio.run(main())
+        self.assertEqual([e["event"] for e in ok_events], ["page"] * 3 + ["end"])
+        self.assertEqual([e["seq"] for e in ok_events[:3]], [0, 1, 2])
+        self.assertEqual(ok_events[-1]["status"], DONE)
+        self.assertEqual(ok_events[-1]["result"], {"pages_crawled": 3})
+        self.assertEqual((bad_events[-1]["status"], bad_events[-1]["error"]), (FAILED, "boom"))
+        self.assertEqual([e.get("seq") for e in resumed], [2, None])
+        self.assertEqual((job.status, job.pages), (DONE, 3))
+        self.assertEqual(progress, {})
+
+    def test_stop_requeues_running_jobs(self):
+        """Jobs interrupted by shutdown go back to the queue."""
+        async def main():
+            gate = asyncio.Event()
+
+            async def runner(job, on_page):
+                gate.set()
+                await asyncio.sleep(60)
+
+            store = MemoryJobStore()
+            manager = JobManager(store=store, workers=1, runner=runner, poll_interval=0.05)
+            await manager.start()
+            job = await manager.submit("crawl", {})
+            await gate.wait()
+            await manager.stop()
+            return store.get(job.id)
+
+        self.assertEqual(asyncio.run(main()).status, QUEUED)
+
+    def test_leases_are_renewed_and_orphans_recovered(self):
+        """A long job keeps its lease; a dead process's job is picked up without a restart."""
+        async def main():
+            store = MemoryJobStore()
+
+            async def runner(job, on_page):
+                await asyncio.sleep(0.3)
+                on_page({"url": job.id})
+                return {}
+
+            manager = JobManager(store=store, workers=1, runner=runner, poll_interval=0.02, lease_seconds=0.1)
+            await manager.start()
+            try:
+                alive = await manager.submit("crawl", {})
+                while (await manager.get(alive.id)).status != RUNNING:
+                    await asyncio.sleep(0.01)
+                # A job claimed by a process that died without releasing it.
+                store.add(Job(id="orphan", kind="crawl", payload={}))
+                store.claim(owner="dead", lease=0.1)
+                events = [e async for e in manager.stream("orphan")]
+            finally:
+                await manager.stop()
+            return store.get(alive.id), store.get("orphan"), events
+
+        alive, orphan, events = asyncio.run(main())
+        self.assertEqual((alive.status, alive.pages), (DONE, 1))
+        self.assertEqual((orphan.status, orphan.pages), (DONE, 1))
+        self.assertEqual(events[-1]["event"], "end")
+
+    def test_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            JobStore()
+
+
+if __name__ == "__main__":
+    unittest.main()
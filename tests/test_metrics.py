@@ -0,0 +1,114 @@
+import asyncio
+import functools
+import gc
+import http.server
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from fastapi.testclient import TestClient
+from crawler_scraper.app.main import app
+from crawler_scraper.crawler import fetch_client as fetch_module
+from crawler_scraper.crawler.metrics import MetricsRegistry
+
+
+class _Owner:
+    def __init__(self, n):
+        self.n = n
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry(max_hosts=2)
+
+    def test_prometheus_text_format(self):
+        errors = self.registry.counter("crawl_errors_total", "Failures.", ("stage", "error"))
+        errors.inc(stage="fetch", error="ConnectError")
+        errors.inc(2, stage="fetch", error="ConnectError")
+        latency = self.registry.histogram("fetch_seconds", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            latency.observe(value)
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE crawl_errors_total counter", lines)
+        self.assertIn('crawl_errors_total{stage="fetch",error="ConnectError"} 3', lines)
+        self.assertIn('fetch_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('fetch_seconds_bucket{le="1"} 2', lines)
+        self.assertIn('fetch_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("fetch_seconds_count 3", lines)
+        self.assertIn("fetch_seconds_sum 5.55", lines)
+
+    def test_summary_percentiles(self):
+        stages = self.registry.histogram("crawl_stage_seconds", "Stages.", ("stage",), buckets=(0.01, 0.1, 1.0))
+        for _ in range(90):
+            stages.observe(0.005, stage="parse")
+        for _ in range(10):
+            stages.observe(0.5, stage="parse")
+        parse = self.registry.summary()["crawl_stage_seconds"]["parse"]
+        self.assertEqual(parse["count"], 100)
+        self.assertLessEqual(parse["p50"], 0.01)
+        self.assertGreater(parse["p99"], 0.1)
+
+    def test_host_labels_are_capped(self):
+        hosts = [self.registry.host(u) for u in ("https://a.example/x", "b.example", "https://c.example/")]
+        self.assertEqual(hosts, ["a.example", "b.example", "other"])
+        self.assertEqual(self.registry.host("https://A.example/y"), "a.example")
+
+    def test_collectors_follow_their_owner(self):
+        """Collector fields are summed over live instances and dropped with them."""
+        first, second = _Owner(2), _Owner(3)
+        collect = lambda o: {"leased": o.n, "name": "x"}
+        self.registry.add_collector("pool", collect, owner=first)
+        self.registry.add_collector("pool", collect, owner=second)
+        self.assertEqual(self.registry.collected(), {"pool_leased": 5})
+        del second
+        gc.collect()
+        self.assertEqual(self.registry.collected(), {"pool_leased": 2})
+        self.assertIn("pool_leased 2", self.registry.render())
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_fetch_records_stages_and_bytes(self):
+        with tempfile.TemporaryDirectory() as site:
+            Path(site, "page.html").write_text("<html><body>" + "x" * 5000 + "</body></html>")
+            server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=site))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}/page.html"
+            client = fetch_module.FetchClient()
+            stage_counts = lambda: {k: v["count"] for k, v in fetch_module.STAGE_SECONDS.summary().items()}
+            before = stage_counts()
+            bytes_before = fetch_module.BYTES.value(host="127.0.0.1")
+
+            async def main():
+                async with client.stream("GET", url) as r:
+                    body = b"".join([chunk async for chunk in fetch_module.aiter_capped(r)])
+                await client.aclose()
+                return body
+
+            try:
+                body = asyncio.run(main())
+            finally:
+                server.shutdown()
+                server.server_close()
+        after = stage_counts()
+        for name in ("connect", "ttfb", "download"):
+            self.assertEqual(after.get(name, 0) - before.get(name, 0), 1, name)
+        self.assertEqual(fetch_module.BYTES.value(host="127.0.0.1") - bytes_before, len(body))
+        self.assertIn("127.0.0.1", fetch_module.HOST_FETCH_SECONDS.summary())
+
+    def test_metrics_endpoint(self):
+        response = TestClient(app).get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn("# TYPE crawl_stage_seconds histogram", response.text)
+        self.assertIn("fetch_requests", response.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+import types
+import unittest
+from unittest.mock import AsyncMock, patch
+from crawler_scraper import orchestrator
+from crawler_scraper.app.change_detector import ChangeResult
+
+
+def _report():
+    return {"triage": {"urls": 0, "seconds": 0, "urls_per_second": 0, "errors": 0},
+            "render": {"errors": 0, "queued": 0},
+            "url_policy": {"fetches_avoided": 0, "skipped": {}}}
+
+
+class TestOrchestrateFromSeed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.seed = os.path.join(self.tmp.name, "seed.yaml")
+        with open(self.seed, "w", encoding="utf-8") as f:
+            f.write("sources:\n  - url: https://a.test/\n    sitemap: https://a.test/sitemap.xml\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_discovery_and_pipeline_share_one_loop(self):
+        loops = []
+        locate = orchestrator.SitemapDiscovery.locate
+
+        async def tracking_locate(discovery, sources):
+            loops.append(asyncio.get_running_loop())
+            return await locate(discovery, sources)
+
+        async def fake_pipeline(urls, **kwargs):
+            loops.append(asyncio.get_running_loop())
+            return _report()
+
+        with patch.object(orchestrator.SitemapDiscovery, "locate", tracking_locate), \
+                patch.object(orchestrator, "_pipeline", side_effect=fake_pipeline):
+            report = orchestrator.orchestrate_from_seed(self.seed)
+        self.assertEqual(len(loops), 2)
+        self.assertIs(loops[0], loops[1])
+        self.assertEqual(report["sitemaps"]["sites"], 1)
+
+
+class _Detector:
+    def validators(self, url):
+        return {}
+
+    def observe(self, url, text, etag=None, last_modified=None):
+        return ChangeResult(url, "changed", fingerprint=0)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_render_starts_while_triage_is_still_running(self):
+        urls = [f"https://h{i}.test/" for i in range(6)]
+        rendering = None
+        triaged, rendered = [], []
+        triaged_at_first_render = None
+
+        async def fake_fetch(url, keep_body=True, headers=None):
+            # Only the first page is ready at once; the rest of triage waits
+            # for a render to start, which a triage-then-render pipeline never does.
+            if url != urls[0]:
+                await rendering.wait()
+            triaged.append(url)
+            return {"url": url, "status": "ok", "body": "<p>x</p>", "needs_render": url == urls[0]}
+
+        async def fake_render(pool, url, profile=None):
+            nonlocal triaged_at_first_render
+            if triaged_at_first_render is None:
+                triaged_at_first_render = len(triaged)
+            rendering.set()
+            rendered.append(url)
+            return {"url": url, "html": "<p>x</p>", "text": "x"}
+
+        async def run():
+            nonlocal rendering
+            rendering = asyncio.Event()
+            return await asyncio.wait_for(orchestrator._pipeline(urls, min_delay=0), timeout=5)
+
+        detector = types.SimpleNamespace(cached=lambda url: None, stats={})
+        with patch.object(orchestrator.robots_store, "can_fetch", AsyncMock(return_value=True)), \
+                patch.object(orchestrator.robots_store, "crawl_delay", AsyncMock(return_value=None)), \
+                patch.object(orchestrator, "fetch_url_async", side_effect=fake_fetch), \
+                patch.object(orchestrator, "render_and_save", side_effect=fake_render), \
+                patch.object(orchestrator, "save_snapshot", AsyncMock()), \
+                patch.object(orchestrator, "get_detector", return_value=_Detector()), \
+                patch.object(orchestrator, "get_index", return_value=types.SimpleNamespace(add=lambda *a: None)), \
+                patch.object(orchestrator, "render_detector", detector), \
+                patch.object(orchestrator, "needs_render", side_effect=lambda res: res["needs_render"]):
+            report = asyncio.run(run())
+        self.assertEqual(triaged_at_first_render, 1)
+        self.assertEqual(rendered, [urls[0]])
+        self.assertEqual(sorted(triaged), urls)
+        self.assertEqual((report["render"]["queued"], report["triage"]["saved_static"]), (1, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
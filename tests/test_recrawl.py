@@ -0,0 +1,126 @@
+import asyncio
+import math
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from crawler_scraper.crawler import engine
+from crawler_scraper.crawler.recrawl import RecrawlStore, change_rate
+
+HOUR, DAY = 3600, 86400
+
+
+class TestRecrawlStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = RecrawlStore(os.path.join(self.tmp.name, "recrawl.sqlite3"),
+                                  min_interval=HOUR, max_interval=30 * DAY)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def _visit(self, url, changes, every=DAY, start=0.0):
+        """One first fetch then one re-fetch per entry of ``changes``, ``every`` seconds apart."""
+        self.store.record(url, changed=True, fetched_at=start)
+        for i, changed in enumerate(changes, 1):
+            self.store.record(url, changed=changed, fetched_at=start + i * every)
+        return start + len(changes) * every
+
+    def test_change_rate_estimator(self):
+        """No re-fetch gives no estimate; changes on every visit still give a finite rate."""
+        self.assertIsNone(change_rate(0, 0, 0))
+        self.assertEqual(change_rate(10, 0, 10 * DAY), 0.0)
+        self.assertAlmostEqual(change_rate(10, 5, 10 * DAY), -math.log(5.5 / 10.5) / DAY)
+        self.assertTrue(math.isfinite(change_rate(10, 10, 10 * DAY)))
+
+    def test_due_prefers_new_and_frequently_changing_pages(self):
+        now = self._visit("https://a.example/daily", [True] * 6)
+        self._visit("https://a.example/static", [False] * 6)
+        self._visit("https://a.example/weekly", [False, False, False, False, False, True])
+        self.store.add(["https://a.example/new"], now=now)
+        due = self.store.due(now=now + DAY)
+        self.assertEqual(due, ["https://a.example/new", "https://a.example/daily",
+                               "https://a.example/weekly", "https://a.example/static"])
+        self.assertEqual(self.store.due(budget=2, now=now + DAY), due[:2])
+
+    def test_recent_pages_are_not_due(self):
+        self.store.record("https://a.example/", changed=True, fetched_at=1000)
+        self.assertEqual(self.store.due(now=1000 + HOUR / 2), [])
+        self.assertEqual(self.store.due(now=1000 + 31 * DAY), ["https://a.example/"])
+
+    def test_change_from_content_hash(self):
+        """Without an explicit verdict a different content hash is a change."""
+        self.store.record("https://a.example/", content_hash="h1", fetched_at=0)
+        self.store.record("https://a.example/", content_hash="h1", fetched_at=DAY)
+        self.store.record("https://a.example/", content_hash="h2", fetched_at=2 * DAY)
+        page = self.store.history("https://a.example/")
+        self.assertEqual((page.fetches, page.revisits, page.changes), (3, 2, 1))
+        self.assertEqual(page.revisit_seconds, 2 * DAY)
+
+    def test_failures_lower_priority(self):
+        self.store.add(["https://a.example/ok", "https://a.example/dead"], now=0)
+        self.store.record("https://a.example/dead", error="timeout")
+        self.assertEqual(self.store.due(now=1), ["https://a.example/ok", "https://a.example/dead"])
+        self.assertEqual(self.store.history("https://a.example/dead").failures, 1)
+
+
+class TestIncrementalRun(unittest.TestCase):
+
+    def test_only_due_urls_are_crawled(self):
+        """A second incremental run skips what was just fetched."""
+        crawled = []
+
+        async def fake_crawl(urls, on_result=None, **kwargs):
+            for url in urls:
+                crawled.append(url)
+                on_result(url, {"url": url, "html": "<p>x</p>", "text": "x"}, None)
+            return {"done": len(crawled)}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            seed = os.path.join(tmp, "seed.yaml")
+            with open(seed, "w", encoding="utf-8") as f:
+                f.write("sources:\n  - url: https://a.example/\n  - url: https://b.example/\n")
+            store = RecrawlStore(os.path.join(tmp, "recrawl.sqlite3"))
+            with patch.object(engine, "crawl_urls", side_effect=fake_crawl):
+                first = asyncio.run(engine.run_from_seed(seed, incremental=True, budget=1, recrawl=store))
+                second = asyncio.run(engine.run_from_seed(seed, incremental=True, recrawl=store))
+                third = asyncio.run(engine.run_from_seed(seed, incremental=True, recrawl=store))
+            store.close()
+        self.assertEqual((first["due"], first["skipped"]), (1, 1))
+        self.assertEqual((second["due"], third["due"]), (1, 0))
+        self.assertEqual(sorted(crawled), ["https://a.example/", "https://b.example/"])
+
+    def test_outcomes_are_recorded_off_the_event_loop(self):
+        threads = []
+
+        class Store(RecrawlStore):
+            def record(self, url, **outcome):
+                threads.append(threading.current_thread())
+                return super().record(url, **outcome)
+
+        async def fake_crawl(urls, on_result=None, **kwargs):
+            for url in urls:
+                on_result(url, {"url": url, "html": "<p>x</p>", "text": "x"}, None)
+            on_result("https://a.example/gone", None, RuntimeError("boom"))
+            return {"done": len(threads)}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            seed = os.path.join(tmp, "seed.yaml")
+            with open(seed, "w", encoding="utf-8") as f:
+                f.write("sources:\n  - url: https://a.example/\n")
+            store = Store(os.path.join(tmp, "recrawl.sqlite3"))
+            with patch.object(engine, "crawl_urls", side_effect=fake_crawl):
+                asyncio.run(engine.run_from_seed(seed, incremental=True, recrawl=store))
+            failures = store.history("https://a.example/gone").failures
+            store.close()
+        # Every write finished before run_from_seed returned, none on the loop's thread.
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(failures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from crawler_scraper.crawler.render_detect import RenderDetector, analyze_html
+
+SPA = '<html><body><div id="root"></div><script src="/static/app.js"></script></body></html>'
+SSR = ('<html><body><div id="__next"><h1>Loans</h1>' + '<p>Rates and terms for small business loans.</p>' * 10
+       + '</div><script id="__NEXT_DATA__" type="application/json">{}</script></body></html>')
+STATIC = '<html><body><article>' + '<p>Plain server rendered article text.</p>' * 10 + '</article></body></html>'
+
+
+class TestAnalyzeHtml(unittest.TestCase):
+
+    def test_empty_root_needs_render(self):
+        """An empty SPA mount point requires a browser."""
+        decision = analyze_html(SPA)
+        self.assertTrue(decision.needs_render)
+        self.assertIn("empty_root_container", decision.reasons)
+
+    def test_server_rendered_framework_is_static(self):
+        """Framework markers alone do not force a render when text is present."""
+        decision = analyze_html(SSR)
+        self.assertEqual(decision.framework, "next")
+        self.assertFalse(decision.needs_render)
+
+    def test_plain_html_is_static(self):
+        self.assertFalse(analyze_html(STATIC).needs_render)
+
+
+class TestRenderDetector(unittest.TestCase):
+
+    def test_decisions_are_cached_per_host(self):
+        """Later pages on an analyzed host reuse the cached decision."""
+        detector = RenderDetector()
+        self.assertTrue(detector.classify("https://spa.example/", SPA).needs_render)
+        decision = detector.classify("https://spa.example/other", STATIC)
+        self.assertTrue(decision.needs_render)
+        self.assertTrue(decision.cached)
+        self.assertEqual(detector.stats, {"analyzed": 1, "cache_hits": 1})
+        self.assertIsNone(detector.cached("https://other.example/"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import asyncio
+import unittest
+from crawler_scraper.crawler import render_profiles as rp
+from crawler_scraper.crawler.render_profiles import BUILTIN_PROFILES, RenderProfile, RenderProfiles
+
+
+class _Request:
+    def __init__(self, url, resource_type, frame=None):
+        self.url = url
+        self.resource_type = resource_type
+        self.frame = frame
+
+    def is_navigation_request(self):
+        return self.frame is not None
+
+
+class _Route:
+    def __init__(self, url, resource_type, frame=None):
+        self.request = _Request(url, resource_type, frame)
+        self.outcome = None
+
+    async def abort(self, error_code=None):
+        self.outcome = "aborted"
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+
+class _Response:
+    def __init__(self, url, resource_type, size):
+        self.request = _Request(url, resource_type)
+        self.headers = {"content-length": str(size)}
+
+
+class _Page:
+    """Just enough of a Playwright page for ``apply_profile``."""
+
+    def __init__(self):
+        self.routes = {}
+        self.listeners = {}
+        self.main_frame = object()
+
+    async def route(self, pattern, handler):
+        self.routes[pattern] = handler
+
+    async def unroute(self, pattern, handler):
+        self.routes.pop(pattern)
+
+    def on(self, event, fn):
+        self.listeners.setdefault(event, []).append(fn)
+
+    def remove_listener(self, event, fn):
+        self.listeners[event].remove(fn)
+
+
+class TestSelection(unittest.TestCase):
+
+    def test_seed_domains_sources_and_custom_profiles(self):
+        seed = {
+            "render": {
+                "default": "text",
+                "domains": {"example.com": "spa"},
+                "profiles": {"lite": {"base": "spa", "block_domains": ["cdn.example.net"], "wait_for_selector": "#app"}},
+            },
+            "sources": [{"url": "https://docs.example.org/a", "render_profile": "nojs"},
+                        {"url": "https://shop.example.net/", "render_profile": "lite"}],
+        }
+        profiles = RenderProfiles.from_seed(seed)
+        self.assertEqual(profiles.for_url("https://app.example.com/x").name, "spa")
+        self.assertEqual(profiles.for_url("https://docs.example.org/b").name, "nojs")
+        self.assertEqual(profiles.for_url("https://other.test/").name, "text")
+        lite = profiles.for_url("https://shop.example.net/cart")
+        self.assertEqual((lite.wait_until, lite.wait_for_selector), ("networkidle", "#app"))
+        self.assertEqual(lite.block_resource_types, BUILTIN_PROFILES["spa"].block_resource_types)
+        self.assertEqual(lite.block_domains, ("cdn.example.net",))
+
+    def test_default_is_full_and_errors_are_reported(self):
+        self.assertEqual(RenderProfiles.from_seed({"sources": []}).default, BUILTIN_PROFILES[rp.DEFAULT_PROFILE])
+        with self.assertRaises(ValueError):
+            RenderProfiles.from_seed({"sources": [{"url": "https://a.test/", "render_profile": "fast"}]})
+        with self.assertRaises(ValueError):
+            RenderProfile("bad", frozenset({"pictures"}))
+        with self.assertRaises(ValueError):
+            RenderProfile.from_dict("bad", {"wait_until": "idle"})
+
+    def test_blocking_rules(self):
+        text = BUILTIN_PROFILES["text"]
+        self.assertTrue(text.blocks("image", "https://example.com/a.png"))
+        self.assertTrue(text.blocks("script", "https://www.google-analytics.com/analytics.js"))
+        self.assertFalse(text.blocks("script", "https://example.com/app.js"))
+        self.assertTrue(text.blocks("script", "https://px.ads.linkedin.com/insight.min.js"))
+        self.assertFalse(text.blocks("xhr", "https://www.linkedin.com/voyager/api/me"))
+        self.assertFalse(text.blocks("script", "https://www.google-analytics.com/analytics.js",
+                                     first_party={"google-analytics.com"}))
+        self.assertFalse(BUILTIN_PROFILES["full"].intercepts)
+        self.assertEqual(BUILTIN_PROFILES["nojs"].context_options, {"java_script_enabled": False})
+
+
+class TestApplyProfile(unittest.TestCase):
+
+    def test_interception_accounting_and_cleanup(self):
+        profile = RenderProfile("unit-test", frozenset({"image"}), ("tracker.test",))
+        page = _Page()
+        routes = [_Route("https://site.test/", "document"), _Route("https://site.test/a.png", "image"),
+                  _Route("https://tracker.test/t.js", "script")]
+        blocked_before = rp.BLOCKED.value(profile="unit-test", type="image")
+
+        async def render():
+            async with rp.apply_profile(page, profile):
+                for route in routes:
+                    await page.routes["**/*"](route)
+                for fn in page.listeners["response"]:
+                    fn(_Response("https://site.test/", "document", 1200))
+
+        asyncio.run(render())
+        self.assertEqual([r.outcome for r in routes], ["continued", "aborted", "aborted"])
+        self.assertEqual(page.routes, {})
+        self.assertEqual(page.listeners["response"], [])
+        self.assertEqual(rp.BLOCKED.value(profile="unit-test", type="image") - blocked_before, 1)
+        self.assertGreaterEqual(rp.RENDER_BYTES.value(profile="unit-test"), 1200)
+
+    def test_navigations_and_first_party_hosts_are_never_blocked(self):
+        profile = RenderProfile("unit-nav", frozenset({"image"}), ("tracker.test", "site.test"))
+        page = _Page()
+        routes = [_Route("https://site.test/", "document", page.main_frame),
+                  _Route("https://www.site.test/app.js", "script"),
+                  _Route("https://tracker.test/frame.html", "document", object()),
+                  _Route("https://tracker.test/t.js", "script")]
+
+        async def render():
+            async with rp.apply_profile(page, profile, "https://site.test/"):
+                for route in routes:
+                    await page.routes["**/*"](route)
+
+        asyncio.run(render())
+        self.assertEqual([r.outcome for r in routes], ["continued", "continued", "aborted", "aborted"])
+
+    def test_redirect_targets_count_as_first_party(self):
+        profile = RenderProfile("unit-redirect", frozenset(), ("tracker.test",))
+        page = _Page()
+        routes = [_Route("https://www.tracker.test/", "document", page.main_frame),
+                  _Route("https://cdn.www.tracker.test/app.js", "script")]
+
+        async def render():
+            async with rp.apply_profile(page, profile, "https://tracker-redirect.test/"):
+                for route in routes:
+                    await page.routes["**/*"](route)
+
+        asyncio.run(render())
+        self.assertEqual([r.outcome for r in routes], ["continued", "continued"])
+
+    def test_report_estimates_savings(self):
+        rp.RENDER_SECONDS.observe(2.0, profile="full")
+        rp.RENDER_SECONDS.observe(0.5, profile="unit-report")
+        rp.BLOCKED.inc(3, profile="unit-report", type="font")
+        report = rp.profile_report()["unit-report"]
+        self.assertEqual(report["blocked_by_type"], {"font": 3})
+        self.assertEqual(report["estimated_bytes_saved"], int(3 * rp.average_resource_bytes("font")))
+        self.assertIsNotNone(report["estimated_seconds_saved"])
+
+
+if __name__ == "__main__":
+    unittest.main()
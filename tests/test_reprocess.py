@@ -0,0 +1,88 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from crawler_scraper.app.reprocess import bucket_range, reprocess
+from crawler_scraper.crawler.snapshot_store import SnapshotStore, url_key
+
+PAGE = "<html><body><main><h1>{title}</h1><p>{body}</p><a href='/next'>next</a></main></body></html>"
+
+
+def _lines(path):
+    return [json.loads(line) for line in Path(path).read_text().splitlines()]
+
+
+class TestReprocess(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name, "snapshots")
+        words = " ".join(f"word{i}" for i in range(200))
+        with SnapshotStore(self.root) as store:
+            for n, url in enumerate(f"https://site{i}.test/" for i in range(12)):
+                store.put(url, html=PAGE.format(title="v1", body=words), fetched_at=100 + n)
+                store.put(url, html=PAGE.format(title="v1", body=words), text="rendered", fetched_at=200 + n)
+                store.put(url, html=PAGE.format(title="v2", body="entirely different text " * 40),
+                          fetched_at=300 + n)
+            store.put("https://text.test/", text="  plain\n\ttext  ", source="scrape", fetched_at=50)
+            store.put("https://copy.test/", metadata={"duplicate_of": "https://site0.test/"}, source="scrape",
+                      fetched_at=60)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rebuilds_text_changes_and_links(self):
+        out = Path(self.tmp.name, "out")
+        report = reprocess(out, self.root, workers=0, buckets=8)
+        lines = _lines(out / "pages.jsonl")
+        self.assertEqual(report["snapshots"], len(lines))
+        self.assertEqual(len(lines), 38)
+        self.assertEqual(report["errors"], 0)
+        history = [r for r in lines if r["url"] == "https://site3.test/"]
+        self.assertEqual([r["change_status"] for r in history], ["new", "unchanged", "changed"])
+        self.assertTrue(history[0]["content"].startswith("v1 word0"))
+        self.assertEqual(history[0]["links"], ["https://site3.test/next"])
+        text_only = next(r for r in lines if r["url"] == "https://text.test/")
+        self.assertEqual(text_only["content"], "plain text")
+        self.assertEqual(next(r for r in lines if r["url"] == "https://copy.test/")["duplicate_of"],
+                         "https://site0.test/")
+        # Ordered output: URLs by hash, each URL's snapshots oldest first.
+        keys = [(url_key(r["url"]), r["fetched_at"]) for r in lines]
+        self.assertEqual(keys, sorted(keys))
+        self.assertGreater(report["snapshots_per_second"], 0)
+
+    def test_resume_finishes_an_interrupted_run(self):
+        out = Path(self.tmp.name, "out")
+        reprocess(out, self.root, workers=0, buckets=8, include_text=False)
+        complete = (out / "pages.jsonl").read_bytes()
+        # Pretend the run died while writing its last bucket.
+        progress = json.loads((out / "progress.json").read_text())
+        last = progress["done"].pop()
+        lo, hi = bucket_range(last, 8)
+        in_last = lambda line: lo <= url_key(json.loads(line)["url"]) < (hi or "g")
+        kept = [line for line in complete.decode().splitlines() if not in_last(line)]
+        progress["offset"] = len(("\n".join(kept) + "\n").encode()) if kept else 0
+        (out / "progress.json").write_text(json.dumps(progress))
+        with open(out / "pages.jsonl", "ab") as f:
+            f.write(b'{"partial": tr')
+
+        report = reprocess(out, self.root, workers=0, buckets=8, include_text=False, resume=True)
+        self.assertEqual(report["buckets_processed"], 1)
+        self.assertEqual((out / "pages.jsonl").read_bytes(), complete)
+        with self.assertRaises(ValueError):
+            reprocess(out, self.root, workers=0, buckets=16, include_text=False, resume=True)
+
+    def test_worker_pool_matches_inline_run(self):
+        inline, pooled = Path(self.tmp.name, "inline"), Path(self.tmp.name, "pooled")
+        reprocess(inline, self.root, workers=0, buckets=4)
+        report = reprocess(pooled, self.root, workers=2, buckets=4)
+        self.assertEqual((pooled / "pages.jsonl").read_text(), (inline / "pages.jsonl").read_text())
+        self.assertEqual(report["workers"], 2)
+        unordered = Path(self.tmp.name, "unordered")
+        reprocess(unordered, self.root, workers=2, buckets=4, ordered=False)
+        self.assertEqual(sorted((unordered / "pages.jsonl").read_text().splitlines()),
+                         sorted((inline / "pages.jsonl").read_text().splitlines()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+import unittest
+import httpx
+from crawler_scraper.crawler.robots import RobotsStore, parse_rules
+
+ROBOTS = """User-agent: *
+Disallow: /private
+Crawl-delay: 2
+Sitemap: https://example.com/sitemap.xml
+"""
+
+
+class TestParseRules(unittest.TestCase):
+
+    def test_rules_are_parsed(self):
+        """Disallow, Crawl-delay and Sitemap lines are honoured."""
+        rules = parse_rules(200, ROBOTS, ttl=60, error_ttl=5)
+        self.assertTrue(rules.can_fetch("https://example.com/public"))
+        self.assertFalse(rules.can_fetch("https://example.com/private/x"))
+        self.assertEqual(rules.crawl_delay(), 2.0)
+        self.assertEqual(rules.sitemaps, ["https://example.com/sitemap.xml"])
+
+    def test_missing_allows_and_errors_disallow(self):
+        """A 404 allows everything; 5xx or no response disallows everything."""
+        self.assertTrue(parse_rules(404, "", 60, 5).can_fetch("https://example.com/"))
+        self.assertFalse(parse_rules(503, "", 60, 5).can_fetch("https://example.com/"))
+        self.assertFalse(parse_rules(None, "", 60, 5).can_fetch("https://example.com/"))
+
+
+class TestRobotsStore(unittest.TestCase):
+
+    def test_single_flight_and_cache(self):
+        """Concurrent lookups for one host trigger a single robots.txt fetch."""
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, text=ROBOTS)
+
+        async def main():
+            store = RobotsStore()
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                results = await asyncio.gather(*(
+                    store.can_fetch(f"https://example.com/page{i}", client=client) for i in range(10)
+                ))
+                blocked = await store.can_fetch("https://example.com/private/1", client=client)
+            return results, blocked
+
+        results, blocked = asyncio.run(main())
+        self.assertTrue(all(results))
+        self.assertFalse(blocked)
+        self.assertEqual(calls, ["https://example.com/robots.txt"])
+
+    def test_failed_fetch_reaches_every_waiter(self):
+        """Waiters get the fetch's error, not a CancelledError."""
+        async def broken(origin, client):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("parser exploded")
+
+        async def main():
+            store = RobotsStore()
+            store._fetch_async = broken
+            return await asyncio.gather(*(store.get(f"https://example.com/{i}") for i in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertEqual([type(r) for r in results], [RuntimeError] * 3)
+
+    def test_cancelled_fetch_is_taken_over_by_a_waiter(self):
+        """Cancelling the fetching task does not cancel the lookups waiting on it."""
+        async def handler(request):
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, text=ROBOTS)
+
+        async def main():
+            store = RobotsStore()
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                first = asyncio.create_task(store.can_fetch("https://example.com/a", client=client))
+                await asyncio.sleep(0)
+                second = asyncio.create_task(store.can_fetch("https://example.com/private/b", client=client))
+                await asyncio.sleep(0.01)
+                first.cancel()
+                return await second, store.stats["fetches"]
+
+        self.assertEqual(asyncio.run(main()), (False, 2))
+
+    def test_sync_lookups_never_fetch_one_origin_twice_at_once(self):
+        """A thread arriving while another still waits for the origin joins the same lock."""
+        active, peak = [0], [0]
+        store = RobotsStore()
+        store._store = lambda origin, rules: rules  # nothing cached: every thread fetches in turn
+
+        def slow_fetch(origin):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            active[0] -= 1
+            return parse_rules(404, "", 60, 5)
+
+        store._fetch_sync = slow_fetch
+        threads = [threading.Thread(target=store.get_sync, args=("https://example.com/a",)) for _ in range(3)]
+        threads[0].start()
+        time.sleep(0.02)
+        threads[1].start()
+        # Starts after the first fetch finished, while the second thread fetches.
+        time.sleep(0.13)
+        threads[2].start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 1)
+        self.assertEqual(store._sync_locks, {})
+
+    def test_lru_eviction(self):
+        """The cache never holds more than max_hosts origins."""
+        async def handler(request):
+            return httpx.Response(404)
+
+        async def main():
+            store = RobotsStore(max_hosts=2)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                for host in ("a", "b", "c"):
+                    await store.get(f"https://{host}.test/", client=client)
+            return store
+
+        store = asyncio.run(main())
+        self.assertEqual(list(store._cache), ["https://b.test", "https://c.test"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import time
+import unittest
+from crawler_scraper.crawler.scheduler import CrawlScheduler
+
+
+class TestCrawlScheduler(unittest.TestCase):
+
+    def test_global_concurrency_cap(self):
+        """Never more than ``concurrency`` handlers run at once."""
+        running = {"now": 0, "peak": 0}
+
+        async def handler(url):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+
+        urls = [f"http://host{i}.test/page" for i in range(20)]
+        stats = asyncio.run(CrawlScheduler(handler, concurrency=3, min_delay=0).run(urls))
+        self.assertEqual(stats["completed"], 20)
+        self.assertLessEqual(running["peak"], 3)
+
+    def test_per_host_delay(self):
+        """Requests to one host are spaced by the host's crawl delay."""
+        starts = []
+
+        async def handler(url):
+            starts.append(time.monotonic())
+
+        async def crawl_delay(url):
+            return 0.05
+
+        urls = [f"http://same.test/{i}" for i in range(4)]
+        scheduler = CrawlScheduler(handler, concurrency=4, min_delay=0, host_delay=crawl_delay)
+        asyncio.run(scheduler.run(urls))
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+        self.assertEqual(len(gaps), 3)
+        self.assertTrue(all(g >= 0.045 for g in gaps), gaps)
+
+    def test_submit_does_not_wait_for_crawl_delay_lookups(self):
+        """Crawl-delay lookups run per host in the background, not inside ``submit``."""
+        async def handler(url):
+            await asyncio.sleep(0.01)
+
+        async def crawl_delay(url):
+            await asyncio.sleep(0.2)
+            return None
+
+        async def main():
+            scheduler = CrawlScheduler(handler, concurrency=16, min_delay=0, host_delay=crawl_delay)
+            async with scheduler:
+                start = time.monotonic()
+                for i in range(20):
+                    await scheduler.submit(f"http://host{i}.test/page")
+                submitted = time.monotonic() - start
+            return submitted, time.monotonic() - start, scheduler.stats
+
+        submitted, total, stats = asyncio.run(main())
+        self.assertLess(submitted, 0.1)
+        self.assertLess(total, 1.0)
+        self.assertEqual(stats["completed"], 20)
+
+    def test_priority_order(self):
+        """Lower priority values are dispatched first."""
+        order = []
+
+        async def handler(url):
+            order.append(url)
+
+        async def main():
+            scheduler = CrawlScheduler(handler, concurrency=1, min_delay=0)
+            # Queue everything before the dispatcher gets a chance to run.
+            scheduler.start()
+            await scheduler.submit("http://a.test/low", priority=5)
+            await scheduler.submit("http://b.test/high", priority=0)
+            await scheduler.join()
+            await scheduler.close()
+
+        asyncio.run(main())
+        self.assertEqual(order, ["http://b.test/high", "http://a.test/low"])
+
+    def test_failures_are_counted(self):
+        """A failing handler does not stop the crawl."""
+        async def handler(url):
+            if url.endswith("bad"):
+                raise ValueError("boom")
+
+        urls = ["http://a.test/ok", "http://b.test/bad"]
+        stats = asyncio.run(CrawlScheduler(handler, min_delay=0).run(urls))
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["failed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
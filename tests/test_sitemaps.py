@@ -0,0 +1,190 @@
+import asyncio
+import gzip
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from crawler_scraper.crawler import engine
+from crawler_scraper.crawler.recrawl import RecrawlStore
+from crawler_scraper.crawler.sitemaps import SitemapDiscovery, SitemapParser, parse_lastmod, sitemap_sources
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+def urlset(urls, lastmod=None):
+    stamp = f"<lastmod>{lastmod}</lastmod>" if lastmod else ""
+    return (f"<?xml version='1.0' encoding='UTF-8'?><urlset {NS}>"
+            + "".join(f"<url><loc>{u}</loc>{stamp}</url>" for u in urls) + "</urlset>").encode()
+
+
+def index(entries):
+    return (f"<sitemapindex {NS}>"
+            + "".join(f"<sitemap><loc>{u}</loc><lastmod>{m}</lastmod></sitemap>" for u, m in entries)
+            + "</sitemapindex>").encode()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    files = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = self.files.get(self.path)
+        self.send_response(200 if body is not None else 404)
+        self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        self.wfile.write(body or b"")
+
+
+class TestSitemapParser(unittest.TestCase):
+
+    def test_large_gzipped_sitemap_parses_incrementally(self):
+        urls = [f"https://a.test/p/{i}" for i in range(50_000)]
+        data = gzip.compress(urlset(urls, "2024-05-01T10:00:00Z"))
+        parser = SitemapParser()
+        found, largest_tree = [], 0
+        for i in range(0, len(data), 997):
+            found.extend(parser.feed(data[i:i + 997]))
+            largest_tree = max(largest_tree, len(parser._root) if parser._root is not None else 0)
+        found.extend(parser.close())
+        self.assertEqual(parser.kind, "urlset")
+        self.assertEqual([e.url for e in found], urls)
+        self.assertEqual(found[0].lastmod, parse_lastmod("2024-05-01T10:00:00+00:00"))
+        # Finished entries are dropped from the tree as they are read.
+        self.assertLessEqual(largest_tree, 1)
+
+    def test_decompressed_size_is_capped(self):
+        parser = SitemapParser(max_bytes=10_000)
+        with self.assertRaises(ValueError):
+            parser.feed(gzip.compress(urlset([f"https://a.test/{i}" for i in range(1000)])))
+
+    def test_lastmod_formats(self):
+        self.assertEqual(parse_lastmod("2024-05-01T00:00:00Z"), 1714521600.0)
+        self.assertEqual(parse_lastmod("2024-05-01T02:00:00+02:00"), 1714521600.0)
+        # Dates count as the end of the period they name.
+        self.assertEqual(parse_lastmod("2024-04-30"), 1714521600.0)
+        self.assertEqual(parse_lastmod("2024-04"), 1714521600.0)
+        self.assertEqual(parse_lastmod("2023"), parse_lastmod("2024-01-01T00:00:00Z"))
+        self.assertIsNone(parse_lastmod("yesterday"))
+        self.assertIsNone(parse_lastmod(None))
+
+
+class TestSitemapDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        _Handler.requests = []
+        _Handler.files = {
+            "/robots.txt": f"User-agent: *\nSitemap: {self.base}/index.xml\n".encode(),
+            "/index.xml": index([(f"{self.base}/news.xml.gz", "2024-05-02T00:00:00Z"),
+                                 (f"{self.base}/pages.xml", "2024-05-01T00:00:00Z")]),
+            "/news.xml.gz": gzip.compress(urlset([f"{self.base}/news/{i}" for i in range(3)],
+                                                 "2024-05-02T00:00:00Z")),
+            "/pages.xml": urlset([f"{self.base}/about", f"{self.base}/contact", "https://elsewhere.test/x"]),
+        }
+        self.store = RecrawlStore(os.path.join(self.tmp.name, "recrawl.sqlite3"))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.store.close()
+        self.tmp.cleanup()
+
+    def _discover(self, sources):
+        async def run():
+            discovery = SitemapDiscovery(recrawl=self.store)
+            published = await discovery.locate(sources)
+            return discovery, published, [u async for u in discovery.stream()]
+        return asyncio.run(run())
+
+    def test_follows_robots_index_and_skips_unchanged_pages(self):
+        seen_after = parse_lastmod("2024-05-02T00:00:00Z") + 60
+        self.store.record(f"{self.base}/news/0", content_hash="h", fetched_at=seen_after)
+        discovery, published, urls = self._discover({f"{self.base}/": None})
+        self.assertEqual(published, [f"{self.base}/"])
+        self.assertEqual(urls, [f"{self.base}/news/1", f"{self.base}/news/2",
+                                f"{self.base}/about", f"{self.base}/contact"])
+        self.assertEqual((discovery.stats["unchanged"], discovery.stats["offsite"]), (1, 1))
+
+        # Once committed, sitemaps whose index lastmod did not move are not downloaded again.
+        discovery.commit()
+        _Handler.requests = []
+        discovery, _, urls = self._discover({f"{self.base}/": None})
+        self.assertEqual(discovery.stats["sitemaps_skipped"], 2)
+        self.assertEqual(urls, [])
+        self.assertNotIn("/pages.xml", _Handler.requests)
+
+    def test_limit_caps_seed_and_sitemap_urls_together(self):
+        async def run():
+            discovery = SitemapDiscovery(recrawl=self.store)
+            await discovery.locate({f"{self.base}/": None})
+            urls = [u async for u in discovery.stream([f"{self.base}/due", f"{self.base}/news/0"], limit=3)]
+            discovery.commit()
+            return discovery, urls
+
+        discovery, urls = asyncio.run(run())
+        self.assertEqual(urls, [f"{self.base}/due", f"{self.base}/news/0", f"{self.base}/news/1"])
+        self.assertTrue(discovery.stats["truncated"])
+        # Pages past the limit are offered again next run.
+        self.assertIsNone(self.store.sitemap_read_at(f"{self.base}/news.xml.gz"))
+
+    def test_sites_without_sitemaps_keep_their_seed_url(self):
+        seed = {"sitemaps": True,
+                "sources": [{"url": f"{self.base}/"}, {"url": "https://b.test/", "sitemap": False}]}
+        _Handler.files["/robots.txt"] = b"User-agent: *\n"
+        self.assertEqual(sitemap_sources(seed), {f"{self.base}/": None})
+        _, published, urls = self._discover(sitemap_sources(seed))
+        self.assertEqual((published, urls), ([], []))
+        explicit = {"sources": [{"url": "https://c.test/", "sitemap": "https://c.test/s.xml"}]}
+        self.assertEqual(sitemap_sources(explicit), {"https://c.test/": ["https://c.test/s.xml"]})
+
+    def test_run_from_seed_crawls_sitemap_pages(self):
+        crawled = []
+
+        async def fake_crawl(urls, on_result=None, **kwargs):
+            async for url in urls:
+                crawled.append(url)
+                on_result(url, {"url": url, "html": "<p>x</p>", "text": "x"}, None)
+            return {"submitted": len(crawled), "failed": 0}
+
+        seed = os.path.join(self.tmp.name, "seed.yaml")
+        with open(seed, "w", encoding="utf-8") as f:
+            f.write(f"sources:\n  - url: {self.base}/\n    sitemap: {self.base}/pages.xml\n"
+                    f"  - url: https://plain.test/\n")
+        with patch.object(engine, "crawl_urls", side_effect=fake_crawl):
+            first = asyncio.run(engine.run_from_seed(seed, recrawl=self.store))
+            second = asyncio.run(engine.run_from_seed(seed, recrawl=self.store))
+        self.assertEqual(crawled, ["https://plain.test/", f"{self.base}/about", f"{self.base}/contact"] * 2)
+        self.assertEqual(first["sitemaps"]["urls"], 2)
+        # Pages without lastmod are offered every run; their outcomes are recorded.
+        self.assertEqual(second["sitemaps"]["urls"], 2)
+        self.assertIsNotNone(self.store.history(f"{self.base}/about").last_fetch)
+
+    def test_budget_covers_sitemap_pages(self):
+        crawled = []
+
+        async def fake_crawl(urls, on_result=None, **kwargs):
+            async for url in urls:
+                crawled.append(url)
+            return {"submitted": len(crawled), "failed": 0}
+
+        seed = os.path.join(self.tmp.name, "seed.yaml")
+        with open(seed, "w", encoding="utf-8") as f:
+            f.write(f"sources:\n  - url: {self.base}/\n    sitemap: {self.base}/pages.xml\n"
+                    f"  - url: https://plain.test/\n")
+        with patch.object(engine, "crawl_urls", side_effect=fake_crawl):
+            stats = asyncio.run(engine.run_from_seed(seed, incremental=True, budget=2, recrawl=self.store))
+        self.assertEqual(crawled, ["https://plain.test/", f"{self.base}/about"])
+        self.assertTrue(stats["sitemaps"]["truncated"])
+
+
+if __name__ == "__main__":
+    unittest.main()
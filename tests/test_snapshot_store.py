@@ -0,0 +1,88 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from crawler_scraper.crawler.snapshot_store import SnapshotStore, import_json_files, url_key
+
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(self.tmp.name, fsync_every=3, fsync_interval=60)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_put_get_roundtrip(self):
+        """Latest snapshot wins; earlier ones stay reachable."""
+        self.store.put("https://example.com/", html="<p>v1</p>", text="v1", fetched_at=100)
+        self.store.put("https://example.com/", html="<p>v2</p>", text="v2", fetched_at=200,
+                       metadata={"status": 200}, source="render")
+        snap = self.store.get("https://example.com/")
+        self.assertEqual((snap.html, snap.text, snap.source, snap.metadata), ("<p>v2</p>", "v2", "render", {"status": 200}))
+        self.assertEqual(self.store.get("https://example.com/", at=150).text, "v1")
+        self.assertIsNone(self.store.get("https://example.com/missing"))
+
+    def test_identical_bodies_are_stored_once(self):
+        first = self.store.put("https://a.example/", text="same body")
+        second = self.store.put("https://b.example/", text="same body")
+        self.assertFalse(first.deduplicated)
+        self.assertTrue(second.deduplicated)
+        self.store.flush()
+        stats = self.store.stats()
+        self.assertEqual((stats["snapshots"], stats["bodies"]), (2, 1))
+        self.assertEqual(self.store.get("https://b.example/").text, "same body")
+
+    def test_index_committed_in_batches(self):
+        """Index rows become visible to other readers only after a flush."""
+        other = SnapshotStore(self.tmp.name)
+        try:
+            self.store.put("https://example.com/1", text="one")
+            self.store.put("https://example.com/2", text="two")
+            self.assertEqual(other.stats()["snapshots"], 0)
+            self.store.put("https://example.com/3", text="three")  # fsync_every=3
+            self.assertEqual(other.stats()["snapshots"], 3)
+            self.assertEqual([s.text for s in other.iter_snapshots()], ["one", "two", "three"])
+        finally:
+            other.close()
+
+    def test_segments_are_gzip_jsonl(self):
+        """Segments are plain concatenated gzip members of JSON lines."""
+        self.store.put("https://example.com/", html="<b>x</b>", text="x")
+        self.store.put("https://example.com/y", text="y")
+        self.store.flush()
+        segments = os.listdir(os.path.join(self.tmp.name, "segments"))
+        self.assertEqual(len(segments), 1)
+        with gzip.open(os.path.join(self.tmp.name, "segments", segments[0]), "rt", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f.read().splitlines()]
+        self.assertEqual([r["url"] for r in records], ["https://example.com/", "https://example.com/y"])
+
+    def test_survives_reopen(self):
+        self.store.put("https://example.com/", text="kept")
+        self.store.close()
+        self.store = SnapshotStore(self.tmp.name)
+        self.assertEqual(self.store.get("https://example.com/").text, "kept")
+        self.assertEqual(len(self.store.history("https://example.com/")), 1)
+
+    def test_url_key_is_stable(self):
+        """Keys do not depend on the per-process hash() salt."""
+        self.assertEqual(url_key("https://example.com/"), "b559c7edd3fb67374c1a25e739cdd7edd1d79949")
+
+    def test_import_legacy_json(self):
+        legacy = os.path.join(self.tmp.name, "legacy")
+        os.makedirs(legacy)
+        with open(os.path.join(legacy, "123_456.json"), "w", encoding="utf-8") as f:
+            json.dump({"url": "https://example.com/", "html": "<p>x</p>", "text": "x",
+                       "metadata": {"fetched_at": 5}}, f)
+        with open(os.path.join(legacy, "scrape_1.json"), "w", encoding="utf-8") as f:
+            json.dump({"url": "https://example.com/s", "content": "scraped", "content_length": 7}, f)
+        self.assertEqual(import_json_files(self.store, legacy), 2)
+        self.assertEqual(self.store.get("https://example.com/").fetched_at, 5)
+        self.assertEqual(self.store.get("https://example.com/s").text, "scraped")
+
+
+if __name__ == "__main__":
+    unittest.main()
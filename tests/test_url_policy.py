@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from crawler_scraper.app import crawler
+from crawler_scraper.app.extractors import available_extractors, get_extractor
+from crawler_scraper.crawler.url_policy import UrlPolicy, find_canonical
+
+HEAD = '<html><head><base href="https://example.com/docs/"><link rel="Canonical" href="guide"></head><body>x</body>'
+
+
+class TestCanonicalize(unittest.TestCase):
+
+    def test_variants_collapse_to_one_url(self):
+        policy = UrlPolicy()
+        variants = [
+            "HTTPS://Example.com:443/a/./b/../c?b=2&utm_source=news&a=1#top",
+            "https://example.com/a/c?a=1&b=2&gclid=xyz",
+            "https://example.com/a/c;jsessionid=0AF3?PHPSESSID=1&b=2&a=1",
+            "https://example.com/a/%63?a=1&b=2",
+        ]
+        self.assertEqual({policy.canonicalize(u) for u in variants}, {"https://example.com/a/c?a=1&b=2"})
+        self.assertEqual(policy.canonicalize("https://example.com"), "https://example.com/")
+
+    def test_fetched_form_is_kept(self):
+        policy = UrlPolicy()
+        self.assertEqual(policy.canonicalize("https://ex.com/docs/"), "https://ex.com/docs/")
+        self.assertEqual(policy.canonicalize("https://ex.com/s?q=a%20b&flag&utm_term=x"),
+                         "https://ex.com/s?flag&q=a%20b")
+        self.assertEqual(UrlPolicy.from_dict({"trailing_slash": "strip"}).canonicalize("https://ex.com/docs/"),
+                         "https://ex.com/docs")
+
+    def test_seed_rules(self):
+        policy = UrlPolicy.from_dict({"keep_params": ["id"], "drop_index": True, "lowercase_path": True})
+        self.assertEqual(policy.canonicalize("https://example.com/Shop/?id=3&sort=asc"),
+                         "https://example.com/shop/?id=3")
+        self.assertEqual(policy.canonicalize("https://example.com/a/index.html"), "https://example.com/a/")
+        self.assertEqual(UrlPolicy.from_dict({"drop_params": ["ref"]}).canonicalize("https://e.com/?ref=x&q=1"),
+                         "https://e.com/?q=1")
+        with self.assertRaises(ValueError):
+            UrlPolicy.from_dict({"max_pages": 3})
+
+
+class TestTraps(unittest.TestCase):
+
+    def test_heuristics(self):
+        policy = UrlPolicy.from_dict({"max_query_variants": 2, "max_pages_per_host": 8})
+        decisions = {url: policy.admit(url).reason for url in [
+            "https://shop.test/",
+            "https://shop.test/?utm_medium=mail",
+            "https://shop.test/a/b/a/b/a/b",
+            "https://shop.test/events/2099/01",
+            "https://shop.test/events?date=1985-01-01",
+            "https://shop.test/product/2099",
+            "https://shop.test/search?start=2040",
+            "https://shop.test/archive?from=1980",
+            "https://shop.test/" + "/".join(f"d{i}" for i in range(17)),
+            "https://shop.test/list?color=red",
+            "https://shop.test/list?color=blue",
+            "https://shop.test/list?color=green",
+            "https://shop.test/x?" + "&".join(f"f{i}=1" for i in range(9)),
+            "https://shop.test/about",
+            "https://shop.test/contact",
+            "https://shop.test/jobs",
+        ]}
+        self.assertEqual(list(decisions.values()), [
+            None, "duplicate", "path_repetition", "calendar", "calendar", None, None, None, "path_depth", None,
+            None, "query_variants", "query_params", None, None, "host_cap",
+        ])
+        report = policy.report()
+        self.assertEqual(report["admitted"], 8)
+        self.assertEqual(report["fetches_avoided"], 8)
+        self.assertEqual(report["skipped"]["calendar"], 2)
+
+    def test_declared_canonical_is_queued_and_alias_skipped(self):
+        policy = UrlPolicy()
+        alias = "https://example.com/docs/print-view"
+        self.assertTrue(policy.admit(alias).admitted)
+        canonical = find_canonical(HEAD, alias)
+        self.assertEqual(policy.observe_canonical(alias, canonical), "https://example.com/docs/guide")
+        self.assertTrue(policy.is_alias(alias))
+        self.assertTrue(policy.admit("https://example.com/docs/guide").admitted)
+        self.assertEqual(policy.admit(alias + "#print").reason, "canonical")
+        self.assertIsNone(policy.observe_canonical("https://example.com/a", "https://example.com/docs/guide"))
+        self.assertIsNone(policy.observe_canonical("https://example.com/b", "https://other.test/b"))
+        self.assertFalse(policy.is_alias("https://example.com/b"))
+        self.assertIsNone(find_canonical("<head></head><body><link rel=canonical href=/x>", "https://e.com/"))
+
+    def test_filter_async_urls(self):
+        async def urls():
+            for url in ("https://e.com/a", "https://e.com/a#top", "https://e.com/b?fbclid=1"):
+                yield url
+
+        async def collect():
+            return [u async for u in UrlPolicy().filter(urls())]
+        self.assertEqual(asyncio.run(collect()), ["https://e.com/a", "https://e.com/b"])
+
+
+class TestExtractorCanonical(unittest.TestCase):
+
+    def test_every_backend_reports_the_canonical_link(self):
+        for name in available_extractors():
+            with self.subTest(backend=name):
+                extraction = get_extractor(name).extract(HEAD, "https://example.com/x", collect_links=True)
+                self.assertEqual(extraction.canonical, "https://example.com/docs/guide")
+
+
+SITE = {
+    "https://example.com/": ["https://example.com/a?utm_source=x", "https://example.com/print",
+                             "https://example.com/a/a/a/a"],
+    "https://example.com/a": ["https://example.com/guide", "https://example.com/a#top"],
+    "https://example.com/print": ["https://example.com/guide"],
+    "https://example.com/guide": ["https://example.com/print", "https://other.test/"],
+}
+
+
+async def fake_scrape(url, config, collect_links=True, executor=None):
+    canonical = "https://example.com/guide" if url == "https://example.com/print" else None
+    return {"url": url, "content": url, "links": SITE[url], "bytes": 1, "canonical": canonical}
+
+
+class TestCrawlBfsPolicy(unittest.TestCase):
+
+    @patch.object(crawler, "scrape_url_async", side_effect=fake_scrape)
+    def test_duplicates_traps_and_aliases_are_skipped(self, _):
+        result = asyncio.run(crawler.crawl_bfs("https://example.com", {}, depth=4))
+        self.assertEqual([p["url"] for p in result["pages"]],
+                         ["https://example.com/", "https://example.com/a", "https://example.com/print",
+                          "https://example.com/guide"])
+        skipped = result["stats"]["url_policy"]["skipped"]
+        self.assertEqual((skipped["path_repetition"], skipped["canonical"], skipped["duplicate"]), (1, 1, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,25 @@
 """Headless team integration copied into crawler_scraper for canonical workspace.
 
-Provides a small registry and safe fetch helper using httpx and robots enforcement.
+Provides a small registry and safe fetch helper using the shared fetch client
+and robots enforcement.
 """
 from __future__ import annotations
 
 import time
-import urllib.robotparser
-from typing import Dict, List
-import httpx
+from typing import Dict, List, Optional
 from dataclasses import dataclass
 
+from crawler.fetch_client import (
+    MAX_BODY_BYTES,
+    SNIFF_BYTES,
+    aiter_capped,
+    ensure_content_type,
+    fetch_client,
+    iter_capped,
+    sniff_charset,
+)
+from crawler.robots import robots_store
+
 
 @dataclass
 class HeadlessAgentDesc:
@@ -28,18 +38,13 @@ def init_headless_team() -> List[HeadlessAgentDesc]:
 
 def allowed_by_robots(url: str, user_agent: str = "MCPHeadlessBot/1.0") -> bool:
     try:
-        parsed = httpx.URL(url)
-        robots_url = f"{parsed.scheme}://{parsed.host}/robots.txt"
-        rp = urllib.robotparser.RobotFileParser()
-        rp.set_url(robots_url)
-        rp.read()
-        return rp.can_fetch(user_agent, url)
+        return robots_store.can_fetch_sync(url, user_agent)
     except Exception:
         return False
 
 
-def fetch_url(url: str, timeout: int = 15, user_agent: str = "MCPHeadlessBot/1.0") -> Dict:
-    result = {
+def _new_result(url: str) -> Dict:
+    return {
         "url": url,
         "status": "error",
         "http_status": None,
@@ -47,16 +52,98 @@ def fetch_url(url: str, timeout: int = 15, user_agent: str = "MCPHeadlessBot/1.0
         "text_excerpt": None,
         "duration_seconds": None,
     }
+
+
+EXCERPT_CHARS = 2000
+# Enough raw bytes to decode EXCERPT_CHARS characters in any common charset.
+EXCERPT_BYTES = EXCERPT_CHARS * 4
+
+
+class _BodyCollector:
+    """Counts streamed body bytes, keeping only what the result needs."""
+
+    def __init__(self, keep_body: bool):
+        self.keep_body = keep_body
+        self.size = 0
+        self.truncated = False
+        self._chunks: List[bytes] = []
+        self._kept = 0
+
+    def add(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.keep_body or self._kept < EXCERPT_BYTES:
+            self._chunks.append(chunk)
+            self._kept += len(chunk)
+
+    def fill(self, result: Dict, r) -> None:
+        raw = b"".join(self._chunks)
+        text = raw.decode(sniff_charset(r.headers.get("Content-Type", ""), raw[:SNIFF_BYTES]), "replace")
+        result["content_length"] = self.size
+        result["text_excerpt"] = text[:EXCERPT_CHARS]
+        if self.keep_body:
+            result["body"] = text
+        if self.truncated:
+            result["truncated"] = True
+
+
+def _start_result(result: Dict, r) -> bool:
+    """Fill in the status and validators; False when there is no body to read (304)."""
+    result["http_status"] = r.status_code
+    result["etag"] = r.headers.get("ETag")
+    result["last_modified"] = r.headers.get("Last-Modified")
+    if r.status_code == 304:
+        result["status"] = "not_modified"
+        return False
+    result["status"] = "ok" if r.status_code < 400 else "error"
+    ensure_content_type(r)
+    return True
+
+
+def fetch_url(url: str, timeout: int = 15, user_agent: str = "MCPHeadlessBot/1.0",
+              keep_body: bool = False, headers: Optional[Dict[str, str]] = None) -> Dict:
+    """Fetch ``url`` with a streamed, size-capped read.
+
+    Non-HTML responses are rejected from their headers; at most
+    ``MAX_BODY_BYTES`` are read and only the excerpt is kept in memory unless
+    ``keep_body`` asks for the decoded document under ``body``. Extra
+    request ``headers`` (e.g. ``If-None-Match``) may make the request
+    conditional; a 304 yields ``status == "not_modified"`` and no body.
+    """
+    result = _new_result(url)
+    start = time.time()
+    headers = {"User-Agent": user_agent, **(headers or {})}
+    try:
+        with fetch_client.stream_sync("GET", url, headers=headers, timeout=timeout) as r:
+            if not _start_result(result, r):
+                return result
+            body = _BodyCollector(keep_body)
+            for chunk in iter_capped(r, MAX_BODY_BYTES):
+                body.add(chunk)
+            body.truncated = body.size >= MAX_BODY_BYTES
+            body.fill(result, r)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    finally:
+        result["duration_seconds"] = time.time() - start
+    return result
+
+
+async def fetch_url_async(url: str, timeout: int = 15, user_agent: str = "MCPHeadlessBot/1.0",
+                          keep_body: bool = False, headers: Optional[Dict[str, str]] = None) -> Dict:
+    """Async twin of ``fetch_url`` on the shared pooled client."""
+    result = _new_result(url)
     start = time.time()
-    headers = {"User-Agent": user_agent}
+    headers = {"User-Agent": user_agent, **(headers or {})}
     try:
-        with httpx.Client(timeout=timeout, headers=headers, follow_redirects=True) as client:
-            r = client.get(url)
-            result["http_status"] = r.status_code
-            result["content_length"] = len(r.content or b"")
-            text = r.text or ""
-            result["text_excerpt"] = text[:2000]
-            result["status"] = "ok" if r.status_code < 400 else "error"
+        async with fetch_client.stream("GET", url, headers=headers, timeout=timeout) as r:
+            if not _start_result(result, r):
+                return result
+            body = _BodyCollector(keep_body)
+            async for chunk in aiter_capped(r, MAX_BODY_BYTES):
+                body.add(chunk)
+            body.truncated = body.size >= MAX_BODY_BYTES
+            body.fill(result, r)
     except Exception as e:
         result["status"] = "error"
         result["error"] = str(e)
@@ -1,19 +1,20 @@
 import logging
 
 import asyncio
-import json
 import os
 import time
-from pathlib import Path
-import requests
-import aiofiles
-from playwright.async_api import async_playwright
+from crawler.browser_pool import BrowserPool
+from crawler.fetch_client import fetch_client
+from crawler.metrics import record_error, stage
+from crawler.snapshot_store import snapshot_store
 
-OUT_DIR = Path("results/uncleaned")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+async def fetch_and_save(url: str, use_credential_manager: bool = False, cm_url: str | None = None,
+                         pool: BrowserPool | None = None):
+    if pool is None:
+        async with BrowserPool(size=1, contexts_per_browser=1) as own_pool:
+            return await fetch_and_save(url, use_credential_manager, cm_url, pool=own_pool)
 
-async def fetch_and_save(url: str, use_credential_manager: bool = False, cm_url: str | None = None):
     token = None
     if use_credential_manager and cm_url:
         # try to fetch a test secret (expects authorization via env TOKEN)
@@ -22,43 +23,37 @@ async def fetch_and_save(url: str, use_credential_manager: bool = False, cm_url:
             t = os.environ.get('CREDENTIAL_MANAGER_TOKEN')
             if t:
                 hdr['Authorization'] = f'Bearer {t}'
-            r = requests.get(f"{cm_url}/secret/test-secret", headers=hdr, timeout=10)
+            r = await fetch_client.get(f"{cm_url}/secret/test-secret", headers=hdr, timeout=10)
             if r.status_code == 200:
                 token = r.json().get('secret')
         except Exception:
             token = None
 
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-            try:
-                await page.goto(url, timeout=15000)
-            except Exception as e:
-                await browser.close()
-                raise RuntimeError(f"Navigation failed for {url}: {e}")
-            html = await page.content()
-            try:
-                text = await page.inner_text('body')
-            except Exception:
-                text = ''
-            await browser.close()
+        async with pool.page() as page:
+            with stage("render"):
+                try:
+                    await page.goto(url, timeout=15000)
+                except Exception as e:
+                    raise RuntimeError(f"Navigation failed for {url}: {e}")
+                html = await page.content()
+                try:
+                    text = await page.inner_text('body')
+                except Exception:
+                    text = ''
     except Exception as e:
+        record_error("render", e)
         raise RuntimeError(f"Playwright fetch failed for {url}: {e}")
 
-    ts = int(time.time())
-    out = {
-        'url': url,
-        'fetched_at': ts,
+    metadata = {
+        'fetched_at': time.time(),
         'html_length': len(html),
-        'text_snippet': text[:500],
         'credential_token_present': bool(token),
     }
-    fname = OUT_DIR / f"sample-{ts}.json"
-    logging.info('Wrote', fname)
-    async with aiofiles.open(fname, "w", encoding="utf-8") as f:
-        await f.write(json.dumps(out, ensure_ascii=False, indent=2))
-    logging.info('Wrote', fname)
+    ref = await asyncio.to_thread(snapshot_store.put, url, html=html, text=text,
+                                  metadata=metadata, source="worker")
+    logging.info(f"Stored snapshot of {url} ({ref.content_hash[:12]}{', duplicate' if ref.deduplicated else ''})")
+    return ref
 
 
 def main():